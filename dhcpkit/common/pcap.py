@@ -0,0 +1,353 @@
+"""
+A minimal reader for pcap and pcapng capture files. It only understands enough of the file formats and the captured
+protocols to extract UDP datagrams sent over IPv6, which is what is needed to replay captured DHCPv6 traffic.
+"""
+from ipaddress import IPv6Address
+from struct import unpack_from
+
+from typing import BinaryIO, Iterator, Optional
+
+# Magic numbers of classic pcap files, with microsecond and nanosecond timestamps
+PCAP_MAGIC_USEC = 0xa1b2c3d4
+PCAP_MAGIC_NSEC = 0xa1b23c4d
+
+# Block types of pcapng files
+PCAPNG_SECTION_HEADER = 0x0a0d0d0a
+PCAPNG_INTERFACE_DESCRIPTION = 0x00000001
+PCAPNG_OBSOLETE_PACKET = 0x00000002
+PCAPNG_SIMPLE_PACKET = 0x00000003
+PCAPNG_ENHANCED_PACKET = 0x00000006
+PCAPNG_BYTE_ORDER_MAGIC = 0x1a2b3c4d
+
+# Interface description options we need
+PCAPNG_IF_TSRESOL = 9
+PCAPNG_IF_TSOFFSET = 14
+
+# Link types that can contain IPv6
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LOOP = 108
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+# Protocol numbers
+ETHERTYPE_IPV6 = 0x86dd
+ETHERTYPE_VLAN = (0x8100, 0x88a8, 0x9100)
+AF_INET6_VALUES = (10, 24, 28, 30)
+IPPROTO_HOPOPTS = 0
+IPPROTO_UDP = 17
+IPPROTO_ROUTING = 43
+IPPROTO_FRAGMENT = 44
+IPPROTO_AH = 51
+IPPROTO_DSTOPTS = 60
+
+
+class CapturedPacket:
+    """
+    A packet as it was captured, with the link layer header still attached
+
+    :type timestamp: float
+    :type link_type: int
+    :type data: bytes
+    """
+
+    __slots__ = ('timestamp', 'link_type', 'data')
+
+    def __init__(self, timestamp: float, link_type: int, data: bytes):
+        self.timestamp = timestamp
+        self.link_type = link_type
+        self.data = data
+
+
+class UDPDatagram:
+    """
+    A UDP datagram sent over IPv6, extracted from a captured packet
+
+    :type timestamp: float
+    :type source_address: IPv6Address
+    :type source_port: int
+    :type destination_address: IPv6Address
+    :type destination_port: int
+    :type payload: bytes
+    """
+
+    __slots__ = ('timestamp', 'source_address', 'source_port', 'destination_address', 'destination_port', 'payload')
+
+    def __init__(self, timestamp: float, source_address: IPv6Address, source_port: int,
+                 destination_address: IPv6Address, destination_port: int, payload: bytes):
+        self.timestamp = timestamp
+        self.source_address = source_address
+        self.source_port = source_port
+        self.destination_address = destination_address
+        self.destination_port = destination_port
+        self.payload = payload
+
+
+def read_pcap(file: BinaryIO) -> Iterator[CapturedPacket]:
+    """
+    Read the packets from a classic pcap file.
+
+    :param file: The opened capture file
+    :return: The captured packets
+    """
+    header = file.read(24)
+    if len(header) < 24:
+        raise ValueError("File is too short for a pcap header")
+
+    for byte_order in ('<', '>'):
+        magic = unpack_from(byte_order + 'I', header)[0]
+        if magic in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC):
+            break
+    else:
+        raise ValueError("Not a pcap file")
+
+    resolution = 1e-9 if magic == PCAP_MAGIC_NSEC else 1e-6
+    link_type = unpack_from(byte_order + 'I', header, 20)[0] & 0xffff
+
+    while True:
+        record_header = file.read(16)
+        if len(record_header) < 16:
+            return
+
+        seconds, fraction, captured_length, original_length = unpack_from(byte_order + 'IIII', record_header)
+        data = file.read(captured_length)
+        if len(data) < captured_length:
+            # Truncated file
+            return
+
+        yield CapturedPacket(seconds + fraction * resolution, link_type, data)
+
+
+def read_pcapng(file: BinaryIO) -> Iterator[CapturedPacket]:
+    """
+    Read the packets from a pcapng file. Packets without a timestamp get the timestamp of the packet before them.
+
+    :param file: The opened capture file
+    :return: The captured packets
+    """
+    byte_order = None
+    interfaces = []
+    timestamp = 0.0
+
+    while True:
+        block_header = file.read(8)
+        if len(block_header) < 8:
+            return
+
+        block_type = unpack_from('<I', block_header)[0]
+        if block_type == PCAPNG_SECTION_HEADER:
+            # The byte order magic determines how to read the rest of the section
+            byte_order_magic = file.read(4)
+            if len(byte_order_magic) < 4:
+                return
+
+            for byte_order in ('<', '>'):
+                if unpack_from(byte_order + 'I', byte_order_magic)[0] == PCAPNG_BYTE_ORDER_MAGIC:
+                    break
+            else:
+                raise ValueError("Not a pcapng file")
+
+            block_length = unpack_from(byte_order + 'I', block_header, 4)[0]
+            file.read(block_length - 12)
+
+            # Interface numbering restarts in every section
+            interfaces = []
+            continue
+
+        if byte_order is None:
+            raise ValueError("Not a pcapng file")
+
+        block_type, block_length = unpack_from(byte_order + 'II', block_header)
+        if block_length < 12:
+            raise ValueError("Invalid pcapng block length {}".format(block_length))
+
+        body = file.read(block_length - 8)
+        if len(body) < block_length - 8:
+            # Truncated file
+            return
+
+        if block_type == PCAPNG_INTERFACE_DESCRIPTION:
+            link_type = unpack_from(byte_order + 'H', body)[0]
+            resolution, offset = 1e-6, 0
+            for option_code, option_value in read_pcapng_options(body, 8, byte_order):
+                if option_code == PCAPNG_IF_TSRESOL and option_value:
+                    value = option_value[0]
+                    resolution = 2 ** -(value & 0x7f) if value & 0x80 else 10 ** -value
+                elif option_code == PCAPNG_IF_TSOFFSET and len(option_value) >= 8:
+                    offset = unpack_from(byte_order + 'q', option_value)[0]
+
+            interfaces.append((link_type, resolution, offset))
+
+        elif block_type == PCAPNG_ENHANCED_PACKET:
+            interface_id, timestamp_high, timestamp_low, captured_length = unpack_from(byte_order + 'IIII', body)
+            link_type, resolution, offset = interfaces[interface_id]
+            timestamp = ((timestamp_high << 32) | timestamp_low) * resolution + offset
+            yield CapturedPacket(timestamp, link_type, body[20:20 + captured_length])
+
+        elif block_type == PCAPNG_OBSOLETE_PACKET:
+            interface_id, drops, timestamp_high, timestamp_low, captured_length = unpack_from(byte_order + 'HHIII',
+                                                                                               body)
+            link_type, resolution, offset = interfaces[interface_id]
+            timestamp = ((timestamp_high << 32) | timestamp_low) * resolution + offset
+            yield CapturedPacket(timestamp, link_type, body[20:20 + captured_length])
+
+        elif block_type == PCAPNG_SIMPLE_PACKET:
+            # Simple packets don't have a timestamp, and always belong to the first interface
+            original_length = unpack_from(byte_order + 'I', body)[0]
+            captured_length = min(original_length, len(body) - 8)
+            yield CapturedPacket(timestamp, interfaces[0][0], body[4:4 + captured_length])
+
+
+def read_pcapng_options(body: bytes, offset: int, byte_order: str) -> Iterator[tuple]:
+    """
+    Read the options at the end of a pcapng block body.
+
+    :param body: The block body, including the trailing block length
+    :param offset: Where the options start
+    :param byte_order: The byte order of the section
+    :return: The option codes and values
+    """
+    # The body ends with the block length
+    max_offset = len(body) - 4
+    while offset + 4 <= max_offset:
+        option_code, option_length = unpack_from(byte_order + 'HH', body, offset)
+        if option_code == 0:
+            return
+
+        offset += 4
+        yield option_code, body[offset:offset + option_length]
+
+        # Option values are padded to 32 bits
+        offset += (option_length + 3) & ~3
+
+
+def read_capture(filename: str) -> Iterator[CapturedPacket]:
+    """
+    Read the packets from a capture file, which may be in pcap or pcapng format.
+
+    :param filename: The name of the capture file
+    :return: The captured packets
+    """
+    with open(filename, 'rb') as file:
+        magic = file.read(4)
+        file.seek(0)
+
+        if len(magic) == 4 and unpack_from('<I', magic)[0] == PCAPNG_SECTION_HEADER:
+            yield from read_pcapng(file)
+        else:
+            yield from read_pcap(file)
+
+
+def find_ipv6_header(packet: CapturedPacket) -> Optional[int]:
+    """
+    Skip the link layer header of a captured packet.
+
+    :param packet: The captured packet
+    :return: The offset of the IPv6 header, or None if the packet doesn't contain IPv6
+    """
+    data = packet.data
+
+    if packet.link_type == LINKTYPE_ETHERNET:
+        offset = 12
+        while len(data) >= offset + 2:
+            ethertype = unpack_from('!H', data, offset)[0]
+            if ethertype in ETHERTYPE_VLAN:
+                offset += 4
+                continue
+
+            return offset + 2 if ethertype == ETHERTYPE_IPV6 else None
+
+        return None
+
+    elif packet.link_type in (LINKTYPE_RAW, LINKTYPE_IPV6):
+        return 0
+
+    elif packet.link_type == LINKTYPE_NULL:
+        # The address family in host byte order of the capturing machine
+        if len(data) >= 4 and (unpack_from('<I', data)[0] in AF_INET6_VALUES
+                               or unpack_from('>I', data)[0] in AF_INET6_VALUES):
+            return 4
+
+    elif packet.link_type == LINKTYPE_LOOP:
+        if len(data) >= 4 and unpack_from('!I', data)[0] in AF_INET6_VALUES:
+            return 4
+
+    elif packet.link_type == LINKTYPE_LINUX_SLL:
+        if len(data) >= 16 and unpack_from('!H', data, 14)[0] == ETHERTYPE_IPV6:
+            return 16
+
+    elif packet.link_type == LINKTYPE_LINUX_SLL2:
+        if len(data) >= 20 and unpack_from('!H', data)[0] == ETHERTYPE_IPV6:
+            return 20
+
+    return None
+
+
+def decode_udp_datagram(packet: CapturedPacket) -> Optional[UDPDatagram]:
+    """
+    Extract the UDP datagram from a captured IPv6 packet. Packets that don't contain a complete UDP datagram,
+    including fragmented packets, are ignored.
+
+    :param packet: The captured packet
+    :return: The UDP datagram, or None if the packet doesn't contain one
+    """
+    data = packet.data
+    offset = find_ipv6_header(packet)
+    if offset is None or len(data) < offset + 40 or data[offset] >> 4 != 6:
+        return None
+
+    next_header = data[offset + 6]
+    source_address = IPv6Address(data[offset + 8:offset + 24])
+    destination_address = IPv6Address(data[offset + 24:offset + 40])
+    offset += 40
+
+    # Skip the extension headers
+    while next_header != IPPROTO_UDP:
+        if len(data) < offset + 8:
+            return None
+
+        if next_header in (IPPROTO_HOPOPTS, IPPROTO_ROUTING, IPPROTO_DSTOPTS):
+            header_length = (data[offset + 1] + 1) * 8
+        elif next_header == IPPROTO_AH:
+            header_length = (data[offset + 1] + 2) * 4
+        elif next_header == IPPROTO_FRAGMENT:
+            # Only accept atomic fragments
+            if unpack_from('!H', data, offset + 2)[0] & 0xfff9:
+                return None
+            header_length = 8
+        else:
+            return None
+
+        next_header = data[offset]
+        offset += header_length
+
+    if len(data) < offset + 8:
+        return None
+
+    source_port, destination_port, udp_length = unpack_from('!HHH', data, offset)
+    if udp_length < 8 or len(data) < offset + udp_length:
+        # Truncated by the capture's snap length
+        return None
+
+    return UDPDatagram(timestamp=packet.timestamp,
+                       source_address=source_address,
+                       source_port=source_port,
+                       destination_address=destination_address,
+                       destination_port=destination_port,
+                       payload=data[offset + 8:offset + udp_length])
+
+
+def read_udp_datagrams(filename: str, destination_port: int = None) -> Iterator[UDPDatagram]:
+    """
+    Read the UDP datagrams sent over IPv6 from a capture file.
+
+    :param filename: The name of the capture file
+    :param destination_port: Only return datagrams sent to this port
+    :return: The UDP datagrams
+    """
+    for packet in read_capture(filename):
+        datagram = decode_udp_datagram(packet)
+        if datagram and (destination_port is None or datagram.destination_port == destination_port):
+            yield datagram
@@ -65,6 +65,19 @@ def number_of_workers(value: str) -> int:
     return value
 
 
+def batch_size(value: str) -> int:
+    """
+    The number of messages to handle in one go, must be between 1 and 1024
+
+    :param value: The number of messages
+    :return: The validated number of messages
+    """
+    value = int(value)
+    if not (1 <= value <= 1024):
+        raise ValueError("Batch size must be between 1 and 1024")
+    return value
+
+
 def hex_bytes(value: str) -> bytes:
     """
     A sequence of bytes provided as a hexadecimal string.
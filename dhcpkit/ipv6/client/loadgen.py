@@ -0,0 +1,570 @@
+"""
+A load generator that simulates many DHCPv6 clients to measure the throughput, latency and packet loss of a DHCPv6
+server. The clients can talk to the server directly or through a simulated relay.
+"""
+import argparse
+import asyncio
+import logging.handlers
+import random
+import socket
+import sys
+import time
+from argparse import ArgumentDefaultsHelpFormatter
+from collections import OrderedDict
+from ipaddress import IPv6Address
+from struct import pack
+
+from dhcpkit.common.logging.verbosity import set_verbosity_logger
+from dhcpkit.ipv6 import CLIENT_PORT, SERVER_PORT
+from dhcpkit.ipv6.duids import LinkLayerDUID
+from dhcpkit.ipv6.extensions.prefix_delegation import IAPDOption, IAPrefixOption
+from dhcpkit.ipv6.extensions.remote_id import RemoteIdOption
+from dhcpkit.ipv6.messages import ClientServerMessage, Message, RelayForwardMessage, RelayReplyMessage, \
+    ReleaseMessage, RenewMessage, RequestMessage, SolicitMessage
+from dhcpkit.ipv6.options import ClientIdOption, ElapsedTimeOption, IAAddressOption, IANAOption, InterfaceIdOption, \
+    RelayMessageOption, ServerIdOption
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger()
+
+# The exchanges of a client, in order
+EXCHANGES = ('solicit', 'request', 'renew', 'release')
+
+
+def percentile(sorted_values: List[float], percent: int) -> float:
+    """
+    Get a percentile from a sorted list of values
+
+    :param sorted_values: The values, sorted from low to high
+    :param percent: The percentile to get
+    :return: The value at that percentile
+    """
+    return sorted_values[min(len(sorted_values) * percent // 100, len(sorted_values) - 1)]
+
+
+class SimulatedClient:
+    """
+    The identity of a simulated client and the leases it got from the server
+
+    :type number: int
+    :type duid: LinkLayerDUID
+    :type link_local_address: IPv6Address
+    :type iaid: bytes
+    :type prefix_delegation: bool
+    :type server_id_option: ServerIdOption
+    :type ia_options: List[Option]
+    """
+
+    def __init__(self, number: int, prefix_delegation: bool = False):
+        """
+        Create a client with a unique identity
+
+        :param number: The number of the client, used to generate its identity
+        :param prefix_delegation: Whether to ask for a delegated prefix as well as an address
+        """
+        self.number = number
+
+        # A locally administered MAC address based on the client number
+        self.link_layer_address = pack('!HI', 0x0200, number)
+        self.duid = LinkLayerDUID(hardware_type=1, link_layer_address=self.link_layer_address)
+        self.link_local_address = IPv6Address(int(IPv6Address('fe80::200:0:0:0')) + number)
+        self.iaid = pack('!I', number)
+        self.prefix_delegation = prefix_delegation
+
+        self.server_id_option = None
+        self.ia_options = []
+
+    def create_solicit(self, transaction_id: bytes) -> SolicitMessage:
+        """
+        Create a solicit message that asks for an address, and optionally a prefix
+
+        :param transaction_id: The transaction ID
+        :return: The message
+        """
+        options = [
+            ClientIdOption(self.duid),
+            ElapsedTimeOption(0),
+            IANAOption(self.iaid),
+        ]
+        if self.prefix_delegation:
+            options.append(IAPDOption(self.iaid))
+
+        return SolicitMessage(transaction_id, options)
+
+    def create_request(self, transaction_id: bytes) -> RequestMessage:
+        """
+        Create a request for the leases that the server advertised
+
+        :param transaction_id: The transaction ID
+        :return: The message
+        """
+        return RequestMessage(transaction_id, [ClientIdOption(self.duid), self.server_id_option, ElapsedTimeOption(0)]
+                              + self.ia_options)
+
+    def create_renew(self, transaction_id: bytes) -> RenewMessage:
+        """
+        Create a renew for the leases that the server assigned
+
+        :param transaction_id: The transaction ID
+        :return: The message
+        """
+        return RenewMessage(transaction_id, [ClientIdOption(self.duid), self.server_id_option, ElapsedTimeOption(0)]
+                            + self.ia_options)
+
+    def create_release(self, transaction_id: bytes) -> ReleaseMessage:
+        """
+        Create a release for the leases that the server assigned
+
+        :param transaction_id: The transaction ID
+        :return: The message
+        """
+        return ReleaseMessage(transaction_id, [ClientIdOption(self.duid), self.server_id_option, ElapsedTimeOption(0)]
+                              + self.ia_options)
+
+    def update(self, response: ClientServerMessage):
+        """
+        Remember the server and the leases from an advertise or reply
+
+        :param response: The message from the server
+        """
+        self.server_id_option = response.get_option_of_type(ServerIdOption) or self.server_id_option
+
+        # Keep the addresses and prefixes without their lifetimes and status codes
+        self.ia_options = []
+        for option in response.get_options_of_type(IANAOption):
+            self.ia_options.append(IANAOption(option.iaid, options=[
+                IAAddressOption(suboption.address) for suboption in option.get_options_of_type(IAAddressOption)
+            ]))
+
+        for option in response.get_options_of_type(IAPDOption):
+            self.ia_options.append(IAPDOption(option.iaid, options=[
+                IAPrefixOption(suboption.prefix) for suboption in option.get_options_of_type(IAPrefixOption)
+            ]))
+
+
+class ExchangeStatistics:
+    """
+    Counters and latencies for one type of exchange
+
+    :type sent: int
+    :type received: int
+    :type lost: int
+    :type latencies: List[float]
+    """
+
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+        self.lost = 0
+        self.latencies = []
+
+    def export(self) -> Dict[str, float]:
+        """
+        Export the counters and the latency percentiles in milliseconds
+
+        :return: The statistics in a processable format
+        """
+        data = OrderedDict([
+            ('sent', self.sent),
+            ('received', self.received),
+            ('lost', self.lost),
+        ])
+
+        if self.latencies:
+            latencies = sorted(self.latencies)
+            for percent in (50, 90, 99):
+                data['latency_p{}'.format(percent)] = round(percentile(latencies, percent) * 1000, 3)
+            data['latency_max'] = round(latencies[-1] * 1000, 3)
+
+        return data
+
+
+class LoadGeneratorProtocol(asyncio.DatagramProtocol):
+    """
+    Pass received datagrams to the load generator
+    """
+
+    def __init__(self, load_generator: 'LoadGenerator'):
+        self.load_generator = load_generator
+
+    def datagram_received(self, data: bytes, addr: tuple):
+        """
+        Handle a datagram from the server
+
+        :param data: The received data
+        :param addr: The address of the sender
+        """
+        self.load_generator.response_received(data)
+
+    def error_received(self, exc: Exception):
+        """
+        Log errors, for example when the server isn't listening
+
+        :param exc: The error
+        """
+        logger.debug("Error on load generator socket: {}".format(exc))
+
+
+class LoadGenerator:
+    """
+    Simulate clients that go through the normal DHCPv6 exchanges, starting them at a fixed rate.
+
+    :type server_address: IPv6Address
+    :type server_port: int
+    :type relay_link_address: IPv6Address
+    :type interface_id: bytes
+    :type remote_id_enterprise: int
+    :type exchanges: List[str]
+    :type timeout: float
+    :type statistics: Dict[str, ExchangeStatistics]
+    """
+
+    def __init__(self, server_address: IPv6Address, server_port: int = SERVER_PORT,
+                 relay_link_address: IPv6Address = None, interface_id: bytes = None,
+                 remote_id_enterprise: int = None, exchanges: Iterable[str] = ('solicit', 'request'),
+                 timeout: float = 2.0, prefix_delegation: bool = False):
+        """
+        Configure the load generator
+
+        :param server_address: The address of the server
+        :param server_port: The port the server listens on
+        :param relay_link_address: Wrap the messages in a relay-forward with this link address, or send them directly
+        :param interface_id: The interface-id to add to relayed messages
+        :param remote_id_enterprise: Add a remote-id with this enterprise number and the client's MAC address to
+                                     relayed messages
+        :param exchanges: The exchanges each client goes through, in the order of :data:`EXCHANGES`
+        :param timeout: How long to wait for a response before counting it as lost
+        :param prefix_delegation: Whether the clients ask for a delegated prefix as well as an address
+        """
+        self.server_address = server_address
+        self.server_port = server_port
+        self.relay_link_address = relay_link_address
+        self.interface_id = interface_id
+        self.remote_id_enterprise = remote_id_enterprise
+        self.exchanges = [exchange for exchange in EXCHANGES if exchange in exchanges]
+        self.timeout = timeout
+        self.prefix_delegation = prefix_delegation
+
+        self.loop = None
+        self.transport = None
+        self.next_transaction_id = random.getrandbits(24)
+        self.pending = {}
+
+        self.statistics = OrderedDict((exchange, ExchangeStatistics()) for exchange in self.exchanges)
+        self.clients_started = 0
+        self.clients_completed = 0
+        self.duration = 0.0
+
+    def wrap(self, client: SimulatedClient, message: ClientServerMessage) -> Message:
+        """
+        Wrap the message in a relay-forward message if we are simulating a relay
+
+        :param client: The client that sends the message
+        :param message: The message
+        :return: The message to send to the server
+        """
+        if not self.relay_link_address:
+            return message
+
+        options = []
+        if self.interface_id:
+            options.append(InterfaceIdOption(self.interface_id))
+        if self.remote_id_enterprise is not None:
+            options.append(RemoteIdOption(self.remote_id_enterprise, client.link_layer_address))
+        options.append(RelayMessageOption(message))
+
+        return RelayForwardMessage(hop_count=0, link_address=self.relay_link_address,
+                                   peer_address=client.link_local_address, options=options)
+
+    def response_received(self, data: bytes):
+        """
+        Match a response to the transaction that is waiting for it
+
+        :param data: The received data
+        """
+        try:
+            length, message = Message.parse(data)
+            if isinstance(message, RelayReplyMessage):
+                message = message.inner_message
+        except ValueError as e:
+            logger.debug("Ignoring unparsable response: {}".format(e))
+            return
+
+        future = self.pending.pop(getattr(message, 'transaction_id', None), None)
+        if future and not future.done():
+            future.set_result(message)
+
+    async def exchange(self, client: SimulatedClient, exchange: str) -> Optional[ClientServerMessage]:
+        """
+        Send a message to the server and wait for the response
+
+        :param client: The client that sends the message
+        :param exchange: The name of the exchange
+        :return: The response, or None if it was lost
+        """
+        transaction_id = self.next_transaction_id.to_bytes(3, 'big')
+        self.next_transaction_id = (self.next_transaction_id + 1) & 0xffffff
+
+        message = getattr(client, 'create_' + exchange)(transaction_id)
+        data = self.wrap(client, message).save()
+
+        if hasattr(self.loop, 'create_future'):
+            future = self.loop.create_future()
+        else:
+            # Python 3.5.0 and 3.5.1 don't have loop.create_future()
+            future = asyncio.Future(loop=self.loop)
+        self.pending[transaction_id] = future
+
+        statistics = self.statistics[exchange]
+        statistics.sent += 1
+        start = time.perf_counter()
+        self.transport.sendto(data, (str(self.server_address), self.server_port))
+
+        try:
+            response = await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            self.pending.pop(transaction_id, None)
+            statistics.lost += 1
+            return None
+
+        statistics.received += 1
+        statistics.latencies.append(time.perf_counter() - start)
+        return response
+
+    async def run_client(self, client: SimulatedClient):
+        """
+        Let a client go through the exchanges. The client gives up when a response is lost.
+
+        :param client: The client
+        """
+        for exchange in self.exchanges:
+            response = await self.exchange(client, exchange)
+            if not response:
+                return
+
+            if exchange != 'release':
+                client.update(response)
+
+        self.clients_completed += 1
+
+    async def run(self, sock: socket.socket, client_count: int, rate: float = 0.0, concurrency: int = 1000,
+                  first_client: int = 0):
+        """
+        Start the clients at the given rate and wait until they are all done
+
+        :param sock: The UDP socket to send from
+        :param client_count: The number of clients to simulate
+        :param rate: The number of clients to start per second, or as fast as possible when 0
+        :param concurrency: The maximum number of clients that are active at the same time
+        :param first_client: The number of the first client, to use different clients in consecutive runs
+        """
+        self.loop = asyncio.get_event_loop()
+        self.transport, protocol = await self.loop.create_datagram_endpoint(lambda: LoadGeneratorProtocol(self),
+                                                                            sock=sock)
+
+        slots = asyncio.Semaphore(concurrency)
+        tasks = []
+
+        async def limited(client: SimulatedClient):
+            try:
+                await self.run_client(client)
+            finally:
+                slots.release()
+
+        start = time.perf_counter()
+        try:
+            for number in range(client_count):
+                if rate:
+                    delay = start + number / rate - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+
+                await slots.acquire()
+                self.clients_started += 1
+                tasks.append(asyncio.ensure_future(limited(SimulatedClient(first_client + number,
+                                                                          self.prefix_delegation))))
+
+            await asyncio.gather(*tasks)
+        finally:
+            self.duration = time.perf_counter() - start
+            self.transport.close()
+
+    @property
+    def loss(self) -> float:
+        """
+        The percentage of messages that didn't get a response
+        """
+        sent = sum(statistics.sent for statistics in self.statistics.values())
+        lost = sum(statistics.lost for statistics in self.statistics.values())
+        return lost * 100 / sent if sent else 0.0
+
+    def export(self) -> Dict[str, object]:
+        """
+        Export the results
+
+        :return: The results in a processable format
+        """
+        received = sum(statistics.received for statistics in self.statistics.values())
+        return OrderedDict([
+            ('clients_started', self.clients_started),
+            ('clients_completed', self.clients_completed),
+            ('duration', round(self.duration, 3)),
+            ('exchanges_per_second', round(received / self.duration, 1) if self.duration else 0.0),
+            ('loss', round(self.loss, 2)),
+            ('exchanges', OrderedDict((exchange, statistics.export())
+                                      for exchange, statistics in self.statistics.items())),
+        ])
+
+    def __str__(self):
+        data = self.export()
+        lines = [
+            "Clients started: {}".format(data['clients_started']),
+            "Clients completed: {}".format(data['clients_completed']),
+            "Duration: {} seconds".format(data['duration']),
+            "Exchanges per second: {}".format(data['exchanges_per_second']),
+            "Loss: {}%".format(data['loss']),
+        ]
+        for exchange, exchange_data in data['exchanges'].items():
+            lines += ['', exchange.capitalize()]
+            lines += ['- {}: {}'.format(key.replace('_', ' ').capitalize(), value)
+                      for key, value in exchange_data.items()]
+        return '\n'.join(lines)
+
+
+def create_socket(bind_address: IPv6Address, bind_port: int) -> socket.socket:
+    """
+    Create the UDP socket to send from. The server sends its replies to the client port, or to the server port when
+    we simulate a relay, so those are the ports we normally need to bind to.
+
+    :param bind_address: The address to bind to
+    :param bind_port: The port to bind to
+    :return: The socket
+    """
+    sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+    # Don't lose responses when the server replies in bursts
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+
+    sock.bind((str(bind_address), bind_port))
+    sock.setblocking(False)
+    return sock
+
+
+def handle_args(args: Iterable[str]):
+    """
+    Handle the command line arguments.
+
+    :param args: Command line arguments
+    :return: The arguments object
+    """
+    parser = argparse.ArgumentParser(
+        description="A load generator that simulates many DHCPv6 clients",
+        formatter_class=ArgumentDefaultsHelpFormatter
+    )
+
+    parser.add_argument("-v", "--verbosity", action="count", default=2,
+                        help="increase output verbosity")
+    parser.add_argument("-s", "--server", action="store", metavar="ADDR", type=IPv6Address, default="::1",
+                        help="server address to send messages to")
+    parser.add_argument("-p", "--port", action="store", type=int, default=SERVER_PORT,
+                        help="server port to send messages to")
+    parser.add_argument("-b", "--bind", action="store", metavar="ADDR", type=IPv6Address, default="::",
+                        help="address to send messages from")
+    parser.add_argument("--bind-port", action="store", type=int,
+                        help="port to send messages from, default is the client port or the server port when "
+                             "relaying")
+    parser.add_argument("-n", "--clients", action="store", type=int, default=1000,
+                        help="the number of clients to simulate")
+    parser.add_argument("-r", "--rate", action="store", type=float, default=100.0,
+                        help="the number of clients to start per second, 0 for as fast as possible")
+    parser.add_argument("-c", "--concurrency", action="store", type=int, default=1000,
+                        help="the maximum number of clients that are active at the same time")
+    parser.add_argument("-t", "--timeout", action="store", type=float, default=2.0,
+                        help="seconds to wait for a response before counting it as lost")
+    parser.add_argument("-P", "--prefix-delegation", action="store_true",
+                        help="ask for a delegated prefix as well as an address")
+    parser.add_argument("--renew", action="store_true",
+                        help="renew the leases after getting them")
+    parser.add_argument("--release", action="store_true",
+                        help="release the leases at the end")
+    parser.add_argument("-L", "--relay-link-address", action="store", metavar="ADDR", type=IPv6Address,
+                        help="simulate a relay with this link address")
+    parser.add_argument("-I", "--interface-id", action="store",
+                        help="add this interface-id to relayed messages")
+    parser.add_argument("-R", "--remote-id-enterprise", action="store", metavar="ENTERPRISE_NR", type=int,
+                        help="add a remote-id with this enterprise number and the client's MAC address to relayed "
+                             "messages")
+    parser.add_argument("--max-loss", action="store", type=float, metavar="PERCENT",
+                        help="exit with an error when more than this percentage of messages are lost")
+
+    return parser.parse_args(args)
+
+
+def main(args: Iterable[str]) -> int:
+    """
+    The main program
+
+    :param args: Command line arguments
+    :return: The program exit code
+    """
+    options = handle_args(args)
+    set_verbosity_logger(logger, options.verbosity)
+
+    exchanges = ['solicit', 'request']
+    if options.renew:
+        exchanges.append('renew')
+    if options.release:
+        exchanges.append('release')
+
+    load_generator = LoadGenerator(server_address=options.server,
+                                   server_port=options.port,
+                                   relay_link_address=options.relay_link_address,
+                                   interface_id=options.interface_id.encode('utf-8') if options.interface_id else None,
+                                   remote_id_enterprise=options.remote_id_enterprise,
+                                   exchanges=exchanges,
+                                   timeout=options.timeout,
+                                   prefix_delegation=options.prefix_delegation)
+
+    bind_port = options.bind_port
+    if bind_port is None:
+        bind_port = SERVER_PORT if options.relay_link_address else CLIENT_PORT
+
+    sock = create_socket(options.bind, bind_port)
+
+    logger.info("Simulating {} clients".format(options.clients))
+
+    # Coroutines that don't get the loop passed to them use the current event loop
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(load_generator.run(sock, options.clients, options.rate, options.concurrency))
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+    print(load_generator)
+
+    if options.max_loss is not None and load_generator.loss > options.max_loss:
+        logger.error("Lost {:.2f}% of the messages, more than the allowed {}%".format(load_generator.loss,
+                                                                                    options.max_loss))
+        return 1
+
+    return 0
+
+
+def run() -> int:
+    """
+    Run the main program and handle exceptions
+
+    :return: The program exit code
+    """
+    try:
+        return main(sys.argv[1:])
+    except Exception as e:
+        logger.critical("Error: {}".format(e))
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(run())
@@ -258,6 +258,9 @@ class ClientIdOption(Option):
         self.duid = duid
         """The DUID of the client"""
 
+        self.received_duid = None
+        """The parsed DUID, and the buffer, offset and length it was parsed from"""
+
     def validate(self):
         """
         Validate that the contents of this object conform to protocol specs.
@@ -279,11 +282,29 @@ class ClientIdOption(Option):
         """
         my_offset, option_len = self.parse_option_header(buffer, offset, length, min_length=2)
 
-        duid_len, self.duid = DUID.parse(buffer, offset=offset + my_offset, length=option_len)
+        duid_offset = offset + my_offset
+        duid_len, self.duid = DUID.parse(buffer, offset=duid_offset, length=option_len)
         my_offset += duid_len
 
+        # Remember where the DUID was received so looking it up doesn't have to save it again
+        self.received_duid = (self.duid, buffer, duid_offset, duid_len)
+
         return my_offset
 
+    def get_duid_bytes(self) -> bytes:
+        """
+        Get the DUID as bytes to look it up. When the DUID was parsed from a buffer and hasn't been replaced since, the
+        bytes it was parsed from are returned instead of saving the DUID again. Changes made to the DUID object itself
+        are not seen, so use :meth:`save` to encode the option.
+
+        :return: The DUID as bytes
+        """
+        if self.received_duid and self.received_duid[0] is self.duid:
+            duid, buffer, duid_offset, duid_len = self.received_duid
+            return bytes(buffer[duid_offset:duid_offset + duid_len])
+
+        return self.duid.save()
+
     def save(self) -> Union[bytes, bytearray]:
         """
         Save the internal state of this object as a buffer.
@@ -6,8 +6,10 @@ import grp
 import logging
 
 from dhcpkit.common.server.config_elements import ConfigSection
+from dhcpkit.ipv6.server.dispatch_filters import DispatchFilter, ServerIdDispatchFilter
 from dhcpkit.ipv6.server.message_handler import MessageHandler
 from dhcpkit.ipv6.server.utils import determine_local_duid
+from typing import List
 
 logger = logging.getLogger(__name__)
 
@@ -32,6 +34,22 @@ class MainConfig(ConfigSection):
         if not self.section.server_id:
             self.section.server_id = determine_local_duid()
 
+    def create_dispatch_filters(self) -> List[DispatchFilter]:
+        """
+        Create the dispatch filters based on this configuration.
+
+        :return: The dispatch filters
+        """
+        dispatch_filters = []
+        if self.section.early_server_id_check:
+            # Check this first, so that requests for other servers don't count towards any limits
+            dispatch_filters.append(ServerIdDispatchFilter(self.section.server_id))
+
+        for dispatch_filter_factory in self.section.dispatch_filter_factories:
+            dispatch_filters.append(dispatch_filter_factory())
+
+        return dispatch_filters
+
     def create_message_handler(self) -> MessageHandler:
         """
         Create a message handler based on this configuration.
@@ -53,3 +71,10 @@ class StatisticsConfig(ConfigSection):
     """
     Configuration of the statistics gatherer
     """
+
+    def validate_config_section(self):
+        """
+        Check that the heavy hitter settings make sense
+        """
+        if self.top_n_half_life <= 0:
+            raise ValueError("The half-life of the top-N statistics must be positive")
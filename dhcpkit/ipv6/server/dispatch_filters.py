@@ -0,0 +1,91 @@
+"""
+Dispatch filters run in the master process and can drop incoming packets before they are sent to a worker process.
+They only see a quickly scanned version of the packet, so they must be cheap and they must not rely on a fully parsed
+and validated message.
+"""
+from dhcpkit.common.server.config_elements import ConfigElementFactory
+from dhcpkit.ipv6.duids import DUID
+from dhcpkit.ipv6.server.packet_scanner import ScannedPacket
+from dhcpkit.ipv6.server.statistics import StatisticsSet
+from typing import Dict
+
+
+class DispatchFilter:
+    """
+    Base class for dispatch filters
+    """
+
+    def __str__(self):
+        """
+        Return a representation of this dispatch filter for logging purposes
+
+        :return: A descriptive string
+        """
+        return self.__class__.__name__
+
+    def allow(self, packet: ScannedPacket) -> bool:
+        """
+        Decide whether the packet may be dispatched to a worker process
+
+        :param packet: The scanned incoming packet
+        :return: Whether to dispatch the packet
+        """
+        raise NotImplementedError
+
+    def count_dropped_packet(self, packet: ScannedPacket, statistics: StatisticsSet):
+        """
+        Update the statistics for a packet that this filter dropped. The incoming packet has already been counted.
+
+        :param packet: The scanned incoming packet
+        :param statistics: The statistics to update
+        """
+        statistics.count_dropped_packet()
+
+    def export_statistics(self) -> Dict[str, dict]:
+        """
+        Export statistics about this dispatch filter, keyed by its description.
+
+        :return: The statistics in a processable format
+        """
+        return {}
+
+
+class DispatchFilterFactory(ConfigElementFactory):
+    """
+    Base class for dispatch filter factories
+    """
+
+
+class ServerIdDispatchFilter(DispatchFilter):
+    """
+    Drop requests that contain the server-id of another server, without waiting for the
+    :class:`.ServerIdHandler` in a worker process to reject them. The server-id in the request is compared byte-wise
+    to our own serialised DUID.
+    """
+
+    def __init__(self, duid: DUID):
+        self.duid = duid
+        self.raw_duid = bytes(duid.save())
+
+    def __str__(self):
+        return "{} for {}".format(self.__class__.__name__, self.duid)
+
+    def allow(self, packet: ScannedPacket) -> bool:
+        """
+        Check whether the request is meant for this server.
+
+        :param packet: The scanned incoming packet
+        :return: Whether to dispatch the packet
+        """
+        server_duid = packet.server_duid
+        return server_duid is None or server_duid == self.raw_duid
+
+    def count_dropped_packet(self, packet: ScannedPacket, statistics: StatisticsSet):
+        """
+        Count the request like the message handler would have done.
+
+        :param packet: The scanned incoming packet
+        :param statistics: The statistics to update
+        """
+        statistics.count_message_in(packet.message_type)
+        statistics.count_for_other_server()
@@ -1,8 +1,8 @@
 """
 Implementation of the Leasequery and Bulk Leasequery extensions.
 """
-import codecs
 import logging
+import multiprocessing
 from ipaddress import IPv6Address, IPv6Network
 
 from typing import Iterable, Iterator, List, Optional, Tuple, Union
@@ -180,7 +180,7 @@ class LeasequeryStore:
         :param duid: The DUID object
         :return: The string representing the DUID
         """
-        return codecs.encode(duid.save(), 'hex').decode('ascii')
+        return duid.save().hex()
 
     @staticmethod
     def decode_duid(duid_str: str) -> DUID:
@@ -202,8 +202,7 @@ class LeasequeryStore:
         :param remote_id_option: The remote-id option
         :return: The string representing the remote-id
         """
-        return "{}:{}".format(remote_id_option.enterprise_number,
-                              codecs.encode(remote_id_option.remote_id, 'hex').decode('ascii'))
+        return "{}:{}".format(remote_id_option.enterprise_number, remote_id_option.remote_id.hex())
 
     @staticmethod
     def decode_remote_id(remote_id_str: str) -> RemoteIdOption:
@@ -239,7 +238,7 @@ class LeasequeryStore:
         """
         for relay_message in bundle.incoming_relay_messages:
             for relay_id_option in relay_message.get_options_of_type(RelayIdOption):
-                yield codecs.encode(relay_id_option.duid.save(), 'hex').decode('ascii')
+                yield relay_id_option.duid.save().hex()
 
     def get_address_leases(self, bundle: TransactionBundle) -> Iterator[IAAddressOption]:
         """
@@ -369,19 +368,62 @@ class LeasequeryStore:
         return LQRelayDataOption(peer_address, relay_chain)
 
 
+class BulkTransfer:
+    """
+    A slot for sending a bulk leasequery reply. The slot is released when all messages have been sent, or when the
+    messages are discarded without sending them all.
+    """
+
+    def __init__(self, semaphore: multiprocessing.BoundedSemaphore):
+        """
+        Take ownership of a slot that has already been acquired.
+
+        :param semaphore: The semaphore that the slot was acquired from
+        """
+        self.semaphore = semaphore
+        self.active = True
+
+    def __del__(self):
+        self.release()
+
+    def release(self):
+        """
+        Release the slot, if it hasn't been released yet.
+        """
+        if self.active:
+            self.active = False
+            self.semaphore.release()
+
+    def messages(self, messages: Iterator[Message]) -> Iterator[Message]:
+        """
+        Iterate over the messages and release the slot at the end.
+
+        :param messages: The messages to send
+        :return: The same messages
+        """
+        try:
+            yield from messages
+        finally:
+            self.release()
+
+
 class LeasequeryHandler(Handler):
     """
     Handle leasequery requests and analyse replies that we send out to store any observed leases.
     """
 
     def __init__(self, store: LeasequeryStore, allow_from: Iterable[IPv6Network] = None,
-                 sensitive_options: Iterable[int] = None):
+                 sensitive_options: Iterable[int] = None, max_bulk_transfers: int = 4):
         super().__init__()
 
         self.store = store
         self.allow_from = list(allow_from or [])
         self.sensitive_options = list(sensitive_options or [])
 
+        # Limit the number of bulk leasequery replies that are being sent at the same time, over all workers
+        self.max_bulk_transfers = max_bulk_transfers
+        self.bulk_transfers = multiprocessing.BoundedSemaphore(max_bulk_transfers)
+
     def worker_init(self):
         """
         Make sure the store gets a chance to initialise itself.
@@ -449,6 +491,17 @@ class LeasequeryHandler(Handler):
 
         # What we do now depends on the protocol
         if bundle.received_over_tcp:
+            bulk_transfer = None
+            if lease_count > 0:
+                # Make sure we don't send too many bulk replies at the same time
+                if not self.bulk_transfers.acquire(block=False):
+                    logger.warning("Already sending {} bulk leasequery replies, refusing another one".format(
+                        self.max_bulk_transfers))
+                    raise ReplyWithLeasequeryError(STATUS_QUERY_TERMINATED,
+                                                   "Server is busy, please try again later")
+
+                bulk_transfer = BulkTransfer(self.bulk_transfers)
+
             try:
                 if lease_count > 0:
                     # We're doing bulk leasequery, return all the records in separate messages
@@ -457,9 +510,9 @@ class LeasequeryHandler(Handler):
                     first_message = bundle.response
                     first_message.options.append(first_data_option)
 
-                    bundle.responses = MessagesList(first_message,
-                                                    self.generate_data_messages(first_message.transaction_id,
-                                                                                leases_iterator))
+                    bundle.responses = MessagesList(first_message, bulk_transfer.messages(
+                        self.generate_data_messages(first_message.transaction_id, leases_iterator)
+                    ))
                 else:
                     # If the server does not find any bindings satisfying a query, it
                     # SHOULD send a LEASEQUERY-REPLY without an OPTION_STATUS_CODE option
@@ -467,6 +520,9 @@ class LeasequeryHandler(Handler):
                     pass
             except:
                 # Something went wrong (database changes while reading?), abort
+                if bulk_transfer:
+                    bulk_transfer.release()
+
                 logger.exception("Error while building bulk leasequery response")
                 raise ReplyWithLeasequeryError(STATUS_QUERY_TERMINATED,
                                                "Error constructing your reply, please try again")
@@ -33,6 +33,19 @@ def sensitive_option_name(value: str) -> int:
             raise ValueError("Option {} is not a valid DHCPv6 option".format(value))
 
 
+def bulk_transfer_count(value: str) -> int:
+    """
+    The number of bulk leasequery replies that can be sent at the same time, must be between 1 and 255
+
+    :param value: The number of bulk leasequery replies
+    :return: The validated number of bulk leasequery replies
+    """
+    value = int(value)
+    if not (1 <= value <= 255):
+        raise ValueError("The number of bulk transfers must be between 1 and 255")
+    return value
+
+
 class LeasequeryHandlerFactory(HandlerFactory):
     """
     Config processing for a handler to echo a LinkLayerIdOption back to the relay
@@ -47,7 +60,7 @@ class LeasequeryHandlerFactory(HandlerFactory):
 
         :return: A leasequery handler
         """
-        return LeasequeryHandler(self.store(), self.allow_from, self.sensitive_options)
+        return LeasequeryHandler(self.store(), self.allow_from, self.sensitive_options, self.max_bulk_transfers)
 
 
 class LeasequerySqliteStoreFactory(ConfigElementFactory):
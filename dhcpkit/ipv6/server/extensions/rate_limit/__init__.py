@@ -2,11 +2,16 @@
 Handler to rate limit clients that keep rapidly sending requests.
 """
 import logging
+from collections import OrderedDict
 
-from dhcpkit.ipv6.server.extensions.rate_limit.key_functions import duid_key
-from dhcpkit.ipv6.server.extensions.rate_limit.manager import RateLimitManager
+from dhcpkit.common.server.logging import DEBUG_HANDLING
+from dhcpkit.ipv6.server.dispatch_filters import DispatchFilter
+from dhcpkit.ipv6.server.extensions.rate_limit.counters import RateLimitCounters, check_hierarchical_request
+from dhcpkit.ipv6.server.extensions.rate_limit.key_functions import duid_key, raw_duid_key
 from dhcpkit.ipv6.server.handlers import CannotRespondError, Handler
+from dhcpkit.ipv6.server.packet_scanner import ScannedPacket
 from dhcpkit.ipv6.server.transaction_bundle import TransactionBundle
+from typing import Dict, Iterable
 
 # Create the logger
 logger = logging.getLogger(__name__)
@@ -21,15 +26,11 @@ class RateLimitHandler(Handler):
     responding to them.
     """
 
-    def __init__(self, key=duid_key, rate: int = 5, per: int = 30, burst: int = None):
+    def __init__(self, key=duid_key, rate: int = 5, per: int = 30, burst: int = None, max_clients: int = 16384):
         super().__init__()
 
-        # Create a dictionary that will be shared between child processes
-        my_manager = RateLimitManager()
-        my_manager.start()
-
-        # noinspection PyUnresolvedReferences
-        self.shared_counters = my_manager.RateLimitCounters(rate, per, burst)
+        # Create counters in shared memory that will be shared between child processes
+        self.shared_counters = RateLimitCounters(rate, per, burst, max_clients)
 
         # Set the key extraction function
         self.key = key
@@ -38,6 +39,14 @@ class RateLimitHandler(Handler):
         return "{} on {}".format(self.__class__.__name__,
                                  self.key.__name__)
 
+    def export_statistics(self) -> Dict[str, dict]:
+        """
+        Export the statistics of the shared counters.
+
+        :return: The statistics in a processable format
+        """
+        return {str(self): self.shared_counters.export()}
+
     def pre(self, bundle: TransactionBundle):
         """
         Check the rate of incoming requests from this client and stop processing
@@ -49,3 +58,108 @@ class RateLimitHandler(Handler):
         allow = self.shared_counters.check_request(key)
         if not allow:
             raise CannotRespondError("Client {} has exceeded rate limit".format(key))
+
+
+class RateLimitLevel:
+    """
+    One level of a hierarchical rate limit, with its own key function and limits.
+
+    :type key: FunctionType
+    :type shared_counters: RateLimitCounters
+    """
+
+    def __init__(self, key=duid_key, rate: int = 5, per: int = 30, burst: int = None, max_clients: int = 16384):
+        # Each level keeps its own counters in shared memory
+        self.shared_counters = RateLimitCounters(rate, per, burst, max_clients)
+
+        # Set the key extraction function
+        self.key = key
+
+    def __str__(self):
+        return "{} on {}".format(self.__class__.__name__,
+                                 self.key.__name__)
+
+
+class HierarchicalRateLimitHandler(Handler):
+    """
+    Handler to rate limit requests on multiple levels at once, for example per client within a budget per link within
+    a budget per relay. That way a single misbehaving access network can't use up the capacity of the whole server
+    while clients behind other relays are still being served.
+    """
+
+    def __init__(self, levels: Iterable[RateLimitLevel]):
+        super().__init__()
+
+        self.levels = list(levels)
+
+    def __str__(self):
+        return "{} on {}".format(self.__class__.__name__,
+                                 ', '.join([level.key.__name__ for level in self.levels]))
+
+    def export_statistics(self) -> Dict[str, dict]:
+        """
+        Export the statistics of each level, so the rejections show where requests are being dropped.
+
+        :return: The statistics in a processable format
+        """
+        out = OrderedDict()
+        for index, level in enumerate(self.levels, start=1):
+            name = "{} level {} on {}".format(self.__class__.__name__, index, level.key.__name__)
+            out[name] = level.shared_counters.export()
+        return out
+
+    def pre(self, bundle: TransactionBundle):
+        """
+        Check the rate of incoming requests on all levels and stop processing when any of them is exceeded.
+
+        :param bundle: The transaction bundle
+        """
+        keys = [level.key(bundle) for level in self.levels]
+        rejected = check_hierarchical_request([(level.shared_counters, key)
+                                               for level, key in zip(self.levels, keys)])
+        if rejected is not None:
+            raise CannotRespondError("Rate limit for {} has been exceeded".format(keys[rejected]))
+
+
+class RateLimitDispatchFilter(DispatchFilter):
+    """
+    Dispatch filter to rate limit clients before their requests are sent to a worker process. This protects the
+    worker processes when a large number of clients is misbehaving at the same time.
+    """
+
+    def __init__(self, key=raw_duid_key, rate: int = 5, per: int = 30, burst: int = None, max_clients: int = 16384):
+        # Keep track of clients in a fixed-size table, just like the handler does
+        self.shared_counters = RateLimitCounters(rate, per, burst, max_clients)
+
+        # Set the key extraction function
+        self.key = key
+
+    def __str__(self):
+        return "{} on {}".format(self.__class__.__name__,
+                                 self.key.__name__)
+
+    def export_statistics(self) -> Dict[str, dict]:
+        """
+        Export the statistics of the shared counters.
+
+        :return: The statistics in a processable format
+        """
+        return {str(self): self.shared_counters.export()}
+
+    def allow(self, packet: ScannedPacket) -> bool:
+        """
+        Check the rate of incoming packets from this client.
+
+        :param packet: The scanned incoming packet
+        :return: Whether to dispatch the packet
+        """
+        key = self.key(packet)
+        if key is None:
+            # Can't identify the client, let the worker decide
+            return True
+
+        allow = self.shared_counters.check_request(key)
+        if not allow and logger.isEnabledFor(DEBUG_HANDLING):
+            logger.log(DEBUG_HANDLING, "Client {} has exceeded rate limit".format(key))
+
+        return allow
@@ -3,8 +3,11 @@ Config processing for a handler to rate limit clients
 """
 from types import FunctionType
 
-from dhcpkit.ipv6.server.extensions.rate_limit import RateLimitHandler
-from dhcpkit.ipv6.server.extensions.rate_limit.key_functions import key_function_map
+from dhcpkit.common.server.config_elements import ConfigElementFactory
+from dhcpkit.ipv6.server.dispatch_filters import DispatchFilterFactory
+from dhcpkit.ipv6.server.extensions.rate_limit import HierarchicalRateLimitHandler, RateLimitDispatchFilter, \
+    RateLimitHandler, RateLimitLevel
+from dhcpkit.ipv6.server.extensions.rate_limit.key_functions import key_function_map, raw_key_function_map
 from dhcpkit.ipv6.server.handlers import HandlerFactory
 
 
@@ -21,6 +24,19 @@ def key_function(key_name: str) -> FunctionType:
         raise ValueError("Unknown key function '{}'".format(key_name))
 
 
+def raw_key_function(key_name: str) -> FunctionType:
+    """
+    Map from name to key extraction function for scanned packets.
+
+    :param key_name: The name of the function
+    :return: The specified function
+    """
+    try:
+        return raw_key_function_map[key_name.lower()]
+    except KeyError:
+        raise ValueError("Unknown key function '{}'".format(key_name))
+
+
 def rate(configured_rate: str) -> int:
     """
     Convert the config rate to an integer.
@@ -59,4 +75,51 @@ class RateLimitHandlerFactory(HandlerFactory):
         :return: A handler object
         """
         return RateLimitHandler(key=self.section.key,
-                                rate=self.section.rate, per=self.section.per, burst=self.section.burst)
+                                rate=self.section.rate, per=self.section.per, burst=self.section.burst,
+                                max_clients=self.section.max_clients)
+
+
+class RateLimitLevelFactory(ConfigElementFactory):
+    """
+    Config processing for one level of a hierarchical rate limit
+    """
+
+    def create(self) -> RateLimitLevel:
+        """
+        Create a rate limit level based on the configuration in the config section.
+
+        :return: A rate limit level
+        """
+        return RateLimitLevel(key=self.section.key,
+                              rate=self.section.rate, per=self.section.per, burst=self.section.burst,
+                              max_clients=self.section.max_clients)
+
+
+class HierarchicalRateLimitHandlerFactory(HandlerFactory):
+    """
+    Config processing for a handler to rate limit requests on multiple levels
+    """
+
+    def create(self) -> HierarchicalRateLimitHandler:
+        """
+        Create a handler of this class based on the configuration in the config section.
+
+        :return: A handler object
+        """
+        return HierarchicalRateLimitHandler(levels=[level() for level in self.section.levels])
+
+
+class RateLimitDispatchFilterFactory(DispatchFilterFactory):
+    """
+    Config processing for a dispatch filter to rate limit clients
+    """
+
+    def create(self) -> RateLimitDispatchFilter:
+        """
+        Create a dispatch filter of this class based on the configuration in the config section.
+
+        :return: A dispatch filter object
+        """
+        return RateLimitDispatchFilter(key=self.section.key,
+                                       rate=self.section.rate, per=self.section.per, burst=self.section.burst,
+                                       max_clients=self.section.max_clients)
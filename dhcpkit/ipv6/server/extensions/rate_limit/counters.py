@@ -0,0 +1,228 @@
+"""
+Rate limit counters in shared memory that all worker processes update directly
+"""
+import logging
+import multiprocessing
+import time
+from collections import OrderedDict
+from contextlib import ExitStack
+from ctypes import c_double, c_uint64
+from hashlib import sha1
+from multiprocessing.sharedctypes import RawArray
+
+from typing import Dict, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# The number of entries that a key can be stored in
+GROUP_SIZE = 8
+
+# The number of locks that protect the groups
+LOCK_STRIPES = 64
+
+
+def key_hash(key: str) -> int:
+    """
+    Calculate a 64-bit hash of the key that is the same in all processes. Zero is reserved for empty entries.
+
+    :param key: The key
+    :return: The hash
+    """
+    value = int.from_bytes(sha1(key.encode('utf-8')).digest()[:8], 'big')
+    return value or 1
+
+
+class RateLimitCounters:
+    """
+    Counters for rate limiting of DHCPv6 requests, stored in a fixed-size set-associative hash table in shared memory.
+    Each key maps to a group of entries that is protected by one of a set of striped locks. An entry whose bucket has
+    filled up again is equivalent to an absent one and can be re-used. When all entries of a group are still in use the
+    least recently used one is evicted.
+    """
+
+    def __init__(self, rate: int, per: int, burst: int = None, size: int = 16384):
+        self.rate_per_second = rate / per
+        self.burst = burst or rate
+
+        self.groups = max(1, (size + GROUP_SIZE - 1) // GROUP_SIZE)
+        self.size = self.groups * GROUP_SIZE
+
+        self.hashes = RawArray(c_uint64, self.size)
+        self.allowances = RawArray(c_double, self.size)
+        self.last_checks = RawArray(c_double, self.size)
+
+        # Statistics per group, updated while holding the lock of the group
+        self.evictions = RawArray(c_uint64, self.groups)
+        self.rejections = RawArray(c_uint64, self.groups)
+
+        self.locks = [multiprocessing.Lock() for _ in range(min(LOCK_STRIPES, self.groups))]
+
+    def is_idle(self, entry: int, now: float) -> bool:
+        """
+        Check whether the bucket of an entry has filled up again, which makes it equivalent to an absent entry
+
+        :param entry: The index of the entry
+        :param now: The current time
+        :return: Whether the entry is idle
+        """
+        return self.allowances[entry] + (now - self.last_checks[entry]) * self.rate_per_second >= self.burst
+
+    def lock_for(self, hashed_key: int) -> multiprocessing.Lock:
+        """
+        Get the lock that protects the group of the given hash
+
+        :param hashed_key: The hash of the key
+        :return: The lock
+        """
+        return self.locks[(hashed_key % self.groups) % len(self.locks)]
+
+    def refill(self, entry: int, now: float) -> float:
+        """
+        Add extra allowance for the time waited since the last request and store it. The caller must hold the lock
+        for the group.
+
+        :param entry: The index of the entry
+        :param now: The current time
+        :return: The new allowance
+        """
+        # Calculate the number of seconds since the last request
+        time_passed = now - self.last_checks[entry]
+
+        # Add extra allowance for the time waited since the last request
+        allowance = self.allowances[entry] + time_passed * self.rate_per_second
+        if allowance > self.burst:
+            # Don't allow more than the specified rate as burst size. No saving up!
+            allowance = self.burst
+
+        self.allowances[entry] = allowance
+        self.last_checks[entry] = now
+        return allowance
+
+    def find_entry(self, hashed_key: int, now: float) -> int:
+        """
+        Find the entry for the given hash, or claim a new one. The caller must hold the lock for the group.
+
+        :param hashed_key: The hash of the key
+        :param now: The current time
+        :return: The index of the entry
+        """
+        group = hashed_key % self.groups
+        first = group * GROUP_SIZE
+        entries = range(first, first + GROUP_SIZE)
+
+        free_entry = None
+        for entry in entries:
+            stored = self.hashes[entry]
+            if stored == hashed_key:
+                return entry
+            elif free_entry is None and (stored == 0 or self.is_idle(entry, now)):
+                free_entry = entry
+
+        if free_entry is None:
+            # Evict the least recently used entry
+            free_entry = min(entries, key=self.last_checks.__getitem__)
+            self.evictions[group] += 1
+
+        self.hashes[free_entry] = hashed_key
+        self.allowances[free_entry] = self.burst
+        self.last_checks[free_entry] = now
+        return free_entry
+
+    def tracked_keys(self) -> int:
+        """
+        Count the keys whose buckets are not full. This is a snapshot that is read without locking.
+
+        :return: The number of keys that are being limited
+        """
+        now = time.monotonic()
+        hashes = self.hashes[:]
+        allowances = self.allowances[:]
+        last_checks = self.last_checks[:]
+        return sum(1 for stored, allowance, last_check in zip(hashes, allowances, last_checks)
+                   if stored and allowance + (now - last_check) * self.rate_per_second < self.burst)
+
+    def export(self) -> Dict[str, int]:
+        """
+        Export the statistics of the counters
+
+        :return: The statistics in a processable format
+        """
+        out = OrderedDict()
+        out['size'] = self.size
+        out['tracked_keys'] = self.tracked_keys()
+        out['evictions'] = sum(self.evictions[:])
+        out['rejections'] = sum(self.rejections[:])
+        return out
+
+    def check_request(self, key: str) -> bool:
+        """
+        Check whether this request is within limits. This method uses the algorithm described on
+        http://stackoverflow.com/questions/667508/whats-a-good-rate-limiting-algorithm#668327
+
+        :param key: The key for this client
+        :return: Whether we should allow this
+        """
+        hashed_key = key_hash(key)
+
+        with self.lock_for(hashed_key):
+            # The monotonic clock is shared between processes
+            now = time.monotonic()
+
+            # Get the stored state, or initialise a new one
+            entry = self.find_entry(hashed_key, now)
+            allowance = self.refill(entry, now)
+
+            if allowance < 1:
+                # Allowance exceeded, reject
+                allow = False
+                self.rejections[hashed_key % self.groups] += 1
+            else:
+                # Still enough allowance, accept and deduct message from allowance
+                allow = True
+                allowance -= 1
+                self.allowances[entry] = allowance
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('{}: {} allowance = {:0.2f}'.format(multiprocessing.current_process().name, key, allowance))
+
+        return allow
+
+
+def check_hierarchical_request(levels: Sequence[Tuple[RateLimitCounters, str]]) -> Optional[int]:
+    """
+    Check a request against multiple levels of rate limits in one pass. The request is only deducted from the
+    allowances when all levels allow it, so a client that is rejected because its relay is over its limit doesn't use
+    up its own allowance. The locks are always taken in the order of the levels, so processes can't deadlock.
+
+    :param levels: The counters and the key for this request of each level
+    :return: The index of the level that rejected the request, or None if it is allowed
+    """
+    hashed_keys = [key_hash(key) for counters, key in levels]
+
+    with ExitStack() as stack:
+        for (counters, key), hashed_key in zip(levels, hashed_keys):
+            stack.enter_context(counters.lock_for(hashed_key))
+
+        # The monotonic clock is shared between processes
+        now = time.monotonic()
+
+        # First check all levels
+        entries = []
+        for index, ((counters, key), hashed_key) in enumerate(zip(levels, hashed_keys)):
+            entry = counters.find_entry(hashed_key, now)
+            if counters.refill(entry, now) < 1:
+                # Allowance exceeded, reject
+                counters.rejections[hashed_key % counters.groups] += 1
+
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug('{}: {} allowance exceeded'.format(multiprocessing.current_process().name, key))
+
+                return index
+
+            entries.append(entry)
+
+        # Then deduct the message from all of them
+        for (counters, key), entry in zip(levels, entries):
+            counters.allowances[entry] -= 1
+
+    return None
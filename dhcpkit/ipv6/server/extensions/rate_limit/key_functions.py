@@ -1,13 +1,16 @@
 """
-Functions to extract a key from a transaction bundle
+Functions to extract a key from a transaction bundle or from a scanned packet
 """
 import codecs
+from ipaddress import IPv6Address
 
-from dhcpkit.ipv6.extensions.linklayer_id import LinkLayerIdOption
-from dhcpkit.ipv6.extensions.remote_id import RemoteIdOption
-from dhcpkit.ipv6.extensions.subscriber_id import SubscriberIdOption
-from dhcpkit.ipv6.options import ClientIdOption, InterfaceIdOption
+from dhcpkit.ipv6.extensions.linklayer_id import LinkLayerIdOption, OPTION_CLIENT_LINKLAYER_ADDR
+from dhcpkit.ipv6.extensions.remote_id import OPTION_REMOTE_ID, RemoteIdOption
+from dhcpkit.ipv6.extensions.subscriber_id import OPTION_SUBSCRIBER_ID, SubscriberIdOption
+from dhcpkit.ipv6.options import ClientIdOption, InterfaceIdOption, OPTION_INTERFACE_ID
+from dhcpkit.ipv6.server.packet_scanner import ScannedPacket
 from dhcpkit.ipv6.server.transaction_bundle import TransactionBundle
+from typing import Optional
 
 
 def duid_key(bundle: TransactionBundle) -> str:
@@ -93,10 +96,148 @@ def linklayer_id_key(bundle: TransactionBundle) -> str:
         return duid_key(bundle)
 
 
+def link_key(bundle: TransactionBundle) -> str:
+    """
+    Get the link address that identifies where the request in the transaction bundle is coming from.
+
+    :param bundle: The transaction bundle
+    :return: The link address
+    """
+    return 'link:{}'.format(bundle.link_address)
+
+
+def relay_key(bundle: TransactionBundle) -> str:
+    """
+    Get the address of the relay closest to the client from the transaction bundle, with a fallback to the link
+    address if the client is directly connected to the server.
+
+    :param bundle: The transaction bundle
+    :return: The address of the relay (or the link address)
+    """
+    if len(bundle.incoming_relay_messages) > 1:
+        # The relay closest to the client is the peer of the next relay in the chain
+        return 'relay:{}'.format(bundle.incoming_relay_messages[1].peer_address)
+    else:
+        return link_key(bundle)
+
+
 key_function_map = {
     'duid': duid_key,
     'interface-id': interface_id_key,
     'remote-id': remote_id_key,
     'subscriber-id': subscriber_id_key,
     'linklayer-id': linklayer_id_key,
+    'link': link_key,
+    'relay': relay_key,
+}
+
+
+def raw_duid_key(packet: ScannedPacket) -> Optional[str]:
+    """
+    Get the DUID from a scanned packet, in the same format as :func:`duid_key`
+
+    :param packet: The scanned packet
+    :return: The DUID in hex notation, or None if the packet doesn't have one
+    """
+    duid = packet.client_duid
+    if duid is None:
+        return None
+
+    return 'duid:{}'.format(codecs.encode(duid, 'hex').decode('ascii'))
+
+
+def raw_interface_id_key(packet: ScannedPacket) -> Optional[str]:
+    """
+    Get the Interface-ID from a scanned packet, in the same format as :func:`interface_id_key`
+
+    :param packet: The scanned packet
+    :return: The Interface-ID (or DUID) in hex notation
+    """
+    interface_id = packet.relays[0].options.get(OPTION_INTERFACE_ID)
+    if interface_id is not None:
+        return 'interface-id:{}'.format(codecs.encode(interface_id, 'hex').decode('ascii'))
+    else:
+        return raw_duid_key(packet)
+
+
+def raw_remote_id_key(packet: ScannedPacket) -> Optional[str]:
+    """
+    Get the Remote-ID from a scanned packet, in the same format as :func:`remote_id_key`
+
+    :param packet: The scanned packet
+    :return: The Remote-ID (or DUID) in hex notation
+    """
+    remote_id = packet.relays[0].options.get(OPTION_REMOTE_ID)
+    if remote_id is not None and len(remote_id) >= 4:
+        return 'remote-id:{}:{}'.format(
+            int.from_bytes(remote_id[:4], 'big'),
+            codecs.encode(remote_id[4:], 'hex').decode('ascii')
+        )
+    else:
+        return raw_duid_key(packet)
+
+
+def raw_subscriber_id_key(packet: ScannedPacket) -> Optional[str]:
+    """
+    Get the Subscriber-ID from a scanned packet, in the same format as :func:`subscriber_id_key`
+
+    :param packet: The scanned packet
+    :return: The Subscriber-ID (or DUID) in hex notation
+    """
+    subscriber_id = packet.relays[0].options.get(OPTION_SUBSCRIBER_ID)
+    if subscriber_id is not None:
+        return 'subscriber-id:{}'.format(codecs.encode(subscriber_id, 'hex').decode('ascii'))
+    else:
+        return raw_duid_key(packet)
+
+
+def raw_linklayer_id_key(packet: ScannedPacket) -> Optional[str]:
+    """
+    Get the LinkLayer-ID from a scanned packet, in the same format as :func:`linklayer_id_key`
+
+    :param packet: The scanned packet
+    :return: The LinkLayer-ID (or DUID) in hex notation
+    """
+    linklayer_id = packet.relays[0].options.get(OPTION_CLIENT_LINKLAYER_ADDR)
+    if linklayer_id is not None and len(linklayer_id) >= 2:
+        return 'linklayer-id:{}:{}'.format(
+            int.from_bytes(linklayer_id[:2], 'big'),
+            codecs.encode(linklayer_id[2:], 'hex').decode('ascii')
+        )
+    else:
+        return raw_duid_key(packet)
+
+
+def raw_link_key(packet: ScannedPacket) -> str:
+    """
+    Get the link address from a scanned packet, in the same format as :func:`link_key`
+
+    :param packet: The scanned packet
+    :return: The link address
+    """
+    return 'link:{}'.format(IPv6Address(packet.link_address))
+
+
+def raw_relay_key(packet: ScannedPacket) -> str:
+    """
+    Get the address of the relay closest to the client from a scanned packet, in the same format as
+    :func:`relay_key`
+
+    :param packet: The scanned packet
+    :return: The address of the relay (or the link address)
+    """
+    if len(packet.relays) > 1:
+        return 'relay:{}'.format(IPv6Address(packet.relays[1].peer_address))
+    else:
+        return raw_link_key(packet)
+
+
+raw_key_function_map = {
+    'duid': raw_duid_key,
+    'interface-id': raw_interface_id_key,
+    'remote-id': raw_remote_id_key,
+    'subscriber-id': raw_subscriber_id_key,
+    'linklayer-id': raw_linklayer_id_key,
+    'link': raw_link_key,
+    'relay': raw_relay_key,
 }
@@ -0,0 +1,131 @@
+"""
+A Bloom filter in shared memory, used to skip looking up identifiers that certainly don't have an assignment
+"""
+import logging
+import math
+import zlib
+from ctypes import c_int, c_uint64, c_uint8
+from multiprocessing.sharedctypes import RawArray, RawValue
+
+from typing import Iterable, Iterator
+
+logger = logging.getLogger(__name__)
+
+# The starting value of the second checksum
+HASH_SEED = 0x5bd1e995
+
+
+class SharedBloomFilter:
+    """
+    A Bloom filter whose bits are stored in shared memory, so the master process can build it and all worker processes
+    can use it. There are two bit arrays: workers use the active one while the master process builds a new version in
+    the other one. Switching to the new version is a single write to shared memory.
+
+    The filter is sized when it is created. Adding more keys than its capacity still works, but the false positive rate
+    goes up.
+
+    :type capacity: int
+    :type error_rate: float
+    :type bit_count: int
+    :type hash_count: int
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        """
+        Allocate the filter in shared memory.
+
+        :param capacity: The number of keys that the filter is sized for
+        :param error_rate: The false positive rate when the filter contains its capacity of keys
+        """
+        self.capacity = max(capacity, 1)
+        self.error_rate = error_rate
+
+        # Round the optimal number of bits up to a power of two so positions can be calculated with a bit mask, and
+        # use the optimal number of hash functions for that size
+        optimal_bit_count = -self.capacity * math.log(error_rate) / math.log(2) ** 2
+        self.bit_count = 64
+        while self.bit_count < optimal_bit_count:
+            self.bit_count *= 2
+        self.hash_count = max(1, int(round(self.bit_count / self.capacity * math.log(2))))
+
+        self.bits = [RawArray(c_uint8, self.bit_count // 8), RawArray(c_uint8, self.bit_count // 8)]
+        self.active = RawValue(c_int, 0)
+        self.key_count = RawValue(c_uint64, 0)
+
+        self.views = None
+
+    def __getstate__(self):
+        """
+        Memory views can't be pickled, they are created again when needed.
+
+        :return: The state to pickle
+        """
+        state = self.__dict__.copy()
+        state['views'] = None
+        return state
+
+    def get_positions(self, key: str) -> Iterator[int]:
+        """
+        Calculate the bit positions of a key, using double hashing on two CRC-32 checksums with a different starting
+        value. Unlike Python's own hash these are the same in all processes.
+
+        :param key: The key
+        :return: The bit positions
+        """
+        data = key.encode('utf-8')
+        first = zlib.crc32(data)
+        second = zlib.crc32(data, HASH_SEED) | 1
+        mask = self.bit_count - 1
+        for index in range(self.hash_count):
+            yield (first + index * second) & mask
+
+    def build(self, keys: Iterable[str]) -> int:
+        """
+        Build a new version of the filter in the inactive bit array and then make it the active one.
+
+        :param keys: All the keys that the filter must contain
+        :return: The number of keys added
+        """
+        bits = bytearray(self.bit_count // 8)
+        key_count = 0
+        for key in keys:
+            for position in self.get_positions(key):
+                bits[position >> 3] |= 1 << (position & 7)
+            key_count += 1
+
+        if key_count > self.capacity:
+            logger.warning("Bloom filter contains {} keys but was sized for {}, "
+                           "reload the server to resize it".format(key_count, self.capacity))
+
+        inactive = 1 - self.active.value
+        memoryview(self.bits[inactive]).cast('B')[:] = bits
+        self.key_count.value = key_count
+        self.active.value = inactive
+        return key_count
+
+    def __contains__(self, key: str) -> bool:
+        """
+        Check whether the filter may contain the key. False positives are possible, false negatives are not.
+
+        :param key: The key
+        :return: Whether the filter may contain the key
+        """
+        if self.views is None:
+            self.views = [memoryview(bits).cast('B') for bits in self.bits]
+
+        bits = self.views[self.active.value]
+
+        # The same calculation as get_positions, inlined because this is called for every lookup
+        data = key.encode('utf-8')
+        position = zlib.crc32(data)
+        step = zlib.crc32(data, HASH_SEED) | 1
+        mask = self.bit_count - 1
+        for index in range(self.hash_count):
+            position &= mask
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+            position += step
+        return True
+
+    def __len__(self) -> int:
+        return self.key_count.value
@@ -5,6 +5,7 @@ import logging
 
 from ZConfig.datatypes import existing_file
 from dhcpkit.ipv6.server.extensions.static_assignments.csv import CSVStaticAssignmentHandler
+from dhcpkit.ipv6.server.extensions.static_assignments.index import IndexStaticAssignmentHandler
 from dhcpkit.ipv6.server.extensions.static_assignments.sqlite import SqliteStaticAssignmentHandler
 from dhcpkit.ipv6.server.handlers import HandlerFactory
 
@@ -34,7 +35,8 @@ class CSVStaticAssignmentHandlerFactory(HandlerFactory):
         return CSVStaticAssignmentHandler(
             self.name,
             address_preferred_lifetime, address_valid_lifetime,
-            prefix_preferred_lifetime, prefix_valid_lifetime
+            prefix_preferred_lifetime, prefix_valid_lifetime,
+            reload_interval=self.reload_interval
         )
 
 
@@ -59,6 +61,39 @@ class SqliteStaticAssignmentHandlerFactory(HandlerFactory):
         prefix_valid_lifetime = self.prefix_valid_lifetime
 
         return SqliteStaticAssignmentHandler(
+            self.name,
+            address_preferred_lifetime, address_valid_lifetime,
+            prefix_preferred_lifetime, prefix_valid_lifetime,
+            cache_size=self.cache_size,
+            bloom_filter=self.bloom_filter,
+            read_only=self.read_only,
+            mmap_size=self.mmap_size,
+            page_cache_size=self.page_cache_size,
+            in_memory=self.in_memory
+        )
+
+
+class IndexStaticAssignmentHandlerFactory(HandlerFactory):
+    """
+    Factory for a handler that reads assignments from a compiled index file
+    """
+
+    name_datatype = staticmethod(existing_file)
+
+    def create(self) -> IndexStaticAssignmentHandler:
+        """
+        Create a handler of this class based on the configuration in the config section.
+
+        :return: A handler object
+        """
+
+        # Get the lifetimes
+        address_preferred_lifetime = self.address_preferred_lifetime
+        address_valid_lifetime = self.address_valid_lifetime
+        prefix_preferred_lifetime = self.prefix_preferred_lifetime
+        prefix_valid_lifetime = self.prefix_valid_lifetime
+
+        return IndexStaticAssignmentHandler(
             self.name,
             address_preferred_lifetime, address_valid_lifetime,
             prefix_preferred_lifetime, prefix_valid_lifetime
@@ -4,44 +4,401 @@ An option handler that assigns addresses based on DUID from a CSV file
 import codecs
 import csv
 import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from ctypes import c_uint64
 from ipaddress import IPv6Address, IPv6Network
+from multiprocessing.sharedctypes import RawValue
 
 from dhcpkit.ipv6.duids import DUID
-from dhcpkit.ipv6.extensions.linklayer_id import LinkLayerIdOption
-from dhcpkit.ipv6.extensions.remote_id import RemoteIdOption
-from dhcpkit.ipv6.extensions.subscriber_id import SubscriberIdOption
-from dhcpkit.ipv6.options import ClientIdOption, InterfaceIdOption
 from dhcpkit.ipv6.server.extensions.static_assignments import Assignment, StaticAssignmentHandler
+from dhcpkit.ipv6.server.extensions.static_assignments.index import AssignmentIndex, REMOVED, write_index
+from dhcpkit.ipv6.server.identifiers import encode_key, get_request_keys
 from dhcpkit.ipv6.server.transaction_bundle import TransactionBundle
 from dhcpkit.utils import normalise_hex
-from typing import List, Mapping, Tuple
+from typing import Dict, Iterator, List, Mapping, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
 
+def watch_csv_file(index_ref: weakref.ref, interval: float):
+    """
+    Check the CSV file of a live index periodically. This runs in a thread in the master process, and stops when the
+    live index is no longer in use, for example after the configuration has been reloaded.
+
+    :param index_ref: A weak reference to the live index
+    :param interval: The number of seconds between checks
+    """
+    while True:
+        time.sleep(interval)
+
+        live_index = index_ref()
+        if live_index is None:
+            return
+
+        try:
+            live_index.check()
+        except Exception as e:
+            live_index.errors += 1
+            logger.error("Not reloading {}: {}".format(live_index.csv_filename, e))
+
+        del live_index
+
+
+class LiveCSVIndex:
+    """
+    The assignments from a CSV file, stored in memory-mapped index files that are updated when the CSV file changes.
+
+    The master process reads the whole CSV file and writes the index files. Only rows that have changed since the
+    previous read are parsed again. Changes are written to a small delta index that is used on top of the base index,
+    so the cost of publishing an update is proportional to the size of the change. When the delta index becomes too
+    big compared to the base index both are merged into a new base index.
+
+    The current generation of the index files is kept in shared memory. Workers compare it with the generation they
+    have mapped, and map the new files when it changes. The upper 32 bits contain the generation of the base index
+    and the lower 32 bits the generation of the delta index, so both change with a single write.
+
+    :type csv_filename: str
+    :type max_delta_fraction: float
+    :type directory: str
+    :type generation: c_uint64
+    """
+
+    def __init__(self, csv_filename: str, max_delta_fraction: float = 0.1):
+        """
+        Create the directory for the index files. Call :meth:`reload` to load the assignments.
+
+        :param csv_filename: The filename of the CSV file
+        :param max_delta_fraction: The maximum size of the delta index as a fraction of the base index
+        """
+        self.csv_filename = csv_filename
+        self.max_delta_fraction = max_delta_fraction
+
+        self.directory = tempfile.mkdtemp(prefix='dhcpkit-static-csv-')
+        self.generation = RawValue(c_uint64, 0)
+
+        # The state of the master process
+        self.file_state = None
+        self.rows = {}
+        """:type: Dict[Tuple[str, str, str], Tuple[str, Assignment]]"""
+        self.assignments = {}
+        """:type: Dict[str, Assignment]"""
+        self.base = {}
+        """:type: Dict[str, Assignment]"""
+        self.delta = {}
+        """:type: Dict[str, Optional[Assignment]]"""
+        self.last_generation = 0
+        self.lock = threading.Lock()
+
+        self.reloads = 0
+        self.compactions = 0
+        self.added = 0
+        self.removed = 0
+        self.changed = 0
+        self.errors = 0
+        self.last_duration = 0.0
+
+        # The state of the worker processes
+        self.mapped_generation = None
+        self.base_index = None
+        """:type: Optional[AssignmentIndex]"""
+        self.delta_index = None
+        """:type: Optional[AssignmentIndex]"""
+
+        self.finalizer = weakref.finalize(self, shutil.rmtree, self.directory, True)
+
+    def __getstate__(self):
+        """
+        Only the filenames and shared memory are sent to the worker processes.
+
+        :return: The state to pickle
+        """
+        state = self.__dict__.copy()
+        for name in ('file_state', 'rows', 'assignments', 'base', 'delta', 'lock', 'finalizer'):
+            del state[name]
+        return state
+
+    def start_watching(self, interval: float):
+        """
+        Start a thread that checks the CSV file for changes.
+
+        :param interval: The number of seconds between checks
+        """
+        thread = threading.Thread(target=watch_csv_file, args=(weakref.ref(self), interval),
+                                  name='CSVWatcher', daemon=True)
+        thread.start()
+
+    def get_file_state(self) -> Tuple[int, int, int]:
+        """
+        Get the properties of the CSV file that show whether it has changed.
+
+        :return: The inode, size and modification time of the file
+        """
+        stat = os.stat(self.csv_filename)
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def check(self) -> bool:
+        """
+        Reload the CSV file if it has changed.
+
+        :return: Whether the CSV file was reloaded
+        """
+        if self.get_file_state() == self.file_state:
+            return False
+
+        self.reload()
+        return True
+
+    def reload(self):
+        """
+        Read the CSV file and update the index files with the changes since the previous read.
+        """
+        with self.lock:
+            start = time.monotonic()
+            file_state = self.get_file_state()
+
+            rows = {}
+            assignments = {}
+            for line_num, row in CSVStaticAssignmentHandler.read_csv_rows(self.csv_filename):
+                raw_row = (row.get('id'), row.get('address'), row.get('prefix'))
+                parsed = self.rows.get(raw_row)
+                if parsed is None:
+                    try:
+                        parsed = CSVStaticAssignmentHandler.parse_csv_row(row)
+                    except KeyError:
+                        raise ValueError("Assignment CSV must have columns 'id', 'address' and 'prefix'")
+                    except ValueError as e:
+                        logger.error("Ignoring {} line {} with invalid value: {}".format(self.csv_filename,
+                                                                                         line_num, e))
+                        continue
+
+                rows[raw_row] = parsed
+                row_id, assignment = parsed
+                assignments[row_id] = assignment
+
+            changes = {row_id: None for row_id in self.assignments.keys() - assignments.keys()}
+            removed = len(changes)
+            added = changed = 0
+            for row_id, assignment in assignments.items():
+                old_assignment = self.assignments.get(row_id)
+                if old_assignment is None:
+                    added += 1
+                elif old_assignment != assignment:
+                    changed += 1
+                else:
+                    continue
+                changes[row_id] = assignment
+
+            initial = not self.last_generation
+            self.rows = rows
+            self.assignments = assignments
+            self.file_state = file_state
+
+            if not initial:
+                self.reloads += 1
+                self.added += added
+                self.removed += removed
+                self.changed += changed
+                if not changes:
+                    self.last_duration = time.monotonic() - start
+                    return
+
+                logger.info("Reloaded {}: {} added, {} removed, {} changed".format(self.csv_filename,
+                                                                                   added, removed, changed))
+
+            # Only keep the differences with the base index in the delta
+            for row_id, assignment in changes.items():
+                if self.base.get(row_id) == assignment:
+                    self.delta.pop(row_id, None)
+                else:
+                    self.delta[row_id] = assignment
+
+            self.last_generation += 1
+            base_generation = self.generation.value >> 32
+            if initial or len(self.delta) > len(self.base) * self.max_delta_fraction:
+                # Merge everything into a new base index
+                if not initial:
+                    self.compactions += 1
+                base_generation = self.last_generation
+                write_index(assignments.items(), self.get_filename('base', base_generation))
+                self.base = assignments
+                self.delta = {}
+                self.publish(base_generation, 0)
+            else:
+                write_index(self.delta.items(), self.get_filename('delta', self.last_generation))
+                self.publish(base_generation, self.last_generation)
+
+            if initial:
+                logger.info("Loaded {} assignments from {}".format(len(assignments), self.csv_filename))
+
+            self.last_duration = time.monotonic() - start
+
+    def get_filename(self, kind: str, generation: int) -> str:
+        """
+        Get the filename of an index file.
+
+        :param kind: Either 'base' or 'delta'
+        :param generation: The generation of the index file
+        :return: The filename
+        """
+        return os.path.join(self.directory, '{}-{}.idx'.format(kind, generation))
+
+    def publish(self, base_generation: int, delta_generation: int):
+        """
+        Make the workers use new index files, and remove the files that are no longer needed. Workers that still have
+        the old files mapped can keep using them until they map the new ones.
+
+        :param base_generation: The generation of the base index
+        :param delta_generation: The generation of the delta index, or 0 if there is none
+        """
+        self.generation.value = (base_generation << 32) | delta_generation
+
+        current = {os.path.basename(self.get_filename('base', base_generation)),
+                   os.path.basename(self.get_filename('delta', delta_generation))}
+        for filename in os.listdir(self.directory):
+            if filename not in current and not filename.startswith('.'):
+                os.unlink(os.path.join(self.directory, filename))
+
+    def refresh(self):
+        """
+        Map the current index files if the generation has changed.
+        """
+        while True:
+            generation = self.generation.value
+            if generation == self.mapped_generation:
+                return
+
+            base_generation = generation >> 32
+            delta_generation = generation & 0xffffffff
+            try:
+                base_index = AssignmentIndex(self.get_filename('base', base_generation))
+                try:
+                    delta_index = None
+                    if delta_generation:
+                        delta_index = AssignmentIndex(self.get_filename('delta', delta_generation))
+                except OSError:
+                    base_index.close()
+                    raise
+            except FileNotFoundError:
+                if self.generation.value != generation:
+                    # The files were replaced while we were opening them, try again
+                    continue
+                raise
+
+            self.close()
+            self.base_index = base_index
+            self.delta_index = delta_index
+            self.mapped_generation = generation
+
+    def close(self):
+        """
+        Unmap the index files
+        """
+        if self.base_index is not None:
+            self.base_index.close()
+            self.base_index = None
+        if self.delta_index is not None:
+            self.delta_index.close()
+            self.delta_index = None
+        self.mapped_generation = None
+
+    def lookup(self, key: bytes) -> Optional[Assignment]:
+        """
+        Look up the assignment for a raw key, using the most recent index files.
+
+        :param key: The raw key
+        :return: The assignment, or None if the key isn't known
+        """
+        if self.delta_index is not None:
+            assignment = self.delta_index.lookup(key)
+            if assignment is REMOVED:
+                return None
+            elif assignment is not None:
+                return assignment
+
+        return self.base_index.lookup(key)
+
+    def export(self) -> Dict[str, int]:
+        """
+        Export the reload statistics.
+
+        :return: The statistics in a processable format
+        """
+        return OrderedDict([
+            ('assignments', len(self.assignments)),
+            ('reloads', self.reloads),
+            ('compactions', self.compactions),
+            ('added', self.added),
+            ('removed', self.removed),
+            ('changed', self.changed),
+            ('errors', self.errors),
+            ('delta_size', len(self.delta)),
+            ('last_reload_duration', self.last_duration),
+        ])
+
+
 class CSVStaticAssignmentHandler(StaticAssignmentHandler):
     """
     Assign addresses and/or prefixes based on the contents of a CSV file
+
+    :type filename: str
+    :type reload_interval: float
+    :type mapping: Optional[Dict[bytes, Assignment]]
+    :type live_index: Optional[LiveCSVIndex]
     """
 
     def __init__(self, filename: str,
                  address_preferred_lifetime: int, address_valid_lifetime: int,
-                 prefix_preferred_lifetime: int, prefix_valid_lifetime: int):
+                 prefix_preferred_lifetime: int, prefix_valid_lifetime: int,
+                 reload_interval: float = 0):
         """
         Initialise the mapping. This handler will respond to clients on responsible_for_links and assume that all
         addresses in the mapping are appropriate for on those links.
 
         :param filename: The filename containing the CSV data
+        :param reload_interval: How often to check the file for changes in seconds, or 0 to never reload it
         """
         super().__init__(address_preferred_lifetime, address_valid_lifetime,
                          prefix_preferred_lifetime, prefix_valid_lifetime)
 
         self.filename = filename
-        self.mapping = self.read_csv_file(filename)
+        self.reload_interval = reload_interval
+
+        if reload_interval:
+            self.mapping = None
+            self.live_index = LiveCSVIndex(filename)
+            self.live_index.reload()
+            self.live_index.start_watching(reload_interval)
+        else:
+            self.mapping = self.read_csv_file(filename)
+            self.live_index = None
 
     def __str__(self):
         return "{} from {}".format(self.__class__.__name__, self.filename)
 
+    def worker_init(self):
+        """
+        Map the index files in each worker when the file is reloaded while the server is running
+        """
+        if self.live_index is not None:
+            self.live_index.refresh()
+
+    def export_statistics(self) -> Dict[str, dict]:
+        """
+        Export the reload statistics when the file is reloaded while the server is running.
+
+        :return: The statistics in a processable format
+        """
+        if self.live_index is None:
+            return {}
+
+        return {str(self): self.live_index.export()}
+
     def get_assignment(self, bundle: TransactionBundle) -> Assignment:
         """
         Look up the assignment based on DUID, Interface-ID of the relay closest to the client and Remote-ID of the
@@ -50,71 +407,39 @@ class CSVStaticAssignmentHandler(StaticAssignmentHandler):
         :param bundle: The transaction bundle
         :return: The assignment, if any
         """
-        # Look up based on DUID
-        duid_option = bundle.request.get_option_of_type(ClientIdOption)
-        duid = 'duid:' + codecs.encode(duid_option.duid.save(), 'hex').decode('ascii')
-        if duid in self.mapping:
-            return self.mapping[duid]
-
-        # Look up based on Interface-ID
-        interface_id_option = bundle.incoming_relay_messages[0].get_option_of_type(InterfaceIdOption)
-        if interface_id_option:
-            interface_id = 'interface-id:' + codecs.encode(interface_id_option.interface_id, 'hex').decode('ascii')
-            if interface_id in self.mapping:
-                return self.mapping[interface_id]
-
-        # Look up based on Remote-ID
-        remote_id_option = bundle.incoming_relay_messages[0].get_option_of_type(RemoteIdOption)
-        if remote_id_option:
-            remote_id = 'remote-id:{}:{}'.format(remote_id_option.enterprise_number,
-                                                 codecs.encode(remote_id_option.remote_id, 'hex').decode('ascii'))
-            if remote_id in self.mapping:
-                return self.mapping[remote_id]
-
-        # Look up based on Subscriber-ID
-        subscriber_id_option = bundle.incoming_relay_messages[0].get_option_of_type(SubscriberIdOption)
-        if subscriber_id_option:
-            subscriber_id = 'subscriber-id:{}'.format(
-                codecs.encode(subscriber_id_option.subscriber_id, 'hex').decode('ascii')
-            )
-            if subscriber_id in self.mapping:
-                return self.mapping[subscriber_id]
-
-        # Look up based on LinkLayer-ID
-        linklayer_id_option = bundle.incoming_relay_messages[0].get_option_of_type(LinkLayerIdOption)
-        if linklayer_id_option:
-            linklayer_id = 'linklayer-id:{}:{}'.format(
-                linklayer_id_option.link_layer_type,
-                codecs.encode(linklayer_id_option.link_layer_address, 'hex').decode('ascii')
-            )
-            if linklayer_id in self.mapping:
-                return self.mapping[linklayer_id]
+        if self.live_index is not None:
+            self.live_index.refresh()
+            lookup = self.live_index.lookup
+        else:
+            lookup = self.mapping.get
+
+        for key in get_request_keys(bundle):
+            assignment = lookup(key)
+            if assignment is not None:
+                return assignment
 
         # Nothing found
         return Assignment(address=None, prefix=None)
 
-    def read_csv_file(self, csv_filename: str) -> Mapping[str, Assignment]:
+    def read_csv_file(self, csv_filename: str) -> Mapping[bytes, Assignment]:
         """
         Read the assignments from the file specified in the configuration
 
         :param csv_filename: The filename of the CSV file
-        :return: A dictionary mapping identifiers to assignments
+        :return: A dictionary mapping identifier keys to assignments
         """
-        assignments = dict(self.parse_csv_file(csv_filename))
+        assignments = {encode_key(row_id): assignment for row_id, assignment in self.parse_csv_file(csv_filename)}
         logger.info("Loaded {} assignments from {}".format(len(assignments), csv_filename))
         return assignments
 
     @staticmethod
-    def parse_csv_file(csv_filename: str) -> List[Tuple[str, Assignment]]:
+    def read_csv_rows(csv_filename: str) -> Iterator[Tuple[int, Dict[str, str]]]:
         """
-        Read the assignments from the file specified in the configuration
+        Read the rows from a CSV file, auto-detecting its dialect
 
         :param csv_filename: The filename of the CSV file
-        :return: An list of identifiers and their assignment
+        :return: The line numbers and rows
         """
-
-        logger.debug("Loading assignments from {}".format(csv_filename))
-
         with open(csv_filename) as csv_file:
             # Auto-detect the CSV dialect
             sniffer = csv.Sniffer()
@@ -127,91 +452,117 @@ class CSVStaticAssignmentHandler(StaticAssignmentHandler):
 
             # First line is column headings
             for row in reader:
-                try:
-                    address_str = row['address'].strip()
-                    address = address_str and IPv6Address(address_str) or None
-
-                    prefix_str = row['prefix'].strip()
-                    prefix = prefix_str and IPv6Network(prefix_str) or None
-
-                    # Validate and normalise id input
-                    row_id = row['id']
-
-                    if row_id.startswith('duid:'):
-                        duid_hex = row_id.split(':', 1)[1]
-                        duid_bytes = codecs.decode(duid_hex, 'hex')
-                        length, duid = DUID.parse(duid_bytes, length=len(duid_bytes))
-                        duid_hex = codecs.encode(duid.save(), 'hex').decode('ascii')
-                        row_id = 'duid:{}'.format(duid_hex)
-
-                    elif row_id.startswith('interface-id:'):
-                        interface_id_hex = row_id.split(':', 1)[1]
-                        interface_id_hex = normalise_hex(interface_id_hex)
-                        interface_id = codecs.decode(interface_id_hex, 'hex')
-                        interface_id_hex = codecs.encode(interface_id, 'hex').decode('ascii')
-                        row_id = 'interface-id:{}'.format(interface_id_hex)
-
-                    elif row_id.startswith('interface-id-str:'):
-                        interface_id = row_id.split(':', 1)[1]
-                        interface_id_hex = codecs.encode(interface_id.encode('ascii'), 'hex').decode('ascii')
-                        row_id = 'interface-id:{}'.format(interface_id_hex)
-
-                    elif row_id.startswith('remote-id:') or row_id.startswith('remote-id-str:'):
-                        remote_id_data = row_id.split(':', 1)[1]
-                        try:
-                            enterprise_id, remote_id = remote_id_data.split(':', 1)
-                            enterprise_id = int(enterprise_id)
-                            if row_id.startswith('remote-id:'):
-                                remote_id = normalise_hex(remote_id)
-                                remote_id = codecs.decode(remote_id, 'hex')
-                            else:
-                                remote_id = remote_id.encode('ascii')
-
-                            row_id = 'remote-id:{}:{}'.format(enterprise_id,
-                                                              codecs.encode(remote_id, 'hex').decode('ascii'))
-                        except ValueError:
-                            raise ValueError("Remote-ID must be formatted as 'remote-id:<enterprise>:<remote-id-hex>', "
-                                             "for example: 'remote-id:9:0123456789abcdef")
-
-                    elif row_id.startswith('subscriber-id:'):
-                        subscriber_id_hex = row_id.split(':', 1)[1]
-                        subscriber_id_hex = normalise_hex(subscriber_id_hex)
-                        subscriber_id = codecs.decode(subscriber_id_hex, 'hex')
-                        subscriber_id_hex = codecs.encode(subscriber_id, 'hex').decode('ascii')
-                        row_id = 'subscriber-id:{}'.format(subscriber_id_hex)
-
-                    elif row_id.startswith('subscriber-id-str:'):
-                        subscriber_id = row_id.split(':', 1)[1]
-                        subscriber_id_hex = codecs.encode(subscriber_id.encode('ascii'), 'hex').decode('ascii')
-                        row_id = 'subscriber-id:{}'.format(subscriber_id_hex)
-
-                    elif row_id.startswith('linklayer-id:') or row_id.startswith('linklayer-id-str:'):
-                        linklayer_id_data = row_id.split(':', 1)[1]
-                        try:
-                            linklayer_type, linklayer_id = linklayer_id_data.split(':', 1)
-                            linklayer_type = int(linklayer_type)
-                            if row_id.startswith('linklayer-id:'):
-                                linklayer_id = normalise_hex(linklayer_id)
-                                linklayer_id = codecs.decode(linklayer_id, 'hex')
-                            else:
-                                linklayer_id = linklayer_id.encode('ascii')
-
-                            row_id = 'linklayer-id:{}:{}'.format(linklayer_type,
-                                                                 codecs.encode(linklayer_id, 'hex').decode('ascii'))
-                        except ValueError:
-                            raise ValueError("LinkLayer-ID must be formatted as 'linklayer-id:<type>:<address-hex>', "
-                                             "for example: 'linklayer-id:1:002436ef1d89")
-
-                    else:
-                        raise ValueError("Unsupported ID type, supported types: duid, interface-id, interface-id-str,"
-                                         "remote-id, remote-id-str, subscriber-id, subscriber-id-str, linklayer-id and"
-                                         "linklayer-id-str")
-
-                    # Store the normalised id
-                    logger.debug("Loaded assignment for {}".format(row_id))
-                    yield row_id, Assignment(address=address, prefix=prefix)
-
-                except KeyError:
-                    raise ValueError("Assignment CSV must have columns 'id', 'address' and 'prefix'")
-                except ValueError as e:
-                    logger.error("Ignoring {} line {} with invalid value: {}".format(csv_file, reader.line_num, e))
+                yield reader.line_num, row
+
+    @staticmethod
+    def parse_csv_row(row: Dict[str, str]) -> Tuple[str, Assignment]:
+        """
+        Validate and normalise a single row of the CSV file
+
+        :param row: The row, with at least the columns 'id', 'address' and 'prefix'
+        :return: The normalised identifier and its assignment
+        """
+        address_str = row['address'].strip()
+        address = address_str and IPv6Address(address_str) or None
+
+        prefix_str = row['prefix'].strip()
+        prefix = prefix_str and IPv6Network(prefix_str) or None
+
+        # Validate and normalise id input
+        row_id = row['id']
+
+        if row_id.startswith('duid:'):
+            duid_hex = row_id.split(':', 1)[1]
+            duid_bytes = codecs.decode(duid_hex, 'hex')
+            length, duid = DUID.parse(duid_bytes, length=len(duid_bytes))
+            duid_hex = codecs.encode(duid.save(), 'hex').decode('ascii')
+            row_id = 'duid:{}'.format(duid_hex)
+
+        elif row_id.startswith('interface-id:'):
+            interface_id_hex = row_id.split(':', 1)[1]
+            interface_id_hex = normalise_hex(interface_id_hex)
+            interface_id = codecs.decode(interface_id_hex, 'hex')
+            interface_id_hex = codecs.encode(interface_id, 'hex').decode('ascii')
+            row_id = 'interface-id:{}'.format(interface_id_hex)
+
+        elif row_id.startswith('interface-id-str:'):
+            interface_id = row_id.split(':', 1)[1]
+            interface_id_hex = codecs.encode(interface_id.encode('ascii'), 'hex').decode('ascii')
+            row_id = 'interface-id:{}'.format(interface_id_hex)
+
+        elif row_id.startswith('remote-id:') or row_id.startswith('remote-id-str:'):
+            remote_id_data = row_id.split(':', 1)[1]
+            try:
+                enterprise_id, remote_id = remote_id_data.split(':', 1)
+                enterprise_id = int(enterprise_id)
+                if row_id.startswith('remote-id:'):
+                    remote_id = normalise_hex(remote_id)
+                    remote_id = codecs.decode(remote_id, 'hex')
+                else:
+                    remote_id = remote_id.encode('ascii')
+
+                row_id = 'remote-id:{}:{}'.format(enterprise_id,
+                                                  codecs.encode(remote_id, 'hex').decode('ascii'))
+            except ValueError:
+                raise ValueError("Remote-ID must be formatted as 'remote-id:<enterprise>:<remote-id-hex>', "
+                                 "for example: 'remote-id:9:0123456789abcdef")
+
+        elif row_id.startswith('subscriber-id:'):
+            subscriber_id_hex = row_id.split(':', 1)[1]
+            subscriber_id_hex = normalise_hex(subscriber_id_hex)
+            subscriber_id = codecs.decode(subscriber_id_hex, 'hex')
+            subscriber_id_hex = codecs.encode(subscriber_id, 'hex').decode('ascii')
+            row_id = 'subscriber-id:{}'.format(subscriber_id_hex)
+
+        elif row_id.startswith('subscriber-id-str:'):
+            subscriber_id = row_id.split(':', 1)[1]
+            subscriber_id_hex = codecs.encode(subscriber_id.encode('ascii'), 'hex').decode('ascii')
+            row_id = 'subscriber-id:{}'.format(subscriber_id_hex)
+
+        elif row_id.startswith('linklayer-id:') or row_id.startswith('linklayer-id-str:'):
+            linklayer_id_data = row_id.split(':', 1)[1]
+            try:
+                linklayer_type, linklayer_id = linklayer_id_data.split(':', 1)
+                linklayer_type = int(linklayer_type)
+                if row_id.startswith('linklayer-id:'):
+                    linklayer_id = normalise_hex(linklayer_id)
+                    linklayer_id = codecs.decode(linklayer_id, 'hex')
+                else:
+                    linklayer_id = linklayer_id.encode('ascii')
+
+                row_id = 'linklayer-id:{}:{}'.format(linklayer_type,
+                                                     codecs.encode(linklayer_id, 'hex').decode('ascii'))
+            except ValueError:
+                raise ValueError("LinkLayer-ID must be formatted as 'linklayer-id:<type>:<address-hex>', "
+                                 "for example: 'linklayer-id:1:002436ef1d89")
+
+        else:
+            raise ValueError("Unsupported ID type, supported types: duid, interface-id, interface-id-str,"
+                             "remote-id, remote-id-str, subscriber-id, subscriber-id-str, linklayer-id and"
+                             "linklayer-id-str")
+
+        return row_id, Assignment(address=address, prefix=prefix)
+
+    @classmethod
+    def parse_csv_file(cls, csv_filename: str) -> List[Tuple[str, Assignment]]:
+        """
+        Read the assignments from the file specified in the configuration
+
+        :param csv_filename: The filename of the CSV file
+        :return: An list of identifiers and their assignment
+        """
+
+        logger.debug("Loading assignments from {}".format(csv_filename))
+
+        for line_num, row in cls.read_csv_rows(csv_filename):
+            try:
+                row_id, assignment = cls.parse_csv_row(row)
+
+                # Store the normalised id
+                logger.debug("Loaded assignment for {}".format(row_id))
+                yield row_id, assignment
+
+            except KeyError:
+                raise ValueError("Assignment CSV must have columns 'id', 'address' and 'prefix'")
+            except ValueError as e:
+                logger.error("Ignoring {} line {} with invalid value: {}".format(csv_filename, line_num, e))
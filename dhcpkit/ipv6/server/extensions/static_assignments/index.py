@@ -0,0 +1,279 @@
+"""
+An option handler that assigns addresses based on a compiled binary index file. The index is memory-mapped read-only
+by every worker, so all workers share the same pages of the operating system's cache, and looking up an assignment
+doesn't need to parse anything except the matching record.
+
+The index file consists of:
+
+- A header with a magic value, the format version, the number of records and the number of hash table slots
+- A hash table with open addressing and linear probing. Each slot contains a 32-bit record number plus one, or zero
+  for empty slots. The slot for a key is determined by the CRC-32 of the key.
+- The records, each containing the offset and length of its key, the prefix length, flags and the address and
+  prefix as 16-byte fields. A flag can mark a key as removed, which is used for indexes that contain changes to
+  another index.
+- The keys as created by :func:`~dhcpkit.ipv6.server.identifiers.encode_key`
+
+All numbers are stored in network byte order.
+"""
+import logging
+import mmap
+import os
+import tempfile
+import zlib
+from ipaddress import IPv6Address, IPv6Network
+from struct import Struct, pack
+
+from dhcpkit.ipv6.server.extensions.static_assignments import Assignment, StaticAssignmentHandler
+from dhcpkit.ipv6.server.identifiers import encode_key, get_request_keys
+from dhcpkit.ipv6.server.transaction_bundle import TransactionBundle
+from typing import Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+INDEX_MAGIC = b'DKSTATIC'
+INDEX_VERSION = 1
+
+# Magic, version, number of records, number of hash table slots
+INDEX_HEADER = Struct('!8sIII4x')
+
+# Key offset, key length, prefix length, flags, address, prefix
+INDEX_RECORD = Struct('!IHBB16s16s')
+INDEX_SLOT = Struct('!I')
+
+FLAG_ADDRESS = 0x01
+FLAG_PREFIX = 0x02
+FLAG_REMOVED = 0x04
+
+# Returned by lookups of keys that are marked as removed
+REMOVED = object()
+
+
+def write_index(assignments: Iterable[Tuple[str, Optional[Assignment]]], filename: str) -> int:
+    """
+    Write an index file. The file is written under a temporary name and then renamed, so a server that has the old
+    file open keeps using the old version until it opens the file again. When an identifier occurs multiple times
+    the last assignment is used, just like when the CSV file is loaded directly.
+
+    :param assignments: The normalised identifiers and their assignment, or None to mark the identifier as removed
+    :param filename: The name of the index file
+    :return: The number of records written
+    """
+    records = {}
+    for row_id, assignment in assignments:
+        records[encode_key(row_id)] = assignment
+
+    # Keep the hash table at most half full so probe sequences stay short
+    slot_count = 8
+    while slot_count < len(records) * 2:
+        slot_count *= 2
+
+    slots = [0] * slot_count
+    record_data = []
+    key_data = []
+    keys_offset = INDEX_HEADER.size + slot_count * INDEX_SLOT.size + len(records) * INDEX_RECORD.size
+    key_offset = keys_offset
+
+    for record_number, (key, assignment) in enumerate(records.items()):
+        slot = zlib.crc32(key) & (slot_count - 1)
+        while slots[slot]:
+            slot = (slot + 1) & (slot_count - 1)
+        slots[slot] = record_number + 1
+
+        flags = 0
+        address = prefix = bytes(16)
+        prefix_length = 0
+        if assignment is None:
+            flags |= FLAG_REMOVED
+        elif assignment.address:
+            flags |= FLAG_ADDRESS
+            address = assignment.address.packed
+        if assignment and assignment.prefix:
+            flags |= FLAG_PREFIX
+            prefix = assignment.prefix.network_address.packed
+            prefix_length = assignment.prefix.prefixlen
+
+        record_data.append(INDEX_RECORD.pack(key_offset, len(key), prefix_length, flags, address, prefix))
+        key_data.append(key)
+        key_offset += len(key)
+
+    directory = os.path.dirname(os.path.abspath(filename))
+    temp_fd, temp_filename = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(filename) + '.')
+    try:
+        with os.fdopen(temp_fd, 'wb') as index_file:
+            index_file.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, len(records), slot_count))
+            index_file.write(pack('!{}I'.format(slot_count), *slots))
+            index_file.write(b''.join(record_data))
+            index_file.write(b''.join(key_data))
+
+        os.chmod(temp_filename, 0o644)
+        os.replace(temp_filename, filename)
+    except BaseException:
+        os.unlink(temp_filename)
+        raise
+
+    return len(records)
+
+
+class AssignmentIndex:
+    """
+    Read-only access to a memory-mapped index file
+
+    :type filename: str
+    :type record_count: int
+    :type slot_count: int
+    """
+
+    def __init__(self, filename: str):
+        """
+        Open and map the index file.
+
+        :param filename: The name of the index file
+        """
+        self.filename = filename
+
+        with open(filename, 'rb') as index_file:
+            size = os.fstat(index_file.fileno()).st_size
+            if size < INDEX_HEADER.size:
+                raise ValueError("{} is not an assignment index".format(filename))
+
+            self.map = mmap.mmap(index_file.fileno(), size, access=mmap.ACCESS_READ)
+
+        magic, version, self.record_count, self.slot_count = INDEX_HEADER.unpack_from(self.map)
+        if magic != INDEX_MAGIC:
+            self.close()
+            raise ValueError("{} is not an assignment index".format(filename))
+        if version != INDEX_VERSION:
+            self.close()
+            raise ValueError("{} has unsupported index version {}".format(filename, version))
+
+        self.slots_offset = INDEX_HEADER.size
+        self.records_offset = self.slots_offset + self.slot_count * INDEX_SLOT.size
+
+    def __len__(self):
+        return self.record_count
+
+    def close(self):
+        """
+        Unmap the index file
+        """
+        self.map.close()
+
+    def lookup(self, key: bytes) -> Optional[Assignment]:
+        """
+        Look up the assignment for a raw key.
+
+        :param key: The raw key
+        :return: The assignment, :data:`REMOVED` if the key is marked as removed or None if the key isn't in the index
+        """
+        index_map = self.map
+        mask = self.slot_count - 1
+        slot = zlib.crc32(key) & mask
+
+        while True:
+            record_number = INDEX_SLOT.unpack_from(index_map, self.slots_offset + slot * INDEX_SLOT.size)[0]
+            if not record_number:
+                return None
+
+            key_offset, key_length, prefix_length, flags, address, prefix = INDEX_RECORD.unpack_from(
+                index_map, self.records_offset + (record_number - 1) * INDEX_RECORD.size)
+
+            if key_length == len(key) and index_map[key_offset:key_offset + key_length] == key:
+                if flags & FLAG_REMOVED:
+                    return REMOVED
+
+                return Assignment(address=IPv6Address(address) if flags & FLAG_ADDRESS else None,
+                                  prefix=IPv6Network((IPv6Address(prefix), prefix_length))
+                                  if flags & FLAG_PREFIX else None)
+
+            slot = (slot + 1) & mask
+
+
+class IndexStaticAssignmentHandler(StaticAssignmentHandler):
+    """
+    Assign addresses and/or prefixes based on the contents of a compiled index file
+
+    :type filename: str
+    :type index: AssignmentIndex
+    """
+
+    def __init__(self, filename: str,
+                 address_preferred_lifetime: int, address_valid_lifetime: int,
+                 prefix_preferred_lifetime: int, prefix_valid_lifetime: int):
+        """
+        Initialise the mapping. This handler will respond to clients on responsible_for_links and assume that all
+        addresses in the mapping are appropriate for on those links.
+
+        :param filename: The filename of the index file
+        """
+        super().__init__(address_preferred_lifetime, address_valid_lifetime,
+                         prefix_preferred_lifetime, prefix_valid_lifetime)
+
+        self.filename = filename
+        self.index = None
+
+        # Check the file early so configuration errors are reported on startup
+        index = AssignmentIndex(filename)
+        logger.info("Assignment index {} contains {} assignments".format(filename, len(index)))
+        index.close()
+
+    def __str__(self):
+        return "{} from {}".format(self.__class__.__name__, self.filename)
+
+    def worker_init(self):
+        """
+        Map the index file in each worker
+        """
+        self.index = AssignmentIndex(self.filename)
+
+    def get_assignment(self, bundle: TransactionBundle) -> Assignment:
+        """
+        Look up the assignment based on DUID, Interface-ID of the relay closest to the client and Remote-ID of the
+        relay closest to the client, in that order.
+
+        :param bundle: The transaction bundle
+        :return: The assignment, if any
+        """
+        for key in get_request_keys(bundle):
+            assignment = self.index.lookup(key)
+            if assignment and assignment is not REMOVED:
+                return assignment
+
+        # Nothing found
+        return Assignment(address=None, prefix=None)
+
+
+def build_index() -> int:
+    """
+    Function to be called from the command line to convert a CSV based assignments file to an index file.
+
+    :return: exit code
+    """
+    import argparse
+    from dhcpkit.common.logging.verbosity import set_verbosity_logger
+    from dhcpkit.ipv6.server.extensions.static_assignments.csv import CSVStaticAssignmentHandler
+
+    # Handle command line arguments
+    parser = argparse.ArgumentParser(
+        description="Assignments CSV to index converter",
+    )
+
+    parser.add_argument("source", help="the source CSV file")
+    parser.add_argument("destination", help="the destination index file")
+    parser.add_argument("-v", "--verbosity", action="count", default=0, help="increase output verbosity")
+
+    args = parser.parse_args()
+
+    # Our logger is the root logger now
+    global logger
+    logger = logging.getLogger()
+    set_verbosity_logger(logger, args.verbosity)
+
+    logger.info("Reading assignments from CSV file {}".format(args.source))
+    try:
+        count = write_index(CSVStaticAssignmentHandler.parse_csv_file(args.source), args.destination)
+    except (OSError, ValueError) as e:
+        logger.critical(e)
+        return 1
+
+    logger.info("Wrote {} assignments to index file {}".format(count, args.destination))
+    return 0
@@ -1,22 +1,79 @@
 """
 An option handler that assigns addresses based on DUID from a SQLite database
 """
-import codecs
 import logging
 import os
 import sqlite3
+import threading
 import time
+import weakref
+from collections import OrderedDict
 from ipaddress import IPv6Address, IPv6Network
+from pathlib import Path
 
-from dhcpkit.ipv6.extensions.linklayer_id import LinkLayerIdOption
-from dhcpkit.ipv6.extensions.remote_id import RemoteIdOption
-from dhcpkit.ipv6.extensions.subscriber_id import SubscriberIdOption
-from dhcpkit.ipv6.options import ClientIdOption, InterfaceIdOption
 from dhcpkit.ipv6.server.extensions.static_assignments import Assignment, StaticAssignmentHandler
+from dhcpkit.ipv6.server.extensions.static_assignments.bloom import SharedBloomFilter
+from dhcpkit.ipv6.server.identifiers import decode_key, get_request_keys
+from dhcpkit.ipv6.server.statistics import SharedCounters
 from dhcpkit.ipv6.server.transaction_bundle import TransactionBundle
+from typing import Dict, List, Optional
 
 logger = logging.getLogger(__name__)
 
+# How often the cache, the in-memory copies and the Bloom filter check whether the database has changed
+CHANGE_CHECK_INTERVAL = 1.0
+
+# Connection.backup() is only available since Python 3.7
+HAS_BACKUP = hasattr(sqlite3.Connection, 'backup')
+
+COUNTER_NAMES = [
+    'hits',
+    'misses',
+    'invalidations',
+    'skipped_lookups',
+    'false_positives',
+    'reloads',
+]
+
+# Statements to look up the assignment for a number of identifiers. Each identifier is looked up separately using the
+# primary key and the first one that is found wins, so the identifiers are used in order of preference. These are the
+# only statements used for lookups, so SQLite never needs to compile them again.
+SELECT_ASSIGNMENT = {
+    count: " UNION ALL ".join(["SELECT {0}, address, prefix FROM assignments WHERE id = ?{0}".format(number)
+                               for number in range(1, count + 1)]) + " ORDER BY 1 LIMIT 1"
+    for count in range(1, 6)
+}
+
+
+def watch_database(handler_ref: weakref.ref, db: sqlite3.Connection, data_version: int):
+    """
+    Rebuild the Bloom filter of a handler when the database changes. This runs in a thread in the master process, and
+    stops when the handler is no longer in use, for example after the configuration has been reloaded.
+
+    :param handler_ref: A weak reference to the handler
+    :param db: The database connection to use, which is closed when the thread stops
+    :param data_version: The data version of the database when the Bloom filter was built
+    """
+    try:
+        while True:
+            time.sleep(CHANGE_CHECK_INTERVAL)
+
+            handler = handler_ref()
+            if handler is None:
+                return
+
+            try:
+                new_data_version = db.execute("PRAGMA data_version").fetchone()[0]
+                if new_data_version != data_version:
+                    data_version = new_data_version
+                    handler.build_bloom_filter(db)
+            except sqlite3.Error as e:
+                logger.error("Not rebuilding Bloom filter of {}: {}".format(handler.sqlite_filename, e))
+
+            del handler
+    finally:
+        db.close()
+
 
 def build_sqlite() -> int:
     """
@@ -142,32 +199,188 @@ def build_sqlite() -> int:
 class SqliteStaticAssignmentHandler(StaticAssignmentHandler):
     """
     Assign addresses and/or prefixes based on the contents of a Shelf file
+
+    :type sqlite_filename: str
+    :type read_only: bool
+    :type mmap_size: int
+    :type page_cache_size: int
+    :type in_memory: bool
+    :type cache_size: int
+    :type cache: OrderedDict
+    :type bloom_filter: Optional[SharedBloomFilter]
+    :type counters: SharedCounters
     """
 
     def __init__(self, filename: str,
                  address_preferred_lifetime: int, address_valid_lifetime: int,
-                 prefix_preferred_lifetime: int, prefix_valid_lifetime: int):
+                 prefix_preferred_lifetime: int, prefix_valid_lifetime: int,
+                 cache_size: int = 0, bloom_filter: bool = False,
+                 read_only: bool = False, mmap_size: int = 0, page_cache_size: int = 0, in_memory: bool = False):
         """
         Initialise the mapping. This handler will respond to clients on responsible_for_links and assume that all
         addresses in the mapping are appropriate for on those links.
 
         :param filename: The filename containing the SQLite database
+        :param cache_size: The number of lookups to cache in each worker, or 0 to disable the cache
+        :param bloom_filter: Whether to skip the database for identifiers that are certainly not in it
+        :param read_only: Whether to open the database in read-only mode
+        :param mmap_size: The number of bytes of the database to access through memory-mapped I/O, or 0 for the default
+        :param page_cache_size: The size of the page cache of each connection in bytes, or 0 for the default
+        :param in_memory: Whether each worker uses a copy of the database in memory
         """
         super().__init__(address_preferred_lifetime, address_valid_lifetime,
                          prefix_preferred_lifetime, prefix_valid_lifetime)
 
         self.sqlite_filename = filename
+        self.read_only = read_only
+        self.mmap_size = mmap_size
+        self.page_cache_size = page_cache_size
+        self.in_memory = in_memory
+
+        # The connection to the database file and the connection used for lookups, which is the same one unless an
+        # in-memory copy is used
+        self.source_db = None
         self.db = None
 
+        # The cache is filled separately in each worker, the counters are shared
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.counters = SharedCounters(COUNTER_NAMES)
+        self.data_version = None
+        self.next_cache_check = 0.0
+
+        # The Bloom filter is built in the master process and shared with the workers
+        self.bloom_filter = None
+        if bloom_filter:
+            db = self.connect()
+            data_version = db.execute("PRAGMA data_version").fetchone()[0]
+
+            # Leave room for the database to grow
+            count = db.execute("SELECT COUNT(1) FROM assignments").fetchone()[0]
+            self.bloom_filter = SharedBloomFilter(capacity=max(count * 2, 1024))
+            self.build_bloom_filter(db)
+
+            thread = threading.Thread(target=watch_database, args=(weakref.ref(self), db, data_version),
+                                      name='SqliteWatcher', daemon=True)
+            thread.start()
+
     def __str__(self):
         return "{} from {}".format(self.__class__.__name__, self.sqlite_filename)
 
+    def connect(self) -> sqlite3.Connection:
+        """
+        Open the database file with the configured settings.
+
+        :return: The database connection
+        """
+        if self.read_only:
+            uri = Path(os.path.abspath(self.sqlite_filename)).as_uri() + '?mode=ro'
+            db = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        else:
+            db = sqlite3.connect(self.sqlite_filename, check_same_thread=False)
+
+        if self.mmap_size:
+            db.execute("PRAGMA mmap_size = {:d}".format(self.mmap_size))
+
+        if self.page_cache_size:
+            # A negative cache size is in KiB instead of pages
+            db.execute("PRAGMA cache_size = {:d}".format(-max(self.page_cache_size // 1024, 1)))
+
+        return db
+
     def worker_init(self):
         """
         Open the SQLite database in each worker
         """
         logger.info("Opening SQLite database {}".format(self.sqlite_filename))
-        self.db = sqlite3.connect(self.sqlite_filename, check_same_thread=False)
+        self.source_db = self.connect()
+        self.data_version = self.source_db.execute("PRAGMA data_version").fetchone()[0]
+
+        if self.in_memory:
+            self.db = None
+            self.load_copy()
+        else:
+            self.db = self.source_db
+
+        self.cache.clear()
+        self.next_cache_check = time.monotonic() + CHANGE_CHECK_INTERVAL
+
+    def load_copy(self):
+        """
+        Copy the database file into memory, and use the copy for lookups.
+        """
+        db = sqlite3.connect(':memory:', check_same_thread=False)
+        if HAS_BACKUP:
+            self.source_db.backup(db)
+        else:
+            db.executescript('\n'.join(self.source_db.iterdump()))
+
+        if self.db is not None:
+            self.db.close()
+        self.db = db
+
+    def export_statistics(self) -> Dict[str, dict]:
+        """
+        Export the statistics of the cache and the Bloom filter, if they are used.
+
+        :return: The statistics in a processable format
+        """
+        totals = dict(zip(COUNTER_NAMES, self.counters.totals()))
+        out = OrderedDict()
+
+        if self.cache_size:
+            for name in ('hits', 'misses', 'invalidations'):
+                out[name] = totals[name]
+            lookups = out['hits'] + out['misses']
+            out['hit_ratio'] = out['hits'] / lookups if lookups else 0.0
+
+        if self.in_memory:
+            out['reloads'] = totals['reloads']
+
+        if self.bloom_filter is not None:
+            for name in ('skipped_lookups', 'false_positives'):
+                out[name] = totals[name]
+            negatives = out['skipped_lookups'] + out['false_positives']
+            out['false_positive_rate'] = out['false_positives'] / negatives if negatives else 0.0
+            out['bloom_filter_keys'] = len(self.bloom_filter)
+            out['bloom_filter_capacity'] = self.bloom_filter.capacity
+
+        if not out:
+            return {}
+
+        return {str(self): out}
+
+    def build_bloom_filter(self, db: sqlite3.Connection):
+        """
+        Build the Bloom filter from all identifiers in the database. This is done in the master process.
+
+        :param db: The database connection to use
+        """
+        count = self.bloom_filter.build(row[0] for row in db.execute("SELECT id FROM assignments"))
+        logger.debug("Built Bloom filter of {} with {} identifiers".format(self.sqlite_filename, count))
+
+    def check_cache(self):
+        """
+        Clear the cache and copy the database into memory again when the database has been changed by another
+        connection. SQLite increments the data version on every commit by another connection. To keep it cheap this is
+        checked at most every :data:`CHANGE_CHECK_INTERVAL` seconds.
+        """
+        now = time.monotonic()
+        if now < self.next_cache_check:
+            return
+
+        self.next_cache_check = now + CHANGE_CHECK_INTERVAL
+        data_version = self.source_db.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self.data_version:
+            self.data_version = data_version
+
+            if self.in_memory:
+                self.load_copy()
+                self.counters.increment(COUNTER_NAMES.index('reloads'))
+
+            if self.cache:
+                self.cache.clear()
+                self.counters.increment(COUNTER_NAMES.index('invalidations'))
 
     def get_assignment(self, bundle: TransactionBundle) -> Assignment:
         """
@@ -177,53 +390,78 @@ class SqliteStaticAssignmentHandler(StaticAssignmentHandler):
         :param bundle: The transaction bundle
         :return: The assignment, if any
         """
-        # Gather all possible IDs
-        possible_ids = []
-
-        # Look up based on DUID
-        duid_option = bundle.request.get_option_of_type(ClientIdOption)
-        duid = 'duid:' + codecs.encode(duid_option.duid.save(), 'hex').decode('ascii')
-        possible_ids.append(duid)
-
-        # Look up based on Interface-ID
-        interface_id_option = bundle.incoming_relay_messages[0].get_option_of_type(InterfaceIdOption)
-        if interface_id_option:
-            interface_id = 'interface-id:' + codecs.encode(interface_id_option.interface_id, 'hex').decode('ascii')
-            possible_ids.append(interface_id)
-
-        # Look up based on Remote-ID
-        remote_id_option = bundle.incoming_relay_messages[0].get_option_of_type(RemoteIdOption)
-        if remote_id_option:
-            remote_id = 'remote-id:{}:{}'.format(remote_id_option.enterprise_number,
-                                                 codecs.encode(remote_id_option.remote_id, 'hex').decode('ascii'))
-            possible_ids.append(remote_id)
-
-        # Look up based on Subscriber-ID
-        subscriber_id_option = bundle.incoming_relay_messages[0].get_option_of_type(SubscriberIdOption)
-        if subscriber_id_option:
-            subscriber_id = 'subscriber-id:{}'.format(
-                codecs.encode(subscriber_id_option.subscriber_id, 'hex').decode('ascii')
-            )
-            possible_ids.append(subscriber_id)
-
-        # Look up based on LinkLayer-ID
-        linklayer_id_option = bundle.incoming_relay_messages[0].get_option_of_type(LinkLayerIdOption)
-        if linklayer_id_option:
-            linklayer_id = 'linklayer-id:{}:{}'.format(
-                linklayer_id_option.link_layer_type,
-                codecs.encode(linklayer_id_option.link_layer_address, 'hex').decode('ascii')
-            )
-            possible_ids.append(linklayer_id)
-
-        # Search
-        placeholders = ', '.join(['?'] * len(possible_ids))
-        query = "SELECT address, prefix FROM assignments WHERE id IN (" + placeholders + ") ORDER BY id LIMIT 1"
-        results = self.db.execute(query, possible_ids).fetchone()
-        if results:
-            address = results[0] and IPv6Address(results[0]) or None
-            prefix = results[1] and IPv6Network(results[1]) or None
-
-            return Assignment(address=address, prefix=prefix)
-
-        # Nothing found
-        return Assignment(address=None, prefix=None)
+        keys = get_request_keys(bundle)
+
+        if self.cache_size or self.in_memory:
+            self.check_cache()
+
+        if not self.cache_size:
+            return self.find_assignment([decode_key(key) for key in keys])
+
+        # Try the cache first, its keys don't need to be converted to text
+        cache_key = tuple(keys)
+        assignment = self.cache.get(cache_key)
+        if assignment is not None:
+            self.cache.move_to_end(cache_key)
+            self.counters.increment(COUNTER_NAMES.index('hits'))
+            return assignment
+
+        self.counters.increment(COUNTER_NAMES.index('misses'))
+        assignment = self.find_assignment([decode_key(key) for key in keys])
+
+        self.cache[cache_key] = assignment
+        if len(self.cache) > self.cache_size:
+            # Evict the least recently used entry
+            self.cache.popitem(last=False)
+
+        return assignment
+
+    def find_assignment(self, possible_ids: List[str]) -> Assignment:
+        """
+        Find the assignment, skipping the database if the Bloom filter shows that none of the identifiers are in it.
+
+        :param possible_ids: The identifiers of the client, in order of preference
+        :return: The assignment, if any
+        """
+        if self.bloom_filter is not None:
+            # Only look up the identifiers that may be in the database
+            possible_ids = [possible_id for possible_id in possible_ids if possible_id in self.bloom_filter]
+            if not possible_ids:
+                self.counters.increment(COUNTER_NAMES.index('skipped_lookups'))
+                return Assignment(address=None, prefix=None)
+
+        assignment = self.query_assignment(possible_ids)
+        if assignment is None:
+            if self.bloom_filter is not None:
+                self.counters.increment(COUNTER_NAMES.index('false_positives'))
+
+            # Nothing found
+            return Assignment(address=None, prefix=None)
+
+        return assignment
+
+    def query_assignment(self, possible_ids: List[str]) -> Optional[Assignment]:
+        """
+        Look up the assignment in the database.
+
+        :param possible_ids: The identifiers of the client, in order of preference
+        :return: The assignment, or None if none of the identifiers are in the database
+        """
+        statement = SELECT_ASSIGNMENT.get(len(possible_ids))
+        if statement:
+            results = self.db.execute(statement, possible_ids).fetchone()
+        else:
+            # More identifiers than there are statements for, look them up one by one
+            results = None
+            for possible_id in possible_ids:
+                results = self.db.execute(SELECT_ASSIGNMENT[1], (possible_id,)).fetchone()
+                if results:
+                    break
+
+        if not results:
+            return None
+
+        address = results[1] and IPv6Address(results[1]) or None
+        prefix = results[2] and IPv6Network(results[2]) or None
+
+        return Assignment(address=address, prefix=prefix)
@@ -2,12 +2,12 @@
 Filters to apply to transaction bundles
 """
 import logging
-from typing import Iterable, List, Type
+from typing import Dict, Iterable, List, Type
 
 from cached_property import cached_property
 from dhcpkit.common.server.config_elements import ConfigElementFactory
 from dhcpkit.common.server.logging import DEBUG_HANDLING
-from dhcpkit.ipv6.server.handlers import Handler
+from dhcpkit.ipv6.server.handlers import Handler, merge_statistics
 from dhcpkit.ipv6.server.transaction_bundle import TransactionBundle
 from dhcpkit.utils import camelcase_to_dash
 
@@ -48,6 +48,14 @@ class Filter:
         for sub_handler in self.sub_handlers:
             sub_handler.worker_init()
 
+    def export_statistics(self) -> Dict[str, dict]:
+        """
+        Collect the statistics of the sub-filters and sub-handlers.
+
+        :return: The statistics in a processable format
+        """
+        return merge_statistics(self.sub_filters + self.sub_handlers)
+
     @cached_property
     def filter_description(self) -> str:
         """
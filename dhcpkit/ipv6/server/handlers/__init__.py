@@ -3,11 +3,13 @@ Handlers to apply to transaction bundles
 """
 
 import logging
+from collections import OrderedDict
 
 from dhcpkit.common.server.config_elements import ConfigElementFactory
 from dhcpkit.ipv6.messages import RelayForwardMessage, RelayReplyMessage
 from dhcpkit.ipv6.options import StatusCodeOption
 from dhcpkit.ipv6.server.transaction_bundle import TransactionBundle
+from typing import Dict, Iterable
 
 logger = logging.getLogger(__name__)
 
@@ -55,6 +57,27 @@ class UseMulticastError(HandlerException):
     """
 
 
+def merge_statistics(elements: Iterable) -> Dict[str, dict]:
+    """
+    Collect the statistics of a list of handlers and filters, making sure that every name is unique.
+
+    :param elements: The handlers and filters
+    :return: The statistics per element name
+    """
+    out = OrderedDict()
+    for element in elements:
+        for name, data in element.export_statistics().items():
+            unique_name = name
+            suffix = 2
+            while unique_name in out:
+                unique_name = '{} ({})'.format(name, suffix)
+                suffix += 1
+
+            out[unique_name] = data
+
+    return out
+
+
 class Handler:
     """
     Base class for handlers
@@ -77,6 +100,15 @@ class Handler:
         worker_init() to do so. Filters that don't need per-worker initialisation can do everything in __init__().
         """
 
+    def export_statistics(self) -> Dict[str, dict]:
+        """
+        Export statistics about this handler. This is called in the master process, so only data in shared memory is
+        up to date here. Handlers that keep statistics return them keyed by their description.
+
+        :return: The statistics in a processable format
+        """
+        return {}
+
     def analyse_pre(self, bundle: TransactionBundle):
         """
         Analyse the request that came in before handlers can change it.
@@ -0,0 +1,291 @@
+"""
+Automatic tracking of the busiest relays, links and clients in shared memory
+"""
+import heapq
+import math
+import os
+import time
+from collections import OrderedDict
+from ctypes import c_char, c_double, c_uint16
+from ipaddress import IPv6Address
+from multiprocessing.sharedctypes import RawArray
+
+from dhcpkit.ipv6.server import statistics
+from typing import Dict, Iterable, List, Tuple
+
+# A DUID is at most 130 bytes long, which is the longest key we need to store
+KEY_SIZE = 130
+
+# Rescale the counts when this many half-lives have passed since the epoch, before the weight of new occurrences gets
+# too large
+RESCALE_HALF_LIVES = 32
+
+
+class HeavyHitters:
+    """
+    Keep track of the keys that are seen most often using the space-saving algorithm. Every process has its own slot
+    with a fixed number of entries in shared memory in which it is the only writer. Counts decay exponentially with the
+    given half-life so that the result reflects the current request rate.
+
+    Instead of decreasing all counts as time passes, new occurrences weigh more the longer ago the epoch of the slot
+    is. Counts therefore only increase, which allows each process to find the entry with the lowest count with a heap
+    instead of looking at all entries.
+
+    :type capacity: int
+    :type half_life: float
+    :type slots: int
+    """
+
+    def __init__(self, capacity: int, half_life: float, slots: int = None):
+        """
+        Allocate the tables in shared memory
+
+        :param capacity: The number of keys to keep track of in each slot
+        :param half_life: The half-life of the counts in seconds
+        :param slots: The number of slots to allocate, defaults to one for each process
+        """
+        self.capacity = capacity
+        self.half_life = half_life
+        self.slots = slots or statistics.slot_count
+
+        self.keys = RawArray(c_char, self.slots * self.capacity * KEY_SIZE)
+        self.key_lengths = RawArray(c_uint16, self.slots * self.capacity)
+        self.counts = RawArray(c_double, self.slots * self.capacity)
+        self.epochs = RawArray(c_double, self.slots)
+
+        # Process-local index and heap of our own slot, rebuilt when used in a different process
+        self._index_pid = None
+        self._index = {}
+        self._heap = []
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_index_pid'] = None
+        state['_index'] = {}
+        state['_heap'] = []
+        return state
+
+    def _get_key(self, entry: int) -> bytes:
+        """
+        Get the key stored in the given entry
+
+        :param entry: The absolute entry number
+        :return: The key
+        """
+        start = entry * KEY_SIZE
+        return self.keys[start:start + self.key_lengths[entry]]
+
+    def _set_key(self, entry: int, key: bytes):
+        """
+        Store the key in the given entry
+
+        :param entry: The absolute entry number
+        :param key: The key
+        """
+        start = entry * KEY_SIZE
+        self.keys[start:start + len(key)] = key
+        self.key_lengths[entry] = len(key)
+
+    def _build_index(self, slot: int) -> Dict[bytes, int]:
+        """
+        Build the index of the keys in the given slot
+
+        :param slot: The slot number
+        :return: A dictionary from key to absolute entry number
+        """
+        index = {}
+        first = slot * self.capacity
+        for entry in range(first, first + self.capacity):
+            if self.key_lengths[entry]:
+                index[self._get_key(entry)] = entry
+        return index
+
+    def _build_heap(self) -> List[Tuple[float, int]]:
+        """
+        Build the heap of the counts of the entries in the index
+
+        :return: A heap of counts and absolute entry numbers
+        """
+        heap = [(self.counts[entry], entry) for entry in self._index.values()]
+        heapq.heapify(heap)
+        return heap
+
+    def _rescale(self, slot: int, now: float):
+        """
+        Apply the decay to all counts in the given slot and make the current time its new epoch
+
+        :param slot: The slot number
+        :param now: The current time
+        """
+        factor = 0.5 ** ((now - self.epochs[slot]) / self.half_life)
+        first = slot * self.capacity
+        for entry in range(first, first + self.capacity):
+            self.counts[entry] *= factor
+        self.epochs[slot] = now
+        self._heap = self._build_heap()
+
+    def _find_minimum(self) -> int:
+        """
+        Find the entry with the lowest count. The heap contains every entry once, but counts may have increased since
+        they were put on the heap. Because counts never decrease, an entry whose count is still up to date has the
+        lowest count.
+
+        :return: The absolute entry number
+        """
+        heap = self._heap
+        while True:
+            count, entry = heap[0]
+            current = self.counts[entry]
+            if count == current:
+                return entry
+            heapq.heapreplace(heap, (current, entry))
+
+    def count(self, key: bytes):
+        """
+        Count one occurrence of the given key in the slot of this process
+
+        :param key: The key to count
+        """
+        if not key:
+            return
+
+        key = key[:KEY_SIZE]
+        slot = statistics.current_slot % self.slots
+
+        if self._index_pid != os.getpid():
+            self._index = self._build_index(slot)
+            self._heap = self._build_heap()
+            self._index_pid = os.getpid()
+
+        now = time.monotonic()
+        half_lives = (now - self.epochs[slot]) / self.half_life
+        if half_lives > RESCALE_HALF_LIVES:
+            self._rescale(slot, now)
+            weight = 1.0
+        else:
+            weight = 2.0 ** half_lives
+
+        entry = self._index.get(key)
+        if entry is not None:
+            self.counts[entry] += weight
+            return
+
+        if len(self._index) < self.capacity:
+            # Use an empty entry
+            entry = slot * self.capacity + len(self._index)
+            self._set_key(entry, key)
+            self.counts[entry] = weight
+            self._index[key] = entry
+            heapq.heappush(self._heap, (weight, entry))
+            return
+
+        # Replace the entry with the lowest count, and inherit its count as the space-saving algorithm prescribes
+        entry = self._find_minimum()
+        del self._index[self._get_key(entry)]
+        self._set_key(entry, key)
+        self.counts[entry] += weight
+        self._index[key] = entry
+        heapq.heapreplace(self._heap, (self.counts[entry], entry))
+
+    def top(self, n: int) -> List[Tuple[bytes, float]]:
+        """
+        Get the keys with the highest request rate over all slots
+
+        :param n: The number of keys to return
+        :return: A list of keys and their approximate rate per second, busiest first
+        """
+        now = time.monotonic()
+        totals = {}
+        for slot in range(self.slots):
+            factor = 0.5 ** (max(0.0, now - self.epochs[slot]) / self.half_life)
+            first = slot * self.capacity
+            for entry in range(first, first + self.capacity):
+                if self.key_lengths[entry]:
+                    key = self._get_key(entry)
+                    totals[key] = totals.get(key, 0.0) + self.counts[entry] * factor
+
+        # An exponentially decaying count converges to rate / decay-constant
+        decay_constant = math.log(2) / self.half_life
+        ordered = sorted(totals.items(), key=lambda item: item[1], reverse=True)
+        return [(key, count * decay_constant) for key, count in ordered[:n]]
+
+
+class HeavyHittersSet:
+    """
+    The heavy hitter trackers for the different categories
+
+    :type top_n: int
+    :type trackers: Dict[str, HeavyHitters]
+    """
+
+    # The categories we track
+    categories = ('interfaces', 'relays', 'links', 'clients')
+
+    def __init__(self, top_n: int, half_life: float):
+        """
+        Allocate trackers for all categories
+
+        :param top_n: The number of entries to report for each category
+        :param half_life: The half-life of the counts in seconds
+        """
+        self.top_n = top_n
+        self.half_life = half_life
+
+        # Keep track of more keys than we report to make the results more reliable
+        self.trackers = {category: HeavyHitters(capacity=max(4 * top_n, 16), half_life=half_life)
+                         for category in self.categories}
+
+    def count(self, interface_name: str = None, relays: Iterable[bytes] = (), link_address: bytes = None,
+              client_duid: bytes = None):
+        """
+        Count a request
+
+        :param interface_name: The name of the interface the request was received on
+        :param relays: The packed addresses of the relays the request went through
+        :param link_address: The packed link address of the request
+        :param client_duid: The DUID of the client
+        """
+        if interface_name:
+            self.trackers['interfaces'].count(interface_name.encode('utf-8'))
+        for relay in relays:
+            self.trackers['relays'].count(relay)
+        if link_address:
+            self.trackers['links'].count(link_address)
+        if client_duid:
+            self.trackers['clients'].count(client_duid)
+
+    @staticmethod
+    def format_key(category: str, key: bytes) -> str:
+        """
+        Convert a key to a human readable form
+
+        :param category: The category the key belongs to
+        :param key: The key
+        :return: The key as a string
+        """
+        if category == 'interfaces':
+            return key.decode('utf-8', errors='replace')
+        elif category in ('relays', 'links') and len(key) == 16:
+            return str(IPv6Address(key))
+        else:
+            return key.hex()
+
+    def export(self) -> Dict[str, List[Dict[str, object]]]:
+        """
+        Export the top entries of each category
+
+        :return: The top entries of each category
+        """
+        out = OrderedDict()
+        for category in self.categories:
+            out[category] = [OrderedDict([('key', self.format_key(category, key)),
+                                          ('rate', round(rate, 3))])
+                             for key, rate in self.trackers[category].top(self.top_n)]
+        return out
+
+    def __str__(self):
+        lines = []
+        for category, entries in self.export().items():
+            lines += ['Top {} {} (requests per second)'.format(self.top_n, category)]
+            lines += ['- {}: {:.3f}'.format(entry['key'], entry['rate']) for entry in entries]
+        return '\n'.join(lines)
@@ -0,0 +1,118 @@
+"""
+Binary keys for the identifiers of a client, used to look up information about the client. Each key starts with a byte
+that shows what kind of identifier it contains, followed by the raw bytes of the identifier as received.
+"""
+import codecs
+from struct import pack, unpack_from
+
+from dhcpkit.ipv6.extensions.linklayer_id import LinkLayerIdOption
+from dhcpkit.ipv6.extensions.remote_id import RemoteIdOption
+from dhcpkit.ipv6.extensions.subscriber_id import SubscriberIdOption
+from dhcpkit.ipv6.options import ClientIdOption, InterfaceIdOption
+from dhcpkit.ipv6.server.transaction_bundle import TransactionBundle
+from typing import List
+
+# The first byte of the keys, which shows what kind of identifier the key contains
+KEY_DUID = 1
+KEY_INTERFACE_ID = 2
+KEY_REMOTE_ID = 3
+KEY_SUBSCRIBER_ID = 4
+KEY_LINKLAYER_ID = 5
+
+DUID_PREFIX = bytes([KEY_DUID])
+INTERFACE_ID_PREFIX = bytes([KEY_INTERFACE_ID])
+REMOTE_ID_PREFIX = bytes([KEY_REMOTE_ID])
+SUBSCRIBER_ID_PREFIX = bytes([KEY_SUBSCRIBER_ID])
+LINKLAYER_ID_PREFIX = bytes([KEY_LINKLAYER_ID])
+
+
+def get_request_keys(bundle: TransactionBundle) -> List[bytes]:
+    """
+    Determine the keys to look up for a request, in order of preference: DUID, and the Interface-ID, Remote-ID,
+    Subscriber-ID and LinkLayer-ID of the relay closest to the client.
+
+    :param bundle: The transaction bundle
+    :return: The keys
+    """
+    duid_option = bundle.request.get_option_of_type(ClientIdOption)
+    keys = [DUID_PREFIX + duid_option.get_duid_bytes()]
+
+    relay_message = bundle.incoming_relay_messages[0]
+
+    interface_id_option = relay_message.get_option_of_type(InterfaceIdOption)
+    if interface_id_option:
+        keys.append(INTERFACE_ID_PREFIX + interface_id_option.interface_id)
+
+    remote_id_option = relay_message.get_option_of_type(RemoteIdOption)
+    if remote_id_option:
+        keys.append(REMOTE_ID_PREFIX + pack('!I', remote_id_option.enterprise_number) + remote_id_option.remote_id)
+
+    subscriber_id_option = relay_message.get_option_of_type(SubscriberIdOption)
+    if subscriber_id_option:
+        keys.append(SUBSCRIBER_ID_PREFIX + subscriber_id_option.subscriber_id)
+
+    linklayer_id_option = relay_message.get_option_of_type(LinkLayerIdOption)
+    if linklayer_id_option:
+        keys.append(LINKLAYER_ID_PREFIX + pack('!H', linklayer_id_option.link_layer_type)
+                    + linklayer_id_option.link_layer_address)
+
+    return keys
+
+
+def encode_key(row_id: str) -> bytes:
+    """
+    Convert a normalised identifier as produced by
+    :meth:`~dhcpkit.ipv6.server.extensions.static_assignments.csv.CSVStaticAssignmentHandler.parse_csv_file` into a
+    key.
+
+    :param row_id: The normalised identifier
+    :return: The key
+    """
+    id_type, id_value = row_id.split(':', 1)
+
+    if id_type == 'duid':
+        return DUID_PREFIX + codecs.decode(id_value, 'hex')
+
+    elif id_type == 'interface-id':
+        return INTERFACE_ID_PREFIX + codecs.decode(id_value, 'hex')
+
+    elif id_type == 'remote-id':
+        enterprise_number, remote_id = id_value.split(':', 1)
+        return REMOTE_ID_PREFIX + pack('!I', int(enterprise_number)) + codecs.decode(remote_id, 'hex')
+
+    elif id_type == 'subscriber-id':
+        return SUBSCRIBER_ID_PREFIX + codecs.decode(id_value, 'hex')
+
+    elif id_type == 'linklayer-id':
+        link_layer_type, link_layer_address = id_value.split(':', 1)
+        return LINKLAYER_ID_PREFIX + pack('!H', int(link_layer_type)) + codecs.decode(link_layer_address, 'hex')
+
+    raise ValueError("Unsupported ID type {}".format(id_type))
+
+
+def decode_key(key: bytes) -> str:
+    """
+    Convert a key into a normalised identifier, the reverse of :func:`encode_key`. This is used for storage that
+    contains the identifiers as text.
+
+    :param key: The key
+    :return: The normalised identifier
+    """
+    key_type = key[0]
+
+    if key_type == KEY_DUID:
+        return 'duid:' + key[1:].hex()
+
+    elif key_type == KEY_INTERFACE_ID:
+        return 'interface-id:' + key[1:].hex()
+
+    elif key_type == KEY_REMOTE_ID:
+        return 'remote-id:{}:{}'.format(unpack_from('!I', key, 1)[0], key[5:].hex())
+
+    elif key_type == KEY_SUBSCRIBER_ID:
+        return 'subscriber-id:' + key[1:].hex()
+
+    elif key_type == KEY_LINKLAYER_ID:
+        return 'linklayer-id:{}:{}'.format(unpack_from('!H', key, 1)[0], key[3:].hex())
+
+    raise ValueError("Unsupported key type {}".format(key_type))
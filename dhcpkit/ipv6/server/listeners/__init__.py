@@ -8,7 +8,7 @@ from ipaddress import IPv6Address
 
 from dhcpkit.ipv6.messages import RelayReplyMessage
 from dhcpkit.ipv6.options import Option
-from typing import Iterable, Optional, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
@@ -124,6 +124,31 @@ class Replier:
         """
         raise NotImplementedError
 
+    def send_replies(self, outgoing_messages: Iterable[RelayReplyMessage]) -> int:
+        """
+        Send all replies to the client, stopping at the first one that can't be sent. Repliers that can send multiple
+        replies should override this to send them more efficiently than one by one.
+
+        :param outgoing_messages: The messages to send, including a wrapping RelayReplyMessage
+        :return: The number of replies that were sent
+        """
+        sent = 0
+        for outgoing_message in outgoing_messages:
+            if not self.send_reply(outgoing_message):
+                break
+            sent += 1
+
+        return sent
+
+    def get_result(self) -> Any:
+        """
+        Return the information that should be passed back to the listener in the master process after the request
+        has been handled. Repliers that send their replies themselves don't need to return anything.
+
+        :return: Something that can be pickled, or None
+        """
+        return None
+
 
 class Listener:
     """
@@ -138,6 +163,85 @@ class Listener:
         """
         raise NotImplementedError
 
+    def recv_requests(self, max_count: int) -> List[Tuple[IncomingPacketBundle, Replier]]:
+        """
+        Receive all incoming messages that are waiting, up to the given maximum. Listeners that can receive multiple
+        messages without blocking should override this so that they don't need a select() call for every message.
+
+        :param max_count: The maximum number of messages to receive
+        :return: A list of incoming packet data and a replier object for each message
+        """
+        return [self.recv_request()]
+
+    @property
+    def timeout(self) -> Optional[float]:
+        """
+        The number of seconds after which the main loop must check this listener even when nothing is received, or
+        None if it doesn't need to be checked.
+        """
+        return None
+
+    @property
+    def expired(self) -> bool:
+        """
+        Whether this listener has expired and should be closed
+        """
+        return False
+
+    @property
+    def paused(self) -> bool:
+        """
+        Whether this listener doesn't want to receive more requests until some of the dispatched ones are handled
+        """
+        return False
+
+    @property
+    def has_pending_requests(self) -> bool:
+        """
+        Whether this listener has already received requests that it hasn't returned yet. The main loop then calls
+        recv_requests() again without waiting for the socket to become readable.
+        """
+        return False
+
+    @property
+    def has_unsent_replies(self) -> bool:
+        """
+        Whether this listener has replies that it couldn't send yet. The main loop then calls send_unsent_replies()
+        when the socket becomes writable.
+        """
+        return False
+
+    def send_unsent_replies(self):
+        """
+        Called by the main loop when the socket is writable and the listener has unsent replies.
+        """
+
+    def request_dispatched(self):
+        """
+        Called by the main loop when a request from this listener is sent to a worker process.
+        """
+
+    def request_completed(self, result: Any = None):
+        """
+        Called when the worker process has finished handling a request from this listener. This is called from a
+        different thread than the main loop.
+
+        :param result: What the replier of the request returned from :meth:`Replier.get_result`, if anything
+        """
+
+    def close(self):
+        """
+        Close this listener after it has been removed from the main loop.
+        """
+
+    def export_statistics(self) -> Dict[str, dict]:
+        """
+        Export statistics about this listener, keyed by its description.
+
+        :return: The statistics in a processable format
+        """
+        return {}
+
     def fileno(self) -> int:
         """
         The fileno of the listening socket, so this object can be used by select()
@@ -152,6 +256,14 @@ class ListenerCreator:
     A class to represent something that creates something to listen for incoming requests.
     """
 
+    def export_statistics(self) -> Dict[str, dict]:
+        """
+        Export statistics about this listener creator and the listeners it created, keyed by its description.
+
+        :return: The statistics in a processable format
+        """
+        return {}
+
     def create_listener(self) -> Optional[Listener]:
         """
         Receive incoming messages
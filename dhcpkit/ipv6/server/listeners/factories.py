@@ -2,12 +2,15 @@
 Factory base classes for listener factories
 """
 
+import logging
 import socket
 from ipaddress import IPv6Address
 
 from dhcpkit.common.server.config_elements import ConfigElementFactory
 from dhcpkit.ipv6 import SERVER_PORT
 
+logger = logging.getLogger(__name__)
+
 
 class ListenerFactory(ConfigElementFactory):
     """
@@ -40,6 +43,46 @@ class ListenerFactory(ConfigElementFactory):
         # Amazing! This one seems to match
         return True
 
+    @staticmethod
+    def set_buffer_size(sock: socket.socket, option: int, force_option: int, size: int):
+        """
+        Set a socket buffer size. The kernel limits the size to net.core.rmem_max or net.core.wmem_max, unless we are
+        privileged enough to force it.
+
+        :param sock: The socket
+        :param option: The socket option for the buffer
+        :param force_option: The socket option that ignores the system limit, or None if not available
+        :param size: The requested size in bytes
+        """
+        try:
+            if force_option is None:
+                raise PermissionError
+            sock.setsockopt(socket.SOL_SOCKET, force_option, size)
+        except PermissionError:
+            sock.setsockopt(socket.SOL_SOCKET, option, size)
+
+        # Linux doubles the requested size to leave room for bookkeeping
+        actual_size = sock.getsockopt(socket.SOL_SOCKET, option)
+        if actual_size < size:
+            logger.warning("Socket buffer size for {} is limited to {} bytes instead of {}".format(
+                sock.getsockname()[0], actual_size, size))
+
+    def configure_socket(self, sock: socket.socket, receive: bool = True, send: bool = True):
+        """
+        Apply the configured socket buffer sizes to the socket.
+
+        :param sock: The socket
+        :param receive: Whether to set the receive buffer size
+        :param send: Whether to set the send buffer size
+        """
+        if receive and self.section.receive_buffer_size:
+            self.set_buffer_size(sock, socket.SO_RCVBUF, getattr(socket, 'SO_RCVBUFFORCE', None),
+                                 self.section.receive_buffer_size)
+
+        if send and self.section.send_buffer_size:
+            self.set_buffer_size(sock, socket.SO_SNDBUF, getattr(socket, 'SO_SNDBUFFORCE', None),
+                                 self.section.send_buffer_size)
+
 
 class UDPListenerFactory(ListenerFactory):
     """
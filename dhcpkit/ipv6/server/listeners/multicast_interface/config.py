@@ -123,5 +123,8 @@ class MulticastInterfaceUDPListenerFactory(UDPListenerFactory):
             ll_sock = socket.socket(socket.AF_INET6, self.sock_type, self.sock_proto)
             ll_sock.bind((str(self.reply_from), self.listen_port, 0, interface_index))
 
+        self.configure_socket(mc_sock, send=False)
+        self.configure_socket(ll_sock, receive=False)
+
         return UDPListener(interface_name=self.name, listen_socket=mc_sock, reply_socket=ll_sock,
                            global_address=self.link_address, marks=self.marks)
@@ -0,0 +1,3 @@
+"""
+Implementation of a listener on many local multicast network interfaces using a single socket
+"""
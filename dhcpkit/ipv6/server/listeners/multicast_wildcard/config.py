@@ -0,0 +1,131 @@
+"""
+Implementation of a listener on many local multicast network interfaces using a single socket
+"""
+import logging
+import netifaces
+import socket
+from fnmatch import fnmatchcase
+from ipaddress import IPv6Address
+from struct import pack
+
+from ZConfig.matcher import SectionValue
+from typing import Iterable, List
+
+from dhcpkit.ipv6 import All_DHCP_Relay_Agents_and_Servers
+from dhcpkit.ipv6.server.listeners import Listener
+from dhcpkit.ipv6.server.listeners.factories import UDPListenerFactory
+from dhcpkit.ipv6.server.listeners.udp import ListeningInterface, PktInfoUDPListener
+from dhcpkit.ipv6.utils import is_global_unicast
+
+logger = logging.getLogger(__name__)
+
+
+class MulticastWildcardUDPListenerFactory(UDPListenerFactory):
+    """
+    Factory for the implementation of a listener on many local multicast network interfaces using a single socket
+    """
+
+    def __init__(self, section: SectionValue):
+        # The interfaces are determined when validating the configuration, and again on every reload
+        self.interfaces = []
+
+        super().__init__(section)
+
+    def find_interfaces(self) -> List[ListeningInterface]:
+        """
+        Find all interfaces that match the configured patterns and that have a link-local address.
+
+        :return: The information about the interfaces
+        """
+        interfaces = []
+        for interface_name in netifaces.interfaces():
+            if not any(fnmatchcase(interface_name, pattern) for pattern in self.section.interfaces):
+                continue
+
+            interface_addresses = [IPv6Address(addr_info['addr'].split('%')[0])
+                                   for addr_info
+                                   in netifaces.ifaddresses(interface_name).get(netifaces.AF_INET6, [])]
+
+            if not any(address.is_link_local for address in interface_addresses):
+                # We can't send replies from this interface
+                continue
+
+            # Use the first global unicast address as link-address, or the unspecified address otherwise
+            link_address = next((address for address in interface_addresses if is_global_unicast(address)),
+                                IPv6Address('::'))
+
+            try:
+                interface_index = socket.if_nametoindex(interface_name)
+            except OSError:
+                # Interface disappeared while we were looking at it
+                continue
+
+            interfaces.append(ListeningInterface(interface_name, interface_index, link_address))
+
+        return interfaces
+
+    def validate_config_section(self):
+        """
+        Find the interfaces to listen on
+        """
+        self.interfaces = self.find_interfaces()
+        if not self.interfaces:
+            raise ValueError("No interfaces with a link-local address match {}".format(
+                ', '.join(self.section.interfaces)))
+
+    def create(self, old_listeners: Iterable[Listener] = None) -> PktInfoUDPListener:
+        """
+        Create a listener of this class based on the configuration in the config section.
+
+        :param old_listeners: A list of existing listeners in case we can recycle them
+        :return: A listener object
+        """
+        mc_address = All_DHCP_Relay_Agents_and_Servers
+        wildcard_address = IPv6Address('::')
+
+        # Try recycling
+        joined_interfaces = set()
+        old_listeners = list(old_listeners or [])
+        for old_listener in old_listeners:
+            if not isinstance(old_listener, PktInfoUDPListener):
+                continue
+
+            if self.match_socket(sock=old_listener.listen_socket, address=wildcard_address):
+                logger.debug("Recycling existing wildcard socket")
+                sock = old_listener.listen_socket
+                joined_interfaces = old_listener.joined_interfaces
+                break
+        else:
+            logger.debug("Creating wildcard socket")
+            sock = socket.socket(socket.AF_INET6, self.sock_type, self.sock_proto)
+            sock.bind((str(wildcard_address), self.listen_port))
+
+        # Set the socket options
+        sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_MULTICAST_LOOP, self.listen_to_self and 1 or 0)
+        self.configure_socket(sock)
+
+        listener = PktInfoUDPListener(sock, self.interfaces, marks=self.marks)
+
+        # Update the multicast group memberships
+        wanted_interfaces = set(listener.interfaces.keys())
+        for interface_index in joined_interfaces - wanted_interfaces:
+            try:
+                sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_LEAVE_GROUP,
+                                pack('16sI', mc_address.packed, interface_index))
+            except OSError:
+                # The interface is probably gone
+                pass
+
+        listener.joined_interfaces = joined_interfaces & wanted_interfaces
+
+        for interface_index in sorted(wanted_interfaces - joined_interfaces):
+            interface = listener.interfaces[interface_index]
+            logger.debug("  - Listening for multicast requests on {}".format(interface.interface_name))
+            try:
+                sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_JOIN_GROUP,
+                                pack('16sI', mc_address.packed, interface_index))
+                listener.joined_interfaces.add(interface_index)
+            except OSError as e:
+                logger.warning("Cannot listen for multicast requests on {}: {}".format(interface.interface_name, e))
+
+        return listener
@@ -0,0 +1,388 @@
+"""
+A listener that replays the requests from capture files, and a replier that records replies in memory instead of
+sending them. Together they push captured traffic through the complete server pipeline, which makes it possible to
+benchmark the server without a network or real clients.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from ipaddress import IPv6Address
+
+from dhcpkit.common.pcap import UDPDatagram, read_udp_datagrams
+from dhcpkit.common.server.logging import DEBUG_PACKETS
+from dhcpkit.ipv6 import SERVER_PORT
+from dhcpkit.ipv6.message_registry import message_registry
+from dhcpkit.ipv6.messages import RelayReplyMessage
+from dhcpkit.ipv6.options import InterfaceIdOption
+from dhcpkit.ipv6.server.listeners import IncomingPacketBundle, IncompleteMessage, Listener, Replier, \
+    increase_message_counter
+from dhcpkit.ipv6.utils import is_global_unicast
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def read_captured_requests(filenames: Iterable[str]) -> List[UDPDatagram]:
+    """
+    Read the DHCPv6 requests sent to the server port from capture files. Replies that were captured as well are
+    skipped. The timestamps are made relative to the start of each capture, so that multiple captures are replayed
+    side by side.
+
+    :param filenames: The names of the capture files
+    :return: The requests, ordered by their relative timestamps
+    """
+    requests = []
+    for filename in filenames:
+        first_timestamp = None
+        for datagram in read_udp_datagrams(filename, destination_port=SERVER_PORT):
+            if not datagram.payload:
+                continue
+
+            message_class = message_registry.get(datagram.payload[0])
+            if message_class and (message_class.from_server_to_client or issubclass(message_class,
+                                                                                    RelayReplyMessage)):
+                continue
+
+            if first_timestamp is None:
+                first_timestamp = datagram.timestamp
+
+            datagram.timestamp -= first_timestamp
+            requests.append(datagram)
+
+    requests.sort(key=lambda request: request.timestamp)
+    return requests
+
+
+class MemoryReplier(Replier):
+    """
+    A replier that records the replies in memory. They are returned to the :class:`PcapListener` in the master
+    process after the request has been handled.
+
+    :type request_number: int
+    :type replies: List[bytes]
+    """
+
+    can_send_multiple = True
+
+    def __init__(self, request_number: int):
+        """
+        Remember which request we are replying to
+
+        :param request_number: The number of the request in the replay
+        """
+        self.request_number = request_number
+        self.replies = []
+
+    def send_reply(self, outgoing_message: RelayReplyMessage) -> bool:
+        """
+        Record the reply like it would have been sent to the client
+
+        :param outgoing_message: The message to send, including a wrapping RelayReplyMessage
+        :return: Whether sending was successful
+        """
+        self.replies.append(bytes(outgoing_message.relayed_message.save()))
+        return True
+
+    def get_result(self) -> Tuple[int, List[bytes]]:
+        """
+        Return the recorded replies to the listener
+
+        :return: The request number and the replies
+        """
+        return self.request_number, self.replies
+
+
+class PcapListener(Listener):
+    """
+    Replay captured requests. The requests are handed to the main loop as fast as the workers can handle them, or
+    with the timing from the capture. A background thread decides when the next request is due and signals the main
+    loop through a pipe. The replies are recorded by a :class:`MemoryReplier` and the listener keeps statistics about
+    the throughput and latency of the server.
+
+    :type name: str
+    :type interface_name: str
+    :type requests: List[UDPDatagram]
+    :type speed: float
+    :type repeat: int
+    :type max_in_flight: int
+    :type keep_replies: bool
+    :type replies: Dict[int, List[bytes]]
+    :type latencies: List[float]
+    """
+
+    def __init__(self, name: str, requests: Iterable[UDPDatagram], interface_name: str = 'pcap',
+                 link_address: IPv6Address = None, marks: Iterable[str] = None, speed: float = 0.0,
+                 repeat: int = 1, max_in_flight: int = 1000, keep_replies: bool = False):
+        """
+        Initialise listener and start replaying.
+
+        :param name: A description of the replayed captures, for logging and statistics
+        :param requests: The captured requests, with timestamps relative to the start of the capture
+        :param interface_name: The name of the interface to pretend the requests were received on
+        :param link_address: The link address to pretend the requests were received on, by default the destination
+                             address of the request if it is a global unicast address
+        :param marks: Marks attached to this listener
+        :param speed: Replay at this multiple of the captured timing, or as fast as possible when 0
+        :param repeat: The number of times to replay the requests
+        :param max_in_flight: The maximum number of requests being handled at the same time
+        :param keep_replies: Whether to keep the replies to every request in :attr:`replies`
+        """
+        self.name = name
+        self.interface_name = interface_name
+        self.interface_id = interface_name.encode('utf-8')
+        self.requests = list(requests)
+        self.link_address = link_address
+        self.marks = list(marks or [])
+        self.speed = speed
+        self.repeat = repeat
+        self.max_in_flight = max_in_flight
+        self.keep_replies = keep_replies
+
+        # Requests that are due but not received by the main loop yet
+        self.pending = deque()
+        self.condition = threading.Condition()
+        self.feeding_done = False
+        self.closed = False
+
+        # The main loop selects on the read side of the pipe, which is readable while requests are pending
+        self.signal_r, self.signal_w = os.pipe()
+        self.signalled = False
+
+        # Statistics
+        self.received = 0
+        self.dispatched = 0
+        self.completed = 0
+        self.failed = 0
+        self.reply_count = 0
+        self.replies = {}
+        self.latencies = []
+        self.receive_times = {}
+        self.start_time = None
+        self.end_time = None
+
+        self.feeder = threading.Thread(target=self.feed, name='PcapFeeder', daemon=True)
+        self.feeder.start()
+
+    def __str__(self):
+        return "{} for {}".format(self.__class__.__name__, self.name)
+
+    @property
+    def in_flight(self) -> int:
+        """
+        The number of requests that are due but not completed yet. Requests that were dropped by the main loop instead
+        of being dispatched to a worker don't count.
+        """
+        return len(self.pending) + self.dispatched - self.completed
+
+    def signal(self):
+        """
+        Make the pipe readable so the main loop will call us. Must be called with the condition locked.
+        """
+        if not self.signalled:
+            os.write(self.signal_w, b'\x00')
+            self.signalled = True
+
+    def feed(self):
+        """
+        Add the requests to the pending queue when they are due. This runs in a separate thread.
+        """
+        # Repeat the captured requests with their average spacing between repetitions
+        period = self.requests[-1].timestamp * len(self.requests) / max(len(self.requests) - 1, 1) \
+            if self.requests else 0
+        start = time.monotonic()
+
+        for request_number in range(len(self.requests) * self.repeat):
+            repetition, index = divmod(request_number, len(self.requests))
+
+            with self.condition:
+                if self.speed:
+                    due = start + (repetition * period + self.requests[index].timestamp) / self.speed
+                    while not self.closed and time.monotonic() < due:
+                        self.condition.wait(due - time.monotonic())
+
+                self.condition.wait_for(lambda: self.closed or self.in_flight < self.max_in_flight)
+                if self.closed:
+                    return
+
+                self.pending.append(request_number)
+                self.signal()
+
+        with self.condition:
+            self.feeding_done = True
+            self.signal()
+
+    def create_bundle(self, request_number: int) -> Tuple[IncomingPacketBundle, Replier]:
+        """
+        Create the incoming packet bundle and replier for a captured request
+
+        :param request_number: The number of the request in the replay
+        :return: The incoming packet data and a replier object
+        """
+        request = self.requests[request_number % len(self.requests)]
+
+        # Create the message-ID
+        message_counter = increase_message_counter()
+        message_id = '#{:06X}'.format(message_counter)
+
+        if logger.isEnabledFor(DEBUG_PACKETS):
+            logger.log(DEBUG_PACKETS,
+                       "{message_id}: Replaying message from {client_addr} port {port} on {interface}".format(
+                           message_id=message_id,
+                           client_addr=request.source_address,
+                           port=request.source_port,
+                           interface=self.interface_name))
+
+        link_address = self.link_address
+        if not link_address and is_global_unicast(request.destination_address):
+            link_address = request.destination_address
+
+        packet_bundle = IncomingPacketBundle(message_id=message_id,
+                                             data=request.payload,
+                                             source_address=request.source_address,
+                                             link_address=link_address,
+                                             received_over_multicast=request.destination_address.is_multicast,
+                                             received_over_tcp=False,
+                                             marks=self.marks,
+                                             relay_options=[InterfaceIdOption(interface_id=self.interface_id)])
+
+        return packet_bundle, MemoryReplier(request_number)
+
+    def recv_request(self) -> Tuple[IncomingPacketBundle, Replier]:
+        """
+        Receive the next pending request
+
+        :return: The incoming packet data and a replier object
+        """
+        requests = self.recv_requests(1)
+        if not requests:
+            raise IncompleteMessage
+
+        return requests[0]
+
+    def recv_requests(self, max_count: int) -> List[Tuple[IncomingPacketBundle, Replier]]:
+        """
+        Receive the pending requests, up to the given maximum.
+
+        :param max_count: The maximum number of messages to receive
+        :return: A list of incoming packet data and a replier object for each message
+        """
+        with self.condition:
+            if self.closed:
+                return []
+
+            request_numbers = [self.pending.popleft() for _ in range(min(max_count, len(self.pending)))]
+            self.received += len(request_numbers)
+
+            if not self.pending and self.signalled:
+                os.read(self.signal_r, 1)
+                self.signalled = False
+
+            # Let the feeder continue
+            self.condition.notify_all()
+
+            now = time.monotonic()
+            if self.start_time is None:
+                self.start_time = now
+
+            for request_number in request_numbers:
+                self.receive_times[request_number] = now
+
+        return [self.create_bundle(request_number) for request_number in request_numbers]
+
+    @property
+    def timeout(self) -> Optional[float]:
+        """
+        Make sure the main loop notices that we are done, even when the last requests were not dispatched
+        """
+        return 0 if self.expired else None
+
+    @property
+    def expired(self) -> bool:
+        """
+        Whether all requests have been replayed and handled
+        """
+        return self.feeding_done and not self.pending and self.dispatched == self.completed
+
+    def request_dispatched(self):
+        """
+        Count the request.
+        """
+        self.dispatched += 1
+
+    def request_completed(self, result: Any = None):
+        """
+        Record the latency and the replies of a completed request.
+
+        :param result: The request number and the replies from the :class:`MemoryReplier`
+        """
+        now = time.monotonic()
+        with self.condition:
+            self.completed += 1
+            self.end_time = now
+
+            if result:
+                request_number, replies = result
+                self.latencies.append(now - self.receive_times.pop(request_number, now))
+                self.reply_count += len(replies)
+                if self.keep_replies:
+                    self.replies[request_number] = replies
+            else:
+                self.failed += 1
+
+            # Let the feeder continue, and wake up the main loop when we're done
+            self.condition.notify_all()
+            if self.expired:
+                self.signal()
+
+    def close(self):
+        """
+        Stop replaying.
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+        self.feeder.join()
+        os.close(self.signal_r)
+        os.close(self.signal_w)
+
+    def export_statistics(self) -> Dict[str, dict]:
+        """
+        Export the progress of the replay, the throughput and the latency percentiles in milliseconds.
+
+        :return: The statistics in a processable format
+        """
+        with self.condition:
+            latencies = sorted(self.latencies)
+            duration = (self.end_time - self.start_time) if self.start_time and self.end_time else 0.0
+
+            data = OrderedDict([
+                ('requests', len(self.requests) * self.repeat),
+                ('replayed', self.received),
+                ('dropped', self.received - self.dispatched),
+                ('completed', self.completed),
+                ('failed', self.failed),
+                ('replies', self.reply_count),
+                ('duration', round(duration, 3)),
+                ('requests_per_second', round(self.completed / duration, 1) if duration else 0.0),
+            ])
+
+        if latencies:
+            data['latency_min'] = round(latencies[0] * 1000, 3)
+            data['latency_avg'] = round(sum(latencies) / len(latencies) * 1000, 3)
+            for percentile in (50, 90, 99):
+                position = min(len(latencies) * percentile // 100, len(latencies) - 1)
+                data['latency_p{}'.format(percentile)] = round(latencies[position] * 1000, 3)
+            data['latency_max'] = round(latencies[-1] * 1000, 3)
+
+        return {str(self): data}
+
+    def fileno(self) -> int:
+        """
+        The read side of the pipe, so this object can be used by select()
+
+        :return: The file descriptor
+        """
+        return self.signal_r
@@ -4,11 +4,12 @@ the reply should be sent from a link-local address on the receiving interface. T
 together.
 """
 import logging
-import multiprocessing
 import socket
+import threading
+import time
 import weakref
+from collections import Counter, OrderedDict
 from ipaddress import IPv6Address, IPv6Network
-from multiprocessing import Lock
 from struct import pack, unpack_from
 
 from dhcpkit.common.server.logging import DEBUG_PACKETS
@@ -18,25 +19,52 @@ from dhcpkit.ipv6.options import InterfaceIdOption
 from dhcpkit.ipv6.server.listeners import ClosedListener, IncomingPacketBundle, IncompleteMessage, Listener, \
     ListenerCreator, ListeningSocketError, Replier, increase_message_counter
 from dhcpkit.ipv6.utils import is_global_unicast
-from typing import Iterable, Optional, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# The largest message including the length prefix
+MAX_MESSAGE_SIZE = 2 + 65535
+
+# The receive buffer always has room for at least one complete message after a partial one
+RECEIVE_BUFFER_SIZE = 2 * MAX_MESSAGE_SIZE
+
+# The default maximum amount of reply data that can wait to be sent to a client
+MAX_SEND_BUFFER_SIZE = 16 * 1024 * 1024
+
+# Data that has been sent is removed from the send buffer once there is at least this much of it
+SEND_BUFFER_COMPACT_SIZE = 65536
+
+# How often to check whether a paused connection can continue, and whether the workers have handed over replies
+PAUSE_CHECK_INTERVAL = 0.1
+
 
 class TCPConnection(Listener):
     """
-    A TCP connection listener for DHCPv6 messages
+    A TCP connection listener for DHCPv6 messages. The workers hand the replies back to the connection, which sends
+    them from the master process without blocking. Replies that the client doesn't receive immediately wait in a
+    bounded send buffer until the socket is writable again.
     """
 
-    def __init__(self, interface_name: str, connected_socket: socket.socket, write_lock: Lock,
-                 global_address: IPv6Address, marks: Iterable[str] = None):
+    def __init__(self, interface_name: str, connected_socket: socket.socket, write_lock: threading.Lock,
+                 global_address: IPv6Address, marks: Iterable[str] = None, send_timeout: float = 30.0,
+                 idle_timeout: float = 0, max_in_flight: int = 0, counters: Counter = None,
+                 max_transfer_time: float = 0, max_send_buffer: int = MAX_SEND_BUFFER_SIZE):
         """
         Initialise listener.
 
         :param interface_name: The name of the interface
         :param connected_socket: The socket we are listening on and will send replies to
+        :param write_lock: The lock that protects the send buffer, which is filled from a different thread
         :param global_address: The global address on the listening interface
         :param marks: Marks attached to this listener
+        :param send_timeout: Close the connection when the client doesn't read any replies for this many seconds
+        :param idle_timeout: Close the connection after this many seconds without activity, 0 to never close it
+        :param max_in_flight: Stop receiving when this many requests are being handled, 0 for no limit
+        :param counters: Counters shared with the other connections of the same TCP listener
+        :param max_transfer_time: Close the connection when the send buffer hasn't been empty for this many seconds,
+                                  0 for no limit
+        :param max_send_buffer: The maximum number of bytes waiting to be sent
         """
         self.interface_name = interface_name
         self.interface_id = interface_name.encode('utf-8')
@@ -44,6 +72,27 @@ class TCPConnection(Listener):
         self.global_address = global_address
         self.marks = list(marks or [])
         self.write_lock = write_lock
+        self.send_timeout = send_timeout
+        self.idle_timeout = idle_timeout
+        self.max_in_flight = max_in_flight
+        self.counters = counters if counters is not None else Counter()
+        self.max_transfer_time = max_transfer_time
+        self.max_send_buffer = max_send_buffer
+
+        # Keep track of activity and of the requests that are being handled by the workers. The completed requests are
+        # counted in a different thread, so each counter is only updated by one thread.
+        self.last_activity = time.monotonic()
+        self.requests_dispatched = 0
+        self.requests_completed = 0
+        self.read_closed = False
+        self.closed = False
+
+        # Replies waiting to be sent are between send_offset and the end of the send buffer
+        self.send_buffer = bytearray()
+        self.send_offset = 0
+        self.send_started = 0.0
+        self.last_send_progress = 0.0
+        self.send_error = None
 
         # Check that we have IPv6 TCP sockets
         if self.connected_socket.family != socket.AF_INET6 or self.connected_socket.proto != socket.IPPROTO_TCP:
@@ -62,29 +111,29 @@ class TCPConnection(Listener):
         self.client_address = IPv6Address(peer_sockname[0].split('%')[0])
         self.client_port = peer_sockname[1]
 
-        # Prepare buffer for received data
-        self.buffer = b''
+        # Prepare buffer for received data. Messages are parsed in place, the unparsed data is between buffer_start
+        # and buffer_end.
+        self.buffer = bytearray(RECEIVE_BUFFER_SIZE)
+        self.buffer_view = memoryview(self.buffer)
+        self.buffer_start = 0
+        self.buffer_end = 0
 
-    def packet_from_buffer(self):
+    def create_bundle(self, data: bytes) -> Tuple[IncomingPacketBundle, Replier]:
         """
-        Create a packet and replier from the data in the buffer
+        Create a packet and replier for a message received over this connection
 
+        :param data: The message data, without the length prefix
         :return: The incoming packet data and a replier object
         """
-
-        # Copy the message and remove it from the buffer
-        message_length = unpack_from('!H', self.buffer)[0]
-        data = self.buffer[2:2 + message_length]
-        self.buffer = self.buffer[2 + message_length:]
-
         # Create the message-ID
         message_counter = increase_message_counter()
         message_id = '#{:06X}'.format(message_counter)
 
-        logger.log(DEBUG_PACKETS, "{message_id}: Received message from {client_addr} port {port}".format(
-            message_id=message_id,
-            client_addr=str(self.client_address),
-            port=self.client_port))
+        if logger.isEnabledFor(DEBUG_PACKETS):
+            logger.log(DEBUG_PACKETS, "{message_id}: Received message from {client_addr} port {port}".format(
+                message_id=message_id,
+                client_addr=str(self.client_address),
+                port=self.client_port))
 
         interface_id_option = InterfaceIdOption(interface_id=self.interface_id)
 
@@ -99,10 +148,66 @@ class TCPConnection(Listener):
                                              relay_options=[interface_id_option])
 
         # Create a replier
-        replier = TCPReplier(self.connected_socket, self.write_lock)
+        replier = TCPReplier(self.client_address, self.client_port, self.max_send_buffer)
 
         return packet_bundle, replier
 
+    def next_message_length(self) -> int:
+        """
+        Determine how many bytes are still missing before the next message in the buffer is complete.
+
+        :return: The number of missing bytes, 0 if the message is complete
+        """
+        buffer_length = self.buffer_end - self.buffer_start
+        if buffer_length < 2:
+            return 2 - buffer_length
+
+        message_length = unpack_from('!H', self.buffer, self.buffer_start)[0]
+        return max(2 + message_length - buffer_length, 0)
+
+    def packet_from_buffer(self) -> Tuple[IncomingPacketBundle, Replier]:
+        """
+        Create a packet and replier from the complete message at the start of the buffer
+
+        :return: The incoming packet data and a replier object
+        """
+        # Copy the message out of the buffer and move the start of the buffer past it
+        message_length = unpack_from('!H', self.buffer, self.buffer_start)[0]
+        data_start = self.buffer_start + 2
+        self.buffer_start = data_start + message_length
+        data = bytes(self.buffer_view[data_start:self.buffer_start])
+
+        if self.buffer_start == self.buffer_end:
+            # Buffer is empty, start at the beginning again
+            self.buffer_start = self.buffer_end = 0
+
+        return self.create_bundle(data)
+
+    def packets_from_buffer(self, max_count: int = None) -> List[Tuple[IncomingPacketBundle, Replier]]:
+        """
+        Create packets and repliers for the complete messages in the buffer
+
+        :param max_count: The maximum number of messages to take from the buffer, None for all of them
+        :return: A list of incoming packet data and a replier object for each message
+        """
+        requests = []
+        while self.has_pending_requests and (max_count is None or len(requests) < max_count):
+            requests.append(self.packet_from_buffer())
+
+        self.compact_buffer()
+        return requests
+
+    def compact_buffer(self):
+        """
+        Make sure there is always room for a complete message after the unparsed data. The unparsed data is less than
+        one message, so this copies at most once per MAX_MESSAGE_SIZE bytes received.
+        """
+        if self.buffer_start and RECEIVE_BUFFER_SIZE - self.buffer_end < MAX_MESSAGE_SIZE:
+            buffer_length = self.buffer_end - self.buffer_start
+            self.buffer[:buffer_length] = self.buffer_view[self.buffer_start:self.buffer_end]
+            self.buffer_start = 0
+            self.buffer_end = buffer_length
+
     def recv_data_into_buffer(self, amount: int) -> int:
         """
         Receive data into the buffer and do proper error handling
@@ -110,50 +215,271 @@ class TCPConnection(Listener):
         :param amount: How much data do we want?
         :return: How much data did we receive?
         """
-        data = self.connected_socket.recv(amount)
-        if data == b'':
-            logger.info("TCP connection to {client_addr} port {port} closed".format(
-                client_addr=str(self.client_address),
-                port=self.client_port))
-
+        received = self.connected_socket.recv_into(self.buffer_view[self.buffer_end:], amount)
+        if received == 0:
+            if not self.read_closed:
+                logger.info("TCP connection to {client_addr} port {port} closed".format(
+                    client_addr=str(self.client_address),
+                    port=self.client_port))
+
+            if self.in_flight or self.has_unsent_replies:
+                # The client may only have closed its sending side, keep the connection until the replies are sent
+                self.read_closed = True
+                return 0
+
+            self.closed = True
             raise ClosedListener
 
-        self.buffer += data
+        self.buffer_end += received
+        self.last_activity = time.monotonic()
 
         # Return how much data we added
-        return len(data)
+        return received
 
     def recv_request(self) -> Tuple[IncomingPacketBundle, Replier]:
         """
-        Receive incoming messages
+        Receive incoming messages. Only the data that is needed for the next message is received, so anything else
+        stays in the socket and select() will notify us about it.
 
         :return: The incoming packet data and a replier object
         """
+        missing = self.next_message_length()
+        if missing:
+            self.compact_buffer()
+            self.recv_data_into_buffer(missing)
 
-        # Do we know how much data we need to receive?
-        buffer_length = len(self.buffer)
-        if buffer_length < 2:
-            # Not yet, let's see if we can receive the message length
-            buffer_length += self.recv_data_into_buffer(2 - buffer_length)
+            # We may now know the message length, try to receive the rest
+            missing = self.next_message_length()
+            if missing:
+                self.recv_data_into_buffer(missing)
+                missing = self.next_message_length()
+
+        if missing:
+            # Apparently we don't have a complete message yet
+            raise IncompleteMessage
 
-        if buffer_length >= 2:
-            # Yes, we have the message length in the buffer
-            message_length = unpack_from('!H', self.buffer)[0]
+        return self.packet_from_buffer()
 
-            # Receive extra data into the buffer
-            we_already_have = buffer_length - 2
-            remaining_data = message_length - we_already_have
-            if remaining_data > 0:
-                buffer_length += self.recv_data_into_buffer(remaining_data)
+    def recv_requests(self, max_count: int) -> List[Tuple[IncomingPacketBundle, Replier]]:
+        """
+        Receive as much data as fits in the buffer and return the complete messages in it. No more messages are
+        returned than can be in flight at the same time. The rest stay in the buffer, and no more data is received
+        until they have been returned. The main loop sees that through :attr:`has_pending_requests`, because select()
+        won't notify it about data that has already been received.
 
-            # Check if we have a complete message
-            we_already_have = buffer_length - 2
-            if we_already_have >= message_length:
-                # We have a new message, return it
-                return self.packet_from_buffer()
+        :param max_count: The number of messages the caller expects, ignored
+        :return: A list of incoming packet data and a replier object for each message
+        """
+        if not self.has_pending_requests:
+            self.recv_data_into_buffer(RECEIVE_BUFFER_SIZE - self.buffer_end)
 
-        # Apparently we don't have a complete message yet
-        raise IncompleteMessage
+        if self.max_in_flight:
+            requests = self.packets_from_buffer(max(self.max_in_flight - self.in_flight, 0))
+        else:
+            requests = self.packets_from_buffer()
+        if not requests and not self.has_pending_requests:
+            # Apparently we don't have a complete message yet
+            raise IncompleteMessage
+
+        return requests
+
+    @property
+    def in_flight(self) -> int:
+        """
+        The number of requests from this connection that are being handled by the workers
+        """
+        return self.requests_dispatched - self.requests_completed
+
+    @property
+    def timeout(self) -> Optional[float]:
+        """
+        The number of seconds after which the main loop must check whether this connection is idle or can continue.
+        While requests are being handled the main loop checks regularly whether the workers have handed over replies
+        that didn't fit in the socket buffer.
+        """
+        if self.has_pending_requests and not self.paused:
+            return 0
+
+        if self.paused or self.in_flight or self.has_unsent_replies:
+            return PAUSE_CHECK_INTERVAL
+
+        if not self.idle_timeout:
+            return None
+
+        return max(self.last_activity + self.idle_timeout - time.monotonic(), 0)
+
+    @property
+    def expired(self) -> bool:
+        """
+        Whether this connection must be closed, because the replies can't be sent or because it has been idle for too
+        long. Connections with requests that are still being handled or replies that are still being sent are not
+        idle. A connection that the client has closed expires when the last replies have been sent.
+        """
+        if self.send_problem:
+            return True
+
+        if self.in_flight or self.has_unsent_replies:
+            return False
+
+        return self.read_closed or (bool(self.idle_timeout)
+                                    and time.monotonic() - self.last_activity >= self.idle_timeout)
+
+    @property
+    def paused(self) -> bool:
+        """
+        Whether there are too many requests from this connection being handled to receive more, or whether the client
+        has closed its side of the connection
+        """
+        return self.read_closed or (bool(self.max_in_flight) and self.in_flight >= self.max_in_flight)
+
+    @property
+    def has_unsent_replies(self) -> bool:
+        """
+        Whether there are replies in the send buffer
+        """
+        return len(self.send_buffer) > self.send_offset
+
+    @property
+    def send_problem(self) -> Optional[str]:
+        """
+        The reason why the replies can't be sent to the client, if there is one
+        """
+        if self.send_error:
+            return self.send_error
+
+        if not self.has_unsent_replies:
+            return None
+
+        now = time.monotonic()
+        if self.send_timeout and now - self.last_send_progress >= self.send_timeout:
+            return "the client didn't read any replies for {} seconds".format(self.send_timeout)
+
+        if self.max_transfer_time and now - self.send_started >= self.max_transfer_time:
+            return "the client didn't receive the replies within {} seconds".format(self.max_transfer_time)
+
+        return None
+
+    @property
+    def has_pending_requests(self) -> bool:
+        """
+        Whether there is a complete message in the buffer
+        """
+        return self.buffer_end - self.buffer_start >= 2 and self.next_message_length() == 0
+
+    def request_dispatched(self):
+        """
+        Count the request and see if we need to pause.
+        """
+        self.requests_dispatched += 1
+        if self.max_in_flight and self.in_flight == self.max_in_flight:
+            logger.debug("TCP connection from {client_addr} port {port} has {count} requests in flight, "
+                         "pausing".format(client_addr=str(self.client_address),
+                                          port=self.client_port,
+                                          count=self.in_flight))
+            self.counters['paused'] += 1
+
+    def request_completed(self, result: Any = None):
+        """
+        Queue the replies to the completed request and count it. Sending replies counts as activity.
+
+        :param result: The replies and whether they are complete, from :meth:`TCPReplier.get_result`
+        """
+        if result:
+            reply_data, complete = result
+            with self.write_lock:
+                self.queue_replies(reply_data, complete)
+
+        self.requests_completed += 1
+        self.last_activity = time.monotonic()
+
+    def queue_replies(self, reply_data: bytes, complete: bool):
+        """
+        Add replies to the send buffer and send as much as the socket accepts. Must be called with the write lock held.
+
+        :param reply_data: The replies, each one prefixed with its length
+        :param complete: Whether the worker could serialise all the replies to the request
+        """
+        if self.closed or self.send_error:
+            return
+
+        if not complete:
+            self.send_error = "the replies to a request don't fit in the send buffer of {} bytes".format(
+                self.max_send_buffer)
+            return
+
+        # Make room if we can
+        self.flush_send_buffer()
+
+        if len(self.send_buffer) - self.send_offset + len(reply_data) > self.max_send_buffer:
+            self.send_error = "the client doesn't read the replies fast enough, the send buffer is full"
+            return
+
+        if not self.has_unsent_replies:
+            self.send_started = self.last_send_progress = time.monotonic()
+
+        self.send_buffer += reply_data
+        self.flush_send_buffer()
+
+    def flush_send_buffer(self):
+        """
+        Send as much of the send buffer as the socket accepts without blocking. Must be called with the write lock held.
+        """
+        if self.closed or self.send_error or not self.has_unsent_replies:
+            return
+
+        try:
+            sent = self.connected_socket.send(memoryview(self.send_buffer)[self.send_offset:], socket.MSG_DONTWAIT)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            self.send_error = "sending failed: {}".format(e)
+            return
+
+        self.send_offset += sent
+        self.last_send_progress = self.last_activity = time.monotonic()
+
+        if self.send_offset == len(self.send_buffer):
+            self.send_buffer.clear()
+            self.send_offset = 0
+        elif self.send_offset >= SEND_BUFFER_COMPACT_SIZE and self.send_offset * 2 >= len(self.send_buffer):
+            # Remove the data that has been sent, at most once per the amount of data sent since the previous time
+            del self.send_buffer[:self.send_offset]
+            self.send_offset = 0
+
+    def send_unsent_replies(self):
+        """
+        Send as much of the waiting replies as the socket accepts without blocking.
+        """
+        with self.write_lock:
+            self.flush_send_buffer()
+
+    def close(self):
+        """
+        Shut down the connection.
+        """
+        send_problem = self.send_problem
+        if send_problem:
+            logger.error("Closing TCP connection from {client_addr} port {port}: {problem}".format(
+                client_addr=str(self.client_address),
+                port=self.client_port,
+                problem=send_problem))
+            self.counters['send_failures'] += 1
+        elif self.expired and not self.read_closed:
+            logger.info("Closing idle TCP connection from {client_addr} port {port}".format(
+                client_addr=str(self.client_address),
+                port=self.client_port))
+            self.counters['idle_timeouts'] += 1
+
+        # Don't close the socket while the replies of a completed request are being sent
+        with self.write_lock:
+            self.closed = True
+            self.send_buffer.clear()
+            self.send_offset = 0
+            try:
+                self.connected_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.connected_socket.close()
 
     def fileno(self) -> int:
         """
@@ -166,20 +492,34 @@ class TCPConnection(Listener):
 
 class TCPReplier(Replier):
     """
-    A class to send replies to the client
+    A class to collect the replies to the client. The replies are serialised into a buffer in the worker process and
+    handed back to the connection in the master process, which sends them. A client that reads slowly therefore never
+    keeps a worker process busy.
+
+    :type client_address: IPv6Address
+    :type client_port: int
+    :type max_send_buffer: int
+    :type reply_data: bytearray
+    :type complete: bool
     """
 
     # Whether multiple replies can be sent over this replier
     can_send_multiple = True
 
-    def __init__(self, reply_socket: socket.socket, reply_lock: Lock):
-        self.reply_socket = reply_socket
-        self.reply_lock = reply_lock
+    def __init__(self, client_address: IPv6Address, client_port: int, max_send_buffer: int = MAX_SEND_BUFFER_SIZE):
+        """
+        Initialise replier.
 
-        # Remember the sender
-        peer_sockname = self.reply_socket.getpeername()
-        self.client_address = IPv6Address(peer_sockname[0].split('%')[0])
-        self.client_port = peer_sockname[1]
+        :param client_address: The address of the client
+        :param client_port: The port of the client
+        :param max_send_buffer: The maximum number of bytes of replies to a single request
+        """
+        self.client_address = client_address
+        self.client_port = client_port
+        self.max_send_buffer = max_send_buffer
+
+        self.reply_data = bytearray()
+        self.complete = True
 
     def send_reply(self, outgoing_message: RelayReplyMessage) -> bool:
         """
@@ -188,32 +528,55 @@ class TCPReplier(Replier):
         :param outgoing_message: The message to send, including a wrapping RelayReplyMessage
         :return: Whether sending was successful
         """
-        # Construct reply
-        reply = outgoing_message.relayed_message
-        message_data = reply.save()
-        data = pack('!H', len(message_data)) + message_data
+        return self.send_replies([outgoing_message]) == 1
 
-        try:
-            with self.reply_lock:
-                # Make sure we don't get stuck
-                self.reply_socket.settimeout(300)
-                self.reply_socket.sendall(data)
-                self.reply_socket.settimeout(None)
-
-            logger.log(DEBUG_PACKETS, "Sent {message_type} to {client_addr} port {port}".format(
-                message_type=outgoing_message.inner_message.__class__.__name__,
-                client_addr=str(self.client_address),
-                port=self.client_port))
+    def send_replies(self, outgoing_messages: Iterable[RelayReplyMessage]) -> int:
+        """
+        Serialise all replies into the buffer that is handed back to the connection. The replies are serialised one
+        by one, and serialising stops when the buffer is full.
 
-            return True
-        except OSError as e:
-            logger.error("Could not send {message_type} to {client_addr} port {port}: {exception}".format(
-                message_type=outgoing_message.inner_message.__class__.__name__,
+        :param outgoing_messages: The messages to send, including a wrapping RelayReplyMessage
+        :return: The number of replies that were added to the buffer
+        """
+        sent = 0
+        message_type = None
+
+        for outgoing_message in outgoing_messages:
+            message_type = outgoing_message.inner_message.__class__.__name__
+            message_data = outgoing_message.relayed_message.save()
+
+            if len(self.reply_data) + 2 + len(message_data) > self.max_send_buffer:
+                logger.error("Could not send {message_type} to {client_addr} port {port}: the replies don't fit in "
+                             "the send buffer of {size} bytes".format(message_type=message_type,
+                                                                      client_addr=str(self.client_address),
+                                                                      port=self.client_port,
+                                                                      size=self.max_send_buffer))
+                self.complete = False
+                break
+
+            self.reply_data += pack('!H', len(message_data))
+            self.reply_data += message_data
+            sent += 1
+
+        if sent and logger.isEnabledFor(DEBUG_PACKETS):
+            logger.log(DEBUG_PACKETS, "Sending {message_type} to {client_addr} port {port}{extra}".format(
+                message_type=message_type,
                 client_addr=str(self.client_address),
                 port=self.client_port,
-                exception=e))
+                extra=" after {} other messages".format(sent - 1) if sent > 1 else ""))
 
-            return False
+        return sent
+
+    def get_result(self) -> Optional[Tuple[bytearray, bool]]:
+        """
+        Hand the serialised replies back to the connection in the master process.
+
+        :return: The replies and whether they are complete, or None if there is nothing to send
+        """
+        if not self.reply_data and self.complete:
+            return None
+
+        return self.reply_data, self.complete
 
 
 class TCPConnectionListener(ListenerCreator):
@@ -229,7 +592,9 @@ class TCPConnectionListener(ListenerCreator):
     """
 
     def __init__(self, interface_name: str, listen_socket: socket.socket, global_address: IPv6Address = None,
-                 marks: Iterable[str] = None, max_connections: int = 10, allow_from: Iterable[IPv6Network] = None):
+                 marks: Iterable[str] = None, max_connections: int = 10, allow_from: Iterable[IPv6Network] = None,
+                 send_timeout: float = 30.0, max_connections_per_peer: int = 0, idle_timeout: float = 0,
+                 max_in_flight: int = 0, max_transfer_time: float = 0, max_send_buffer: int = MAX_SEND_BUFFER_SIZE):
         """
         Initialise TCP listener.
 
@@ -237,12 +602,27 @@ class TCPConnectionListener(ListenerCreator):
         :param listen_socket: The socket we are listening on, may be a unicast or multicast socket
         :param global_address: The global address on the listening interface
         :param marks: Marks attached to this listener
+        :param max_connections: The maximum number of open connections
+        :param allow_from: The networks that may connect
+        :param send_timeout: How long to wait for a client that doesn't read the replies we send
+        :param max_connections_per_peer: The maximum number of open connections from one address, 0 for no limit
+        :param idle_timeout: Close connections after this many seconds without activity, 0 to never close them
+        :param max_in_flight: The maximum number of requests per connection that are being handled, 0 for no limit
+        :param max_transfer_time: Close connections when their send buffer hasn't been empty for this many seconds, 0
+                                  for no limit
+        :param max_send_buffer: The maximum number of bytes waiting to be sent per connection
         """
         self.interface_name = interface_name
         self.interface_id = interface_name.encode('utf-8')
         self.marks = list(marks or [])
         self.max_connections = max_connections
         self.allow_from = list(allow_from or [])
+        self.send_timeout = send_timeout
+        self.max_connections_per_peer = max_connections_per_peer
+        self.idle_timeout = idle_timeout
+        self.max_in_flight = max_in_flight
+        self.max_transfer_time = max_transfer_time
+        self.max_send_buffer = max_send_buffer
 
         # Make sure the listening socket is non-blocking
         self.listen_socket = listen_socket
@@ -272,11 +652,21 @@ class TCPConnectionListener(ListenerCreator):
         if self.listen_address.is_unspecified:
             raise ListeningSocketError("This server only supports listening on explicit address, not on wildcard")
 
-        # Create a manager for the locks
-        self.manager = multiprocessing.Manager()
+        # Keep weak references to connections so we can see how many are still alive
+        self.connections = weakref.WeakSet()
 
-        # Keep weak references to sockets so we can see how many are still alive
-        self.open_sockets = weakref.WeakSet()
+        # Counters for the statistics, shared with the connections
+        self.counters = Counter()
+
+    def __str__(self):
+        return "{} on {}".format(self.__class__.__name__, self.listen_address)
+
+    @property
+    def open_connections(self) -> List[TCPConnection]:
+        """
+        The connections that are still open
+        """
+        return [connection for connection in self.connections if not connection.closed]
 
     def create_listener(self) -> Optional[TCPConnection]:
         """
@@ -290,7 +680,11 @@ class TCPConnectionListener(ListenerCreator):
             # Something went wrong before we could accept the socket
             return None
 
-        if len(self.open_sockets) >= self.max_connections:
+        client_address = IPv6Address(client[0].split('%')[0])
+        open_connections = self.open_connections
+
+        if len(open_connections) >= self.max_connections:
+            self.counters['rejected_max_connections'] += 1
             # Too many connections, shut it down
             logger.warning(
                 "More than {max_connections} open TCP connections, "
@@ -305,10 +699,29 @@ class TCPConnectionListener(ListenerCreator):
             connected_socket.close()
             return None
 
+        if self.max_connections_per_peer:
+            peer_connections = [connection for connection in open_connections
+                                if connection.client_address == client_address]
+            if len(peer_connections) >= self.max_connections_per_peer:
+                # Too many connections from this peer, shut it down
+                self.counters['rejected_max_connections_per_peer'] += 1
+                logger.warning(
+                    "More than {max_connections} open TCP connections from {client_addr}, "
+                    "rejecting connection from port {port}".format(
+                        max_connections=self.max_connections_per_peer,
+                        client_addr=client[0],
+                        port=client[1]
+                    )
+                )
+
+                connected_socket.shutdown(socket.SHUT_RDWR)
+                connected_socket.close()
+                return None
+
         if self.allow_from:
             # Restricted access
-            client_address = IPv6Address(client[0].split('%')[0])
             if not any([client_address in allowed_range for allowed_range in self.allow_from]):
+                self.counters['rejected_not_allowed'] += 1
                 logger.error("Rejecting TCP connection from {client_addr} port {port}".format(
                     client_addr=client[0],
                     port=client[1]))
@@ -322,12 +735,33 @@ class TCPConnectionListener(ListenerCreator):
             client_addr=client[0],
             port=client[1]))
 
+        self.counters['accepted'] += 1
+
+        lock = threading.Lock()
+        connection = TCPConnection(interface_name=self.interface_name, connected_socket=connected_socket,
+                                   write_lock=lock, global_address=self.global_address, marks=self.marks,
+                                   send_timeout=self.send_timeout, idle_timeout=self.idle_timeout,
+                                   max_in_flight=self.max_in_flight, counters=self.counters,
+                                   max_transfer_time=self.max_transfer_time, max_send_buffer=self.max_send_buffer)
+
         # Add a weak reference to the set
-        self.open_sockets.add(connected_socket)
+        self.connections.add(connection)
+
+        return connection
+
+    def export_statistics(self) -> Dict[str, dict]:
+        """
+        Export the connection counters.
+
+        :return: The statistics in a processable format
+        """
+        data = OrderedDict()
+        data['open_connections'] = len(self.open_connections)
+        for name in ('accepted', 'rejected_max_connections', 'rejected_max_connections_per_peer',
+                     'rejected_not_allowed', 'idle_timeouts', 'send_failures', 'paused'):
+            data[name] = self.counters[name]
 
-        lock = self.manager.Lock()
-        return TCPConnection(interface_name=self.interface_name, connected_socket=connected_socket, write_lock=lock,
-                             global_address=self.global_address, marks=self.marks)
+        return {str(self): data}
 
     def fileno(self) -> int:
         """
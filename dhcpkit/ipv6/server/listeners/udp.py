@@ -4,18 +4,66 @@ UDP implementations of listeners and repliers
 
 import logging
 import socket
+import sys
+from collections import OrderedDict
 from ipaddress import IPv6Address
+from struct import pack, unpack_from
 
 from dhcpkit.common.server.logging import DEBUG_PACKETS
 from dhcpkit.ipv6 import CLIENT_PORT, SERVER_PORT
 from dhcpkit.ipv6.messages import RelayReplyMessage
 from dhcpkit.ipv6.options import InterfaceIdOption
-from dhcpkit.ipv6.server.listeners import IncomingPacketBundle, Listener, ListeningSocketError, Replier, \
-    increase_message_counter
-from typing import Iterable, Tuple
+from dhcpkit.ipv6.server.listeners import IgnoreMessage, IncomingPacketBundle, Listener, ListeningSocketError, \
+    Replier, increase_message_counter
+from typing import Dict, Iterable, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# Linux can attach the number of packets that were dropped because the receive buffer was full to every received packet.
+# The socket module doesn't define the option, and other platforms may use its number for something else.
+if sys.platform.startswith('linux'):
+    SO_RXQ_OVFL = 40
+
+    # The space needed to receive the drop counter as ancillary data
+    DROP_COUNTER_SPACE = socket.CMSG_SPACE(4)
+else:
+    SO_RXQ_OVFL = None
+    DROP_COUNTER_SPACE = 0
+
+
+def enable_drop_counter(sock: socket.socket) -> bool:
+    """
+    Ask the kernel to tell us how many packets it dropped on this socket
+
+    :param sock: The socket
+    :return: Whether the kernel supports it
+    """
+    if SO_RXQ_OVFL is None:
+        return False
+
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+        return True
+    except OSError:
+        return False
+
+
+def find_drop_counter(ancdata: list) -> Optional[int]:
+    """
+    Find the number of dropped packets in the ancillary data, if present
+
+    :param ancdata: The ancillary data as returned by recvmsg()
+    :return: The total number of packets dropped on the socket
+    """
+    if SO_RXQ_OVFL is None:
+        return None
+
+    for cmsg_level, cmsg_type, cmsg_data in ancdata:
+        if cmsg_level == socket.SOL_SOCKET and cmsg_type == SO_RXQ_OVFL and len(cmsg_data) >= 4:
+            return unpack_from('=I', cmsg_data)[0]
+
+    return None
+
 
 class UDPListener(Listener):
     """
@@ -67,6 +115,13 @@ class UDPListener(Listener):
             raise ListeningSocketError("Listen and reply sockets have to be on same interface")
 
         self.interface_index = listen_sockname[3]
+        if not self.interface_index:
+            # Sockets bound to a global address don't have a scope, so look it up once instead of for every reply
+            try:
+                self.interface_index = socket.if_nametoindex(interface_name)
+            except OSError:
+                pass
+
         self.listen_address = IPv6Address(listen_sockname[0].split('%')[0])
         self.reply_address = IPv6Address(reply_sockname[0].split('%')[0])
 
@@ -89,23 +144,75 @@ class UDPListener(Listener):
         if not self.listen_address.is_multicast and self.reply_socket != self.listen_socket:
             raise ListeningSocketError("Unicast listening addresses can't use separate reply sockets")
 
+        # Keep track of the packets that the kernel dropped because we didn't read them fast enough
+        self.counts_kernel_drops = enable_drop_counter(self.listen_socket)
+        self.kernel_drops = 0
+
+    def __str__(self):
+        return "{} for {} on {}".format(self.__class__.__name__, self.listen_address, self.interface_name)
+
+    def update_kernel_drops(self, ancdata: list):
+        """
+        Update the number of dropped packets from the ancillary data of a received packet
+
+        :param ancdata: The ancillary data as returned by recvmsg()
+        """
+        kernel_drops = find_drop_counter(ancdata)
+        if kernel_drops is not None:
+            self.kernel_drops = kernel_drops
+
     def recv_request(self) -> Tuple[IncomingPacketBundle, Replier]:
         """
         Receive incoming messages
 
         :return: The incoming packet data and a replier object
         """
-        data, sender = self.listen_socket.recvfrom(65536)
+        data, ancdata, msg_flags, sender = self.listen_socket.recvmsg(65536, DROP_COUNTER_SPACE)
+        self.update_kernel_drops(ancdata)
+        return self.create_bundle(data, sender)
+
+    def recv_requests(self, max_count: int) -> List[Tuple[IncomingPacketBundle, Replier]]:
+        """
+        Receive all incoming messages that are waiting on the socket, up to the given maximum. Only the first receive
+        may block, which it shouldn't because select() told us there is data.
+
+        :param max_count: The maximum number of messages to receive
+        :return: A list of incoming packet data and a replier object for each message
+        """
+        requests = [self.recv_request()]
+
+        while len(requests) < max_count:
+            try:
+                data, ancdata, msg_flags, sender = self.listen_socket.recvmsg(65536, DROP_COUNTER_SPACE,
+                                                                              socket.MSG_DONTWAIT)
+            except (BlockingIOError, InterruptedError):
+                # Nothing more waiting
+                break
+
+            self.update_kernel_drops(ancdata)
+            requests.append(self.create_bundle(data, sender))
+
+        return requests
+
+    def create_bundle(self, data: bytes, sender: tuple) -> Tuple[IncomingPacketBundle, Replier]:
+        """
+        Create the incoming packet bundle and replier for a received message
 
+        :param data: The received data
+        :param sender: The address of the sender, as returned by recvfrom()
+        :return: The incoming packet data and a replier object
+        """
         # Create the message-ID
         message_counter = increase_message_counter()
         message_id = '#{:06X}'.format(message_counter)
 
-        logger.log(DEBUG_PACKETS, "{message_id}: Received message from {client_addr} port {port} on {interface}".format(
-            message_id=message_id,
-            client_addr=sender[0],
-            port=sender[1],
-            interface=self.interface_name))
+        if logger.isEnabledFor(DEBUG_PACKETS):
+            logger.log(DEBUG_PACKETS,
+                       "{message_id}: Received message from {client_addr} port {port} on {interface}".format(
+                           message_id=message_id,
+                           client_addr=sender[0],
+                           port=sender[1],
+                           interface=self.interface_name))
 
         interface_id_option = InterfaceIdOption(interface_id=self.interface_id)
 
@@ -119,10 +226,21 @@ class UDPListener(Listener):
                                              marks=self.marks,
                                              relay_options=[interface_id_option])
 
-        replier = UDPReplier(self.reply_socket)
+        replier = UDPReplier(self.reply_socket, self.interface_index, self.interface_name)
 
         return packet_bundle, replier
 
+    def export_statistics(self) -> Dict[str, dict]:
+        """
+        Export the number of packets that the kernel dropped on this listener.
+
+        :return: The statistics in a processable format
+        """
+        if not self.counts_kernel_drops:
+            return {}
+
+        return {str(self): OrderedDict([('kernel_drops', self.kernel_drops)])}
+
     def fileno(self) -> int:
         """
         The fileno of the listening socket, so this object can be used by select()
@@ -137,8 +255,17 @@ class UDPReplier(Replier):
     A class to send replies to the client
     """
 
-    def __init__(self, reply_socket: socket.socket):
+    def __init__(self, reply_socket: socket.socket, interface_index: int = 0, interface_name: str = None):
+        """
+        Store the reply socket and the interface that the request was received on
+
+        :param reply_socket: The socket to send replies from
+        :param interface_index: The index of the interface to send replies on, if known
+        :param interface_name: The name of that interface, for logging
+        """
         self.reply_socket = reply_socket
+        self.interface_index = interface_index
+        self.interface_name = interface_name
 
     def send_reply(self, outgoing_message: RelayReplyMessage) -> bool:
         """
@@ -153,32 +280,269 @@ class UDPReplier(Replier):
         destination_address = str(outgoing_message.peer_address)
         data = reply.save()
 
-        # Try to determine the interface index from the outgoing relay options
-        interface_index = 0
-        interface_name = 'unknown'
-        interface_id_option = outgoing_message.get_option_of_type(InterfaceIdOption)
-        if interface_id_option:
-            try:
-                interface_name = interface_id_option.interface_id.decode(encoding='utf-8', errors='replace')
-                interface_index = socket.if_nametoindex(interface_id_option.interface_id)
-            except OSError:
-                pass
+        interface_index = self.interface_index
+        interface_name = self.interface_name
+        if not interface_index:
+            # The listener didn't know, try to determine the interface index from the outgoing relay options
+            interface_name = 'unknown'
+            interface_id_option = outgoing_message.get_option_of_type(InterfaceIdOption)
+            if interface_id_option:
+                try:
+                    interface_name = interface_id_option.interface_id.decode(encoding='utf-8', errors='replace')
+                    interface_index = socket.if_nametoindex(interface_id_option.interface_id)
+                except OSError:
+                    pass
 
         destination = (destination_address, port, 0, interface_index)
         sent_length = self.reply_socket.sendto(data, destination)
         success = len(data) == sent_length
 
         if success:
-            logger.log(DEBUG_PACKETS, "Sent {message_type} to {client_addr} port {port} on {interface}".format(
+            if logger.isEnabledFor(DEBUG_PACKETS):
+                logger.log(DEBUG_PACKETS, "Sent {message_type} to {client_addr} port {port} on {interface}".format(
+                    message_type=outgoing_message.inner_message.__class__.__name__,
+                    client_addr=destination_address,
+                    port=port,
+                    interface=interface_name))
+        else:
+            logger.error("Could not send {message_type} to {client_addr} port {port} on {interface}".format(
                 message_type=outgoing_message.inner_message.__class__.__name__,
                 client_addr=destination_address,
                 port=port,
                 interface=interface_name))
+
+        return success
+
+
+class ListeningInterface:
+    """
+    The information about an interface that a wildcard listener needs to construct an incoming packet bundle
+
+    :type interface_name: str
+    :type interface_index: int
+    :type link_address: IPv6Address
+    :type interface_id_option: InterfaceIdOption
+    """
+
+    __slots__ = ('interface_name', 'interface_index', 'link_address', 'interface_id_option')
+
+    def __init__(self, interface_name: str, interface_index: int, link_address: IPv6Address):
+        self.interface_name = interface_name
+        self.interface_index = interface_index
+        self.link_address = link_address
+        self.interface_id_option = InterfaceIdOption(interface_id=interface_name.encode('utf-8'))
+
+
+class PktInfoUDPListener(Listener):
+    """
+    A listener that uses a single socket bound to the wildcard address for many interfaces. The interface that a
+    message was received on and the address it was sent to are taken from the IPV6_PKTINFO ancillary data, so the
+    number of sockets doesn't grow with the number of interfaces.
+
+    :type listen_socket: socket.socket
+    :type interfaces: Dict[int, ListeningInterface]
+    :type joined_interfaces: Set[int]
+    """
+
+    # The size of a struct in6_pktinfo
+    pktinfo_size = 20
+
+    def __init__(self, listen_socket: socket.socket, interfaces: Iterable[ListeningInterface],
+                 marks: Iterable[str] = None):
+        """
+        Initialise listener.
+
+        :param listen_socket: The socket we are listening on, must be bound to the wildcard address
+        :param interfaces: The interfaces that we accept messages from
+        :param marks: Marks attached to this listener
+        """
+        self.listen_socket = listen_socket
+        self.interfaces = {interface.interface_index: interface for interface in interfaces}
+        self.marks = list(marks or [])
+
+        # The factory keeps track of multicast group membership
+        self.joined_interfaces = set()
+
+        # Check that we have an IPv6 UDP socket
+        if self.listen_socket.family != socket.AF_INET6 or self.listen_socket.proto != socket.IPPROTO_UDP:
+            raise ListeningSocketError("Listen socket has to be an IPv6 UDP socket")
+
+        listen_sockname = self.listen_socket.getsockname()
+
+        # Check that we are on the right port
+        if listen_sockname[1] != SERVER_PORT:
+            raise ListeningSocketError("Listen socket has to be on port {}".format(SERVER_PORT))
+
+        # We need the ancillary data to know where a message came from
+        self.listen_socket.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_RECVPKTINFO, 1)
+        self.ancillary_size = socket.CMSG_SPACE(self.pktinfo_size) + DROP_COUNTER_SPACE
+
+        # Keep track of the packets that the kernel dropped because we didn't read them fast enough
+        self.counts_kernel_drops = enable_drop_counter(self.listen_socket)
+        self.kernel_drops = 0
+
+    def __str__(self):
+        return "{} for {} interfaces".format(self.__class__.__name__, len(self.interfaces))
+
+    def recv_request(self) -> Tuple[IncomingPacketBundle, Replier]:
+        """
+        Receive incoming messages
+
+        :return: The incoming packet data and a replier object
+        """
+        request = self.create_bundle(*self.listen_socket.recvmsg(65536, self.ancillary_size))
+        if not request:
+            raise IgnoreMessage("Message received on an unknown interface")
+
+        return request
+
+    def recv_requests(self, max_count: int) -> List[Tuple[IncomingPacketBundle, Replier]]:
+        """
+        Receive all incoming messages that are waiting on the socket, up to the given maximum. Messages from
+        interfaces that we don't listen on are skipped.
+
+        :param max_count: The maximum number of messages to receive
+        :return: A list of incoming packet data and a replier object for each message
+        """
+        requests = []
+        flags = 0
+        for _ in range(max_count):
+            try:
+                request = self.create_bundle(*self.listen_socket.recvmsg(65536, self.ancillary_size, flags))
+            except (BlockingIOError, InterruptedError):
+                # Nothing more waiting
+                break
+
+            if request:
+                requests.append(request)
+
+            # Only the first receive may block, which it shouldn't because select() told us there is data
+            flags = socket.MSG_DONTWAIT
+
+        return requests
+
+    def create_bundle(self, data: bytes, ancdata: list, msg_flags: int,
+                      sender: tuple) -> Optional[Tuple[IncomingPacketBundle, Replier]]:
+        """
+        Create the incoming packet bundle and replier for a received message, based on the ancillary data
+
+        :param data: The received data
+        :param ancdata: The ancillary data
+        :param msg_flags: The message flags
+        :param sender: The address of the sender, as returned by recvmsg()
+        :return: The incoming packet data and a replier object, or None if the interface isn't known
+        """
+        destination_address = None
+        interface_index = sender[3]
+        for cmsg_level, cmsg_type, cmsg_data in ancdata:
+            if cmsg_level == socket.IPPROTO_IPV6 and cmsg_type == socket.IPV6_PKTINFO \
+                    and len(cmsg_data) >= self.pktinfo_size:
+                packed_address, interface_index = unpack_from('=16sI', cmsg_data)
+                destination_address = IPv6Address(packed_address)
+            elif SO_RXQ_OVFL is not None and cmsg_level == socket.SOL_SOCKET and cmsg_type == SO_RXQ_OVFL \
+                    and len(cmsg_data) >= 4:
+                self.kernel_drops = unpack_from('=I', cmsg_data)[0]
+
+        interface = self.interfaces.get(interface_index)
+        if not interface or not destination_address:
+            logger.debug("Ignoring message from {} received on unknown interface {}".format(sender[0],
+                                                                                            interface_index))
+            return None
+
+        # Create the message-ID
+        message_counter = increase_message_counter()
+        message_id = '#{:06X}'.format(message_counter)
+
+        if logger.isEnabledFor(DEBUG_PACKETS):
+            logger.log(DEBUG_PACKETS,
+                       "{message_id}: Received message from {client_addr} port {port} on {interface}".format(
+                           message_id=message_id,
+                           client_addr=sender[0],
+                           port=sender[1],
+                           interface=interface.interface_name))
+
+        received_over_multicast = destination_address.is_multicast
+
+        packet_bundle = IncomingPacketBundle(message_id=message_id,
+                                             data=data,
+                                             source_address=IPv6Address(sender[0].split('%')[0]),
+                                             link_address=interface.link_address,
+                                             interface_index=interface_index,
+                                             received_over_multicast=received_over_multicast,
+                                             received_over_tcp=False,
+                                             marks=self.marks,
+                                             relay_options=[interface.interface_id_option])
+
+        # Let the kernel pick the link-local source address for replies to multicast requests
+        reply_from = IPv6Address(0) if received_over_multicast else destination_address
+        replier = PktInfoUDPReplier(self.listen_socket, interface_index, interface.interface_name, reply_from)
+
+        return packet_bundle, replier
+
+    def export_statistics(self) -> Dict[str, dict]:
+        """
+        Export the number of packets that the kernel dropped on the shared socket.
+
+        :return: The statistics in a processable format
+        """
+        if not self.counts_kernel_drops:
+            return {}
+
+        return {str(self): OrderedDict([('kernel_drops', self.kernel_drops)])}
+
+    def fileno(self) -> int:
+        """
+        The fileno of the listening socket, so this object can be used by select()
+
+        :return: The file descriptor
+        """
+        return self.listen_socket.fileno()
+
+
+class PktInfoUDPReplier(Replier):
+    """
+    A class to send replies to the client over a wildcard socket, using IPV6_PKTINFO to select the source address and
+    outgoing interface.
+    """
+
+    def __init__(self, reply_socket: socket.socket, interface_index: int, interface_name: str,
+                 reply_from: IPv6Address):
+        self.reply_socket = reply_socket
+        self.interface_index = interface_index
+        self.interface_name = interface_name
+        self.reply_from = reply_from
+
+    def send_reply(self, outgoing_message: RelayReplyMessage) -> bool:
+        """
+        Send a reply to the client
+
+        :param outgoing_message: The message to send, including a wrapping RelayReplyMessage
+        :return: Whether sending was successful
+        """
+        # Determine network addresses and bytes
+        reply = outgoing_message.relayed_message
+        port = isinstance(reply, RelayReplyMessage) and SERVER_PORT or CLIENT_PORT
+        destination_address = str(outgoing_message.peer_address)
+        data = reply.save()
+
+        pktinfo = pack('=16sI', self.reply_from.packed, self.interface_index)
+        destination = (destination_address, port, 0, self.interface_index)
+        sent_length = self.reply_socket.sendmsg([data], [(socket.IPPROTO_IPV6, socket.IPV6_PKTINFO, pktinfo)], 0,
+                                                destination)
+        success = len(data) == sent_length
+
+        if success:
+            if logger.isEnabledFor(DEBUG_PACKETS):
+                logger.log(DEBUG_PACKETS, "Sent {message_type} to {client_addr} port {port} on {interface}".format(
+                    message_type=outgoing_message.inner_message.__class__.__name__,
+                    client_addr=destination_address,
+                    port=port,
+                    interface=self.interface_name))
         else:
             logger.error("Could not send {message_type} to {client_addr} port {port} on {interface}".format(
                 message_type=outgoing_message.inner_message.__class__.__name__,
                 client_addr=destination_address,
                 port=port,
-                interface=interface_name))
+                interface=self.interface_name))
 
         return success
@@ -73,4 +73,6 @@ class UnicastUDPListenerFactory(UDPListenerFactory):
             sock = socket.socket(socket.AF_INET6, self.sock_type, self.sock_proto)
             sock.bind((str(self.name), self.listen_port))
 
+        self.configure_socket(sock)
+
         return UDPListener(self.found_interface, sock, marks=self.marks)
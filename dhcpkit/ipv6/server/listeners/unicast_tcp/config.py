@@ -9,7 +9,7 @@ from ipaddress import IPv6Address
 from ZConfig.matcher import SectionValue
 from dhcpkit.ipv6.server.listeners import Listener
 from dhcpkit.ipv6.server.listeners.factories import TCPListenerFactory
-from dhcpkit.ipv6.server.listeners.tcp import TCPConnectionListener
+from dhcpkit.ipv6.server.listeners.tcp import MAX_MESSAGE_SIZE, TCPConnectionListener
 from dhcpkit.ipv6.utils import is_global_unicast
 from typing import Iterable
 
@@ -35,6 +35,13 @@ class UnicastTCPListenerFactory(TCPListenerFactory):
         if not is_global_unicast(self.address):
             raise ValueError("The listener address must be a global unicast address")
 
+        if self.max_transfer_time < 0:
+            raise ValueError("The maximum transfer time can't be negative")
+
+        if self.max_send_buffer < MAX_MESSAGE_SIZE:
+            raise ValueError("The send buffer must be able to contain at least one message of {} bytes".format(
+                MAX_MESSAGE_SIZE))
+
         for interface_name in netifaces.interfaces():
             interface_addresses = [IPv6Address(addr_info['addr'].split('%')[0])
                                    for addr_info
@@ -71,5 +78,13 @@ class UnicastTCPListenerFactory(TCPListenerFactory):
             sock.bind((str(self.address), self.listen_port))
             sock.listen(10)
 
+        # Accepted connections inherit the buffer sizes of the listening socket
+        self.configure_socket(sock)
+
         return TCPConnectionListener(interface_name=self.found_interface, listen_socket=sock, marks=self.marks,
-                                     allow_from=self.allow_from)
+                                     max_connections=self.max_connections, allow_from=self.allow_from,
+                                     send_timeout=self.send_timeout,
+                                     max_connections_per_peer=self.max_connections_per_peer,
+                                     idle_timeout=self.idle_timeout, max_in_flight=self.max_in_flight,
+                                     max_transfer_time=self.max_transfer_time,
+                                     max_send_buffer=self.max_send_buffer)
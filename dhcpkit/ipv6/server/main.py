@@ -14,6 +14,7 @@ import selectors
 import signal
 import sys
 import time
+from functools import partial
 from multiprocessing import forkserver
 from multiprocessing.util import get_logger
 from urllib.parse import urlparse
@@ -21,16 +22,22 @@ from urllib.parse import urlparse
 import dhcpkit
 from ZConfig import ConfigurationSyntaxError, DataConversionError
 from dhcpkit.common.privileges import drop_privileges, restore_privileges
+from dhcpkit.common.server.logging import DEBUG_HANDLING
 from dhcpkit.common.server.logging.config_elements import set_verbosity_logger
 from dhcpkit.ipv6.server import config_parser, queue_logger
 from dhcpkit.ipv6.server.config_elements import MainConfig
 from dhcpkit.ipv6.server.control_socket import ControlConnection, ControlSocket
-from dhcpkit.ipv6.server.listeners import ClosedListener, IgnoreMessage, Listener, ListenerCreator
+from dhcpkit.ipv6.server.dispatch_filters import DispatchFilter
+from dhcpkit.ipv6.server.listeners import ClosedListener, IgnoreMessage, IncomingPacketBundle, Listener, \
+    ListenerCreator
+from dhcpkit.ipv6.server.listeners.pcap import PcapListener, read_captured_requests
+from dhcpkit.ipv6.server.metrics_socket import MetricsConnection, MetricsSocket, REQUEST_TIMEOUT
 from dhcpkit.ipv6.server.nonblocking_pool import NonBlockingPool
+from dhcpkit.ipv6.server.packet_scanner import scan_packet
 from dhcpkit.ipv6.server.queue_logger import WorkerQueueHandler
 from dhcpkit.ipv6.server.statistics import ServerStatistics
-from dhcpkit.ipv6.server.worker import handle_message, setup_worker
-from typing import Iterable, Optional
+from dhcpkit.ipv6.server.worker import get_interface_name_from_options, handle_messages, setup_worker
+from typing import Any, Iterable, List, Optional
 
 logger = logging.getLogger()
 
@@ -60,6 +67,52 @@ def error_callback(exception):
     logger.error(message)
 
 
+def requests_completed(listeners: List[Listener], results: List[Any] = None):
+    """
+    Let the listeners know that the worker has finished handling their requests
+
+    :param listeners: The listener of each request in the batch
+    :param results: The result of the replier of each request in the batch, if the worker returned them
+    """
+    for listener, result in zip(listeners, results or [None] * len(listeners)):
+        listener.request_completed(result)
+
+
+def requests_failed(listeners: List[Listener], exception: Exception):
+    """
+    Let the listeners know that the worker has stopped handling their requests, and show the exception
+
+    :param listeners: The listener of each request in the batch
+    :param exception: The exception that occurred
+    """
+    requests_completed(listeners)
+    error_callback(exception)
+
+
+def update_registration(sel: selectors.BaseSelector, listener: Listener):
+    """
+    Register the listener for the events it is interested in: incoming requests while it isn't paused, and being able
+    to send while it has unsent replies.
+
+    :param sel: The selector of the main loop
+    :param listener: The listener
+    """
+    events = 0
+    if not listener.paused:
+        events |= selectors.EVENT_READ
+    if listener.has_unsent_replies:
+        events |= selectors.EVENT_WRITE
+
+    key = sel.get_map().get(listener)
+    if key is None:
+        if events:
+            sel.register(listener, events)
+    elif not events:
+        sel.unregister(listener)
+    elif key.events != events:
+        sel.modify(listener, events)
+
+
 def handle_args(args: Iterable[str]):
     """
     Handle the command line arguments.
@@ -80,6 +133,18 @@ def handle_args(args: Iterable[str]):
     parser.add_argument("-p", "--pidfile", action="store",
                         help="save the server's PID to this file")
 
+    benchmark = parser.add_argument_group("benchmark mode")
+    benchmark.add_argument("--benchmark", action="append", metavar="CAPTURE_FILE",
+                           help="replay the DHCPv6 requests from this pcap or pcapng file instead of listening to the "
+                                "network, show the statistics and exit; can be given multiple times")
+    benchmark.add_argument("--benchmark-speed", action="store", type=float, default=0.0, metavar="SPEED",
+                           help="replay at this multiple of the captured timing, default is as fast as possible")
+    benchmark.add_argument("--benchmark-repeat", action="store", type=int, default=1, metavar="COUNT",
+                           help="replay the captured requests this many times")
+    benchmark.add_argument("--benchmark-max-in-flight", action="store", type=int, metavar="COUNT",
+                           help="the maximum number of requests being handled at the same time, default is four "
+                                "times the number of workers")
+
     args = parser.parse_args(args)
 
     return args
@@ -150,6 +215,97 @@ def create_control_socket(args, config: MainConfig) -> ControlSocket:
         return control_socket
 
 
+def create_metrics_socket(config: MainConfig) -> Optional[MetricsSocket]:
+    """
+    Create a metrics socket when configured to do so.
+
+    :param config: The server configuration
+    :return: The created metrics socket
+    """
+    if not config.statistics or not config.statistics.metrics_address:
+        return None
+
+    return MetricsSocket(config.statistics.metrics_address, config.statistics.metrics_port,
+                         config.statistics.metrics_allow_from)
+
+
+def dispatch_allowed(dispatch_filters: Iterable[DispatchFilter], packet: IncomingPacketBundle,
+                     statistics: ServerStatistics) -> bool:
+    """
+    Run the dispatch filters on an incoming packet, and update the statistics when it is dropped.
+
+    :param dispatch_filters: The dispatch filters
+    :param packet: The incoming packet
+    :param statistics: The statistics to update
+    :return: Whether to dispatch the packet
+    """
+    scanned_packet = scan_packet(packet)
+    if not scanned_packet:
+        # Let the worker deal with (and count) malformed packets
+        return True
+
+    for dispatch_filter in dispatch_filters:
+        if not dispatch_filter.allow(scanned_packet):
+            break
+    else:
+        return True
+
+    if logger.isEnabledFor(DEBUG_HANDLING):
+        logger.log(DEBUG_HANDLING, "{} dropped packet {}".format(dispatch_filter, packet.message_id))
+
+    interface_name = get_interface_name_from_options(packet.relay_options)
+    update_set = statistics.get_update_set(interface_name=interface_name)
+    update_set.count_incoming_packet()
+    dispatch_filter.count_dropped_packet(scanned_packet, update_set)
+
+    if statistics.heavy_hitters:
+        statistics.heavy_hitters.count(interface_name=interface_name,
+                                       relays=scanned_packet.relay_link_addresses,
+                                       link_address=scanned_packet.link_address,
+                                       client_duid=scanned_packet.client_duid)
+
+    return False
+
+
+def create_benchmark_listener(args, config: MainConfig) -> Optional[PcapListener]:
+    """
+    Create a listener that replays captured requests when running in benchmark mode.
+
+    :param args: The command line arguments
+    :param config: The server configuration
+    :return: The listener, or None when not running in benchmark mode
+    """
+    if not args.benchmark:
+        return None
+
+    requests = read_captured_requests(args.benchmark)
+    if not requests:
+        raise ValueError("No DHCPv6 requests found in {}".format(', '.join(args.benchmark)))
+
+    logger.info("Replaying {} captured requests".format(len(requests) * args.benchmark_repeat))
+
+    return PcapListener(', '.join(map(os.path.basename, args.benchmark)), requests,
+                        speed=args.benchmark_speed,
+                        repeat=args.benchmark_repeat,
+                        max_in_flight=args.benchmark_max_in_flight or 4 * config.workers)
+
+
+def split_into_batches(items: List, parts: int) -> List[List]:
+    """
+    Split the items into at most the given number of batches of (almost) equal size, so that all worker processes
+    can work on them at the same time.
+
+    :param items: The items to split
+    :param parts: The maximum number of batches
+    :return: The batches
+    """
+    if not items:
+        return []
+
+    batch_size = -(-len(items) // parts)
+    return [items[start:start + batch_size] for start in range(0, len(items), batch_size)]
+
+
 def main(args: Iterable[str]) -> int:
     """
     The main program loop
@@ -163,6 +319,8 @@ def main(args: Iterable[str]) -> int:
 
     # Go to the working directory
     config_file = os.path.realpath(args.config)
+    if args.benchmark:
+        args.benchmark = [os.path.realpath(capture_file) for capture_file in args.benchmark]
     os.chdir(os.path.dirname(config_file))
 
     try:
@@ -220,9 +378,17 @@ def main(args: Iterable[str]) -> int:
     # Create a queue for our children to log to
     logging_queue = multiprocessing.Queue()
 
+    try:
+        benchmark_listener = create_benchmark_listener(args=args, config=config)
+    except (OSError, ValueError) as e:
+        logger.critical("Cannot read captured requests: {}".format(e))
+        return 1
+
     statistics = ServerStatistics()
     listeners = []
     control_socket = None
+    metrics_socket = None
+    metrics_connections = []
     stopping = False
 
     while not stopping:
@@ -251,15 +417,19 @@ def main(args: Iterable[str]) -> int:
         # Restore our privileges while we write the PID file and open network listeners
         restore_privileges()
 
-        # Open the network listeners
-        old_listeners = listeners
-        listeners = []
-        for listener_factory in config.listener_factories:
-            # Create new listener while trying to re-use existing sockets
-            listeners.append(listener_factory(old_listeners + listeners))
+        if benchmark_listener:
+            # Replay the captured requests instead of listening to the network
+            listeners = [benchmark_listener]
+        else:
+            # Open the network listeners
+            old_listeners = listeners
+            listeners = []
+            for listener_factory in config.listener_factories:
+                # Create new listener while trying to re-use existing sockets
+                listeners.append(listener_factory(old_listeners + listeners))
 
-        # Forget old listeners
-        del old_listeners
+            # Forget old listeners
+            del old_listeners
 
         # Write the PID file
         pid_filename = create_pidfile(args=args, config=config)
@@ -273,6 +443,15 @@ def main(args: Iterable[str]) -> int:
         if control_socket:
             sel.register(control_socket, selectors.EVENT_READ)
 
+        # Create a metrics socket
+        if metrics_socket:
+            sel.unregister(metrics_socket)
+            metrics_socket.close()
+
+        metrics_socket = create_metrics_socket(config=config)
+        if metrics_socket:
+            sel.register(metrics_socket, selectors.EVENT_READ)
+
         # And Drop privileges again
         drop_privileges(config.user, config.group, permanent=False)
 
@@ -281,8 +460,9 @@ def main(args: Iterable[str]) -> int:
             # Don't remove our signal handling pipe, control socket, still existing listeners and control connections
             if key.fileobj is signal_r \
                     or (control_socket and key.fileobj is control_socket) \
+                    or (metrics_socket and key.fileobj is metrics_socket) \
                     or key.fileobj in listeners \
-                    or isinstance(key.fileobj, ControlConnection):
+                    or isinstance(key.fileobj, (ControlConnection, MetricsConnection)):
                 continue
 
             # Seems we don't need this one anymore
@@ -294,8 +474,12 @@ def main(args: Iterable[str]) -> int:
             if listener not in existing_listeners:
                 sel.register(listener, selectors.EVENT_READ)
 
+        # Make sure the shared counters have a slot for every process
+        statistics.set_worker_count(config.workers)
+
         # Configuration tree
         try:
+            dispatch_filters = config.create_dispatch_filters()
             message_handler = config.create_message_handler()
         except Exception as e:
             if args.verbosity >= 3:
@@ -306,6 +490,9 @@ def main(args: Iterable[str]) -> int:
 
         # Make sure we have space to store all the interface statistics
         statistics.set_categories(config.statistics)
+        statistics.message_handler = message_handler
+        statistics.dispatch_filters = dispatch_filters
+        statistics.listeners = listeners
 
         # Start worker processes
         my_pid = os.getpid()
@@ -321,17 +508,66 @@ def main(args: Iterable[str]) -> int:
 
                 # noinspection PyBroadException
                 try:
-                    events = sel.select()
+                    # Only listen to the events that the listeners are interested in
+                    for listener in listeners:
+                        if isinstance(listener, Listener):
+                            update_registration(sel, listener)
+
+                    # Only wake up periodically when there are metrics connections or listeners that may time out
+                    timeouts = [listener.timeout for listener in listeners if isinstance(listener, Listener)]
+                    timeouts = [timeout for timeout in timeouts if timeout is not None]
+                    if metrics_connections:
+                        timeouts.append(REQUEST_TIMEOUT)
+
+                    events = sel.select(timeout=min(timeouts) if timeouts else None)
+
+                    # Listeners that have already received requests don't wait for their socket to become readable
+                    ready = {key.fileobj for key, mask in events if mask & selectors.EVENT_READ}
+                    events += [(key, selectors.EVENT_READ) for key in list(sel.get_map().values())
+                               if isinstance(key.fileobj, Listener) and key.events & selectors.EVENT_READ
+                               and key.fileobj not in ready and key.fileobj.has_pending_requests]
+
+                    for listener in [listener for listener in listeners
+                                     if isinstance(listener, Listener) and listener.expired]:
+                        if listener in sel.get_map():
+                            sel.unregister(listener)
+                        listeners.remove(listener)
+                        listener.close()
+
+                    for metrics_connection in [connection for connection in metrics_connections
+                                               if connection.expired]:
+                        logger.debug("Closing metrics connection that has been open for too long")
+                        sel.unregister(metrics_connection)
+                        metrics_connection.close()
+                        metrics_connections.remove(metrics_connection)
+
+                    # Collect the incoming packets from all listeners so we can dispatch them in batches
+                    incoming_packets = []
+                    incoming_listeners = []
+
                     for key, mask in events:
                         if isinstance(key.fileobj, Listener):
+                            if key.fileobj not in listeners:
+                                # Already closed because it expired
+                                continue
+
+                            if mask & selectors.EVENT_WRITE:
+                                key.fileobj.send_unsent_replies()
+
+                            if not mask & selectors.EVENT_READ:
+                                continue
+
                             try:
-                                packet, replier = key.fileobj.recv_request()
+                                for packet, replier in key.fileobj.recv_requests(config.receive_batch_size):
+                                    # Update stats
+                                    message_count += 1
 
-                                # Update stats
-                                message_count += 1
+                                    # Drop packets that the workers would reject anyway
+                                    if dispatch_filters and not dispatch_allowed(dispatch_filters, packet, statistics):
+                                        continue
 
-                                # Dispatch
-                                pool.apply_async(handle_message, args=(packet, replier), error_callback=error_callback)
+                                    incoming_packets.append((packet, replier))
+                                    incoming_listeners.append(key.fileobj)
                             except IgnoreMessage:
                                 # Message isn't complete, leave it for now
                                 pass
@@ -339,6 +575,7 @@ def main(args: Iterable[str]) -> int:
                                 # This listener is closed (at least TCP shutdown for incoming data), so forget about it
                                 sel.unregister(key.fileobj)
                                 listeners.remove(key.fileobj)
+                                key.fileobj.close()
 
                         elif isinstance(key.fileobj, ListenerCreator):
                             # Activity on this object means we have a new listener
@@ -393,6 +630,33 @@ def main(args: Iterable[str]) -> int:
                                 # We got a connection, listen to events
                                 sel.register(control_connection, selectors.EVENT_READ)
 
+                        elif isinstance(key.fileobj, MetricsSocket):
+                            # A new scraper
+                            metrics_connection = key.fileobj.accept()
+                            if metrics_connection:
+                                sel.register(metrics_connection, selectors.EVENT_READ)
+                                metrics_connections.append(metrics_connection)
+
+                        elif isinstance(key.fileobj, MetricsConnection):
+                            metrics_connection = key.fileobj
+                            if metrics_connection not in metrics_connections:
+                                # Already closed because it expired
+                                continue
+
+                            if mask & selectors.EVENT_READ:
+                                if metrics_connection.handle_read(statistics):
+                                    # The response is ready
+                                    sel.modify(metrics_connection, selectors.EVENT_WRITE)
+
+                            elif mask & selectors.EVENT_WRITE:
+                                if metrics_connection.handle_write():
+                                    metrics_connection.closed = True
+
+                            if metrics_connection.closed:
+                                sel.unregister(metrics_connection)
+                                metrics_connection.close()
+                                metrics_connections.remove(metrics_connection)
+
                         elif isinstance(key.fileobj, ControlConnection):
                             # Let the connection handle received data
                             control_connection = key.fileobj
@@ -406,6 +670,7 @@ def main(args: Iterable[str]) -> int:
                                     control_connection.send("  help")
                                     control_connection.send("  stats")
                                     control_connection.send("  stats-json")
+                                    control_connection.send("  top")
                                     control_connection.send("  reload")
                                     control_connection.send("  shutdown")
                                     control_connection.send("  quit")
@@ -419,6 +684,13 @@ def main(args: Iterable[str]) -> int:
                                     control_connection.send(json.dumps(statistics.export()))
                                     control_connection.acknowledge()
 
+                                elif command == 'top':
+                                    if statistics.heavy_hitters:
+                                        control_connection.send(str(statistics.heavy_hitters))
+                                        control_connection.acknowledge()
+                                    else:
+                                        control_connection.acknowledge('Heavy hitter tracking is disabled')
+
                                 elif command == 'reload':
                                     # Simulate a SIGHUP to reload
                                     os.write(signal_w, bytes([signal.SIGHUP]))
@@ -446,6 +718,21 @@ def main(args: Iterable[str]) -> int:
                                     logger.warning("Rejecting unknown control command '{}'".format(command))
                                     control_connection.reject()
 
+                    # Dispatch
+                    for batch, batch_listeners in zip(split_into_batches(incoming_packets, config.workers),
+                                                      split_into_batches(incoming_listeners, config.workers)):
+                        for listener in batch_listeners:
+                            listener.request_dispatched()
+
+                        pool.apply_async(handle_messages, args=(batch,),
+                                         callback=partial(requests_completed, batch_listeners),
+                                         error_callback=partial(requests_failed, batch_listeners))
+
+                    # The benchmark is done when all captured requests have been handled
+                    if benchmark_listener and benchmark_listener.closed:
+                        running = False
+                        stopping = True
+
                 except Exception as e:
                     # Catch-all exception handler
                     logger.exception("Caught unexpected exception {!r}".format(e))
@@ -488,6 +775,11 @@ def main(args: Iterable[str]) -> int:
         except OSError:
             pass
 
+    if benchmark_listener:
+        # Show the results, including those of the benchmark listener that has been removed by now
+        statistics.listeners = [benchmark_listener]
+        print(statistics, flush=True)
+
     logger.info("Shutting down Python DHCPv6 server v{}".format(dhcpkit.__version__))
 
     return 0
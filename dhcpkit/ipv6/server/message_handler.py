@@ -3,7 +3,7 @@ The code to handle a message
 """
 import logging
 import multiprocessing
-from typing import Iterable, List, Optional
+from typing import Dict, Iterable, List, Optional
 
 from dhcpkit.common.server.logging import DEBUG_HANDLING
 from dhcpkit.ipv6.duids import DUID
@@ -17,7 +17,7 @@ from dhcpkit.ipv6.options import ClientIdOption, IAAddressOption, IANAOption, IA
 from dhcpkit.ipv6.server.extension_registry import server_extension_registry
 from dhcpkit.ipv6.server.filters import Filter
 from dhcpkit.ipv6.server.handlers import CannotRespondError, Handler, ReplyWithLeasequeryError, ReplyWithStatusError, \
-    UseMulticastError
+    UseMulticastError, merge_statistics
 from dhcpkit.ipv6.server.handlers.client_id import ClientIdHandler
 from dhcpkit.ipv6.server.handlers.interface_id import InterfaceIdOptionHandler
 from dhcpkit.ipv6.server.handlers.rapid_commit import RapidCommitHandler
@@ -62,6 +62,14 @@ class MessageHandler:
         for sub_handler in self.sub_handlers:
             sub_handler.worker_init()
 
+    def export_statistics(self) -> Dict[str, dict]:
+        """
+        Collect the statistics of the sub-filters and sub-handlers.
+
+        :return: The statistics in a processable format
+        """
+        return merge_statistics(self.sub_filters + self.sub_handlers)
+
     def get_handlers(self, bundle: TransactionBundle) -> List[Handler]:
         """
         Get all handlers that are going to be applied to the request in the bundle.
@@ -0,0 +1,316 @@
+"""
+A minimal HTTP listener that exports the server statistics in OpenMetrics format
+"""
+import logging
+import socket
+import time
+from ipaddress import IPv4Address, IPv4Network, IPv6Address, IPv6Network, ip_address
+
+import dhcpkit
+from dhcpkit.ipv6.message_registry import message_registry
+from dhcpkit.ipv6.server.statistics import COUNTER_NAMES, ServerStatistics
+from dhcpkit.utils import camelcase_to_underscore
+from typing import Iterable, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Don't accept ridiculously large requests
+MAX_REQUEST_SIZE = 8192
+
+# Close connections that don't send a complete request in time
+REQUEST_TIMEOUT = 10
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+COUNTER_DESCRIPTIONS = {
+    'incoming_packets': 'Incoming packets',
+    'outgoing_packets': 'Outgoing packets',
+    'unparsable_packets': 'Incoming packets that could not be parsed',
+    'handling_errors': 'Errors while handling requests',
+    'for_other_server': 'Requests meant for another server',
+    'do_not_respond': 'Requests that were deliberately not answered',
+    'use_multicast': 'Requests that were rejected because the client must use multicast',
+    'unknown_query_type': 'Leasequery requests with an unknown query type',
+    'malformed_query': 'Malformed leasequery requests',
+    'not_allowed': 'Leasequery requests that were not allowed',
+    'other_error': 'Requests that failed with another error',
+    'dropped_packets': 'Packets that were dropped before being dispatched to a worker',
+}
+
+# Cache of the label values for message types
+message_type_names = {}
+
+
+def escape_label_value(value: str) -> str:
+    """
+    Escape a label value according to the OpenMetrics specification
+
+    :param value: The raw value
+    :return: The escaped value
+    """
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def get_message_type_name(message_type: int) -> str:
+    """
+    Get the name of a message type for use as a label value
+
+    :param message_type: The message type
+    :return: The name of the message type
+    """
+    name = message_type_names.get(message_type)
+    if name is None:
+        name = camelcase_to_underscore(message_registry[message_type].__name__)
+        if name.endswith('_message'):
+            name = name[:-8]
+        message_type_names[message_type] = name
+    return name
+
+
+def render_metrics(statistics: ServerStatistics) -> bytes:
+    """
+    Render the server statistics in OpenMetrics text format
+
+    :param statistics: The statistics to render
+    :return: The rendered metrics
+    """
+    # Each source gets a set of labels, and we read its counters exactly once
+    sources = [('', statistics.global_stats)]
+    sources += [('interface="{}"'.format(escape_label_value(name)), stats)
+                for name, stats in sorted(statistics.interface_stats.items())]
+    sources += [('subnet="{}"'.format(subnet), stats)
+                for subnet, stats in sorted(statistics.subnet_stats.items())]
+    sources += [('relay="{}"'.format(relay), stats)
+                for relay, stats in sorted(statistics.relay_stats.items())]
+
+    sources = [(labels, stats, stats.counters.totals()) for labels, stats in sources]
+
+    lines = [
+        '# TYPE dhcpkit_build info',
+        '# HELP dhcpkit_build DHCPKit version information',
+        'dhcpkit_build_info{{version="{}"}} 1'.format(escape_label_value(dhcpkit.__version__)),
+        '# TYPE dhcpkit_workers gauge',
+        '# HELP dhcpkit_workers Number of worker processes',
+        'dhcpkit_workers {}'.format(len(statistics.slot_owners) - 1),
+    ]
+
+    for index, counter_name in enumerate(COUNTER_NAMES):
+        family = 'dhcpkit_' + counter_name
+        lines.append('# TYPE {} counter'.format(family))
+        lines.append('# HELP {} {}'.format(family, COUNTER_DESCRIPTIONS[counter_name]))
+        for labels, stats, totals in sources:
+            lines.append('{}_total{} {}'.format(family, '{' + labels + '}' if labels else '', totals[index]))
+
+    for family, attribute, description in (('dhcpkit_messages_in', 'messages_in', 'Incoming messages by type'),
+                                           ('dhcpkit_messages_out', 'messages_out', 'Outgoing messages by type')):
+        lines.append('# TYPE {} counter'.format(family))
+        lines.append('# HELP {} {}'.format(family, description))
+        for labels, stats, totals in sources:
+            for message_type, counter_index in getattr(stats, attribute).items():
+                type_label = 'type="{}"'.format(get_message_type_name(message_type))
+                lines.append('{}_total{{{}}} {}'.format(family, labels + ',' + type_label if labels else type_label,
+                                                        totals[counter_index]))
+
+    if statistics.heavy_hitters:
+        lines.append('# TYPE dhcpkit_top_request_rate gauge')
+        lines.append('# HELP dhcpkit_top_request_rate Request rate per second of the busiest sources')
+        for category, entries in statistics.heavy_hitters.export().items():
+            for entry in entries:
+                lines.append('dhcpkit_top_request_rate{{category="{}",key="{}"}} {}'.format(
+                    category, escape_label_value(entry['key']), entry['rate']))
+
+    lines.append('# EOF')
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+class MetricsConnection:
+    """
+    A connection to the metrics socket. Every connection handles a single request.
+    """
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.sock.setblocking(False)
+
+        self.buffer = b''
+        self.output = b''
+        self.closed = False
+        self.started = time.monotonic()
+
+    def fileno(self) -> int:
+        """
+        The fileno of the socket, so this object can be used by select()
+
+        :return: The file descriptor
+        """
+        return self.sock.fileno()
+
+    @property
+    def expired(self) -> bool:
+        """
+        Whether this connection has been open for too long
+        """
+        return time.monotonic() - self.started > REQUEST_TIMEOUT
+
+    def handle_read(self, statistics: ServerStatistics) -> bool:
+        """
+        Receive data and prepare a response when the request is complete
+
+        :param statistics: The statistics to render
+        :return: Whether there is a response to write
+        """
+        try:
+            received = self.sock.recv(MAX_REQUEST_SIZE)
+        except BlockingIOError:
+            return False
+        except OSError:
+            received = b''
+
+        if not received:
+            # The other end closed the connection, or had an error
+            self.closed = True
+            return False
+
+        self.buffer += received
+        if b'\r\n\r\n' not in self.buffer and b'\n\n' not in self.buffer:
+            if len(self.buffer) > MAX_REQUEST_SIZE:
+                self.output = self.build_response(413, 'Request Entity Too Large')
+                return True
+            return False
+
+        request_line = self.buffer.split(b'\n', maxsplit=1)[0].decode('ascii', errors='replace').split()
+        if len(request_line) < 2:
+            self.output = self.build_response(400, 'Bad Request')
+        elif request_line[0] not in ('GET', 'HEAD'):
+            self.output = self.build_response(405, 'Method Not Allowed')
+        elif request_line[1].split('?', maxsplit=1)[0] not in ('/', '/metrics'):
+            self.output = self.build_response(404, 'Not Found')
+        else:
+            body = render_metrics(statistics)
+            self.output = self.build_response(200, 'OK', body, CONTENT_TYPE, head_only=request_line[0] == 'HEAD')
+
+        return True
+
+    @staticmethod
+    def build_response(status: int, reason: str, body: bytes = None, content_type: str = 'text/plain; charset=utf-8',
+                       head_only: bool = False) -> bytes:
+        """
+        Build a complete HTTP response
+
+        :param status: The HTTP status code
+        :param reason: The HTTP reason phrase
+        :param body: The response body, defaults to the reason phrase
+        :param content_type: The content type of the body
+        :param head_only: Leave out the body
+        :return: The response
+        """
+        if body is None:
+            body = (reason + '\n').encode('ascii')
+
+        headers = ('HTTP/1.0 {} {}\r\n'
+                   'Content-Type: {}\r\n'
+                   'Content-Length: {}\r\n'
+                   'Connection: close\r\n'
+                   '\r\n').format(status, reason, content_type, len(body))
+
+        return headers.encode('ascii') + (b'' if head_only else body)
+
+    def handle_write(self) -> bool:
+        """
+        Send as much of the response as the socket accepts
+
+        :return: Whether the response is completely sent
+        """
+        try:
+            sent = self.sock.send(self.output)
+            self.output = self.output[sent:]
+        except BlockingIOError:
+            pass
+        except OSError:
+            # They have gone away, fine
+            self.output = b''
+
+        return not self.output
+
+    def close(self):
+        """
+        Close the socket nicely
+        """
+        self.sock.close()
+
+
+class MetricsSocket:
+    """
+    A listening socket for OpenMetrics scrapers
+    """
+
+    def __init__(self, address: Union[IPv4Address, IPv6Address], port: int,
+                 allow_from: Iterable[Union[IPv4Network, IPv6Network]] = None):
+        self.address = address
+        self.port = port
+
+        self.allow_from = list(allow_from or [])
+
+        family = socket.AF_INET6 if address.version == 6 else socket.AF_INET
+        self.listen_socket = socket.socket(family, socket.SOCK_STREAM)
+        self.listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listen_socket.setblocking(False)
+
+        logger.info("Creating metrics socket on port {} of {}".format(port, address))
+        try:
+            self.listen_socket.bind((str(address), port))
+        except OSError as e:
+            self.listen_socket.close()
+            raise RuntimeError("Cannot create metrics socket on port {} of {}: {}".format(port, address, e)) from None
+
+        self.listen_socket.listen(16)
+
+    def close(self):
+        """
+        Close the socket nicely
+        """
+        self.listen_socket.close()
+
+    def fileno(self) -> int:
+        """
+        The fileno of the listening socket, so this object can be used by select()
+
+        :return: The file descriptor
+        """
+        return self.listen_socket.fileno()
+
+    def is_allowed(self, peer: Tuple) -> bool:
+        """
+        Check whether the given peer may access the metrics
+
+        :param peer: The socket address of the peer
+        :return: Whether access is allowed
+        """
+        if not self.allow_from:
+            return True
+
+        address = ip_address(peer[0].split('%')[0])
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+
+        return any(address in network for network in self.allow_from if network.version == address.version)
+
+    def accept(self) -> Optional[MetricsConnection]:
+        """
+        Accept a new connection
+
+        :return: The new connection
+        """
+        try:
+            sock, peer = self.listen_socket.accept()
+        except OSError:
+            logger.debug("Metrics connection broken after connecting, ignoring")
+            return None
+
+        if not self.is_allowed(peer):
+            logger.debug("Rejecting metrics connection from {}".format(peer[0]))
+            sock.close()
+            return None
+
+        return MetricsConnection(sock)
+
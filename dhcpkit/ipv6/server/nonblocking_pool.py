@@ -2,6 +2,7 @@
 A multiprocessing pool that doesn't block when full. If we don't do this then the queue fills up with old messages and
 the workers keep answering those while the client has probably already given up, instead of answering recent messages.
 """
+import sys
 from multiprocessing.pool import ApplyResult, Pool, RUN
 from queue import Full
 
@@ -24,7 +25,8 @@ class NonBlockingPool(Pool):
             raise ValueError("Pool not running")
 
         try:
-            result = ApplyResult(self._cache, callback, error_callback)
+            # Since Python 3.8 the result is linked to the pool instead of to the cache
+            result = ApplyResult(self if sys.version_info >= (3, 8) else self._cache, callback, error_callback)
             self._taskqueue.put(([(result._job, None, func, args, kwds or {})], None), block=False)
         except Full:
             return None
@@ -0,0 +1,147 @@
+"""
+A minimal scanner that extracts the interesting bits from a raw DHCPv6 packet without fully parsing it. This is used
+in the master process to make quick decisions before dispatching a packet to a worker.
+"""
+from ipaddress import IPv6Address
+from struct import unpack_from
+
+from dhcpkit.ipv6.messages import MSG_RELAY_FORW
+from dhcpkit.ipv6.options import OPTION_CLIENTID, OPTION_RELAY_MSG, OPTION_SERVERID
+from dhcpkit.ipv6.server.listeners import IncomingPacketBundle
+from typing import Dict, List, Optional
+
+# Don't follow relay chains that are longer than the hop count limit
+MAX_RELAY_DEPTH = 32
+
+
+def scan_options(data: bytes, offset: int) -> Dict[int, bytes]:
+    """
+    Find the options in a message. Only the first occurrence of each option type is returned.
+
+    :param data: The raw message
+    :param offset: Where the options start
+    :return: The option payloads by option type
+    """
+    options = {}
+    max_offset = len(data)
+    while offset < max_offset:
+        if offset + 4 > max_offset:
+            raise ValueError("Option header extends beyond the end of the message")
+
+        option_type, option_length = unpack_from('!HH', data, offset)
+        offset += 4
+
+        if offset + option_length > max_offset:
+            raise ValueError("Option extends beyond the end of the message")
+
+        if option_type not in options:
+            options[option_type] = data[offset:offset + option_length]
+
+        offset += option_length
+
+    return options
+
+
+class ScannedRelay:
+    """
+    The interesting parts of a relay message, with addresses in packed form and options as raw payloads
+    """
+
+    __slots__ = ('link_address', 'peer_address', 'options')
+
+    def __init__(self, link_address: bytes, peer_address: bytes, options: Dict[int, bytes]):
+        self.link_address = link_address
+        self.peer_address = peer_address
+        self.options = options
+
+
+class ScannedPacket:
+    """
+    The interesting parts of an incoming packet. The relays are ordered like the incoming relay messages of a
+    transaction bundle: the relay closest to the client first, and the pseudo-relay for the listener last.
+    """
+
+    __slots__ = ('message_type', 'options', 'relays', 'received_over_tcp')
+
+    def __init__(self, message_type: int, options: Dict[int, bytes], relays: List[ScannedRelay],
+                 received_over_tcp: bool = False):
+        self.message_type = message_type
+        self.options = options
+        self.relays = relays
+        self.received_over_tcp = received_over_tcp
+
+    @property
+    def client_duid(self) -> Optional[bytes]:
+        """
+        The raw DUID from the client-id option, if any
+        """
+        return self.options.get(OPTION_CLIENTID)
+
+    @property
+    def server_duid(self) -> Optional[bytes]:
+        """
+        The raw DUID from the server-id option, if any
+        """
+        return self.options.get(OPTION_SERVERID)
+
+    @property
+    def relay_link_addresses(self) -> List[bytes]:
+        """
+        The link addresses of all the relays that are not unspecified, like :attr:`TransactionBundle.relays`
+        """
+        return [relay.link_address for relay in self.relays if any(relay.link_address)]
+
+    @property
+    def link_address(self) -> bytes:
+        """
+        The link address that identifies where this request is coming from, like
+        :attr:`TransactionBundle.link_address`
+        """
+        # Use remote TCP endpoint
+        if self.received_over_tcp:
+            return self.relays[-1].peer_address
+
+        for relay in self.relays:
+            address = IPv6Address(relay.link_address)
+            if not address.is_unspecified and not address.is_loopback and not address.is_link_local:
+                return relay.link_address
+
+        return bytes(16)
+
+
+def scan_packet(packet: IncomingPacketBundle) -> Optional[ScannedPacket]:
+    """
+    Scan an incoming packet and extract the interesting parts
+
+    :param packet: The incoming packet
+    :return: The scanned packet, or None if the packet is malformed
+    """
+    relays = []
+    data = packet.data
+
+    try:
+        while data and data[0] == MSG_RELAY_FORW:
+            if len(data) < 34 or len(relays) >= MAX_RELAY_DEPTH:
+                return None
+
+            options = scan_options(data, 34)
+            relays.insert(0, ScannedRelay(data[2:18], data[18:34], options))
+
+            data = options.get(OPTION_RELAY_MSG)
+
+        if not data or len(data) < 4:
+            return None
+
+        options = scan_options(data, 4)
+    except ValueError:
+        return None
+
+    # Add the listener as a relay, like the worker does
+    relay_options = {}
+    for option in packet.relay_options:
+        relay_options.setdefault(option.option_type, option.save()[4:])
+
+    source_address = packet.source_address.packed if packet.source_address else bytes(16)
+    relays.append(ScannedRelay(packet.link_address.packed, source_address, relay_options))
+
+    return ScannedPacket(data[0], options, relays, packet.received_over_tcp)
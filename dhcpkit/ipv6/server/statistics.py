@@ -1,17 +1,130 @@
 """
 Statistics about the server in shared memory
 """
+import logging
+import os
 from collections import OrderedDict
-from ctypes import c_uint64
-from multiprocessing import Value
-from multiprocessing.sharedctypes import Synchronized
+from ctypes import c_int64, c_uint64
+from multiprocessing import Lock
+from multiprocessing.sharedctypes import RawArray
 
 from dhcpkit.ipv6.message_registry import message_registry
 from dhcpkit.ipv6.messages import ClientServerMessage
+from dhcpkit.ipv6.options import ClientIdOption
+from dhcpkit.ipv6.server.handlers import merge_statistics
 from dhcpkit.ipv6.server.transaction_bundle import TransactionBundle
 from dhcpkit.utils import camelcase_to_underscore
 from typing import Dict, Hashable, Iterable, List
 
+logger = logging.getLogger(__name__)
+
+current_slot = 0
+"""The slot in shared counters that this process writes to. The master process always uses slot 0."""
+
+slot_count = 1
+"""The number of slots to allocate in new shared counters, one for the master and one for each worker"""
+
+DEFAULT_TOP_N = 10
+"""The number of heavy hitters to report when there is no statistics configuration"""
+
+DEFAULT_TOP_N_HALF_LIFE = 60.0
+"""The half-life of the heavy hitter counts when there is no statistics configuration"""
+
+# The simple counters that every Statistics object keeps
+COUNTER_NAMES = [
+    'incoming_packets',
+    'outgoing_packets',
+    'unparsable_packets',
+    'handling_errors',
+    'for_other_server',
+    'do_not_respond',
+    'use_multicast',
+    'unknown_query_type',
+    'malformed_query',
+    'not_allowed',
+    'other_error',
+    'dropped_packets',
+]
+
+
+def process_exists(pid: int) -> bool:
+    """
+    Check whether a process with the given PID still exists
+
+    :param pid: The PID of the process
+    :return: Whether it exists
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # It exists, but it's not ours
+        return True
+
+    return True
+
+
+class SharedCounters:
+    """
+    A set of counters in shared memory. Every process has its own slot in which it is the only writer, so updating a
+    counter doesn't need any locking. Reading a counter adds up the values of all the slots.
+
+    :type names: List[str]
+    :type stride: int
+    :type slots: int
+    """
+
+    def __init__(self, names: Iterable[str], slots: int = None):
+        """
+        Allocate the counters in shared memory
+
+        :param names: The names of the counters
+        :param slots: The number of slots to allocate, defaults to one for each process
+        """
+        self.names = list(names)
+
+        # Round the slot size up to a multiple of 64 bytes so different processes don't write to the same cache line
+        self.stride = max(8, (len(self.names) + 7) // 8 * 8)
+        self.slots = slots or slot_count
+        self.counters = RawArray(c_uint64, self.slots * self.stride)
+
+    def increment(self, index: int, amount: int = 1):
+        """
+        Increment a counter in the slot of this process
+
+        :param index: The index of the counter
+        :param amount: How much to add to the counter
+        """
+        # The modulo is just a safety net for objects that survived a change in the number of workers
+        self.counters[(current_slot % self.slots) * self.stride + index] += amount
+
+    def totals(self) -> List[int]:
+        """
+        Add up the values from all the slots
+
+        :return: The totals in the same order as the names
+        """
+        values = self.counters[:]
+        return [sum(values[index::self.stride]) for index in range(len(self.names))]
+
+    def resize(self, slots: int):
+        """
+        Change the number of slots. This may only be done while no worker processes are running. The current totals are
+        preserved.
+
+        :param slots: The new number of slots
+        """
+        if slots == self.slots:
+            return
+
+        totals = self.totals()
+
+        self.slots = slots
+        self.counters = RawArray(c_uint64, self.slots * self.stride)
+        for index, total in enumerate(totals):
+            self.counters[index] = total
+
 
 def create_update_method(counter_name):
     """
@@ -20,14 +133,13 @@ def create_update_method(counter_name):
     :param counter_name: The name of the counter to update
     :return: The generated method
     """
+    counter_index = COUNTER_NAMES.index(counter_name)
 
     def count_method(self):
         """
         Call the counting method on all statistics objects
         """
-        counter = getattr(self, counter_name)
-        with counter.get_lock():
-            counter.value += 1
+        self.counters.increment(counter_index)
 
     return count_method
 
@@ -44,11 +156,9 @@ def create_update_dict_method(counter_name):
         """
         Update the counter for the given key
         """
-        counter_dict = getattr(self, counter_name)
-        if key in counter_dict:
-            counter = counter_dict[key]
-            with counter.get_lock():
-                counter.value += 1
+        counter_index = getattr(self, counter_name).get(key)
+        if counter_index is not None:
+            self.counters.increment(counter_index)
 
     return count_method
 
@@ -95,43 +205,15 @@ class Statistics:
     """
     A set of statistics about DHCPv6
 
-    :type incoming_packets: Synchronized
-    :type outgoing_packets: Synchronized
-
-    :type unparsable_packets: Synchronized
-    :type handling_errors: Synchronized
-
-    :type for_other_server: Synchronized
-    :type do_not_respond: Synchronized
-    :type use_multicast: Synchronized
-    :type unknown_query_type: Synchronized
-    :type malformed_query: Synchronized
-    :type not_allowed: Synchronized
-    :type other_error: Synchronized
-
-    :type messages_in: Dict[int, Synchronized]
-    :type messages_out: Dict[int, Synchronized]
+    :type counters: SharedCounters
+    :type messages_in: Dict[int, int]
+    :type messages_out: Dict[int, int]
     """
 
     def __init__(self):
-        # Packet counts
-        self.incoming_packets = Value(c_uint64)
-        self.outgoing_packets = Value(c_uint64)
-
-        # Errors
-        self.unparsable_packets = Value(c_uint64)
-        self.handling_errors = Value(c_uint64)
-
-        # Special replies
-        self.for_other_server = Value(c_uint64)
-        self.do_not_respond = Value(c_uint64)
-        self.use_multicast = Value(c_uint64)
-        self.unknown_query_type = Value(c_uint64)
-        self.malformed_query = Value(c_uint64)
-        self.not_allowed = Value(c_uint64)
-        self.other_error = Value(c_uint64)
-
-        # Counters per message type
+        counter_names = list(COUNTER_NAMES)
+
+        # Index of the counter per message type
         self.messages_in = OrderedDict()
         self.messages_out = OrderedDict()
 
@@ -142,43 +224,50 @@ class Statistics:
         for key in message_registry_keys:
             message_class = message_registry[key]
             if message_class.from_client_to_server and issubclass(message_class, ClientServerMessage):
-                self.messages_in[message_class.message_type] = Value(c_uint64)
+                self.messages_in[message_class.message_type] = len(counter_names)
+                counter_names.append('messages_in_{}'.format(message_class.message_type))
 
             if message_class.from_server_to_client and issubclass(message_class, ClientServerMessage):
-                self.messages_out[message_class.message_type] = Value(c_uint64)
+                self.messages_out[message_class.message_type] = len(counter_names)
+                counter_names.append('messages_out_{}'.format(message_class.message_type))
+
+        self.counters = SharedCounters(counter_names)
 
     def __str__(self):
+        totals = self.counters.totals()
         lines = [
             "Packets",
-            "- Incoming packets: {}".format(self.incoming_packets.value),
-            "- Outgoing packets: {}".format(self.outgoing_packets.value),
+            "- Incoming packets: {}".format(totals[0]),
+            "- Outgoing packets: {}".format(totals[1]),
             "Errors",
-            "- Unparsable packets: {}".format(self.unparsable_packets.value),
-            "- Handling errors: {}".format(self.handling_errors.value),
+            "- Unparsable packets: {}".format(totals[2]),
+            "- Handling errors: {}".format(totals[3]),
             "Special replies",
-            "- For other server: {}".format(self.for_other_server.value),
-            "- Do not respond: {}".format(self.do_not_respond.value),
-            "- Use multicast: {}".format(self.use_multicast.value),
-            "- Unknown query type: {}".format(self.unknown_query_type.value),
-            "- Malformed query: {}".format(self.malformed_query.value),
-            "- Not allowed: {}".format(self.not_allowed.value),
-            "- Other error: {}".format(self.other_error.value),
+            "- For other server: {}".format(totals[4]),
+            "- Do not respond: {}".format(totals[5]),
+            "- Use multicast: {}".format(totals[6]),
+            "- Unknown query type: {}".format(totals[7]),
+            "- Malformed query: {}".format(totals[8]),
+            "- Not allowed: {}".format(totals[9]),
+            "- Other error: {}".format(totals[10]),
+            "Dropped before dispatching",
+            "- Dropped packets: {}".format(totals[11]),
             "Incoming messages",
         ]
 
-        for message_type, counter in self.messages_in.items():
+        for message_type, counter_index in self.messages_in.items():
             message_type_name = message_registry[message_type].__name__
             if message_type_name.endswith('Message'):
                 message_type_name = message_type_name[:-7]
-            lines += ['- {}: {}'.format(message_type_name, counter.value)]
+            lines += ['- {}: {}'.format(message_type_name, totals[counter_index])]
 
         lines += ['Outgoing messages']
 
-        for message_type, counter in self.messages_out.items():
+        for message_type, counter_index in self.messages_out.items():
             message_type_name = message_registry[message_type].__name__
             if message_type_name.endswith('Message'):
                 message_type_name = message_type_name[:-7]
-            lines += ['- {}: {}'.format(message_type_name, counter.value)]
+            lines += ['- {}: {}'.format(message_type_name, totals[counter_index])]
 
         return '\n'.join(lines)
 
@@ -188,34 +277,27 @@ class Statistics:
 
         :return: The counters in a processable format
         """
+        totals = self.counters.totals()
+
         out = OrderedDict()
-        out['incoming_packets'] = self.incoming_packets.value
-        out['outgoing_packets'] = self.outgoing_packets.value
-        out['unparsable_packets'] = self.unparsable_packets.value
-        out['handling_errors'] = self.handling_errors.value
-        out['for_other_server'] = self.for_other_server.value
-        out['do_not_respond'] = self.do_not_respond.value
-        out['use_multicast'] = self.use_multicast.value
-        out['unknown_query_type'] = self.unknown_query_type.value
-        out['malformed_query'] = self.malformed_query.value
-        out['not_allowed'] = self.not_allowed.value
-        out['other_error'] = self.other_error.value
+        for counter_index, counter_name in enumerate(COUNTER_NAMES):
+            out[counter_name] = totals[counter_index]
 
         out['messages_in'] = OrderedDict()
-        for message_type, counter in self.messages_in.items():
+        for message_type, counter_index in self.messages_in.items():
             message_type_name = message_registry[message_type].__name__
             message_type_name = camelcase_to_underscore(message_type_name)
             if message_type_name.endswith('_message'):
                 message_type_name = message_type_name[:-8]
-            out['messages_in'][message_type_name] = counter.value
+            out['messages_in'][message_type_name] = totals[counter_index]
 
         out['messages_out'] = OrderedDict()
-        for message_type, counter in self.messages_out.items():
+        for message_type, counter_index in self.messages_out.items():
             message_type_name = message_registry[message_type].__name__
             message_type_name = camelcase_to_underscore(message_type_name)
             if message_type_name.endswith('_message'):
                 message_type_name = message_type_name[:-8]
-            out['messages_out'][message_type_name] = counter.value
+            out['messages_out'][message_type_name] = totals[counter_index]
 
         return out
 
@@ -230,6 +312,7 @@ class Statistics:
     count_malformed_query = create_update_method('malformed_query')
     count_not_allowed = create_update_method('not_allowed')
     count_other_error = create_update_method('other_error')
+    count_dropped_packet = create_update_method('dropped_packets')
     count_message_in = create_update_dict_method('messages_in')
     count_message_out = create_update_dict_method('messages_out')
 
@@ -253,6 +336,7 @@ class StatisticsSet:
     count_malformed_query = create_count_method('count_malformed_query')
     count_not_allowed = create_count_method('count_not_allowed')
     count_other_error = create_count_method('count_other_error')
+    count_dropped_packet = create_count_method('count_dropped_packet')
     count_message_in = create_count_dict_method('count_message_in')
     count_message_out = create_count_dict_method('count_message_out')
 
@@ -265,6 +349,12 @@ class ServerStatistics:
     :type interface_stats: Dict[str, Statistics]
     :type subnet_stats: Dict[IPv6Network, Statistics]
     :type relay_stats: Dict[IPv6Address, Statistics]
+    :type heavy_hitters: HeavyHittersSet
+    :type message_handler: MessageHandler
+    :type dispatch_filters: List[DispatchFilter]
+    :type listeners: List[Listener]
+    :type slot_owners: Array
+    :type slot_lock: Lock
     """
 
     def __init__(self):
@@ -275,12 +365,102 @@ class ServerStatistics:
         self.subnet_stats = {}
         self.relay_stats = {}
 
+        # Automatic tracking of the busiest relays, links and clients
+        self.heavy_hitters = None
+
+        # The message handler that can provide statistics of its handlers
+        self.message_handler = None
+        self.dispatch_filters = []
+
+        # The listeners of the main process, not sent to the worker processes
+        self.listeners = []
+
+        # Which process owns which slot in the shared counters
+        self.slot_owners = RawArray(c_int64, slot_count)
+        self.slot_lock = Lock()
+
+    def __getstate__(self):
+        # Listeners contain sockets and locks that stay in the main process
+        state = self.__dict__.copy()
+        state['listeners'] = []
+        return state
+
+    def all_statistics(self) -> Iterable[Statistics]:
+        """
+        Iterate over all the statistics objects that we keep
+
+        :return: All statistics objects
+        """
+        yield self.global_stats
+        yield from self.interface_stats.values()
+        yield from self.subnet_stats.values()
+        yield from self.relay_stats.values()
+
+    def set_worker_count(self, workers: int):
+        """
+        Make sure there is a slot in the shared counters for the master process and for each worker. This must be called
+        while no worker processes are running.
+
+        :param workers: The number of worker processes
+        """
+        global slot_count, current_slot
+
+        slot_count = workers + 1
+
+        with self.slot_lock:
+            self.slot_owners = RawArray(c_int64, slot_count)
+
+            # The master process always uses the first slot
+            self.slot_owners[0] = os.getpid()
+            current_slot = 0
+
+        for stats in self.all_statistics():
+            stats.counters.resize(slot_count)
+
+    def claim_slot(self):
+        """
+        Claim a slot in the shared counters for the current worker process. A slot that was owned by a process that
+        doesn't exist anymore is re-used.
+        """
+        global current_slot
+
+        pid = os.getpid()
+        with self.slot_lock:
+            free_slot = None
+            for slot in range(1, len(self.slot_owners)):
+                owner = self.slot_owners[slot]
+                if owner == pid:
+                    # We already own this one
+                    current_slot = slot
+                    return
+
+                if free_slot is None and (owner == 0 or not process_exists(owner)):
+                    free_slot = slot
+
+            if free_slot is None:
+                # This shouldn't happen, but sharing a slot is better than not counting at all
+                logger.warning("No free statistics slot available for worker {}, "
+                               "counters may be inaccurate".format(pid))
+                free_slot = len(self.slot_owners) - 1
+
+            self.slot_owners[free_slot] = pid
+            current_slot = free_slot
+
     def set_categories(self, category_settings):
         """
         Create space for the given interfaces
 
         :param category_settings: Configuration setting for categories
         """
+        if category_settings:
+            top_n = category_settings.top_n
+            half_life = category_settings.top_n_half_life
+        else:
+            top_n = DEFAULT_TOP_N
+            half_life = DEFAULT_TOP_N_HALF_LIFE
+
+        self.set_heavy_hitters(top_n, half_life)
+
         if not category_settings:
             return
 
@@ -310,6 +490,52 @@ class ServerStatistics:
         update_categories(self.subnet_stats, category_settings.subnets)
         update_categories(self.relay_stats, category_settings.relays)
 
+    def set_heavy_hitters(self, top_n: int, half_life: float):
+        """
+        Create the heavy hitter trackers, re-using the existing ones if nothing changed
+
+        :param top_n: The number of heavy hitters to report, 0 disables tracking
+        :param half_life: The half-life of the counts in seconds
+        """
+        # Imported here to avoid a circular import
+        from dhcpkit.ipv6.server.heavy_hitters import HeavyHittersSet
+
+        if not top_n:
+            self.heavy_hitters = None
+            return
+
+        current = self.heavy_hitters
+        if current and current.top_n == top_n and current.half_life == half_life \
+                and all(tracker.slots == slot_count for tracker in current.trackers.values()):
+            return
+
+        self.heavy_hitters = HeavyHittersSet(top_n, half_life)
+
+    def track_heavy_hitters(self, interface_name: str = None, bundle: TransactionBundle = None):
+        """
+        Count the request in the heavy hitter trackers
+
+        :param interface_name: The name of the interface that we received the packet on
+        :param bundle: The transaction bundle of the request
+        """
+        if not self.heavy_hitters:
+            return
+
+        relays = []
+        link_address = None
+        client_duid = None
+        if bundle and bundle.request:
+            relays = [relay.packed for relay in bundle.relays]
+            if bundle.incoming_relay_messages:
+                link_address = bundle.link_address.packed
+
+            client_id = bundle.request.get_option_of_type(ClientIdOption)
+            if client_id:
+                client_duid = client_id.duid.save()
+
+        self.heavy_hitters.count(interface_name=interface_name, relays=relays, link_address=link_address,
+                                 client_duid=client_duid)
+
     def get_update_set(self, interface_name: str = None, bundle: TransactionBundle = None) -> StatisticsSet:
         """
         Return all statistics objects that need to be updated.
@@ -365,6 +591,19 @@ class ServerStatistics:
         lines += get_category_lines('Subnet', self.subnet_stats)
         lines += get_category_lines('Relay', self.relay_stats)
 
+        for name, data in merge_statistics(self.listeners).items():
+            lines += ['', 'Listener {}'.format(name)]
+            lines += ['- {}: {}'.format(key.replace('_', ' ').capitalize(), value) for key, value in data.items()]
+
+        for name, data in merge_statistics(self.dispatch_filters).items():
+            lines += ['', 'Dispatch filter {}'.format(name)]
+            lines += ['- {}: {}'.format(key.replace('_', ' ').capitalize(), value) for key, value in data.items()]
+
+        if self.message_handler:
+            for name, data in self.message_handler.export_statistics().items():
+                lines += ['', 'Handler {}'.format(name)]
+                lines += ['- {}: {}'.format(key.replace('_', ' ').capitalize(), value) for key, value in data.items()]
+
         return '\n'.join(lines)
 
     def export(self) -> Dict[str, int]:
@@ -397,4 +636,20 @@ class ServerStatistics:
         out['subnets'] = get_category_data(self.subnet_stats)
         out['relays'] = get_category_data(self.relay_stats)
 
+        if self.heavy_hitters:
+            out['top'] = self.heavy_hitters.export()
+
+        listener_stats = merge_statistics(self.listeners)
+        if listener_stats:
+            out['listeners'] = listener_stats
+
+        dispatch_filter_stats = merge_statistics(self.dispatch_filters)
+        if dispatch_filter_stats:
+            out['dispatch_filters'] = dispatch_filter_stats
+
+        if self.message_handler:
+            handler_stats = self.message_handler.export_statistics()
+            if handler_stats:
+                out['handlers'] = handler_stats
+
         return out
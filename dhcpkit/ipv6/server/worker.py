@@ -14,9 +14,9 @@ from dhcpkit.ipv6.options import InterfaceIdOption, Option, RelayMessageOption
 from dhcpkit.ipv6.server.listeners import IncomingPacketBundle, Replier
 from dhcpkit.ipv6.server.message_handler import MessageHandler
 from dhcpkit.ipv6.server.queue_logger import WorkerQueueHandler
-from dhcpkit.ipv6.server.statistics import ServerStatistics
+from dhcpkit.ipv6.server.statistics import ServerStatistics, StatisticsSet
 from dhcpkit.ipv6.server.transaction_bundle import TransactionBundle
-from typing import Iterable
+from typing import Any, Iterable, Iterator, List, Tuple
 
 logger = None
 """:type: logging.Logger"""
@@ -70,6 +70,7 @@ def setup_worker(message_handler: MessageHandler, logging_queue: Queue, lowest_l
 
         global shared_statistics
         shared_statistics = statistics
+        shared_statistics.claim_slot()
 
         # Run the per-process startup code for the message handler and its children
         message_handler.worker_init()
@@ -138,6 +139,40 @@ def verify_response(outgoing_message: Message):
         raise ValueError("The RelayReplyMessage does not contain a message")
 
 
+class VerifiedResponses:
+    """
+    Verify and count the outgoing messages before each one is handed to the replier. When a message is invalid the
+    iteration stops, so the replier still sends the messages before it, and the error is kept so the caller can handle
+    it after the replier is done.
+
+    :type outgoing_messages: Iterable[RelayReplyMessage]
+    :type statistics: StatisticsSet
+    :type error: Optional[ValueError]
+    """
+
+    def __init__(self, outgoing_messages: Iterable[RelayReplyMessage], statistics: StatisticsSet):
+        """
+        Prepare the verification.
+
+        :param outgoing_messages: The outgoing messages, usually from :attr:`TransactionBundle.outgoing_messages`
+        :param statistics: The statistics to update
+        """
+        self.outgoing_messages = outgoing_messages
+        self.statistics = statistics
+        self.error = None
+
+    def __iter__(self) -> Iterator[RelayReplyMessage]:
+        for outgoing_message in self.outgoing_messages:
+            try:
+                verify_response(outgoing_message)
+            except ValueError as e:
+                self.error = e
+                return
+
+            self.statistics.count_outgoing_packet()
+            yield outgoing_message
+
+
 def get_interface_name_from_options(options: Iterable[Option]):
     """
     Get the interface name from the given options and decode it as unicode
@@ -190,18 +225,21 @@ def handle_message(incoming_packet: IncomingPacketBundle, replier: Replier):
         # Now we know more: update all statistics and count the packet on all
         statistics = shared_statistics.get_update_set(interface_name=interface_name, bundle=bundle)
         statistics.count_incoming_packet()
+        shared_statistics.track_heavy_hitters(interface_name=interface_name, bundle=bundle)
 
         try:
             current_message_handler.handle(bundle, statistics)
 
-            for outgoing_message in bundle.outgoing_messages:
-                verify_response(outgoing_message)
-                statistics.count_outgoing_packet()
+            # Let the replier send all the replies at once, multiple replies can be sent more efficiently
+            outgoing_messages = VerifiedResponses(bundle.outgoing_messages, statistics)
+            try:
+                replier.send_replies(outgoing_messages)
+            except ValueError as e:
+                logger.error("Handler returned invalid message: {}".format(e))
 
-                try:
-                    replier.send_reply(outgoing_message)
-                except ValueError as e:
-                    logger.error("Handler returned invalid message: {}".format(e))
+            if outgoing_messages.error:
+                # An invalid reply is an error of the handler
+                raise outgoing_messages.error
 
         except Exception as e:
             logger.exception("Error while handling request: {}".format(e))
@@ -210,3 +248,21 @@ def handle_message(incoming_packet: IncomingPacketBundle, replier: Replier):
     finally:
         # Always reset the log_id when leaving
         logging_handler.log_id = None
+
+
+def handle_messages(incoming_packets: List[Tuple[IncomingPacketBundle, Replier]]) -> List[Any]:
+    """
+    Handle a batch of incoming requests. Sending requests to the workers in batches reduces the overhead of the
+    inter-process communication when the server is busy.
+
+    :param incoming_packets: The raw incoming requests and the objects that will send replies for us
+    :return: The result of the replier of each request, to be passed back to the listeners
+    """
+    for incoming_packet, replier in incoming_packets:
+        try:
+            handle_message(incoming_packet, replier)
+        except Exception as e:
+            # Don't let one message prevent handling of the rest of the batch
+            logger.exception("Unexpected exception while handling request {}: {}".format(incoming_packet.message_id, e))
+
+    return [replier.get_result() for incoming_packet, replier in incoming_packets]
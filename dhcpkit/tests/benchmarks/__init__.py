@@ -0,0 +1,3 @@
+"""
+Performance benchmarks. They are not run as part of the normal test suite, see :mod:`dhcpkit.tests.benchmarks.codec`.
+"""
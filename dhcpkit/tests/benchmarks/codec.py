@@ -0,0 +1,403 @@
+"""
+Microbenchmarks for parsing, validating and saving DHCPv6 messages.
+
+The benchmarks use the messages from the test suite, the DHCPv6 messages in the captures in the ``pcaps`` directory
+of the source tree and synthetic worst cases. Timings are divided by the timing of a fixed pure-Python workload so
+that the results can be compared between machines. The results are compared to the baseline stored next to this
+module, and the benchmark fails when an operation got slower than the threshold allows.
+
+Run the benchmarks with ``python -m dhcpkit.tests.benchmarks.codec`` and store new baselines with
+``python -m dhcpkit.tests.benchmarks.codec --save-baseline`` after a deliberate change in performance.
+"""
+import argparse
+import fnmatch
+import glob
+import json
+import os
+import sys
+import statistics
+import timeit
+from collections import OrderedDict
+from ipaddress import IPv4Network, IPv6Address, IPv6Network
+from struct import pack, unpack_from
+
+from dhcpkit.common.pcap import read_udp_datagrams
+from dhcpkit.ipv6 import CLIENT_PORT, SERVER_PORT
+from dhcpkit.ipv6.duids import LinkLayerDUID
+from dhcpkit.ipv6.extensions.dns import DomainSearchListOption, RecursiveNameServersOption
+from dhcpkit.ipv6.extensions.map import S46BROption, S46DMROption, S46LWContainerOption, S46MapEContainerOption, \
+    S46MapTContainerOption, S46PortParametersOption, S46RuleOption, S46V4V6BindingOption
+from dhcpkit.ipv6.extensions.prefix_delegation import IAPDOption, IAPrefixOption
+from dhcpkit.ipv6.messages import Message, RelayForwardMessage, ReplyMessage
+from dhcpkit.ipv6.options import ClientIdOption, IAAddressOption, IANAOption, InterfaceIdOption, Option, \
+    RelayMessageOption, ServerIdOption
+from dhcpkit.tests.ipv6.messages.test_advertise_message import advertise_message
+from dhcpkit.tests.ipv6.messages.test_relay_forward_message import relayed_solicit_message
+from dhcpkit.tests.ipv6.messages.test_relay_reply_message import relayed_advertise_message
+from dhcpkit.tests.ipv6.messages.test_reply_message import reply_message
+from dhcpkit.tests.ipv6.messages.test_request_message import request_message
+from dhcpkit.tests.ipv6.messages.test_solicit_message import solicit_message
+from typing import Callable, Dict, List, Tuple
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+PCAP_DIR = os.path.join(os.path.dirname(__file__), '..', '..', '..', 'pcaps')
+
+# The default relative slowdown that counts as a regression
+DEFAULT_THRESHOLD = 0.25
+
+# The minimum time to spend on one measurement
+MIN_MEASURE_TIME = 0.05
+
+# The number of measurements per benchmark
+DEFAULT_REPEAT = 7
+
+
+def identification_options() -> List[Option]:
+    """
+    The client and server identifiers that every reply must contain
+
+    :return: The options
+    """
+    return [
+        ClientIdOption(duid=LinkLayerDUID(hardware_type=1, link_layer_address=bytes.fromhex('3431c43cb2f1'))),
+        ServerIdOption(duid=LinkLayerDUID(hardware_type=1, link_layer_address=bytes.fromhex('00137265ca42'))),
+    ]
+
+
+def max_options_message() -> Message:
+    """
+    A reply with as many different options as possible, and many of them
+
+    :return: The message
+    """
+    options = identification_options()
+
+    for number in range(64):
+        options.append(IANAOption(iaid=pack('!I', number), t1=3600, t2=5400, options=[
+            IAAddressOption(address=IPv6Address('2001:db8:1::') + (number << 16) + address,
+                            preferred_lifetime=7200, valid_lifetime=14400)
+            for address in range(4)
+        ]))
+        options.append(IAPDOption(iaid=pack('!I', number), t1=3600, t2=5400, options=[
+            IAPrefixOption(prefix=IPv6Network('2001:db8:{:x}:{:x}00::/56'.format(0x100 + number, prefix)),
+                           preferred_lifetime=7200, valid_lifetime=14400)
+            for prefix in range(4)
+        ]))
+
+    options.append(RecursiveNameServersOption(dns_servers=[IPv6Address('2001:db8::53') + number
+                                                           for number in range(32)]))
+    options.append(DomainSearchListOption(search_list=['subdomain-{}.example.com'.format(number)
+                                                       for number in range(32)]))
+
+    return ReplyMessage(transaction_id=b'max', options=options)
+
+
+def deep_relay_message(depth: int = 32) -> Message:
+    """
+    A solicit message that passed through a long chain of relays
+
+    :param depth: The number of relays
+    :return: The message
+    """
+    message = solicit_message
+    for hop_count in range(depth):
+        message = RelayForwardMessage(
+            hop_count=hop_count,
+            link_address=IPv6Address('2001:db8:ffff::') + hop_count,
+            peer_address=IPv6Address('fe80::1') + hop_count,
+            options=[
+                InterfaceIdOption(interface_id='Fa2/{}'.format(hop_count).encode('ascii')),
+                RelayMessageOption(relayed_message=message),
+            ]
+        )
+    return message
+
+
+def large_map_message(rule_count: int = 256) -> Message:
+    """
+    A reply containing MAP-E, MAP-T and lightweight 4over6 configuration with many mapping rules
+
+    :param rule_count: The number of rules in each MAP container
+    :return: The message
+    """
+    rules = [S46RuleOption(flags=int(number == 0), ea_len=16,
+                           ipv4_prefix=IPv4Network('10.{}.{}.0/24'.format(number // 256, number % 256)),
+                           ipv6_prefix=IPv6Network('2001:db8:{:x}::/48'.format(number)),
+                           options=[S46PortParametersOption(offset=6, psid_len=8, psid=number % 256)])
+             for number in range(rule_count)]
+
+    return ReplyMessage(transaction_id=b'map', options=identification_options() + [
+        S46MapEContainerOption(options=rules + [S46BROption(br_address=IPv6Address('2001:db8::1'))]),
+        S46MapTContainerOption(options=rules + [S46DMROption(dmr_prefix=IPv6Network('2001:db8:ffff::/64'))]),
+        S46LWContainerOption(options=[
+            S46V4V6BindingOption(ipv4_address=IPv4Network('192.0.2.0/24')[1],
+                                 ipv6_prefix=IPv6Network('2001:db8:1234::/48'),
+                                 options=[S46PortParametersOption(offset=6, psid_len=8, psid=1)]),
+            S46BROption(br_address=IPv6Address('2001:db8::1')),
+        ]),
+    ])
+
+
+def read_pcap_packets(pcap_dir: str = PCAP_DIR) -> Dict[str, List[bytes]]:
+    """
+    Read the DHCPv6 messages from the captures in the given directory. Identical messages are only included once, and
+    messages that are not valid are skipped because they can't be benchmarked completely.
+
+    :param pcap_dir: The directory containing the captures
+    :return: The messages per capture file
+    """
+    pcap_packets = OrderedDict()
+    for filename in sorted(glob.glob(os.path.join(pcap_dir, '*.pcap*'))):
+        packets = []
+        for datagram in read_udp_datagrams(filename):
+            if datagram.destination_port not in (CLIENT_PORT, SERVER_PORT) or datagram.payload in packets:
+                continue
+
+            try:
+                length, message = Message.parse(datagram.payload)
+                message.validate()
+            except ValueError:
+                continue
+
+            packets.append(datagram.payload)
+
+        if packets:
+            pcap_packets['pcap:' + os.path.basename(filename)] = packets
+
+    return pcap_packets
+
+
+def get_cases(pcap_dir: str = PCAP_DIR) -> Dict[str, List[bytes]]:
+    """
+    Collect the packets to benchmark. Each case is a list of packets that are handled together in one measurement.
+
+    :param pcap_dir: The directory containing the captures, which are skipped if it doesn't exist
+    :return: The packets per case
+    """
+    cases = OrderedDict([
+        ('solicit', [bytes(solicit_message.save())]),
+        ('advertise', [bytes(advertise_message.save())]),
+        ('request', [bytes(request_message.save())]),
+        ('reply', [bytes(reply_message.save())]),
+        ('relayed-solicit', [bytes(relayed_solicit_message.save())]),
+        ('relayed-advertise', [bytes(relayed_advertise_message.save())]),
+        ('max-options', [bytes(max_options_message().save())]),
+        ('deep-relay', [bytes(deep_relay_message().save())]),
+        ('large-map', [bytes(large_map_message().save())]),
+    ])
+    cases.update(read_pcap_packets(pcap_dir))
+    return cases
+
+
+def parse_packets(packets: List[bytes]) -> List[Message]:
+    """
+    Parse every packet, like the server does with incoming packets.
+
+    :param packets: The packets to parse
+    :return: The parsed messages
+    """
+    messages = []
+    for packet in packets:
+        length, message = Message.parse(packet)
+        messages.append(message)
+    return messages
+
+
+def calibration_workload():
+    """
+    A fixed workload that exercises the same interpreter features as the codec: function calls, object creation,
+    struct unpacking and list and bytes manipulation. Benchmark timings are expressed relative to this workload.
+    """
+    data = bytes(range(256)) * 4
+    result = []
+    offset = 0
+    while offset < len(data):
+        option_type, option_len = unpack_from('!HH', data, offset)
+        result.append(pack('!HH', option_len, option_type) + data[offset + 4:offset + 8])
+        offset += 8
+    return b''.join(result)
+
+
+def autorange(timer: timeit.Timer) -> int:
+    """
+    Determine how many times a function must be called to make its timing reliable.
+
+    :param timer: The timer for the function
+    :return: The number of calls per measurement
+    """
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= MIN_MEASURE_TIME:
+            return number
+        number *= 10 if elapsed < MIN_MEASURE_TIME / 10 else 2
+
+
+def measure(function: Callable, repeat: int = DEFAULT_REPEAT) -> float:
+    """
+    Measure how long a function takes relative to the calibration workload. Both are measured alternately so that
+    changes in the speed of the machine affect both in the same way, and the median of the ratios is used to ignore
+    measurements disturbed by other activity on the machine.
+
+    :param function: The function to measure
+    :param repeat: The number of measurements
+    :return: The time per call relative to the calibration workload
+    """
+    timer = timeit.Timer(function)
+    calibration_timer = timeit.Timer(calibration_workload)
+    number = autorange(timer)
+    calibration_number = autorange(calibration_timer)
+
+    ratios = []
+    for _ in range(repeat):
+        calibration_timing = calibration_timer.timeit(calibration_number) / calibration_number
+        timing = timer.timeit(number) / number
+        ratios.append(timing / calibration_timing)
+
+    return statistics.median(ratios)
+
+
+def run_benchmarks(cases: Dict[str, List[bytes]], pattern: str = '*', repeat: int = DEFAULT_REPEAT) -> Dict[str, float]:
+    """
+    Run the benchmarks.
+
+    :param cases: The packets per case, as returned by :func:`get_cases`
+    :param pattern: Only run benchmarks whose name matches this pattern
+    :param repeat: The number of measurements per benchmark
+    :return: The timing of each benchmark relative to the calibration workload
+    """
+    results = OrderedDict()
+    for case_name, packets in cases.items():
+        messages = parse_packets(packets)
+        operations = OrderedDict([
+            ('parse', lambda: parse_packets(packets)),
+            ('validate', lambda: [message.validate() for message in messages]),
+            ('save', lambda: [message.save() for message in messages]),
+        ])
+
+        for operation, function in operations.items():
+            name = '{}/{}'.format(case_name, operation)
+            if fnmatch.fnmatchcase(name, pattern):
+                results[name] = measure(function, repeat)
+
+    return results
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float],
+            threshold: float = DEFAULT_THRESHOLD) -> List[Tuple[str, float]]:
+    """
+    Compare the results with the baseline. Benchmarks without a baseline are ignored.
+
+    :param results: The results from :func:`run_benchmarks`
+    :param baseline: The stored results
+    :param threshold: The relative slowdown that counts as a regression
+    :return: The names of the regressed benchmarks and their relative change
+    """
+    regressions = []
+    for name, result in results.items():
+        if name in baseline and result > baseline[name] * (1 + threshold):
+            regressions.append((name, result / baseline[name] - 1))
+    return regressions
+
+
+def load_baseline(filename: str = BASELINE_FILE) -> Dict[str, float]:
+    """
+    Load the stored baseline.
+
+    :param filename: The file containing the baseline
+    :return: The baseline, which is empty if none was stored
+    """
+    try:
+        with open(filename) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(results: Dict[str, float], filename: str = BASELINE_FILE):
+    """
+    Store the results as the new baseline. Existing baselines for benchmarks that were not run are kept.
+
+    :param results: The results from :func:`run_benchmarks`
+    :param filename: The file to store the baseline in
+    """
+    baseline = load_baseline(filename)
+    baseline.update({name: round(result, 3) for name, result in results.items()})
+
+    with open(filename, 'w') as file:
+        json.dump(OrderedDict(sorted(baseline.items())), file, indent=2)
+        file.write('\n')
+
+
+def handle_args(args: List[str]):
+    """
+    Handle the command line arguments.
+
+    :param args: Command line arguments
+    :return: The arguments object
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark parsing, validating and saving of DHCPv6 messages.",
+    )
+
+    parser.add_argument("-t", "--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="the relative slowdown that counts as a regression, default {}".format(DEFAULT_THRESHOLD))
+    parser.add_argument("-k", "--filter", metavar="PATTERN", default='*',
+                        help="only run benchmarks matching this pattern, like 'large-map/*'")
+    parser.add_argument("-r", "--repeat", type=int, default=DEFAULT_REPEAT,
+                        help="the number of measurements per benchmark")
+    parser.add_argument("-p", "--pcap-dir", default=PCAP_DIR,
+                        help="the directory with captures to benchmark")
+    parser.add_argument("-b", "--baseline", default=BASELINE_FILE,
+                        help="the file containing the baseline")
+    parser.add_argument("-s", "--save-baseline", action="store_true",
+                        help="store the results as the new baseline")
+
+    args = parser.parse_args(args)
+
+    return args
+
+
+def main(args: List[str]) -> int:
+    """
+    Run the benchmarks and compare them with the baseline.
+
+    :param args: Command line arguments
+    :return: The exit code: 1 if there were regressions
+    """
+    args = handle_args(args)
+
+    results = run_benchmarks(get_cases(args.pcap_dir), args.filter, args.repeat)
+    baseline = load_baseline(args.baseline)
+
+    print("{:<40} {:>10} {:>10} {:>8}".format("Benchmark", "Relative", "Baseline", "Change"))
+    for name, result in results.items():
+        if name in baseline:
+            print("{:<40} {:>10.3f} {:>10.3f} {:>+7.1%}".format(name, result, baseline[name],
+                                                                result / baseline[name] - 1))
+        else:
+            print("{:<40} {:>10.3f} {:>10} {:>8}".format(name, result, '-', '-'))
+
+    if args.save_baseline:
+        save_baseline(results, args.baseline)
+        print("Baseline saved to {}".format(args.baseline))
+        return 0
+
+    regressions = compare(results, baseline, args.threshold)
+    for name, change in regressions:
+        print("Regression: {} is {:.1%} slower than the baseline".format(name, change), file=sys.stderr)
+
+    return 1 if regressions else 0
+
+
+def run() -> int:
+    """
+    Run the benchmarks with the command line arguments
+
+    :return: The exit code
+    """
+    return main(sys.argv[1:])
+
+
+if __name__ == '__main__':
+    sys.exit(run())
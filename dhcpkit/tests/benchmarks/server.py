@@ -0,0 +1,545 @@
+"""
+End-to-end benchmarks of the complete server on the loopback interface.
+
+The server is started with a set of representative configurations, listening on ``::1``, and the load generator from
+:mod:`dhcpkit.ipv6.client.loadgen` simulates clients at increasing rates until the server can't keep up anymore. For
+each configuration the saturation throughput, the latency percentiles at every rate and the memory usage of the
+worker processes are reported.
+
+The server and the simulated clients use the DHCPv6 ports, so the benchmarks must be run as root:
+``python -m dhcpkit.tests.benchmarks.server``. The load generator runs on the same machine as the server, so on
+machines with few CPUs it competes with the worker processes and the results are lower than in production.
+"""
+import argparse
+import asyncio
+import csv
+import grp
+import json
+import logging
+import os
+import pwd
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+from ipaddress import IPv6Address, IPv6Network
+
+from dhcpkit.ipv6 import CLIENT_PORT
+from dhcpkit.ipv6.client.loadgen import LoadGenerator, SimulatedClient, create_socket, percentile
+from dhcpkit.ipv6.server.extensions.static_assignments import Assignment
+from dhcpkit.ipv6.server.extensions.static_assignments.index import write_index
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# The part of the configuration that all scenarios share
+COMMON_CONFIG = """\
+user {user}
+group {group}
+pid-file {directory}/ipv6-dhcpd.pid
+control-socket {directory}/ipv6-dhcpd.sock
+workers {workers}
+
+<listen-unicast ::1>
+</listen-unicast>
+
+<logging>
+    <console>
+        level warning
+    </console>
+</logging>
+
+<recursive-name-servers>
+    address 2001:db8::53
+</recursive-name-servers>
+
+<domain-search-list>
+    domain-name example.com
+</domain-search-list>
+"""
+
+# The handlers of each scenario
+SCENARIOS = OrderedDict([
+    ('stateless', ""),
+
+    ('csv', """
+<static-csv {directory}/assignments.csv>
+</static-csv>
+"""),
+
+    ('index', """
+<static-index {directory}/assignments.idx>
+</static-index>
+"""),
+
+    ('sqlite-leasequery', """
+<static-sqlite {directory}/assignments.sqlite>
+</static-sqlite>
+
+<leasequery>
+    allow-from ::1
+    <lq-sqlite {directory}/leases.sqlite />
+</leasequery>
+"""),
+
+    ('sqlite-cache', """
+<static-sqlite {directory}/assignments.sqlite>
+    cache-size 100000
+</static-sqlite>
+"""),
+
+    ('sqlite-bloom', """
+<static-sqlite {directory}/assignments.sqlite>
+    bloom-filter yes
+</static-sqlite>
+"""),
+
+    ('sqlite-memory', """
+<static-sqlite {directory}/assignments.sqlite>
+    read-only yes
+    in-memory yes
+</static-sqlite>
+"""),
+
+    ('rate-limit', """
+<dispatch-rate-limit>
+    rate 5
+    per 30
+</dispatch-rate-limit>
+
+<rate-limit>
+    rate 5
+    per 30
+</rate-limit>
+
+<static-csv {directory}/assignments.csv>
+</static-csv>
+"""),
+])
+
+# How long to wait for the server to start answering
+STARTUP_TIMEOUT = 30.0
+
+# A step counts as saturated when the throughput is less than this fraction of the offered load
+SATURATION_FRACTION = 0.9
+
+
+def write_assignments(directory: str, client_count: int):
+    """
+    Write the static assignments for the simulated clients as CSV file, as index file and as SQLite database.
+
+    :param directory: The directory to write the files in
+    :param client_count: The number of simulated clients to create assignments for
+    """
+    rows = []
+    for number in range(client_count):
+        client = SimulatedClient(number)
+        rows.append(('duid:' + client.duid.save().hex(),
+                     str(IPv6Address('2001:db8:0:1::') + number + 1),
+                     '2001:db8:{:x}:{:x}00::/56'.format(0x1000 + (number >> 8), number & 0xff)))
+
+    with open(os.path.join(directory, 'assignments.csv'), 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(('id', 'address', 'prefix'))
+        writer.writerows(rows)
+
+    # The same structure as created by ipv6-dhcp-build-sqlite
+    db = sqlite3.connect(os.path.join(directory, 'assignments.sqlite'))
+    with db:
+        db.execute("CREATE TABLE assignments ("
+                   "id TEXT NOT NULL PRIMARY KEY, "
+                   "address TEXT, "
+                   "prefix TEXT, "
+                   "csv_mtime INT NOT NULL"
+                   ") WITHOUT ROWID")
+        db.executemany("INSERT INTO assignments (id, address, prefix, csv_mtime) VALUES (?, ?, ?, 0)", rows)
+    db.close()
+
+    write_index(((row_id, Assignment(address=IPv6Address(address), prefix=IPv6Network(prefix)))
+                 for row_id, address, prefix in rows),
+                os.path.join(directory, 'assignments.idx'))
+
+
+def write_config(directory: str, name: str, workers: int) -> str:
+    """
+    Write the configuration of a scenario in its own directory.
+
+    :param directory: The working directory, containing the assignments
+    :param name: The name of the scenario
+    :param workers: The number of worker processes
+    :return: The name of the configuration file
+    """
+    scenario_directory = os.path.join(directory, name)
+    os.mkdir(scenario_directory)
+
+    config_file = os.path.join(scenario_directory, 'ipv6-dhcpd.conf')
+    with open(config_file, 'w') as config:
+        config.write(COMMON_CONFIG.format(user=pwd.getpwuid(os.getuid()).pw_name,
+                                          group=grp.getgrgid(os.getgid()).gr_name,
+                                          directory=scenario_directory,
+                                          workers=workers))
+        config.write(SCENARIOS[name].format(directory=directory))
+
+    return config_file
+
+
+def get_process_tree(pid: int) -> Dict[int, List[int]]:
+    """
+    Find the children of all processes, using the Linux proc filesystem.
+
+    :param pid: The process to start from
+    :return: The children of each process in the tree
+    """
+    parents = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+
+        try:
+            with open('/proc/{}/stat'.format(entry)) as stat_file:
+                stat = stat_file.read()
+        except OSError:
+            continue
+
+        # The command name can contain spaces and parentheses, the parent PID is the second field after it
+        parents[int(entry)] = int(stat[stat.rindex(')') + 2:].split()[1])
+
+    tree = {}
+    todo = [pid]
+    while todo:
+        parent = todo.pop()
+        tree[parent] = [child for child, child_parent in parents.items() if child_parent == parent]
+        todo += tree[parent]
+
+    return tree
+
+
+def get_rss(pid: int) -> Optional[int]:
+    """
+    Get the resident set size of a process, using the Linux proc filesystem.
+
+    :param pid: The process
+    :return: The RSS in bytes, or None if unknown
+    """
+    try:
+        with open('/proc/{}/status'.format(pid)) as status_file:
+            for line in status_file:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    return None
+
+
+class ServerProcess:
+    """
+    The server running in a separate process
+
+    :type config_file: str
+    :type log_file: str
+    :type process: subprocess.Popen
+    """
+
+    def __init__(self, config_file: str):
+        """
+        Prepare to start the server
+
+        :param config_file: The configuration file
+        """
+        self.config_file = config_file
+        self.log_file = os.path.splitext(config_file)[0] + '.log'
+        self.process = None
+
+    def __enter__(self) -> 'ServerProcess':
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        """
+        Start the server and wait until it answers
+        """
+        with open(self.log_file, 'w') as log:
+            self.process = subprocess.Popen([sys.executable, '-m', 'dhcpkit.ipv6.server.main', self.config_file],
+                                            cwd=os.path.dirname(self.config_file),
+                                            stdout=log, stderr=subprocess.STDOUT)
+
+        # Probe with clients that don't have assignments
+        probe = 0xffffff00
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError("Server stopped with exit code {}: {}".format(self.process.returncode,
+                                                                                self.read_log()))
+
+            load_generator = LoadGenerator(server_address=IPv6Address('::1'), exchanges=['solicit'], timeout=0.5)
+            run_load_generator(load_generator, client_count=1, rate=0.0, first_client=probe)
+            if load_generator.statistics['solicit'].received:
+                return
+
+            probe += 1
+
+        self.stop()
+        raise RuntimeError("Server didn't answer within {} seconds: {}".format(STARTUP_TIMEOUT, self.read_log()))
+
+    def stop(self):
+        """
+        Stop the server
+        """
+        if self.process and self.process.poll() is None:
+            self.process.send_signal(signal.SIGTERM)
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+
+    def read_log(self) -> str:
+        """
+        Read the output of the server
+
+        :return: The log output
+        """
+        with open(self.log_file) as log:
+            return log.read().strip()
+
+    def get_memory_usage(self) -> Tuple[Optional[int], List[Optional[int]]]:
+        """
+        Get the RSS of the main process and of the worker processes. The workers are started by the forkserver
+        process, so they are the grandchildren of the main process.
+
+        :return: The RSS of the main process and the RSS of each worker process in bytes
+        """
+        tree = get_process_tree(self.process.pid)
+        workers = [grandchild
+                   for child in tree[self.process.pid]
+                   for grandchild in tree.get(child, [])]
+        return get_rss(self.process.pid), [get_rss(worker) for worker in sorted(workers)]
+
+
+def run_load_generator(load_generator: LoadGenerator, client_count: int, rate: float, first_client: int = 0,
+                       concurrency: int = 1000):
+    """
+    Run the load generator to completion in its own event loop.
+
+    :param load_generator: The load generator
+    :param client_count: The number of clients to simulate
+    :param rate: The number of clients to start per second
+    :param first_client: The number of the first client
+    :param concurrency: The maximum number of clients that are active at the same time
+    """
+    sock = create_socket(IPv6Address('::1'), CLIENT_PORT)
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(load_generator.run(sock, client_count, rate, concurrency, first_client))
+    finally:
+        loop.close()
+
+
+def get_step_rates(start_rate: float, factor: float, max_rate: float) -> List[float]:
+    """
+    Determine the client rates of the steps of the benchmark.
+
+    :param start_rate: The rate of the first step
+    :param factor: The increase of the rate for every next step
+    :param max_rate: The maximum rate
+    :return: The rates
+    """
+    rates = []
+    rate = start_rate
+    while rate <= max_rate:
+        rates.append(rate)
+        rate *= factor
+    return rates
+
+
+def run_step(rate: float, duration: float, first_client: int, exchanges: Iterable[str],
+             timeout: float) -> Dict[str, float]:
+    """
+    Simulate clients at a fixed rate.
+
+    :param rate: The number of clients to start per second
+    :param duration: How long to start new clients
+    :param first_client: The number of the first client
+    :param exchanges: The exchanges each client goes through
+    :param timeout: How long to wait for a response before counting it as lost
+    :return: The results
+    """
+    load_generator = LoadGenerator(server_address=IPv6Address('::1'), exchanges=exchanges, timeout=timeout)
+    run_load_generator(load_generator, client_count=int(rate * duration), rate=rate, first_client=first_client)
+
+    received = sum(statistics.received for statistics in load_generator.statistics.values())
+    latencies = sorted(latency
+                       for statistics in load_generator.statistics.values()
+                       for latency in statistics.latencies)
+
+    result = OrderedDict([
+        ('rate', rate),
+        ('offered', round(rate * len(load_generator.exchanges), 1)),
+        ('throughput', round(received / load_generator.duration, 1) if load_generator.duration else 0.0),
+        ('loss', round(load_generator.loss, 2)),
+    ])
+    if latencies:
+        result['latency_p50'] = round(percentile(latencies, 50) * 1000, 3)
+        result['latency_p99'] = round(percentile(latencies, 99) * 1000, 3)
+
+    return result
+
+
+def run_scenario(name: str, directory: str, args) -> Dict[str, object]:
+    """
+    Run the benchmark for one scenario, increasing the rate until the server is saturated.
+
+    :param name: The name of the scenario
+    :param directory: The working directory, containing the assignments
+    :param args: The command line arguments
+    :return: The results
+    """
+    config_file = write_config(directory, name, args.workers)
+
+    steps = []
+    with ServerProcess(config_file) as server:
+        first_client = 0
+        for rate in get_step_rates(args.start_rate, args.factor, args.max_rate):
+            step = run_step(rate, args.step_duration, first_client, args.exchanges, args.timeout)
+            first_client += int(rate * args.step_duration)
+            steps.append(step)
+            logger.info("{}: {}".format(name, ', '.join('{} {}'.format(key, value) for key, value in step.items())))
+
+            if step['loss'] > args.max_loss or step['throughput'] < step['offered'] * SATURATION_FRACTION:
+                break
+
+        main_rss, worker_rss = server.get_memory_usage()
+
+    return OrderedDict([
+        ('saturation_throughput', max(step['throughput'] for step in steps)),
+        ('main_rss', main_rss),
+        ('worker_rss', worker_rss),
+        ('steps', steps),
+    ])
+
+
+def format_results(results: Dict[str, Dict[str, object]]) -> str:
+    """
+    Format the results for humans
+
+    :param results: The results per scenario
+    :return: The formatted results
+    """
+
+    def mib(value: Optional[int]) -> str:
+        return '{:.1f}'.format(value / 1048576) if value else '?'
+
+    lines = []
+    for name, result in results.items():
+        lines += [
+            "Scenario {}".format(name),
+            "{:>10} {:>10} {:>10} {:>8} {:>10} {:>10}".format("Clients/s", "Offered", "Throughput", "Loss",
+                                                             "p50 (ms)", "p99 (ms)"),
+        ]
+        for step in result['steps']:
+            lines.append("{:>10} {:>10} {:>10} {:>7}% {:>10} {:>10}".format(step['rate'], step['offered'],
+                                                                            step['throughput'], step['loss'],
+                                                                            step.get('latency_p50', '-'),
+                                                                            step.get('latency_p99', '-')))
+        lines += [
+            "Saturation throughput: {} exchanges per second".format(result['saturation_throughput']),
+            "RSS main process: {} MiB, per worker: {} MiB".format(mib(result['main_rss']),
+                                                                 ', '.join(map(mib, result['worker_rss'])) or '?'),
+            "",
+        ]
+
+    return '\n'.join(lines)
+
+
+def handle_args(args: Iterable[str]):
+    """
+    Handle the command line arguments.
+
+    :param args: Command line arguments
+    :return: The arguments object
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark the server with representative configurations on the loopback interface.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    parser.add_argument("-s", "--scenario", action="append", choices=list(SCENARIOS),
+                        help="the scenarios to run, default is all of them")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1,
+                        help="the number of worker processes of the server")
+    parser.add_argument("-r", "--start-rate", type=float, default=50.0,
+                        help="the number of clients per second to start with")
+    parser.add_argument("-f", "--factor", type=float, default=2.0,
+                        help="the increase of the rate for every next step")
+    parser.add_argument("-m", "--max-rate", type=float, default=6400.0,
+                        help="the highest number of clients per second to try")
+    parser.add_argument("-d", "--step-duration", type=float, default=5.0,
+                        help="the number of seconds to spend on each rate")
+    parser.add_argument("-l", "--max-loss", type=float, default=1.0,
+                        help="the percentage of lost messages at which the server counts as saturated")
+    parser.add_argument("-t", "--timeout", type=float, default=2.0,
+                        help="seconds to wait for a response before counting it as lost")
+    parser.add_argument("--renew", action="store_true",
+                        help="let the clients renew their leases as well")
+    parser.add_argument("--json", action="store_true",
+                        help="show the results in JSON format")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="show the results of every step while running")
+
+    args = parser.parse_args(args)
+    args.scenario = args.scenario or list(SCENARIOS)
+    args.exchanges = ['solicit', 'request', 'renew'] if args.renew else ['solicit', 'request']
+
+    return args
+
+
+def main(args: Iterable[str]) -> int:
+    """
+    Run the benchmarks
+
+    :param args: Command line arguments
+    :return: The exit code
+    """
+    args = handle_args(args)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format='%(message)s')
+
+    rates = get_step_rates(args.start_rate, args.factor, args.max_rate)
+    client_count = sum(int(rate * args.step_duration) for rate in rates)
+
+    results = OrderedDict()
+    with tempfile.TemporaryDirectory(prefix='dhcpkit-benchmark-') as directory:
+        write_assignments(directory, client_count)
+
+        for name in args.scenario:
+            try:
+                results[name] = run_scenario(name, directory, args)
+            except RuntimeError as e:
+                logger.error("Scenario {} failed: {}".format(name, e))
+                return 1
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(format_results(results))
+
+    return 0
+
+
+def run() -> int:
+    """
+    Run the benchmarks with the command line arguments
+
+    :return: The exit code
+    """
+    return main(sys.argv[1:])
+
+
+if __name__ == '__main__':
+    sys.exit(run())
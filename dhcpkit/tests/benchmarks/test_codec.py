@@ -0,0 +1,47 @@
+"""
+Test the codec benchmarks, and run them when the DHCPKIT_BENCHMARKS environment variable is set
+"""
+import os
+import unittest
+
+from dhcpkit.ipv6.extensions.map import S46MapEContainerOption
+from dhcpkit.ipv6.messages import RelayForwardMessage, SolicitMessage
+from dhcpkit.tests.benchmarks.codec import compare, deep_relay_message, get_cases, large_map_message, load_baseline, \
+    parse_packets, run_benchmarks
+
+
+class CodecBenchmarkTestCase(unittest.TestCase):
+    def test_cases(self):
+        for case_name, packets in get_cases().items():
+            with self.subTest(case=case_name):
+                messages = parse_packets(packets)
+                for message, packet in zip(messages, packets):
+                    message.validate()
+                    self.assertEqual(message.save(), packet)
+
+    def test_deep_relay(self):
+        message = deep_relay_message(depth=3)
+        self.assertIsInstance(message, RelayForwardMessage)
+        self.assertEqual(message.hop_count, 2)
+        self.assertIsInstance(message.inner_message, SolicitMessage)
+
+    def test_large_map(self):
+        message = large_map_message(rule_count=10)
+        container = message.get_option_of_type(S46MapEContainerOption)
+        self.assertEqual(len(container.options), 11)
+
+    def test_compare(self):
+        baseline = {'a/parse': 1.0, 'b/parse': 2.0}
+        results = {'a/parse': 1.3, 'b/parse': 2.2, 'c/parse': 5.0}
+        regressions = compare(results, baseline, threshold=0.25)
+        self.assertEqual([name for name, change in regressions], ['a/parse'])
+        self.assertAlmostEqual(regressions[0][1], 0.3)
+
+    @unittest.skipUnless(os.environ.get('DHCPKIT_BENCHMARKS'), "Set DHCPKIT_BENCHMARKS to run the benchmarks")
+    def test_no_regressions(self):
+        results = run_benchmarks(get_cases())
+        self.assertEqual(compare(results, load_baseline()), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+"""
+Test the end-to-end server benchmark, and run it when the DHCPKIT_BENCHMARKS environment variable is set
+"""
+import os
+import tempfile
+import unittest
+
+from dhcpkit.ipv6.client.loadgen import SimulatedClient
+from dhcpkit.ipv6.server.config_parser import load_config
+from dhcpkit.ipv6.server.extensions.static_assignments.csv import CSVStaticAssignmentHandler
+from dhcpkit.tests.benchmarks.server import SCENARIOS, get_process_tree, get_rss, get_step_rates, main, \
+    write_assignments, write_config
+
+
+class ServerBenchmarkTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.directory = self.temp_dir.name
+        write_assignments(self.directory, 10)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_assignments(self):
+        assignments = dict(CSVStaticAssignmentHandler.parse_csv_file(os.path.join(self.directory,
+                                                                                  'assignments.csv')))
+        self.assertEqual(len(assignments), 10)
+
+        client = SimulatedClient(9)
+        assignment = assignments['duid:' + client.duid.save().hex()]
+        self.assertEqual(str(assignment.address), '2001:db8:0:1::a')
+        self.assertEqual(str(assignment.prefix), '2001:db8:1000:900::/56')
+
+    def test_configs(self):
+        for name in SCENARIOS:
+            with self.subTest(scenario=name):
+                config = load_config(write_config(self.directory, name, 2))
+                self.assertEqual(config.workers, 2)
+
+    def test_step_rates(self):
+        self.assertEqual(get_step_rates(50, 2, 400), [50, 100, 200, 400])
+        self.assertEqual(get_step_rates(50, 2, 399), [50, 100, 200])
+
+    @unittest.skipUnless(os.path.exists('/proc/self/status'), "Needs the Linux proc filesystem")
+    def test_memory_usage(self):
+        self.assertIn(os.getpid(), get_process_tree(os.getppid())[os.getppid()])
+        self.assertGreater(get_rss(os.getpid()), 0)
+
+    @unittest.skipUnless(os.environ.get('DHCPKIT_BENCHMARKS'), "Set DHCPKIT_BENCHMARKS to run the benchmarks")
+    def test_benchmark(self):
+        self.assertEqual(main(['--scenario', 'csv', '--max-rate', '50', '--step-duration', '1']), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
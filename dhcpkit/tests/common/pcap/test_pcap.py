@@ -0,0 +1,147 @@
+"""
+Test reading pcap and pcapng capture files
+"""
+import io
+import os
+import tempfile
+import unittest
+from ipaddress import IPv6Address
+from struct import pack
+
+from dhcpkit.common.pcap import CapturedPacket, LINKTYPE_ETHERNET, LINKTYPE_LINUX_SLL, LINKTYPE_RAW, \
+    decode_udp_datagram, read_capture, read_pcap, read_pcapng
+
+
+def ipv6_udp_packet(payload: bytes, source_port: int = 546, destination_port: int = 547,
+                    extension_headers: bytes = b'', first_next_header: int = 17) -> bytes:
+    udp = pack('!HHHH', source_port, destination_port, 8 + len(payload), 0) + payload
+    return (pack('!IHBB', 0x60000000, len(extension_headers) + len(udp), first_next_header, 64)
+            + IPv6Address('fe80::1').packed + IPv6Address('ff02::1:2').packed
+            + extension_headers + udp)
+
+
+def ethernet_frame(ip_packet: bytes, vlan: bool = False) -> bytes:
+    header = bytes.fromhex('333300010002') + bytes.fromhex('001122334455')
+    if vlan:
+        header += pack('!HH', 0x8100, 42)
+    return header + pack('!H', 0x86dd) + ip_packet
+
+
+def pcap_file(packets: list, link_type: int, byte_order: str = '<', magic: int = 0xa1b2c3d4) -> io.BytesIO:
+    data = pack(byte_order + 'IHHiIII', magic, 2, 4, 0, 0, 65535, link_type)
+    for seconds, fraction, packet in packets:
+        data += pack(byte_order + 'IIII', seconds, fraction, len(packet), len(packet)) + packet
+    return io.BytesIO(data)
+
+
+def pcapng_block(block_type: int, body: bytes, byte_order: str = '<') -> bytes:
+    body += bytes(-len(body) % 4)
+    return pack(byte_order + 'II', block_type, len(body) + 12) + body + pack(byte_order + 'I', len(body) + 12)
+
+
+def pcapng_file(packets: list, link_type: int, byte_order: str = '<', tsresol: int = None) -> bytes:
+    data = pcapng_block(0x0a0d0d0a, pack(byte_order + 'IHHq', 0x1a2b3c4d, 1, 0, -1), byte_order)
+
+    options = b''
+    if tsresol is not None:
+        options = pack(byte_order + 'HH', 9, 1) + bytes([tsresol, 0, 0, 0]) + pack(byte_order + 'HH', 0, 0)
+    data += pcapng_block(1, pack(byte_order + 'HHI', link_type, 0, 65535) + options, byte_order)
+
+    for timestamp, packet in packets:
+        data += pcapng_block(6, pack(byte_order + 'IIIII', 0, timestamp >> 32, timestamp & 0xffffffff,
+                                     len(packet), len(packet)) + packet, byte_order)
+    return data
+
+
+class PcapTestCase(unittest.TestCase):
+    def test_read_pcap(self):
+        packets = list(read_pcap(pcap_file([(1000, 500000, b'first'), (1001, 0, b'second')], LINKTYPE_RAW)))
+        self.assertEqual([packet.data for packet in packets], [b'first', b'second'])
+        self.assertEqual([packet.timestamp for packet in packets], [1000.5, 1001.0])
+        self.assertEqual(packets[0].link_type, LINKTYPE_RAW)
+
+    def test_read_pcap_big_endian_nanoseconds(self):
+        packets = list(read_pcap(pcap_file([(1000, 250000000, b'data')], LINKTYPE_RAW, '>', 0xa1b23c4d)))
+        self.assertEqual(packets[0].timestamp, 1000.25)
+
+    def test_read_pcap_truncated(self):
+        file = pcap_file([(1000, 0, b'first'), (1001, 0, b'second')], LINKTYPE_RAW)
+        file = io.BytesIO(file.getvalue()[:-3])
+        self.assertEqual([packet.data for packet in read_pcap(file)], [b'first'])
+
+    def test_not_a_pcap(self):
+        self.assertRaisesRegex(ValueError, 'Not a pcap file', list, read_pcap(io.BytesIO(bytes(24))))
+
+    def test_read_pcapng(self):
+        file = io.BytesIO(pcapng_file([(1000500000, b'first'), (1001000000, b'second')], LINKTYPE_ETHERNET))
+        packets = list(read_pcapng(file))
+        self.assertEqual([packet.data for packet in packets], [b'first', b'second'])
+        self.assertEqual([packet.timestamp for packet in packets], [1000.5, 1001.0])
+        self.assertEqual(packets[0].link_type, LINKTYPE_ETHERNET)
+
+    def test_read_pcapng_big_endian_resolution(self):
+        file = io.BytesIO(pcapng_file([(1000 * 1024 + 512, b'data')], LINKTYPE_RAW, '>', tsresol=0x8a))
+        packets = list(read_pcapng(file))
+        self.assertEqual(packets[0].data, b'data')
+        self.assertEqual(packets[0].timestamp, 1000.5)
+
+    def test_read_capture(self):
+        with tempfile.TemporaryDirectory() as tmp_dir_name:
+            pcap_name = os.path.join(tmp_dir_name, 'test.pcap')
+            with open(pcap_name, 'wb') as capture_file:
+                capture_file.write(pcap_file([(1000, 0, b'pcap')], LINKTYPE_RAW).getvalue())
+
+            pcapng_name = os.path.join(tmp_dir_name, 'test.pcapng')
+            with open(pcapng_name, 'wb') as capture_file:
+                capture_file.write(pcapng_file([(1000000000, b'pcapng')], LINKTYPE_RAW))
+
+            self.assertEqual([packet.data for packet in read_capture(pcap_name)], [b'pcap'])
+            self.assertEqual([packet.data for packet in read_capture(pcapng_name)], [b'pcapng'])
+
+
+class DecodeUDPDatagramTestCase(unittest.TestCase):
+    def test_ethernet(self):
+        datagram = decode_udp_datagram(CapturedPacket(1000.0, LINKTYPE_ETHERNET,
+                                                      ethernet_frame(ipv6_udp_packet(b'payload'))))
+        self.assertEqual(datagram.timestamp, 1000.0)
+        self.assertEqual(datagram.source_address, IPv6Address('fe80::1'))
+        self.assertEqual(datagram.source_port, 546)
+        self.assertEqual(datagram.destination_address, IPv6Address('ff02::1:2'))
+        self.assertEqual(datagram.destination_port, 547)
+        self.assertEqual(datagram.payload, b'payload')
+
+    def test_vlan(self):
+        datagram = decode_udp_datagram(CapturedPacket(1000.0, LINKTYPE_ETHERNET,
+                                                      ethernet_frame(ipv6_udp_packet(b'payload'), vlan=True)))
+        self.assertEqual(datagram.payload, b'payload')
+
+    def test_linux_sll(self):
+        header = pack('!HHH8sH', 0, 1, 6, bytes(8), 0x86dd)
+        datagram = decode_udp_datagram(CapturedPacket(1000.0, LINKTYPE_LINUX_SLL,
+                                                      header + ipv6_udp_packet(b'payload')))
+        self.assertEqual(datagram.payload, b'payload')
+
+    def test_extension_headers(self):
+        # A hop-by-hop header with padding, followed by UDP
+        hop_by_hop = bytes([17, 0, 1, 4, 0, 0, 0, 0])
+        datagram = decode_udp_datagram(CapturedPacket(1000.0, LINKTYPE_RAW,
+                                                      ipv6_udp_packet(b'payload', extension_headers=hop_by_hop,
+                                                                      first_next_header=0)))
+        self.assertEqual(datagram.payload, b'payload')
+
+    def test_fragment(self):
+        fragment = bytes([17, 0]) + pack('!HI', 0x0001, 1234)
+        self.assertIsNone(decode_udp_datagram(CapturedPacket(1000.0, LINKTYPE_RAW,
+                                                             ipv6_udp_packet(b'payload', extension_headers=fragment,
+                                                                             first_next_header=44))))
+
+    def test_not_ipv6(self):
+        frame = bytes(12) + pack('!H', 0x0800) + bytes(40)
+        self.assertIsNone(decode_udp_datagram(CapturedPacket(1000.0, LINKTYPE_ETHERNET, frame)))
+
+    def test_truncated(self):
+        self.assertIsNone(decode_udp_datagram(CapturedPacket(1000.0, LINKTYPE_RAW, ipv6_udp_packet(b'payload')[:-1])))
+
+
+if __name__ == '__main__':
+    unittest.main()
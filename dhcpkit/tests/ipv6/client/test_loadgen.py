@@ -0,0 +1,163 @@
+"""
+Test the load generator against a minimal server on the loopback interface
+"""
+import asyncio
+import socket
+import threading
+import unittest
+from ipaddress import IPv6Address, IPv6Network
+
+from dhcpkit.ipv6.client.loadgen import LoadGenerator, SimulatedClient, create_socket
+from dhcpkit.ipv6.duids import LinkLayerDUID
+from dhcpkit.ipv6.extensions.prefix_delegation import IAPDOption, IAPrefixOption
+from dhcpkit.ipv6.extensions.remote_id import RemoteIdOption
+from dhcpkit.ipv6.messages import AdvertiseMessage, Message, RelayForwardMessage, RelayReplyMessage, ReleaseMessage, \
+    ReplyMessage, RequestMessage, SolicitMessage
+from dhcpkit.ipv6.options import ClientIdOption, IAAddressOption, IANAOption, InterfaceIdOption, RelayMessageOption, \
+    ServerIdOption
+
+server_duid = LinkLayerDUID(hardware_type=1, link_layer_address=bytes.fromhex('00137265ca42'))
+
+
+class FakeServer(threading.Thread):
+    """
+    Answer every message with an advertise or reply that assigns an address
+    """
+
+    def __init__(self, ignore=()):
+        super().__init__(daemon=True)
+        self.socket = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+        self.socket.bind(('::1', 0))
+        self.socket.settimeout(0.1)
+        self.ignore = ignore
+        self.received = []
+        self.stopping = False
+
+    def run(self):
+        while not self.stopping:
+            try:
+                data, sender = self.socket.recvfrom(65536)
+            except socket.timeout:
+                continue
+
+            length, message = Message.parse(data)
+            self.received.append(message)
+
+            request = message.inner_message if isinstance(message, RelayForwardMessage) else message
+            if isinstance(request, self.ignore):
+                continue
+
+            response_class = AdvertiseMessage if isinstance(request, SolicitMessage) else ReplyMessage
+            ia_na = request.get_option_of_type(IANAOption)
+            response = response_class(request.transaction_id, [
+                request.get_option_of_type(ClientIdOption),
+                ServerIdOption(server_duid),
+                IANAOption(ia_na.iaid, options=[IAAddressOption(IPv6Address('2001:db8::1'), 3600, 7200)]),
+            ])
+
+            if isinstance(message, RelayForwardMessage):
+                response = RelayReplyMessage(hop_count=0, link_address=message.link_address,
+                                             peer_address=message.peer_address,
+                                             options=[RelayMessageOption(response)])
+
+            self.socket.sendto(response.save(), sender)
+
+    def stop(self):
+        self.stopping = True
+        self.join()
+        self.socket.close()
+
+
+class SimulatedClientTestCase(unittest.TestCase):
+    def test_identity(self):
+        client = SimulatedClient(258, prefix_delegation=True)
+        self.assertEqual(client.link_layer_address, bytes.fromhex('020000000102'))
+        self.assertEqual(client.link_local_address, IPv6Address('fe80::200:0:0:102'))
+
+        solicit = client.create_solicit(b'abc')
+        self.assertEqual(solicit.get_option_of_type(ClientIdOption).duid, client.duid)
+        self.assertEqual(solicit.get_option_of_type(IANAOption).iaid, b'\x00\x00\x01\x02')
+        self.assertEqual(solicit.get_option_of_type(IAPDOption).iaid, b'\x00\x00\x01\x02')
+
+    def test_update(self):
+        client = SimulatedClient(1)
+        client.update(AdvertiseMessage(b'abc', [
+            ServerIdOption(server_duid),
+            IANAOption(b'1234', options=[IAAddressOption(IPv6Address('2001:db8::1'), 3600, 7200)]),
+            IAPDOption(b'1234', options=[IAPrefixOption(IPv6Network('2001:db8:1::/48'), 3600, 7200)]),
+        ]))
+
+        request = client.create_request(b'def')
+        self.assertIsInstance(request, RequestMessage)
+        self.assertEqual(request.get_option_of_type(ServerIdOption).duid, server_duid)
+        self.assertEqual(request.get_option_of_type(IANAOption).get_option_of_type(IAAddressOption).address,
+                         IPv6Address('2001:db8::1'))
+        self.assertEqual(request.get_option_of_type(IAPDOption).get_option_of_type(IAPrefixOption).prefix,
+                         IPv6Network('2001:db8:1::/48'))
+
+
+class LoadGeneratorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    def run_load_generator(self, server: FakeServer, load_generator: LoadGenerator, client_count: int):
+        server.start()
+        try:
+            self.loop.run_until_complete(load_generator.run(create_socket(IPv6Address('::1'), 0), client_count))
+        finally:
+            server.stop()
+
+    def test_direct(self):
+        server = FakeServer()
+        load_generator = LoadGenerator(IPv6Address('::1'), server.socket.getsockname()[1],
+                                       exchanges=['solicit', 'request', 'renew', 'release'])
+        self.run_load_generator(server, load_generator, 20)
+
+        self.assertEqual(load_generator.clients_completed, 20)
+        self.assertEqual(load_generator.loss, 0)
+        self.assertEqual(len(server.received), 80)
+
+        exported = load_generator.export()
+        self.assertEqual(list(exported['exchanges']), ['solicit', 'request', 'renew', 'release'])
+        self.assertEqual(exported['exchanges']['renew']['received'], 20)
+        self.assertIn('latency_p99', exported['exchanges']['renew'])
+        self.assertIn('Clients completed: 20', str(load_generator))
+
+        # The request contains what the server advertised
+        request = [message for message in server.received if isinstance(message, RequestMessage)][0]
+        self.assertEqual(request.get_option_of_type(ServerIdOption).duid, server_duid)
+
+    def test_relayed(self):
+        server = FakeServer()
+        load_generator = LoadGenerator(IPv6Address('::1'), server.socket.getsockname()[1],
+                                       relay_link_address=IPv6Address('2001:db8::1'), interface_id=b'eth0',
+                                       remote_id_enterprise=9)
+        self.run_load_generator(server, load_generator, 5)
+
+        self.assertEqual(load_generator.clients_completed, 5)
+
+        relay_message = server.received[0]
+        self.assertIsInstance(relay_message, RelayForwardMessage)
+        self.assertEqual(relay_message.link_address, IPv6Address('2001:db8::1'))
+        self.assertEqual(relay_message.get_option_of_type(InterfaceIdOption).interface_id, b'eth0')
+        self.assertEqual(relay_message.get_option_of_type(RemoteIdOption).enterprise_number, 9)
+        self.assertIsInstance(relay_message.relayed_message, SolicitMessage)
+
+    def test_loss(self):
+        server = FakeServer(ignore=ReleaseMessage)
+        load_generator = LoadGenerator(IPv6Address('::1'), server.socket.getsockname()[1],
+                                       exchanges=['solicit', 'request', 'release'], timeout=0.2)
+        self.run_load_generator(server, load_generator, 4)
+
+        self.assertEqual(load_generator.clients_completed, 0)
+        self.assertEqual(load_generator.statistics['release'].lost, 4)
+        self.assertEqual(load_generator.loss, 100 * 4 / 12)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+"""
+Testing of the limit on concurrent bulk leasequery replies
+"""
+import unittest
+from ipaddress import IPv6Address, IPv6Network
+
+from dhcpkit.ipv6.extensions.bulk_leasequery import LeasequeryDataMessage, LeasequeryDoneMessage, \
+    QUERY_BY_LINK_ADDRESS, STATUS_QUERY_TERMINATED
+from dhcpkit.ipv6.extensions.leasequery import ClientDataOption, LQQueryOption, LeasequeryMessage, \
+    LeasequeryReplyMessage
+from dhcpkit.ipv6.server.extensions.leasequery import LeasequeryHandler, LeasequeryStore
+from dhcpkit.ipv6.server.extensions.leasequery.config import bulk_transfer_count
+from dhcpkit.ipv6.server.handlers import ReplyWithLeasequeryError
+from dhcpkit.ipv6.server.transaction_bundle import TransactionBundle
+
+
+class FixedLeasesStore(LeasequeryStore):
+    """
+    A store that returns the same leases for every query
+    """
+
+    def find_leases(self, query: LQQueryOption):
+        leases = [(IPv6Address('2001:db8::1'), ClientDataOption()) for _ in range(3)]
+        return len(leases), iter(leases)
+
+
+class BulkTransferTestCase(unittest.TestCase):
+    def setUp(self):
+        self.handler = LeasequeryHandler(FixedLeasesStore(), allow_from=[IPv6Network('::/0')], max_bulk_transfers=1)
+
+    def create_bundle(self) -> TransactionBundle:
+        request = LeasequeryMessage(transaction_id=b'abc', options=[
+            LQQueryOption(query_type=QUERY_BY_LINK_ADDRESS, link_address=IPv6Address('2001:db8::')),
+        ])
+        bundle = TransactionBundle(request, received_over_multicast=False, received_over_tcp=True)
+        bundle.response = LeasequeryReplyMessage(transaction_id=b'abc')
+        return bundle
+
+    def test_slot_released_after_sending(self):
+        for _ in range(2):
+            bundle = self.create_bundle()
+            self.handler.handle(bundle)
+
+            responses = list(bundle.responses)
+            self.assertIsInstance(responses[0], LeasequeryReplyMessage)
+            self.assertIsInstance(responses[1], LeasequeryDataMessage)
+            self.assertIsInstance(responses[-1], LeasequeryDoneMessage)
+            self.assertEqual(len(responses), 4)
+
+    def test_slot_released_when_discarded(self):
+        self.handler.handle(self.create_bundle())
+        self.handler.handle(self.create_bundle())
+
+    def test_too_many_transfers(self):
+        first_bundle = self.create_bundle()
+        self.handler.handle(first_bundle)
+
+        with self.assertLogs('dhcpkit.ipv6.server.extensions.leasequery', 'WARNING'):
+            with self.assertRaises(ReplyWithLeasequeryError) as cm:
+                self.handler.handle(self.create_bundle())
+
+        self.assertEqual(cm.exception.option.status_code, STATUS_QUERY_TERMINATED)
+
+        # Finishing the first transfer makes room for a new one
+        list(first_bundle.responses)
+        self.handler.handle(self.create_bundle())
+
+    def test_bulk_transfer_count(self):
+        self.assertEqual(bulk_transfer_count('1'), 1)
+        self.assertEqual(bulk_transfer_count('255'), 255)
+        self.assertRaisesRegex(ValueError, 'between 1 and 255', bulk_transfer_count, '0')
+        self.assertRaisesRegex(ValueError, 'between 1 and 255', bulk_transfer_count, '256')
+
+
+if __name__ == '__main__':
+    unittest.main()
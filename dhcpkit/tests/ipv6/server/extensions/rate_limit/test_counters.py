@@ -0,0 +1,157 @@
+"""
+Test the shared memory rate limit counters
+"""
+import multiprocessing
+import unittest
+from unittest.mock import patch
+
+from dhcpkit.ipv6.duids import LinkLayerDUID
+from dhcpkit.ipv6.server.extensions.rate_limit import RateLimitHandler
+from dhcpkit.ipv6.server.extensions.rate_limit.counters import GROUP_SIZE, RateLimitCounters, \
+    check_hierarchical_request, key_hash
+from dhcpkit.ipv6.server.message_handler import MessageHandler
+
+shared_counters = None
+
+
+def init_process(counters: RateLimitCounters):
+    """
+    Shared memory can only be passed to worker processes when they start
+
+    :param counters: The shared counters
+    """
+    global shared_counters
+    shared_counters = counters
+
+
+def use_counters(key: str, count: int) -> int:
+    """
+    Send a number of requests from another process
+
+    :param key: The key to use
+    :param count: The number of requests
+    :return: How many were allowed
+    """
+    return sum(shared_counters.check_request(key) for _ in range(count))
+
+
+class RateLimitCountersTestCase(unittest.TestCase):
+    def test_key_hash(self):
+        self.assertEqual(key_hash('duid:0001'), key_hash('duid:0001'))
+        self.assertNotEqual(key_hash('duid:0001'), key_hash('duid:0002'))
+        self.assertNotEqual(key_hash('duid:0001'), 0)
+
+    def test_size(self):
+        counters = RateLimitCounters(rate=5, per=30, size=100)
+        self.assertEqual(counters.size % GROUP_SIZE, 0)
+        self.assertGreaterEqual(counters.size, 100)
+
+    def test_burst(self):
+        counters = RateLimitCounters(rate=5, per=30, burst=3)
+        with patch('time.monotonic', return_value=1000.0):
+            results = [counters.check_request('client') for _ in range(5)]
+        self.assertEqual(results, [True, True, True, False, False])
+
+        # Other clients are not affected
+        with patch('time.monotonic', return_value=1000.0):
+            self.assertTrue(counters.check_request('other'))
+
+    def test_refill(self):
+        counters = RateLimitCounters(rate=5, per=30)
+        with patch('time.monotonic', return_value=1000.0):
+            for _ in range(5):
+                counters.check_request('client')
+            self.assertFalse(counters.check_request('client'))
+
+        # After 6 seconds one request is allowed again
+        with patch('time.monotonic', return_value=1006.0):
+            self.assertTrue(counters.check_request('client'))
+            self.assertFalse(counters.check_request('client'))
+
+    def test_eviction(self):
+        # A single group
+        counters = RateLimitCounters(rate=2, per=30, size=GROUP_SIZE)
+        with patch('time.monotonic', return_value=1000.0):
+            counters.check_request('first')
+            counters.check_request('first')
+            self.assertFalse(counters.check_request('first'))
+
+        for number in range(GROUP_SIZE):
+            with patch('time.monotonic', return_value=1001.0 + number):
+                counters.check_request('client-{}'.format(number))
+
+        # The first client has been forgotten, so it starts with a full bucket again
+        with patch('time.monotonic', return_value=1010.0):
+            self.assertTrue(counters.check_request('first'))
+
+    def test_idle_expiry(self):
+        # A single group
+        counters = RateLimitCounters(rate=2, per=10, size=GROUP_SIZE)
+        with patch('time.monotonic', return_value=1000.0):
+            for number in range(GROUP_SIZE):
+                counters.check_request('client-{}'.format(number))
+            self.assertEqual(counters.tracked_keys(), GROUP_SIZE)
+
+        # All buckets are full again after 5 seconds, so new clients don't cause evictions
+        with patch('time.monotonic', return_value=1005.0):
+            self.assertEqual(counters.tracked_keys(), 0)
+            counters.check_request('new')
+            self.assertEqual(counters.tracked_keys(), 1)
+
+        self.assertEqual(counters.export()['evictions'], 0)
+
+    def test_statistics(self):
+        counters = RateLimitCounters(rate=2, per=10, size=GROUP_SIZE)
+        with patch('time.monotonic', return_value=1000.0):
+            for number in range(GROUP_SIZE + 2):
+                counters.check_request('client-{}'.format(number))
+            for _ in range(3):
+                counters.check_request('client-{}'.format(GROUP_SIZE + 1))
+
+            exported = counters.export()
+
+        self.assertEqual(exported['size'], GROUP_SIZE)
+        self.assertEqual(exported['tracked_keys'], GROUP_SIZE)
+        self.assertEqual(exported['evictions'], 2)
+        self.assertEqual(exported['rejections'], 2)
+
+    def test_hierarchical(self):
+        relays = RateLimitCounters(rate=3, per=30)
+        clients = RateLimitCounters(rate=2, per=30)
+
+        with patch('time.monotonic', return_value=1000.0):
+            results = [check_hierarchical_request([(relays, 'relay'), (clients, 'client-{}'.format(number // 2))])
+                       for number in range(5)]
+
+            # The second client is rejected by the relay level without using up its own allowance
+            self.assertEqual(results, [None, None, None, 0, 0])
+            self.assertTrue(clients.check_request('client-1'))
+
+            # A client over its own limit doesn't use up the allowance of the relay, so its bucket stays full
+            self.assertEqual(check_hierarchical_request([(relays, 'other-relay'), (clients, 'client-0')]), 1)
+            self.assertEqual(relays.tracked_keys(), 1)
+
+        self.assertEqual(relays.export()['rejections'], 2)
+        self.assertEqual(clients.export()['rejections'], 1)
+
+    def test_handler_statistics(self):
+        handler = RateLimitHandler(rate=5, per=30)
+        message_handler = MessageHandler(server_id=LinkLayerDUID(hardware_type=1, link_layer_address=bytes(6)),
+                                         sub_handlers=[handler, RateLimitHandler(rate=5, per=30)])
+
+        exported = message_handler.export_statistics()
+        self.assertEqual(list(exported.keys()), ['RateLimitHandler on duid_key', 'RateLimitHandler on duid_key (2)'])
+        self.assertEqual(exported['RateLimitHandler on duid_key']['tracked_keys'], 0)
+
+    def test_shared_between_processes(self):
+        counters = RateLimitCounters(rate=10, per=3600)
+
+        with multiprocessing.Pool(2, initializer=init_process, initargs=(counters,)) as pool:
+            allowed = pool.starmap(use_counters, [('client', 10), ('client', 10)])
+
+        # The bucket is shared, so only 10 requests are allowed in total
+        self.assertEqual(sum(allowed), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
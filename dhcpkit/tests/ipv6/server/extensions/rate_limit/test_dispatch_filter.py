@@ -0,0 +1,65 @@
+"""
+Test the rate limit dispatch filter in the master process
+"""
+import unittest
+from ipaddress import IPv6Address
+from unittest.mock import patch
+
+from dhcpkit.ipv6.options import InterfaceIdOption
+from dhcpkit.ipv6.server.extensions.rate_limit import RateLimitDispatchFilter
+from dhcpkit.ipv6.server.extensions.rate_limit.key_functions import raw_interface_id_key
+from dhcpkit.ipv6.server.listeners import IncomingPacketBundle
+from dhcpkit.ipv6.server.main import dispatch_allowed
+from dhcpkit.ipv6.server.packet_scanner import scan_packet
+from dhcpkit.ipv6.server.statistics import ServerStatistics
+from dhcpkit.tests.ipv6.messages.test_solicit_message import solicit_message
+
+
+class RateLimitDispatchFilterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.packet = IncomingPacketBundle(data=bytes(solicit_message.save()),
+                                           source_address=IPv6Address('fe80::babe'),
+                                           link_address=IPv6Address('2001:db8::1'),
+                                           relay_options=[InterfaceIdOption(interface_id=b'eth0')])
+
+    def test_str(self):
+        self.assertEqual(str(RateLimitDispatchFilter()), 'RateLimitDispatchFilter on raw_duid_key')
+        self.assertEqual(str(RateLimitDispatchFilter(key=raw_interface_id_key)),
+                         'RateLimitDispatchFilter on raw_interface_id_key')
+
+    def test_allow(self):
+        dispatch_filter = RateLimitDispatchFilter(rate=2, per=30)
+        scanned_packet = scan_packet(self.packet)
+
+        with patch('time.monotonic', return_value=1000.0):
+            results = [dispatch_filter.allow(scanned_packet) for _ in range(3)]
+        self.assertEqual(results, [True, True, False])
+
+        exported = dispatch_filter.export_statistics()
+        self.assertEqual(exported['RateLimitDispatchFilter on raw_duid_key']['rejections'], 1)
+
+    def test_dispatch_allowed(self):
+        statistics = ServerStatistics()
+        statistics.set_categories(None)
+        dispatch_filters = [RateLimitDispatchFilter(rate=2, per=30)]
+
+        with patch('time.monotonic', return_value=1000.0):
+            results = [dispatch_allowed(dispatch_filters, self.packet, statistics) for _ in range(3)]
+        self.assertEqual(results, [True, True, False])
+
+        # Only the dropped packet is counted in the master process, the workers count the others
+        exported = statistics.global_stats.export()
+        self.assertEqual(exported['incoming_packets'], 1)
+        self.assertEqual(exported['dropped_packets'], 1)
+
+    def test_malformed_packets_are_dispatched(self):
+        dispatch_filters = [RateLimitDispatchFilter(rate=1, per=30)]
+        packet = IncomingPacketBundle(data=b'\x01\x00')
+
+        with patch('time.monotonic', return_value=1000.0):
+            results = [dispatch_allowed(dispatch_filters, packet, ServerStatistics()) for _ in range(3)]
+        self.assertEqual(results, [True, True, True])
+
+
+if __name__ == '__main__':
+    unittest.main()
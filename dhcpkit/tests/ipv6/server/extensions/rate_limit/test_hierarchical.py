@@ -0,0 +1,52 @@
+"""
+Test the hierarchical rate limit handler
+"""
+import unittest
+from unittest.mock import patch
+
+from dhcpkit.ipv6.server.extensions.rate_limit import HierarchicalRateLimitHandler, RateLimitLevel
+from dhcpkit.ipv6.server.extensions.rate_limit.key_functions import duid_key, link_key, relay_key
+from dhcpkit.ipv6.server.handlers import CannotRespondError
+from dhcpkit.ipv6.server.transaction_bundle import TransactionBundle
+from dhcpkit.tests.ipv6.messages.test_relay_forward_message import relayed_solicit_message
+from dhcpkit.tests.ipv6.messages.test_solicit_message import solicit_message
+
+
+class HierarchicalRateLimitHandlerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.handler = HierarchicalRateLimitHandler(levels=[
+            RateLimitLevel(key=relay_key, rate=3, per=30),
+            RateLimitLevel(key=link_key, rate=10, per=30),
+            RateLimitLevel(key=duid_key, rate=2, per=30),
+        ])
+
+    def test_keys(self):
+        bundle = TransactionBundle(relayed_solicit_message, received_over_multicast=False)
+        self.assertEqual(relay_key(bundle), 'relay:fe80::3631:c4ff:fe3c:b2f1')
+        self.assertEqual(link_key(bundle), 'link:2001:db8:ffff:1::1')
+
+        # Directly connected clients don't have a relay
+        bundle = TransactionBundle(solicit_message, received_over_multicast=True)
+        self.assertEqual(relay_key(bundle), 'link:::')
+
+    def test_str(self):
+        self.assertEqual(str(self.handler), 'HierarchicalRateLimitHandler on relay_key, link_key, duid_key')
+
+    def test_pre(self):
+        bundle = TransactionBundle(relayed_solicit_message, received_over_multicast=False)
+
+        with patch('time.monotonic', return_value=1000.0):
+            self.handler.pre(bundle)
+            self.handler.pre(bundle)
+            with self.assertRaisesRegex(CannotRespondError, 'duid:'):
+                self.handler.pre(bundle)
+
+        exported = self.handler.export_statistics()
+        self.assertEqual(list(exported.keys()), ['HierarchicalRateLimitHandler level 1 on relay_key',
+                                                 'HierarchicalRateLimitHandler level 2 on link_key',
+                                                 'HierarchicalRateLimitHandler level 3 on duid_key'])
+        self.assertEqual([level['rejections'] for level in exported.values()], [0, 0, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,3 @@
+"""
+Tests for the static assignments extension
+"""
@@ -0,0 +1,60 @@
+"""
+Test the Bloom filter in shared memory
+"""
+import unittest
+
+from dhcpkit.ipv6.server.extensions.static_assignments.bloom import SharedBloomFilter
+
+
+class SharedBloomFilterTestCase(unittest.TestCase):
+    def test_size(self):
+        bloom_filter = SharedBloomFilter(capacity=1000, error_rate=0.01)
+        self.assertEqual(bloom_filter.bit_count, 16384)
+        self.assertEqual(bloom_filter.hash_count, 11)
+
+    def test_positions(self):
+        bloom_filter = SharedBloomFilter(capacity=1000)
+        bloom_filter.build(['duid:01'])
+
+        # The positions are the same as the ones that are checked
+        bits = memoryview(bloom_filter.bits[bloom_filter.active.value]).cast('B')
+        positions = list(bloom_filter.get_positions('duid:01'))
+        self.assertEqual(len(positions), bloom_filter.hash_count)
+        self.assertEqual(sum(bin(byte).count('1') for byte in bits), len(set(positions)))
+        for position in positions:
+            self.assertTrue(bits[position >> 3] & (1 << (position & 7)))
+
+    def test_no_false_negatives(self):
+        bloom_filter = SharedBloomFilter(capacity=1000)
+        keys = ['duid:{:08x}'.format(number) for number in range(1000)]
+        self.assertEqual(bloom_filter.build(keys), 1000)
+        self.assertEqual(len(bloom_filter), 1000)
+
+        for key in keys:
+            self.assertIn(key, bloom_filter)
+
+    def test_false_positive_rate(self):
+        bloom_filter = SharedBloomFilter(capacity=1000, error_rate=0.01)
+        bloom_filter.build('duid:{:08x}'.format(number) for number in range(1000))
+
+        false_positives = sum('interface-id:{:08x}'.format(number) in bloom_filter for number in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_rebuild(self):
+        bloom_filter = SharedBloomFilter(capacity=10)
+        bloom_filter.build(['duid:01'])
+        self.assertEqual(bloom_filter.active.value, 1)
+        self.assertIn('duid:01', bloom_filter)
+
+        bloom_filter.build(['duid:02'])
+        self.assertEqual(bloom_filter.active.value, 0)
+        self.assertNotIn('duid:01', bloom_filter)
+        self.assertIn('duid:02', bloom_filter)
+
+        bloom_filter.build([])
+        self.assertEqual(len(bloom_filter), 0)
+        self.assertNotIn('duid:02', bloom_filter)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+"""
+Test reloading CSV based static assignments while the server is running
+"""
+import os
+import tempfile
+import unittest
+from ipaddress import IPv6Address, IPv6Network
+from unittest.mock import patch
+
+from dhcpkit.ipv6.server.extensions.static_assignments import Assignment
+from dhcpkit.ipv6.server.extensions.static_assignments.csv import CSVStaticAssignmentHandler, LiveCSVIndex
+from dhcpkit.ipv6.server.identifiers import encode_key
+from dhcpkit.ipv6.server.transaction_bundle import TransactionBundle
+from dhcpkit.tests.ipv6.messages.test_relay_forward_message import relayed_solicit_message
+
+CSV_LINES = [
+    "id,address,prefix",
+    "duid:000100011d1d6071002436ef1d89,,2001:db8:0201::/48",
+    "interface-id:4661322f31,2001:db8:0:1::2:2,2001:db8:0202::/48",
+    "interface-id-str:Fa2/3,2001:db8:0:1::2:3,",
+    "remote-id:9:020023000001000a0003000100211c7d486e,2001:db8:0:1::2:4,2001:db8:0204::/48",
+    "subscriber-id-str:Customer5,2001:db8:0:1::2:5,2001:db8:0205::/48",
+    "linklayer-id:1:002436ef1d89,2001:db8:0:1::2:6,",
+]
+
+
+class LiveCSVIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.csv_filename = os.path.join(self.temp_dir.name, 'assignments.csv')
+        self.write_csv(CSV_LINES)
+
+        self.live_index = LiveCSVIndex(self.csv_filename, max_delta_fraction=0.5)
+        self.live_index.reload()
+
+        # Simulate a worker process, which gets a pickled copy
+        self.worker_index = LiveCSVIndex.__new__(LiveCSVIndex)
+        self.worker_index.__dict__.update(self.live_index.__getstate__())
+
+    def tearDown(self):
+        self.worker_index.close()
+        self.live_index.finalizer()
+        self.temp_dir.cleanup()
+
+    def write_csv(self, lines):
+        with open(self.csv_filename, 'w') as csv_file:
+            csv_file.write('\n'.join(lines) + '\n')
+
+        # Make sure the change is noticed even on file systems with a coarse timestamp resolution
+        stat = os.stat(self.csv_filename)
+        os.utime(self.csv_filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+
+    def lookup(self, row_id: str) -> Assignment:
+        self.worker_index.refresh()
+        return self.worker_index.lookup(encode_key(row_id))
+
+    def test_initial(self):
+        self.assertEqual(len(self.live_index.assignments), 6)
+        self.assertEqual(self.lookup('interface-id:4661322f33'),
+                         Assignment(address=IPv6Address('2001:db8:0:1::2:3'), prefix=None))
+        self.assertIsNone(self.lookup('interface-id:4661322f34'))
+        self.assertFalse(self.live_index.check())
+
+    def test_changes(self):
+        lines = list(CSV_LINES)
+        lines[3] = "interface-id-str:Fa2/3,2001:db8:0:1::2:33,"
+        del lines[5]
+        lines.append("interface-id-str:Fa2/4,2001:db8:0:1::2:7,")
+
+        with patch.object(CSVStaticAssignmentHandler, 'parse_csv_row',
+                          wraps=CSVStaticAssignmentHandler.parse_csv_row) as parse_csv_row:
+            self.write_csv(lines)
+            self.assertTrue(self.live_index.check())
+
+        # Only the changed rows are parsed
+        self.assertEqual(parse_csv_row.call_count, 2)
+
+        statistics = self.live_index.export()
+        self.assertEqual(statistics['reloads'], 1)
+        self.assertEqual(statistics['added'], 1)
+        self.assertEqual(statistics['removed'], 1)
+        self.assertEqual(statistics['changed'], 1)
+        self.assertEqual(statistics['compactions'], 0)
+        self.assertEqual(statistics['delta_size'], 3)
+
+        self.assertEqual(self.lookup('interface-id:4661322f33').address, IPv6Address('2001:db8:0:1::2:33'))
+        self.assertEqual(self.lookup('interface-id:4661322f34').address, IPv6Address('2001:db8:0:1::2:7'))
+        self.assertIsNone(self.lookup('subscriber-id:437573746f6d657235'))
+        self.assertEqual(self.lookup('duid:000100011d1d6071002436ef1d89').prefix, IPv6Network('2001:db8:0201::/48'))
+
+        # Changing a row back removes it from the delta
+        lines[3] = CSV_LINES[3]
+        self.write_csv(lines)
+        self.assertTrue(self.live_index.check())
+        self.assertEqual(self.live_index.export()['delta_size'], 2)
+        self.assertEqual(self.lookup('interface-id:4661322f33').address, IPv6Address('2001:db8:0:1::2:3'))
+
+        # Old index files are cleaned up
+        self.assertEqual(sorted(os.listdir(self.live_index.directory)), ['base-1.idx', 'delta-3.idx'])
+
+    def test_compaction(self):
+        lines = CSV_LINES[:1] + ["interface-id:{:02x},2001:db8::{:x},".format(number, number)
+                                 for number in range(10)]
+        self.write_csv(lines)
+        self.assertTrue(self.live_index.check())
+
+        statistics = self.live_index.export()
+        self.assertEqual(statistics['compactions'], 1)
+        self.assertEqual(statistics['delta_size'], 0)
+        self.assertEqual(statistics['assignments'], 10)
+
+        self.assertEqual(self.lookup('interface-id:09').address, IPv6Address('2001:db8::9'))
+        self.assertIsNone(self.lookup('interface-id:4661322f33'))
+        self.assertEqual(os.listdir(self.live_index.directory), ['base-2.idx'])
+
+    def test_bad_file(self):
+        self.write_csv(["foo,bar", "1,2"])
+        with self.assertRaisesRegex(ValueError, "must have columns"):
+            self.live_index.check()
+
+        # The old assignments stay in use
+        self.assertEqual(len(self.live_index.assignments), 6)
+        self.assertIsNotNone(self.lookup('interface-id:4661322f33'))
+
+    def test_handler(self):
+        handler = CSVStaticAssignmentHandler(self.csv_filename, 1, 2, 3, 4, reload_interval=3600)
+        self.assertIsNone(handler.mapping)
+
+        # The interface-id of the relay closest to the client is Fa2/3
+        bundle = TransactionBundle(relayed_solicit_message, received_over_multicast=False)
+        self.assertEqual(handler.get_assignment(bundle),
+                         Assignment(address=IPv6Address('2001:db8:0:1::2:3'), prefix=None))
+
+        # Without the interface-id the remote-id is used
+        self.write_csv(CSV_LINES[:3] + CSV_LINES[4:])
+        self.assertTrue(handler.live_index.check())
+        self.assertEqual(handler.get_assignment(bundle),
+                         Assignment(address=IPv6Address('2001:db8:0:1::2:4'), prefix=IPv6Network('2001:db8:0204::/48')))
+
+        self.assertEqual(handler.export_statistics()[str(handler)]['removed'], 1)
+
+        handler.live_index.close()
+        handler.live_index.finalizer()
+
+    def test_handler_without_reload(self):
+        handler = CSVStaticAssignmentHandler(self.csv_filename, 1, 2, 3, 4)
+        self.assertIsNone(handler.live_index)
+        self.assertEqual(len(handler.mapping), 6)
+        self.assertEqual(handler.export_statistics(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+"""
+Test the compiled index of static assignments
+"""
+import os
+import tempfile
+import unittest
+from ipaddress import IPv6Address, IPv6Network
+
+from dhcpkit.ipv6.server.extensions.static_assignments import Assignment
+from dhcpkit.ipv6.server.extensions.static_assignments.csv import CSVStaticAssignmentHandler
+from dhcpkit.ipv6.server.extensions.static_assignments.index import AssignmentIndex, IndexStaticAssignmentHandler, \
+    write_index
+from dhcpkit.ipv6.server.identifiers import encode_key
+from dhcpkit.ipv6.server.transaction_bundle import TransactionBundle
+from dhcpkit.tests.ipv6.messages.test_relay_forward_message import relayed_solicit_message
+
+CSV_DATA = """id,address,prefix
+duid:000100011d1d6071002436ef1d89,,2001:db8:0201::/48
+interface-id:4661322f31,2001:db8:0:1::2:2,2001:db8:0202::/48
+interface-id-str:Fa2/3,2001:db8:0:1::2:3,
+remote-id:9:020023000001000a0003000100211c7d486e,2001:db8:0:1::2:4,2001:db8:0204::/48
+subscriber-id-str:Customer5,2001:db8:0:1::2:5,2001:db8:0205::/48
+linklayer-id:1:002436ef1d89,2001:db8:0:1::2:6,
+"""
+
+
+class IndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.csv_filename = os.path.join(self.temp_dir.name, 'assignments.csv')
+        self.index_filename = os.path.join(self.temp_dir.name, 'assignments.idx')
+
+        with open(self.csv_filename, 'w') as csv_file:
+            csv_file.write(CSV_DATA)
+
+        self.assignments = list(CSVStaticAssignmentHandler.parse_csv_file(self.csv_filename))
+        write_index(self.assignments, self.index_filename)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_lookup(self):
+        index = AssignmentIndex(self.index_filename)
+        self.assertEqual(len(index), 6)
+
+        for row_id, assignment in self.assignments:
+            with self.subTest(row_id=row_id):
+                self.assertEqual(index.lookup(encode_key(row_id)), assignment)
+
+        self.assertIsNone(index.lookup(encode_key('duid:000100011d1d6071002436ef1d8a')))
+        index.close()
+
+    def test_many_assignments(self):
+        assignments = [('duid:00030001{:012x}'.format(number),
+                        Assignment(address=IPv6Address('2001:db8::') + number, prefix=None))
+                       for number in range(5000)]
+        write_index(assignments, self.index_filename)
+
+        index = AssignmentIndex(self.index_filename)
+        self.assertEqual(len(index), 5000)
+        for row_id, assignment in assignments:
+            self.assertEqual(index.lookup(encode_key(row_id)), assignment)
+        index.close()
+
+    def test_duplicates(self):
+        write_index([('interface-id:01', Assignment(address=IPv6Address('2001:db8::1'), prefix=None)),
+                     ('interface-id:01', Assignment(address=IPv6Address('2001:db8::2'), prefix=None))],
+                    self.index_filename)
+
+        index = AssignmentIndex(self.index_filename)
+        self.assertEqual(len(index), 1)
+        self.assertEqual(index.lookup(encode_key('interface-id:01')).address, IPv6Address('2001:db8::2'))
+        index.close()
+
+    def test_replace(self):
+        index = AssignmentIndex(self.index_filename)
+        write_index([], self.index_filename)
+
+        # The old index stays usable until it is opened again
+        self.assertEqual(len(index), 6)
+        self.assertIsNotNone(index.lookup(encode_key(self.assignments[0][0])))
+        index.close()
+
+        index = AssignmentIndex(self.index_filename)
+        self.assertEqual(len(index), 0)
+        self.assertIsNone(index.lookup(encode_key(self.assignments[0][0])))
+        index.close()
+
+        self.assertEqual(sorted(os.listdir(self.temp_dir.name)), ['assignments.csv', 'assignments.idx'])
+
+    def test_bad_file(self):
+        with self.assertRaisesRegex(ValueError, 'not an assignment index'):
+            AssignmentIndex(self.csv_filename)
+
+    def test_bad_key(self):
+        with self.assertRaisesRegex(ValueError, 'Unsupported ID type'):
+            encode_key('mac:002436ef1d89')
+
+    def test_handler(self):
+        handler = IndexStaticAssignmentHandler(self.index_filename, 1, 2, 3, 4)
+        handler.worker_init()
+
+        # The interface-id of the relay closest to the client is Fa2/3
+        bundle = TransactionBundle(relayed_solicit_message, received_over_multicast=False)
+        self.assertEqual(handler.get_assignment(bundle),
+                         Assignment(address=IPv6Address('2001:db8:0:1::2:3'), prefix=None))
+
+        handler.index.close()
+
+    def test_handler_remote_id(self):
+        write_index(self.assignments[3:], self.index_filename)
+        handler = IndexStaticAssignmentHandler(self.index_filename, 1, 2, 3, 4)
+        handler.worker_init()
+
+        bundle = TransactionBundle(relayed_solicit_message, received_over_multicast=False)
+        self.assertEqual(handler.get_assignment(bundle),
+                         Assignment(address=IPv6Address('2001:db8:0:1::2:4'),
+                                    prefix=IPv6Network('2001:db8:0204::/48')))
+
+        handler.index.close()
+        write_index([], self.index_filename)
+        handler.worker_init()
+        self.assertEqual(handler.get_assignment(bundle), Assignment(address=None, prefix=None))
+        handler.index.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
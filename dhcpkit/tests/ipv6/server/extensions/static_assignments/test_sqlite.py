@@ -0,0 +1,206 @@
+"""
+Test the SQLite based static assignments, their cache and the read-optimised access modes
+"""
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+from ipaddress import IPv6Address, IPv6Network
+
+from unittest.mock import patch
+
+from dhcpkit.ipv6.server.extensions.static_assignments import Assignment
+from dhcpkit.ipv6.server.extensions.static_assignments.sqlite import SqliteStaticAssignmentHandler
+from dhcpkit.ipv6.server.transaction_bundle import TransactionBundle
+from dhcpkit.tests.ipv6.messages.test_relay_forward_message import relayed_solicit_message
+
+ROWS = [
+    ('interface-id:4661322f33', '2001:db8:0:1::2:3', None),
+    ('remote-id:9:020023000001000a0003000100211c7d486e', '2001:db8:0:1::2:4', '2001:db8:0204::/48'),
+]
+
+
+class SqliteTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.sqlite_filename = os.path.join(self.temp_dir.name, 'assignments.sqlite')
+
+        self.db = sqlite3.connect(self.sqlite_filename)
+        with self.db:
+            self.db.execute("CREATE TABLE assignments ("
+                            "id TEXT NOT NULL PRIMARY KEY, "
+                            "address TEXT, "
+                            "prefix TEXT, "
+                            "csv_mtime INT NOT NULL"
+                            ") WITHOUT ROWID")
+            self.db.executemany("INSERT INTO assignments (id, address, prefix, csv_mtime) VALUES (?, ?, ?, 0)", ROWS)
+
+        self.bundle = TransactionBundle(relayed_solicit_message, received_over_multicast=False)
+
+    def tearDown(self):
+        self.db.close()
+        self.temp_dir.cleanup()
+
+    def create_handler(self, cache_size: int, bloom_filter: bool = False, **kwargs) -> SqliteStaticAssignmentHandler:
+        handler = SqliteStaticAssignmentHandler(self.sqlite_filename, 1, 2, 3, 4,
+                                                cache_size=cache_size, bloom_filter=bloom_filter, **kwargs)
+        handler.worker_init()
+        self.addCleanup(handler.source_db.close)
+        self.addCleanup(lambda: handler.db.close())
+        return handler
+
+    def test_without_cache(self):
+        handler = self.create_handler(cache_size=0)
+
+        # The interface-id of the relay closest to the client is Fa2/3
+        self.assertEqual(handler.get_assignment(self.bundle),
+                         Assignment(address=IPv6Address('2001:db8:0:1::2:3'), prefix=None))
+        self.assertEqual(len(handler.cache), 0)
+        self.assertEqual(handler.export_statistics(), {})
+
+    def test_cache(self):
+        handler = self.create_handler(cache_size=10)
+
+        for count in range(3):
+            self.assertEqual(handler.get_assignment(self.bundle),
+                             Assignment(address=IPv6Address('2001:db8:0:1::2:3'), prefix=None))
+
+        statistics = handler.export_statistics()[str(handler)]
+        self.assertEqual(statistics['hits'], 2)
+        self.assertEqual(statistics['misses'], 1)
+        self.assertEqual(statistics['invalidations'], 0)
+        self.assertAlmostEqual(statistics['hit_ratio'], 2 / 3)
+
+    def test_invalidation(self):
+        handler = self.create_handler(cache_size=10)
+        handler.get_assignment(self.bundle)
+
+        with self.db:
+            self.db.execute("DELETE FROM assignments WHERE id = 'interface-id:4661322f33'")
+
+        # The change isn't seen until the next check
+        self.assertEqual(handler.get_assignment(self.bundle).address, IPv6Address('2001:db8:0:1::2:3'))
+
+        handler.next_cache_check = 0.0
+        self.assertEqual(handler.get_assignment(self.bundle),
+                         Assignment(address=IPv6Address('2001:db8:0:1::2:4'), prefix=IPv6Network('2001:db8:0204::/48')))
+        self.assertEqual(handler.export_statistics()[str(handler)]['invalidations'], 1)
+
+    def test_eviction(self):
+        handler = self.create_handler(cache_size=2)
+        handler.check_cache()
+        handler.cache[('duid:01',)] = Assignment(address=None, prefix=None)
+        handler.cache[('duid:02',)] = Assignment(address=None, prefix=None)
+
+        # Adding the lookup of the bundle removes the least recently used entry
+        handler.get_assignment(self.bundle)
+        self.assertEqual(len(handler.cache), 2)
+        self.assertNotIn(('duid:01',), handler.cache)
+        self.assertIn(('duid:02',), handler.cache)
+
+        # A hit makes the entry the most recently used one
+        handler.get_assignment(self.bundle)
+        self.assertEqual(list(handler.cache)[0], ('duid:02',))
+
+    def test_bloom_filter(self):
+        handler = self.create_handler(cache_size=0, bloom_filter=True)
+        self.assertEqual(len(handler.bloom_filter), 2)
+        self.assertEqual(handler.bloom_filter.capacity, 1024)
+
+        self.assertEqual(handler.get_assignment(self.bundle),
+                         Assignment(address=IPv6Address('2001:db8:0:1::2:3'), prefix=None))
+        self.assertEqual(handler.find_assignment(['duid:01']), Assignment(address=None, prefix=None))
+
+        statistics = handler.export_statistics()[str(handler)]
+        self.assertEqual(statistics['skipped_lookups'], 1)
+        self.assertEqual(statistics['false_positives'], 0)
+        self.assertNotIn('hits', statistics)
+
+    def test_bloom_filter_rebuild(self):
+        handler = self.create_handler(cache_size=0, bloom_filter=True)
+
+        with self.db:
+            self.db.execute("INSERT INTO assignments (id, address, prefix, csv_mtime) "
+                            "VALUES ('duid:01', '2001:db8::1', NULL, 0)")
+
+        # New identifiers are skipped until the filter is rebuilt
+        self.assertEqual(handler.find_assignment(['duid:01']), Assignment(address=None, prefix=None))
+
+        handler.build_bloom_filter(self.db)
+        self.assertEqual(handler.find_assignment(['duid:01']),
+                         Assignment(address=IPv6Address('2001:db8::1'), prefix=None))
+
+        # Identifiers that were removed are false positives until the filter is rebuilt
+        with self.db:
+            self.db.execute("DELETE FROM assignments WHERE id = 'duid:01'")
+        self.assertEqual(handler.find_assignment(['duid:01']), Assignment(address=None, prefix=None))
+        self.assertEqual(handler.export_statistics()[str(handler)]['false_positives'], 1)
+
+    @patch('dhcpkit.ipv6.server.extensions.static_assignments.sqlite.CHANGE_CHECK_INTERVAL', 0.01)
+    def test_bloom_filter_watcher(self):
+        handler = self.create_handler(cache_size=0, bloom_filter=True)
+        with self.db:
+            self.db.execute("INSERT INTO assignments (id, address, prefix, csv_mtime) "
+                            "VALUES ('duid:01', '2001:db8::1', NULL, 0)")
+
+        deadline = time.monotonic() + 5
+        while 'duid:01' not in handler.bloom_filter and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        self.assertIn('duid:01', handler.bloom_filter)
+        self.assertEqual(len(handler.bloom_filter), 3)
+
+    def test_precedence(self):
+        with self.db:
+            self.db.execute("INSERT INTO assignments (id, address, prefix, csv_mtime) "
+                            "VALUES ('linklayer-id:1:002436ef1d89', '2001:db8::1', NULL, 0)")
+
+        handler = self.create_handler(cache_size=0)
+        remote_id = 'remote-id:9:020023000001000a0003000100211c7d486e'
+        linklayer_id = 'linklayer-id:1:002436ef1d89'
+
+        # The identifiers are used in the given order, not in the order of the database
+        self.assertEqual(handler.find_assignment([remote_id, linklayer_id]).address, IPv6Address('2001:db8:0:1::2:4'))
+        self.assertEqual(handler.find_assignment([linklayer_id, remote_id]).address, IPv6Address('2001:db8::1'))
+        self.assertEqual(handler.find_assignment(['duid:01', 'duid:02', linklayer_id]).address,
+                         IPv6Address('2001:db8::1'))
+
+        # More identifiers than there are statements for
+        possible_ids = ['duid:{:02x}'.format(number) for number in range(10)] + [remote_id]
+        self.assertEqual(handler.find_assignment(possible_ids).address, IPv6Address('2001:db8:0:1::2:4'))
+        self.assertIsNone(handler.query_assignment(possible_ids[:-1]))
+
+    def test_read_only(self):
+        handler = self.create_handler(cache_size=0, read_only=True, mmap_size=1048576, page_cache_size=1048576)
+        self.assertEqual(handler.get_assignment(self.bundle).address, IPv6Address('2001:db8:0:1::2:3'))
+        self.assertEqual(handler.db.execute("PRAGMA cache_size").fetchone()[0], -1024)
+
+        with self.assertRaisesRegex(sqlite3.OperationalError, 'readonly'):
+            handler.db.execute("DELETE FROM assignments")
+
+    def test_in_memory(self):
+        handler = self.create_handler(cache_size=0, in_memory=True)
+        self.assertIsNot(handler.db, handler.source_db)
+        self.assertEqual(handler.get_assignment(self.bundle).address, IPv6Address('2001:db8:0:1::2:3'))
+
+        with self.db:
+            self.db.execute("DELETE FROM assignments WHERE id = 'interface-id:4661322f33'")
+
+        # The change isn't seen until the next check
+        self.assertEqual(handler.get_assignment(self.bundle).address, IPv6Address('2001:db8:0:1::2:3'))
+
+        handler.next_cache_check = 0.0
+        self.assertEqual(handler.get_assignment(self.bundle).address, IPv6Address('2001:db8:0:1::2:4'))
+        self.assertEqual(handler.export_statistics(), {str(handler): {'reloads': 1}})
+
+    def test_in_memory_without_backup(self):
+        with patch('dhcpkit.ipv6.server.extensions.static_assignments.sqlite.HAS_BACKUP', False):
+            handler = self.create_handler(cache_size=0, in_memory=True)
+
+        self.assertIsNot(handler.db, handler.source_db)
+        self.assertEqual(handler.get_assignment(self.bundle).address, IPv6Address('2001:db8:0:1::2:3'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+"""
+Test replaying captured requests
+"""
+import os
+import select
+import tempfile
+import time
+import unittest
+from ipaddress import IPv6Address
+
+from dhcpkit.common.pcap import LINKTYPE_RAW, UDPDatagram
+from dhcpkit.ipv6.messages import RelayReplyMessage
+from dhcpkit.ipv6.options import InterfaceIdOption, RelayMessageOption
+from dhcpkit.ipv6.server.listeners import IncompleteMessage
+from dhcpkit.ipv6.server.listeners.pcap import MemoryReplier, PcapListener, read_captured_requests
+from dhcpkit.tests.common.pcap.test_pcap import ipv6_udp_packet, pcap_file
+from dhcpkit.tests.ipv6.messages.test_advertise_message import advertise_message
+from dhcpkit.tests.ipv6.messages.test_solicit_message import solicit_message
+
+
+def captured_request(timestamp: float) -> UDPDatagram:
+    return UDPDatagram(timestamp=timestamp,
+                       source_address=IPv6Address('fe80::1'), source_port=546,
+                       destination_address=IPv6Address('ff02::1:2'), destination_port=547,
+                       payload=bytes(solicit_message.save()))
+
+
+relay_reply_message = RelayReplyMessage(hop_count=0, link_address=IPv6Address('2001:db8::1'),
+                                        peer_address=IPv6Address('fe80::1'),
+                                        options=[RelayMessageOption(relayed_message=advertise_message)])
+
+
+class ReadCapturedRequestsTestCase(unittest.TestCase):
+    def test_read(self):
+        with tempfile.TemporaryDirectory() as tmp_dir_name:
+            pcap_name = os.path.join(tmp_dir_name, 'test.pcap')
+            with open(pcap_name, 'wb') as capture_file:
+                capture_file.write(pcap_file([
+                    (1000, 0, ipv6_udp_packet(bytes(solicit_message.save()))),
+                    (1001, 0, ipv6_udp_packet(bytes(advertise_message.save()), 547, 546)),
+                    # Replies to relays go to the server port as well
+                    (1002, 0, ipv6_udp_packet(bytes(relay_reply_message.save()), 547, 547)),
+                    (1003, 0, ipv6_udp_packet(bytes(solicit_message.save()))),
+                ], LINKTYPE_RAW).getvalue())
+
+            requests = read_captured_requests([pcap_name, pcap_name])
+
+        # Both captures start at 0
+        self.assertEqual([request.timestamp for request in requests], [0, 0, 3, 3])
+        self.assertEqual(requests[0].payload, bytes(solicit_message.save()))
+
+
+class MemoryReplierTestCase(unittest.TestCase):
+    def test_send_replies(self):
+        replier = MemoryReplier(42)
+        self.assertEqual(replier.send_replies([relay_reply_message, relay_reply_message]), 2)
+        self.assertEqual(replier.get_result(), (42, [bytes(advertise_message.save())] * 2))
+
+
+class PcapListenerTestCase(unittest.TestCase):
+    def wait_for_pending(self, listener: PcapListener, count: int):
+        deadline = time.monotonic() + 5
+        while len(listener.pending) < count and time.monotonic() < deadline:
+            select.select([listener], [], [], 0.1)
+
+    def test_replay(self):
+        listener = PcapListener('test', [captured_request(0), captured_request(1)], repeat=2, keep_replies=True,
+                                marks=['replayed'])
+        self.assertEqual(str(listener), 'PcapListener for test')
+
+        self.wait_for_pending(listener, 4)
+        self.assertEqual(select.select([listener], [], [], 0)[0], [listener])
+
+        requests = listener.recv_requests(10)
+        self.assertEqual(len(requests), 4)
+        self.assertEqual(select.select([listener], [], [], 0)[0], [])
+        self.assertRaises(IncompleteMessage, listener.recv_request)
+
+        packet, replier = requests[0]
+        self.assertEqual(packet.data, bytes(solicit_message.save()))
+        self.assertEqual(packet.source_address, IPv6Address('fe80::1'))
+        self.assertEqual(packet.link_address, IPv6Address('::'))
+        self.assertTrue(packet.received_over_multicast)
+        self.assertEqual(packet.marks, ['replayed'])
+        self.assertEqual(packet.relay_options, [InterfaceIdOption(interface_id=b'pcap')])
+        self.assertIsInstance(replier, MemoryReplier)
+
+        # Pretend that the last one was dropped, and that the others got a reply
+        for packet, replier in requests[:3]:
+            listener.request_dispatched()
+
+        self.assertFalse(listener.expired)
+        for packet, replier in requests[:3]:
+            replier.send_reply(relay_reply_message)
+            listener.request_completed(replier.get_result())
+
+        self.assertTrue(listener.expired)
+        self.assertEqual(listener.timeout, 0)
+        self.assertEqual(listener.replies[0], [bytes(advertise_message.save())])
+
+        exported = listener.export_statistics()['PcapListener for test']
+        self.assertEqual(exported['requests'], 4)
+        self.assertEqual(exported['replayed'], 4)
+        self.assertEqual(exported['dropped'], 1)
+        self.assertEqual(exported['completed'], 3)
+        self.assertEqual(exported['replies'], 3)
+        self.assertIn('latency_p99', exported)
+
+        listener.close()
+        self.assertEqual(listener.recv_requests(10), [])
+
+    def test_max_in_flight(self):
+        listener = PcapListener('test', [captured_request(0)], repeat=5, max_in_flight=2)
+        try:
+            self.wait_for_pending(listener, 2)
+            time.sleep(0.1)
+            self.assertEqual(len(listener.pending), 2)
+
+            for packet, replier in listener.recv_requests(10):
+                listener.request_dispatched()
+
+            # A failed request makes room for the next one
+            listener.request_completed()
+            self.wait_for_pending(listener, 1)
+            self.assertEqual(len(listener.pending), 1)
+            self.assertEqual(listener.failed, 1)
+        finally:
+            listener.close()
+
+    def test_captured_timing(self):
+        listener = PcapListener('test', [captured_request(0), captured_request(10)], speed=20)
+        try:
+            self.wait_for_pending(listener, 1)
+            self.assertEqual(len(listener.pending), 1)
+
+            # The second request is due after 10 / 20 seconds
+            self.wait_for_pending(listener, 2)
+            self.assertEqual(len(listener.pending), 2)
+            self.assertFalse(listener.expired)
+        finally:
+            listener.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,415 @@
+"""
+Test the TCP connection listener
+"""
+import select
+import socket
+import threading
+import time
+import unittest
+from ipaddress import IPv6Address, IPv6Network
+from struct import pack, unpack_from
+from unittest.mock import patch
+
+from dhcpkit.ipv6 import SERVER_PORT
+from dhcpkit.ipv6.messages import Message, RelayReplyMessage
+from dhcpkit.ipv6.options import RelayMessageOption
+from dhcpkit.ipv6.server.listeners import ClosedListener, IncompleteMessage
+from dhcpkit.ipv6.server.listeners.tcp import MAX_MESSAGE_SIZE, PAUSE_CHECK_INTERVAL, TCPConnection, \
+    TCPConnectionListener, TCPReplier
+from dhcpkit.tests.ipv6.messages.test_advertise_message import advertise_message
+
+
+def frame(data: bytes) -> bytes:
+    return pack('!H', len(data)) + data
+
+
+class TCPTestCase(unittest.TestCase):
+    def setUp(self):
+        listen_socket = socket.socket(socket.AF_INET6, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+        listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            listen_socket.bind(('::1', SERVER_PORT))
+        except OSError as e:
+            listen_socket.close()
+            raise unittest.SkipTest("Cannot bind to the DHCPv6 server port: {}".format(e))
+
+        listen_socket.listen(1)
+        self.client_socket = socket.create_connection(('::1', SERVER_PORT))
+        self.server_socket = listen_socket.accept()[0]
+        listen_socket.close()
+
+        self.connection = TCPConnection('lo', self.server_socket, threading.Lock(), IPv6Address('2001:db8::1'),
+                                        marks=['test'])
+
+    def tearDown(self):
+        self.client_socket.close()
+        self.server_socket.close()
+
+
+class TCPConnectionTestCase(TCPTestCase):
+    def test_recv_request(self):
+        # Send two messages, the second one in pieces
+        self.client_socket.sendall(frame(b'\x01\x00\x00\x01') + frame(b'\x01\x00\x00\x02')[:3])
+
+        packet, replier = self.connection.recv_request()
+        self.assertEqual(packet.data, b'\x01\x00\x00\x01')
+        self.assertEqual(packet.source_address, IPv6Address('::1'))
+        self.assertEqual(packet.link_address, IPv6Address('2001:db8::1'))
+        self.assertEqual(packet.marks, ['test'])
+        self.assertTrue(packet.received_over_tcp)
+        self.assertIsInstance(replier, TCPReplier)
+
+        self.assertRaises(IncompleteMessage, self.connection.recv_request)
+
+        self.client_socket.sendall(b'\x00\x00\x02')
+        packet, replier = self.connection.recv_request()
+        self.assertEqual(packet.data, b'\x01\x00\x00\x02')
+
+    def test_recv_requests(self):
+        messages = [bytes([1, 0, 0, number]) * (number + 1) for number in range(100)]
+        data = b''.join(frame(message) for message in messages)
+
+        # Send everything except the last byte
+        self.client_socket.sendall(data[:-1])
+        received = []
+        while len(received) < 99:
+            try:
+                received += [packet.data for packet, replier in self.connection.recv_requests(1)]
+            except IncompleteMessage:
+                pass
+        self.assertEqual(received, messages[:99])
+
+        self.client_socket.sendall(data[-1:])
+        received = [packet.data for packet, replier in self.connection.recv_requests(1)]
+        self.assertEqual(received, messages[99:])
+
+    def test_large_messages(self):
+        # Enough maximum size messages to make the buffer wrap around a few times
+        messages = [bytes([number]) * (MAX_MESSAGE_SIZE - 2) for number in range(5)]
+        sender = threading.Thread(target=self.client_socket.sendall,
+                                  args=(b''.join(frame(message) for message in messages),))
+        sender.start()
+
+        received = []
+        while len(received) < len(messages):
+            try:
+                received += [packet.data for packet, replier in self.connection.recv_requests(1)]
+            except IncompleteMessage:
+                pass
+
+        sender.join()
+        self.assertEqual(received, messages)
+
+    def test_closed(self):
+        self.client_socket.sendall(frame(b'\x01\x00\x00\x01')[:3])
+        self.client_socket.shutdown(socket.SHUT_WR)
+
+        self.assertRaises(IncompleteMessage, self.connection.recv_requests, 1)
+        self.assertRaises(ClosedListener, self.connection.recv_requests, 1)
+
+    def test_idle_timeout(self):
+        with patch('time.monotonic', return_value=1000.0):
+            connection = TCPConnection('lo', self.server_socket, threading.Lock(), IPv6Address('2001:db8::1'),
+                                       idle_timeout=60)
+
+        with patch('time.monotonic', return_value=1050.0):
+            self.assertEqual(connection.timeout, 10)
+            self.assertFalse(connection.expired)
+
+        with patch('time.monotonic', return_value=1060.0):
+            self.assertEqual(connection.timeout, 0)
+            self.assertTrue(connection.expired)
+
+            # Not idle while requests are being handled
+            connection.request_dispatched()
+            self.assertFalse(connection.expired)
+
+        with patch('time.monotonic', return_value=1200.0):
+            connection.request_completed()
+            self.assertFalse(connection.expired)
+
+        with self.assertLogs('dhcpkit.ipv6.server.listeners.tcp', 'INFO') as cm, \
+                patch('time.monotonic', return_value=1260.0):
+            connection.close()
+
+        self.assertRegex(cm.output[0], 'Closing idle TCP connection')
+        self.assertEqual(connection.counters['idle_timeouts'], 1)
+        self.assertTrue(connection.closed)
+
+    def test_no_idle_timeout(self):
+        with patch('time.monotonic', return_value=1000.0):
+            self.assertIsNone(self.connection.timeout)
+            self.assertFalse(self.connection.expired)
+
+    def test_max_in_flight(self):
+        connection = TCPConnection('lo', self.server_socket, threading.Lock(), IPv6Address('2001:db8::1'),
+                                   max_in_flight=2)
+
+        connection.request_dispatched()
+        self.assertFalse(connection.paused)
+        connection.request_dispatched()
+        self.assertTrue(connection.paused)
+        self.assertEqual(connection.timeout, PAUSE_CHECK_INTERVAL)
+        self.assertEqual(connection.counters['paused'], 1)
+
+        connection.request_completed()
+        self.assertFalse(connection.paused)
+        self.assertEqual(connection.in_flight, 1)
+
+    def test_pipelined_max_in_flight(self):
+        connection = TCPConnection('lo', self.server_socket, threading.Lock(), IPv6Address('2001:db8::1'),
+                                   max_in_flight=2)
+        messages = [bytes([1, 0, 0, number]) for number in range(5)]
+        self.client_socket.sendall(b''.join(frame(message) for message in messages))
+
+        received = []
+        while not received:
+            try:
+                received = [packet.data for packet, replier in connection.recv_requests(10)]
+            except IncompleteMessage:
+                pass
+
+        # The rest stays in the buffer until there is room for it
+        self.assertEqual(received, messages[:2])
+        for _ in received:
+            connection.request_dispatched()
+        self.assertTrue(connection.paused)
+        self.assertTrue(connection.has_pending_requests)
+        self.assertEqual(connection.recv_requests(10), [])
+
+        connection.request_completed()
+        self.assertEqual(connection.timeout, 0)
+        received = [packet.data for packet, replier in connection.recv_requests(10)]
+        self.assertEqual(received, messages[2:3])
+
+
+class TCPConnectionListenerTestCase(unittest.TestCase):
+    def setUp(self):
+        listen_socket = socket.socket(socket.AF_INET6, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+        listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            listen_socket.bind(('::1', SERVER_PORT))
+        except OSError as e:
+            listen_socket.close()
+            raise unittest.SkipTest("Cannot bind to the DHCPv6 server port: {}".format(e))
+
+        listen_socket.listen(10)
+        self.listener = TCPConnectionListener('lo', listen_socket, global_address=IPv6Address('2001:db8::1'),
+                                              max_connections=3, max_connections_per_peer=2)
+        self.client_sockets = []
+        self.connections = []
+
+    def tearDown(self):
+        for client_socket in self.client_sockets:
+            client_socket.close()
+        for connection in self.connections:
+            connection.close()
+        self.listener.listen_socket.close()
+
+    def connect(self, source: str = '::1') -> TCPConnection:
+        client_socket = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
+        client_socket.bind((source, 0))
+        client_socket.connect(('::1', SERVER_PORT))
+        self.client_sockets.append(client_socket)
+
+        # Accepting is non-blocking, so wait for the connection to arrive
+        select.select([self.listener], [], [], 1)
+        connection = self.listener.create_listener()
+        if connection:
+            self.connections.append(connection)
+        return connection
+
+    def test_str(self):
+        self.assertEqual(str(self.listener), 'TCPConnectionListener on ::1')
+
+    def test_limits(self):
+        with self.assertLogs('dhcpkit.ipv6.server.listeners.tcp', 'INFO') as cm:
+            self.assertIsInstance(self.connect(), TCPConnection)
+            self.assertIsInstance(self.connect(), TCPConnection)
+
+            # Third connection from the same peer
+            self.assertIsNone(self.connect())
+
+        self.assertRegex(cm.output[-1], 'More than 2 open TCP connections from ::1')
+
+        # Closed connections don't count
+        self.connections.pop().close()
+        self.assertIsInstance(self.connect(), TCPConnection)
+
+        exported = self.listener.export_statistics()['TCPConnectionListener on ::1']
+        self.assertEqual(exported['open_connections'], 2)
+        self.assertEqual(exported['accepted'], 3)
+        self.assertEqual(exported['rejected_max_connections_per_peer'], 1)
+
+    def test_not_allowed(self):
+        self.listener.allow_from = [IPv6Network('2001:db8::/32')]
+        with self.assertLogs('dhcpkit.ipv6.server.listeners.tcp', 'ERROR'):
+            self.assertIsNone(self.connect())
+
+        self.assertEqual(self.listener.counters['rejected_not_allowed'], 1)
+
+
+class TCPReplierTestCase(unittest.TestCase):
+    def setUp(self):
+        self.replier = TCPReplier(IPv6Address('2001:db8::2'), 12345)
+        self.reply = RelayReplyMessage(options=[RelayMessageOption(relayed_message=advertise_message)])
+
+    def test_send_reply(self):
+        self.assertIsNone(self.replier.get_result())
+        self.assertTrue(self.replier.send_reply(self.reply))
+
+        reply_data, complete = self.replier.get_result()
+        self.assertEqual(reply_data, frame(advertise_message.save()))
+        self.assertTrue(complete)
+
+    def test_send_replies(self):
+        self.assertEqual(self.replier.send_replies([self.reply] * 5000), 5000)
+
+        reply_data, complete = self.replier.get_result()
+        self.assertEqual(reply_data, frame(advertise_message.save()) * 5000)
+        self.assertTrue(complete)
+
+    def test_send_buffer_full(self):
+        self.replier.max_send_buffer = 1000
+        with self.assertLogs('dhcpkit.ipv6.server.listeners.tcp', 'ERROR') as cm:
+            sent = self.replier.send_replies([self.reply] * 5000)
+
+        self.assertLess(sent, 5000)
+        self.assertRegex(cm.output[0], "don't fit in the send buffer of 1000 bytes")
+
+        reply_data, complete = self.replier.get_result()
+        self.assertLessEqual(len(reply_data), 1000)
+        self.assertFalse(complete)
+
+
+class TCPConnectionSendTestCase(TCPTestCase):
+    def setUp(self):
+        super().setUp()
+        self.reply_data = frame(advertise_message.save()) * 5000
+
+    def receive_replies(self, count: int):
+        data = b''
+        replies = []
+        while len(replies) < count:
+            data += self.client_socket.recv(65536)
+            while len(data) >= 2 and len(data) >= 2 + unpack_from('!H', data)[0]:
+                message_length = unpack_from('!H', data)[0]
+                length, message = Message.parse(data, 2, message_length)
+                replies.append(message)
+                data = data[2 + message_length:]
+        return replies
+
+    def limit_socket_buffers(self):
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        self.client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+
+    def test_send_replies(self):
+        replies = []
+        receiver = threading.Thread(target=lambda: replies.extend(self.receive_replies(5000)))
+        receiver.start()
+
+        self.connection.request_dispatched()
+        self.connection.request_completed((self.reply_data, True))
+
+        # The main loop sends the rest when the socket is writable
+        while self.connection.has_unsent_replies:
+            select.select([], [self.connection], [], 1)
+            self.connection.send_unsent_replies()
+        receiver.join()
+
+        self.assertEqual(replies, [advertise_message] * 5000)
+        self.assertFalse(self.connection.expired)
+
+    def test_stalled_client(self):
+        # The client doesn't read, so the send buffers fill up
+        self.limit_socket_buffers()
+        self.connection.send_timeout = 0.1
+
+        self.connection.request_dispatched()
+        self.connection.request_completed((self.reply_data, True))
+        self.assertTrue(self.connection.has_unsent_replies)
+        self.assertEqual(self.connection.timeout, PAUSE_CHECK_INTERVAL)
+        self.assertFalse(self.connection.expired)
+
+        time.sleep(0.2)
+        self.assertTrue(self.connection.expired)
+
+        with self.assertLogs('dhcpkit.ipv6.server.listeners.tcp', 'ERROR') as cm:
+            self.connection.close()
+
+        self.assertRegex(cm.output[0], "the client didn't read any replies for 0.1 seconds")
+        self.assertEqual(self.connection.counters['send_failures'], 1)
+
+    def test_slow_client(self):
+        # The client keeps reading, but too slowly to catch up in time
+        self.limit_socket_buffers()
+        self.connection.max_transfer_time = 0.3
+
+        def slow_reader():
+            try:
+                while self.client_socket.recv(1024):
+                    time.sleep(0.01)
+            except OSError:
+                pass
+
+        reader = threading.Thread(target=slow_reader, daemon=True)
+        reader.start()
+
+        start = time.monotonic()
+        self.connection.request_dispatched()
+        self.connection.request_completed((self.reply_data, True))
+        while not self.connection.expired:
+            select.select([], [self.connection], [], 0.1)
+            self.connection.send_unsent_replies()
+
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertTrue(self.connection.has_unsent_replies)
+        self.assertRegex(self.connection.send_problem, 'within 0.3 seconds')
+
+    def test_send_buffer_full(self):
+        self.limit_socket_buffers()
+        self.connection.max_send_buffer = len(self.reply_data) * 2
+
+        for _ in range(5):
+            self.connection.request_dispatched()
+            self.connection.request_completed((self.reply_data, True))
+
+        self.assertTrue(self.connection.expired)
+        self.assertRegex(self.connection.send_problem, 'the send buffer is full')
+
+    def test_incomplete_replies(self):
+        self.connection.request_dispatched()
+        self.connection.request_completed((bytearray(), False))
+
+        self.assertTrue(self.connection.expired)
+        self.assertRegex(self.connection.send_problem, "don't fit in the send buffer")
+
+    def test_half_closed(self):
+        # The client closes its side of the connection after sending a request
+        self.client_socket.sendall(frame(b'\x01\x00\x00\x01'))
+        self.client_socket.shutdown(socket.SHUT_WR)
+
+        with self.assertLogs('dhcpkit.ipv6.server.listeners.tcp', 'INFO'):
+            requests = []
+            while not self.connection.read_closed:
+                try:
+                    requests += self.connection.recv_requests(1)
+                    for _ in requests:
+                        self.connection.request_dispatched()
+                except IncompleteMessage:
+                    pass
+
+        self.assertEqual(len(requests), 1)
+        self.assertTrue(self.connection.paused)
+        self.assertFalse(self.connection.expired)
+
+        # The reply is still sent, and then the connection is done
+        packet, replier = requests[0]
+        replier.send_reply(RelayReplyMessage(options=[RelayMessageOption(relayed_message=advertise_message)]))
+        self.connection.request_completed(replier.get_result())
+        self.assertEqual(self.receive_replies(1), [advertise_message])
+        self.assertTrue(self.connection.expired)
+
+
+if __name__ == '__main__':
+    unittest.main()
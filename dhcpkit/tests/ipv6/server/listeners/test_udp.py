@@ -0,0 +1,183 @@
+"""
+Test the UDP listener
+"""
+import socket
+import unittest
+from ipaddress import IPv6Address
+from unittest.mock import Mock, patch
+
+from dhcpkit.ipv6 import CLIENT_PORT, SERVER_PORT
+from dhcpkit.ipv6.messages import RelayReplyMessage
+from dhcpkit.ipv6.options import RelayMessageOption
+from dhcpkit.ipv6.server.listeners.factories import ListenerFactory
+from dhcpkit.ipv6.server.listeners.udp import ListeningInterface, PktInfoUDPListener, PktInfoUDPReplier, \
+    UDPListener, UDPReplier, enable_drop_counter, find_drop_counter
+from dhcpkit.tests.ipv6.messages.test_advertise_message import advertise_message
+
+
+class UDPListenerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.listen_socket = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        try:
+            self.listen_socket.bind(('::1', SERVER_PORT))
+        except OSError as e:
+            self.listen_socket.close()
+            raise unittest.SkipTest("Cannot bind to the DHCPv6 server port: {}".format(e))
+
+        self.client_socket = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+        self.listener = UDPListener('lo', self.listen_socket, marks=['test'])
+
+    def tearDown(self):
+        self.listen_socket.close()
+        self.client_socket.close()
+
+    def send_packets(self, count: int):
+        for number in range(count):
+            self.client_socket.sendto(bytes([1, 0, 0, number]), ('::1', SERVER_PORT))
+
+    def test_recv_request(self):
+        self.send_packets(1)
+        packet, replier = self.listener.recv_request()
+
+        self.assertEqual(packet.data, b'\x01\x00\x00\x00')
+        self.assertEqual(packet.source_address, IPv6Address('::1'))
+        self.assertEqual(packet.link_address, IPv6Address('::1'))
+        self.assertEqual(packet.marks, ['test'])
+        self.assertFalse(packet.received_over_multicast)
+        self.assertIsInstance(replier, UDPReplier)
+
+        # The interface is looked up once by the listener, not for every reply
+        self.assertEqual(packet.interface_index, socket.if_nametoindex('lo'))
+        self.assertEqual(replier.interface_index, packet.interface_index)
+        self.assertEqual(replier.interface_name, 'lo')
+
+    def test_send_reply(self):
+        self.send_packets(1)
+        packet, replier = self.listener.recv_request()
+
+        client_socket = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+        try:
+            client_socket.bind(('::1', CLIENT_PORT))
+        except OSError as e:
+            client_socket.close()
+            self.skipTest("Cannot bind to the DHCPv6 client port: {}".format(e))
+        client_socket.settimeout(1)
+
+        outgoing_message = RelayReplyMessage(peer_address=IPv6Address('::1'),
+                                             options=[RelayMessageOption(relayed_message=advertise_message)])
+        with client_socket, patch('socket.if_nametoindex', side_effect=AssertionError("Unexpected lookup")):
+            self.assertTrue(replier.send_reply(outgoing_message))
+            data, sender = client_socket.recvfrom(65536)
+
+        self.assertEqual(data, advertise_message.save())
+
+    def test_recv_requests(self):
+        self.send_packets(5)
+
+        # Don't receive more than asked for
+        requests = self.listener.recv_requests(3)
+        self.assertEqual([packet.data[3] for packet, replier in requests], [0, 1, 2])
+
+        # Stop when there is nothing left
+        requests = self.listener.recv_requests(3)
+        self.assertEqual([packet.data[3] for packet, replier in requests], [3, 4])
+
+        # All message-IDs are unique
+        self.send_packets(2)
+        requests = self.listener.recv_requests(3)
+        self.assertNotEqual(requests[0][0].message_id, requests[1][0].message_id)
+
+    def test_kernel_drops(self):
+        if not self.listener.counts_kernel_drops:
+            raise unittest.SkipTest("The kernel doesn't count dropped packets")
+
+        self.assertEqual(str(self.listener), 'UDPListener for ::1 on lo')
+        self.assertEqual(self.listener.export_statistics(), {'UDPListener for ::1 on lo': {'kernel_drops': 0}})
+
+        # Overflow a small receive buffer
+        ListenerFactory.set_buffer_size(self.listen_socket, socket.SO_RCVBUF, None, 4096)
+        self.send_packets(250)
+
+        self.listener.recv_requests(250)
+
+        # The drop counter is attached to packets that are queued after the drops
+        self.send_packets(1)
+        self.listener.recv_request()
+        self.assertGreater(self.listener.kernel_drops, 0)
+        self.assertEqual(self.listener.export_statistics()['UDPListener for ::1 on lo']['kernel_drops'],
+                         self.listener.kernel_drops)
+
+    def test_no_drop_counter(self):
+        # Platforms other than Linux don't get the socket option or the ancillary data
+        with patch('dhcpkit.ipv6.server.listeners.udp.SO_RXQ_OVFL', None), \
+                patch('dhcpkit.ipv6.server.listeners.udp.DROP_COUNTER_SPACE', 0):
+            sock = Mock()
+            self.assertFalse(enable_drop_counter(sock))
+            sock.setsockopt.assert_not_called()
+            self.assertIsNone(find_drop_counter([(socket.SOL_SOCKET, 40, bytes(4))]))
+
+            self.send_packets(1)
+            packet, replier = self.listener.recv_request()
+            self.assertEqual(self.listener.kernel_drops, 0)
+
+
+class PktInfoUDPListenerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.listen_socket = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        try:
+            self.listen_socket.bind(('::', SERVER_PORT))
+        except OSError as e:
+            self.listen_socket.close()
+            raise unittest.SkipTest("Cannot bind to the DHCPv6 server port: {}".format(e))
+
+        self.client_socket = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+        try:
+            self.client_socket.bind(('::1', CLIENT_PORT))
+        except OSError as e:
+            self.listen_socket.close()
+            self.client_socket.close()
+            raise unittest.SkipTest("Cannot bind to the DHCPv6 client port: {}".format(e))
+        self.client_socket.settimeout(1)
+
+        self.loopback_index = socket.if_nametoindex('lo')
+        self.listener = PktInfoUDPListener(self.listen_socket, [
+            ListeningInterface('lo', self.loopback_index, IPv6Address('2001:db8::1'))
+        ])
+
+    def tearDown(self):
+        self.listen_socket.close()
+        self.client_socket.close()
+
+    def test_receive_and_reply(self):
+        self.client_socket.sendto(b'\x01\x00\x00\x01', ('::1', SERVER_PORT))
+        requests = self.listener.recv_requests(10)
+        self.assertEqual(len(requests), 1)
+
+        packet, replier = requests[0]
+        self.assertEqual(packet.data, b'\x01\x00\x00\x01')
+        self.assertEqual(packet.source_address, IPv6Address('::1'))
+        self.assertEqual(packet.link_address, IPv6Address('2001:db8::1'))
+        self.assertEqual(packet.interface_index, self.loopback_index)
+        self.assertEqual(packet.relay_options[0].interface_id, b'lo')
+        self.assertFalse(packet.received_over_multicast)
+
+        # Replies to unicast requests come from the address the request was sent to
+        self.assertIsInstance(replier, PktInfoUDPReplier)
+        self.assertEqual(replier.reply_from, IPv6Address('::1'))
+
+        outgoing_message = RelayReplyMessage(peer_address=IPv6Address('::1'),
+                                             options=[RelayMessageOption(relayed_message=advertise_message)])
+        self.assertTrue(replier.send_reply(outgoing_message))
+
+        data, sender = self.client_socket.recvfrom(65536)
+        self.assertEqual(data, advertise_message.save())
+        self.assertEqual(sender[:2], ('::1', SERVER_PORT))
+
+    def test_unknown_interface(self):
+        self.listener.interfaces = {}
+        self.client_socket.sendto(b'\x01\x00\x00\x01', ('::1', SERVER_PORT))
+        self.assertEqual(self.listener.recv_requests(10), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
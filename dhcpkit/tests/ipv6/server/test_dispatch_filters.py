@@ -0,0 +1,61 @@
+"""
+Test the built-in dispatch filters
+"""
+import unittest
+from ipaddress import IPv6Address
+
+from dhcpkit.ipv6.duids import LinkLayerDUID, LinkLayerTimeDUID
+from dhcpkit.ipv6.options import InterfaceIdOption
+from dhcpkit.ipv6.server.dispatch_filters import ServerIdDispatchFilter
+from dhcpkit.ipv6.server.listeners import IncomingPacketBundle
+from dhcpkit.ipv6.server.main import dispatch_allowed
+from dhcpkit.ipv6.server.packet_scanner import scan_packet
+from dhcpkit.ipv6.server.statistics import ServerStatistics
+from dhcpkit.tests.ipv6.messages.test_request_message import request_message
+from dhcpkit.tests.ipv6.messages.test_solicit_message import solicit_message
+
+
+class ServerIdDispatchFilterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.our_duid = LinkLayerTimeDUID(hardware_type=1, time=488458703,
+                                          link_layer_address=bytes.fromhex('00137265ca42'))
+        self.other_duid = LinkLayerDUID(hardware_type=1, link_layer_address=bytes.fromhex('00137265ca42'))
+
+    @staticmethod
+    def create_packet(message) -> IncomingPacketBundle:
+        return IncomingPacketBundle(data=bytes(message.save()),
+                                    source_address=IPv6Address('fe80::babe'),
+                                    link_address=IPv6Address('2001:db8::1'),
+                                    relay_options=[InterfaceIdOption(interface_id=b'eth0')])
+
+    def test_str(self):
+        self.assertEqual(str(ServerIdDispatchFilter(self.our_duid)),
+                         'ServerIdDispatchFilter for {}'.format(self.our_duid))
+
+    def test_allow(self):
+        request_packet = scan_packet(self.create_packet(request_message))
+        solicit_packet = scan_packet(self.create_packet(solicit_message))
+
+        self.assertTrue(ServerIdDispatchFilter(self.our_duid).allow(request_packet))
+        self.assertFalse(ServerIdDispatchFilter(self.other_duid).allow(request_packet))
+
+        # Messages without a server-id are always allowed
+        self.assertTrue(ServerIdDispatchFilter(self.other_duid).allow(solicit_packet))
+
+    def test_dispatch_allowed(self):
+        statistics = ServerStatistics()
+        dispatch_filters = [ServerIdDispatchFilter(self.other_duid)]
+
+        self.assertFalse(dispatch_allowed(dispatch_filters, self.create_packet(request_message), statistics))
+        self.assertTrue(dispatch_allowed(dispatch_filters, self.create_packet(solicit_message), statistics))
+
+        # Dropped requests are counted like the message handler would have done
+        exported = statistics.global_stats.export()
+        self.assertEqual(exported['incoming_packets'], 1)
+        self.assertEqual(exported['messages_in']['request'], 1)
+        self.assertEqual(exported['for_other_server'], 1)
+        self.assertEqual(exported['dropped_packets'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+"""
+Test the heavy hitter tracking
+"""
+import unittest
+from unittest.mock import patch
+
+from dhcpkit.ipv6.server import statistics as statistics_module
+from dhcpkit.ipv6.server.heavy_hitters import HeavyHitters, HeavyHittersSet
+from dhcpkit.ipv6.server.statistics import ServerStatistics
+from dhcpkit.ipv6.server.transaction_bundle import TransactionBundle
+from dhcpkit.tests.ipv6.messages.test_relay_forward_message import relayed_solicit_message
+
+
+class HeavyHittersTestCase(unittest.TestCase):
+    def tearDown(self):
+        statistics_module.current_slot = 0
+
+    def test_count_and_top(self):
+        tracker = HeavyHitters(capacity=4, half_life=60, slots=2)
+        for i in range(10):
+            tracker.count(b'busy')
+        for i in range(3):
+            tracker.count(b'medium')
+        tracker.count(b'quiet')
+
+        top = tracker.top(2)
+        self.assertEqual([key for key, rate in top], [b'busy', b'medium'])
+        self.assertGreater(top[0][1], top[1][1])
+
+    def test_sum_over_slots(self):
+        tracker = HeavyHitters(capacity=4, half_life=60, slots=2)
+        tracker.count(b'key')
+
+        # Pretend to be another process in another slot
+        statistics_module.current_slot = 1
+        tracker._index_pid = None
+        tracker.count(b'key')
+        tracker.count(b'other')
+
+        top = dict(tracker.top(10))
+        self.assertAlmostEqual(top[b'key'] / top[b'other'], 2, places=2)
+
+    def test_replace_minimum(self):
+        tracker = HeavyHitters(capacity=2, half_life=60, slots=1)
+
+        # Keep the time still, otherwise later occurrences weigh a little bit more
+        with patch('time.monotonic', return_value=1000.0):
+            tracker.count(b'a')
+            tracker.count(b'a')
+            tracker.count(b'b')
+            tracker.count(b'c')
+
+            # The space-saving algorithm replaces b and inherits its count
+            keys = [key for key, rate in tracker.top(2)]
+            self.assertEqual(keys, [b'a', b'c'])
+
+    def test_replace_after_increase(self):
+        tracker = HeavyHitters(capacity=3, half_life=60, slots=1)
+        with patch('time.monotonic', return_value=1000.0):
+            for key in (b'a', b'b', b'c'):
+                tracker.count(key)
+
+            # The heap still has a and b at their old count
+            for count in range(5):
+                tracker.count(b'a')
+            for count in range(3):
+                tracker.count(b'b')
+
+            tracker.count(b'd')
+            self.assertEqual([key for key, rate in tracker.top(3)], [b'a', b'b', b'd'])
+            self.assertAlmostEqual(dict(tracker.top(3))[b'd'] / dict(tracker.top(3))[b'b'], 2 / 4)
+
+    def test_weight(self):
+        tracker = HeavyHitters(capacity=2, half_life=10, slots=1)
+        with patch('time.monotonic', return_value=1000.0):
+            tracker.count(b'a')
+        with patch('time.monotonic', return_value=1010.0):
+            tracker.count(b'b')
+
+            # An occurrence one half-life ago counts for half
+            top = dict(tracker.top(2))
+            self.assertAlmostEqual(top[b'a'] / top[b'b'], 0.5)
+
+        # Epochs far in the past make the counts rescale instead of overflowing
+        with patch('time.monotonic', return_value=1000000.0):
+            tracker.count(b'a')
+            self.assertEqual(tracker.epochs[0], 1000000.0)
+            self.assertEqual([key for key, rate in tracker.top(2)], [b'a', b'b'])
+
+    def test_decay(self):
+        tracker = HeavyHitters(capacity=2, half_life=10, slots=1)
+        with patch('time.monotonic', return_value=1000.0):
+            tracker.count(b'a')
+            tracker.count(b'a')
+            before = tracker.top(1)[0][1]
+
+        with patch('time.monotonic', return_value=1010.0):
+            after = tracker.top(1)[0][1]
+
+        self.assertAlmostEqual(after, before / 2)
+
+    def test_long_key(self):
+        tracker = HeavyHitters(capacity=2, half_life=10, slots=1)
+        tracker.count(bytes(200))
+        self.assertEqual(tracker.top(1)[0][0], bytes(130))
+
+
+class HeavyHittersSetTestCase(unittest.TestCase):
+    def test_track_bundle(self):
+        server_stats = ServerStatistics()
+        server_stats.set_categories(None)
+        self.assertIsInstance(server_stats.heavy_hitters, HeavyHittersSet)
+
+        bundle = TransactionBundle(relayed_solicit_message, received_over_multicast=False)
+        server_stats.track_heavy_hitters(interface_name='eth0', bundle=bundle)
+
+        exported = server_stats.export()['top']
+        self.assertEqual(exported['interfaces'][0]['key'], 'eth0')
+        self.assertEqual(exported['links'][0]['key'], str(bundle.link_address))
+        self.assertEqual([entry['key'] for entry in exported['relays']], [str(relay) for relay in bundle.relays])
+        self.assertEqual(len(exported['clients']), 1)
+        self.assertIn('eth0', str(server_stats.heavy_hitters))
+
+    def test_disabled(self):
+        server_stats = ServerStatistics()
+        server_stats.set_heavy_hitters(0, 60)
+        self.assertIsNone(server_stats.heavy_hitters)
+
+        # Doesn't crash
+        server_stats.track_heavy_hitters(interface_name='eth0')
+        self.assertNotIn('top', server_stats.export())
+
+    def test_keep_existing(self):
+        server_stats = ServerStatistics()
+        server_stats.set_heavy_hitters(5, 60)
+        existing = server_stats.heavy_hitters
+
+        server_stats.set_heavy_hitters(5, 60)
+        self.assertIs(server_stats.heavy_hitters, existing)
+
+        server_stats.set_heavy_hitters(6, 60)
+        self.assertIsNot(server_stats.heavy_hitters, existing)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+"""
+Test the binary keys for client identifiers
+"""
+import unittest
+
+from dhcpkit.ipv6.duids import LinkLayerDUID
+from dhcpkit.ipv6.messages import RelayForwardMessage
+from dhcpkit.ipv6.options import ClientIdOption
+from dhcpkit.ipv6.server.identifiers import decode_key, encode_key, get_request_keys
+from dhcpkit.ipv6.server.transaction_bundle import TransactionBundle
+from dhcpkit.tests.ipv6.messages.test_relay_forward_message import relayed_solicit_packet
+
+ROW_IDS = [
+    'duid:000100011d1d6071002436ef1d89',
+    'interface-id:4661322f33',
+    'remote-id:9:020023000001000a0003000100211c7d486e',
+    'subscriber-id:437573746f6d657235',
+    'linklayer-id:1:002436ef1d89',
+]
+
+
+class IdentifiersTestCase(unittest.TestCase):
+    def setUp(self):
+        # Parse the packet so the options remember the bytes they were received as
+        length, message = RelayForwardMessage.parse(relayed_solicit_packet)
+        self.bundle = TransactionBundle(message, received_over_multicast=False)
+
+    def test_round_trip(self):
+        for row_id in ROW_IDS:
+            with self.subTest(row_id=row_id):
+                self.assertEqual(decode_key(encode_key(row_id)), row_id)
+
+    def test_encode_key(self):
+        self.assertEqual(encode_key('interface-id:4661322f33'), b'\x02Fa2/3')
+        self.assertEqual(encode_key('linklayer-id:1:002436ef1d89'), bytes.fromhex('050001002436ef1d89'))
+
+    def test_bad_keys(self):
+        with self.assertRaisesRegex(ValueError, 'Unsupported ID type'):
+            encode_key('mac:002436ef1d89')
+        with self.assertRaisesRegex(ValueError, 'Unsupported key type'):
+            decode_key(b'\x09abc')
+
+    def test_request_keys(self):
+        keys = get_request_keys(self.bundle)
+        self.assertEqual([decode_key(key) for key in keys], [
+            'duid:000300013431c43cb2f1',
+            'interface-id:4661322f33',
+            'remote-id:9:020023000001000a0003000100211c7d486e',
+        ])
+
+    def test_received_duid_bytes(self):
+        client_id = self.bundle.request.get_option_of_type(ClientIdOption)
+        self.assertIsNotNone(client_id.received_duid)
+        self.assertEqual(client_id.get_duid_bytes(), client_id.duid.save())
+
+        # Bytes that were received are used as they are
+        client_id.received_duid = (client_id.duid, b'xxreceived', 2, 8)
+        self.assertEqual(client_id.get_duid_bytes(), b'received')
+
+        # Saving the option always encodes the DUID
+        self.assertEqual(client_id.save(), bytes.fromhex('0001000a') + client_id.duid.save())
+
+        # After changing the DUID in place saving the option sees the change
+        client_id.duid.link_layer_address = bytes.fromhex('002436ef1d89')
+        self.assertEqual(client_id.save(), bytes.fromhex('0001000a00030001002436ef1d89'))
+
+        # After replacing the DUID the new one is encoded
+        client_id.duid = LinkLayerDUID(hardware_type=1, link_layer_address=bytes.fromhex('002436ef1d8a'))
+        self.assertEqual(client_id.get_duid_bytes(), bytes.fromhex('00030001002436ef1d8a'))
+
+    def test_created_option(self):
+        client_id = ClientIdOption(duid=LinkLayerDUID(hardware_type=1, link_layer_address=bytes(6)))
+        self.assertIsNone(client_id.received_duid)
+        self.assertEqual(client_id.get_duid_bytes(), client_id.duid.save())
+
+if __name__ == '__main__':
+    unittest.main()
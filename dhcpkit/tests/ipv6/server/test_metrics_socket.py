@@ -0,0 +1,87 @@
+"""
+Test the OpenMetrics exporter
+"""
+import socket
+import unittest
+from ipaddress import IPv4Address, IPv4Network, IPv6Network
+
+from dhcpkit.ipv6.messages import SolicitMessage
+from dhcpkit.ipv6.server.metrics_socket import MetricsSocket, escape_label_value, render_metrics
+from dhcpkit.ipv6.server.statistics import ServerStatistics, Statistics
+
+
+class RenderMetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.statistics = ServerStatistics()
+        self.statistics.interface_stats['eth0'] = Statistics()
+        self.statistics.global_stats.count_incoming_packet()
+        self.statistics.global_stats.count_message_in(SolicitMessage.message_type)
+        self.statistics.interface_stats['eth0'].count_incoming_packet()
+
+    def test_escape(self):
+        self.assertEqual(escape_label_value('a"b\\c\nd'), 'a\\"b\\\\c\\nd')
+
+    def test_render(self):
+        output = render_metrics(self.statistics).decode('utf-8')
+        lines = output.splitlines()
+
+        self.assertIn('# TYPE dhcpkit_incoming_packets counter', lines)
+        self.assertIn('dhcpkit_incoming_packets_total 1', lines)
+        self.assertIn('dhcpkit_incoming_packets_total{interface="eth0"} 1', lines)
+        self.assertIn('dhcpkit_messages_in_total{type="solicit"} 1', lines)
+        self.assertIn('dhcpkit_messages_in_total{interface="eth0",type="solicit"} 0', lines)
+        self.assertEqual(lines[-1], '# EOF')
+
+
+class MetricsSocketTestCase(unittest.TestCase):
+    def setUp(self):
+        self.statistics = ServerStatistics()
+        self.metrics_socket = MetricsSocket(IPv4Address('127.0.0.1'), 0)
+        self.port = self.metrics_socket.listen_socket.getsockname()[1]
+
+    def tearDown(self):
+        self.metrics_socket.close()
+
+    def request(self, request: bytes) -> bytes:
+        client = socket.create_connection(('127.0.0.1', self.port))
+        client.sendall(request)
+
+        connection = self.metrics_socket.accept()
+        connection.sock.setblocking(True)
+        self.assertTrue(connection.handle_read(self.statistics))
+        self.assertTrue(connection.handle_write())
+        connection.close()
+
+        response = b''
+        while True:
+            data = client.recv(65536)
+            if not data:
+                break
+            response += data
+        client.close()
+        return response
+
+    def test_metrics(self):
+        response = self.request(b'GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        self.assertTrue(response.startswith(b'HTTP/1.0 200 OK\r\n'))
+        self.assertIn(b'application/openmetrics-text', response)
+        self.assertTrue(response.endswith(b'# EOF\n'))
+
+    def test_not_found(self):
+        response = self.request(b'GET /other HTTP/1.1\r\n\r\n')
+        self.assertTrue(response.startswith(b'HTTP/1.0 404 Not Found\r\n'))
+
+    def test_method_not_allowed(self):
+        response = self.request(b'POST /metrics HTTP/1.1\r\n\r\n')
+        self.assertTrue(response.startswith(b'HTTP/1.0 405 Method Not Allowed\r\n'))
+
+    def test_allow_from(self):
+        self.metrics_socket.allow_from = [IPv4Network('192.0.2.0/24'), IPv6Network('2001:db8::/32')]
+        self.assertFalse(self.metrics_socket.is_allowed(('127.0.0.1', 1234)))
+        self.assertTrue(self.metrics_socket.is_allowed(('192.0.2.1', 1234)))
+        self.assertTrue(self.metrics_socket.is_allowed(('::ffff:192.0.2.1', 1234, 0, 0)))
+        self.assertTrue(self.metrics_socket.is_allowed(('2001:db8::1', 1234, 0, 0)))
+
+
+if __name__ == '__main__':
+    unittest.main()
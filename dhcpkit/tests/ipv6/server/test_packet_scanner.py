@@ -0,0 +1,64 @@
+"""
+Test the raw packet scanner
+"""
+import unittest
+from ipaddress import IPv6Address
+
+from dhcpkit.ipv6.extensions.linklayer_id import LinkLayerIdOption
+from dhcpkit.ipv6.extensions.subscriber_id import SubscriberIdOption
+from dhcpkit.ipv6.options import InterfaceIdOption
+from dhcpkit.ipv6.server.extensions.rate_limit.key_functions import key_function_map, raw_key_function_map
+from dhcpkit.ipv6.server.listeners import IncomingPacketBundle
+from dhcpkit.ipv6.server.packet_scanner import scan_options, scan_packet
+from dhcpkit.ipv6.server.worker import parse_incoming_request
+from dhcpkit.tests.ipv6.messages.test_relay_forward_message import relayed_solicit_message
+from dhcpkit.tests.ipv6.messages.test_solicit_message import solicit_message
+
+
+class PacketScannerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.relayed_packet = IncomingPacketBundle(data=bytes(relayed_solicit_message.save()),
+                                                   source_address=IPv6Address('2001:db8::babe'),
+                                                   link_address=IPv6Address('2001:db8::1'),
+                                                   relay_options=[InterfaceIdOption(interface_id=b'eth0')])
+        self.direct_packet = IncomingPacketBundle(data=bytes(solicit_message.save()),
+                                                  source_address=IPv6Address('fe80::babe'),
+                                                  link_address=IPv6Address('2001:db8::1'),
+                                                  relay_options=[
+                                                      InterfaceIdOption(interface_id=b'eth0'),
+                                                      SubscriberIdOption(subscriber_id=b'sub'),
+                                                      LinkLayerIdOption(link_layer_type=1,
+                                                                        link_layer_address=bytes(6)),
+                                                  ])
+
+    def test_scan_options(self):
+        self.assertEqual(scan_options(bytes.fromhex('00010002010200020000'), 0), {1: b'\x01\x02', 2: b''})
+        self.assertRaisesRegex(ValueError, 'beyond', scan_options, bytes.fromhex('00010005010203'), 0)
+        self.assertRaisesRegex(ValueError, 'beyond', scan_options, bytes.fromhex('000100'), 0)
+
+    def test_malformed(self):
+        self.assertIsNone(scan_packet(IncomingPacketBundle(data=b'')))
+        self.assertIsNone(scan_packet(IncomingPacketBundle(data=b'\x01\x00')))
+        self.assertIsNone(scan_packet(IncomingPacketBundle(data=relayed_solicit_message.save()[:40])))
+
+        # A relay message without a relayed message in it
+        self.assertIsNone(scan_packet(IncomingPacketBundle(data=relayed_solicit_message.save()[:34])))
+
+    def test_compare_with_bundle(self):
+        for packet in (self.relayed_packet, self.direct_packet):
+            bundle = parse_incoming_request(packet)
+            scanned = scan_packet(packet)
+
+            self.assertEqual(scanned.message_type, bundle.request.message_type)
+            self.assertEqual(len(scanned.relays), len(bundle.incoming_relay_messages))
+            self.assertEqual(scanned.link_address, bundle.link_address.packed)
+            self.assertEqual(scanned.relay_link_addresses, [address.packed for address in bundle.relays])
+            self.assertIsNone(scanned.server_duid)
+
+            for name, key_function in key_function_map.items():
+                with self.subTest(key=name):
+                    self.assertEqual(raw_key_function_map[name](scanned), key_function(bundle))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+"""
+Test the shared statistics counters
+"""
+import os
+import unittest
+
+from dhcpkit.ipv6.messages import ReplyMessage, SolicitMessage
+from dhcpkit.ipv6.server import statistics as statistics_module
+from dhcpkit.ipv6.server.statistics import ServerStatistics, SharedCounters, Statistics
+
+
+class SharedCountersTestCase(unittest.TestCase):
+    def tearDown(self):
+        statistics_module.current_slot = 0
+
+    def test_stride(self):
+        self.assertEqual(SharedCounters(['a'], slots=2).stride, 8)
+        self.assertEqual(SharedCounters(['a'] * 9, slots=2).stride, 16)
+
+    def test_totals_over_slots(self):
+        counters = SharedCounters(['a', 'b'], slots=3)
+
+        for slot in range(3):
+            statistics_module.current_slot = slot
+            counters.increment(0)
+            counters.increment(1, slot)
+
+        self.assertEqual(counters.totals(), [3, 3])
+
+    def test_resize_keeps_totals(self):
+        counters = SharedCounters(['a', 'b'], slots=2)
+        statistics_module.current_slot = 1
+        counters.increment(0, 5)
+        counters.increment(1, 7)
+
+        counters.resize(4)
+        self.assertEqual(counters.slots, 4)
+        self.assertEqual(counters.totals(), [5, 7])
+
+
+class StatisticsTestCase(unittest.TestCase):
+    def test_counting(self):
+        stats = Statistics()
+        stats.count_incoming_packet()
+        stats.count_incoming_packet()
+        stats.count_other_error()
+        stats.count_message_in(SolicitMessage.message_type)
+        stats.count_message_out(ReplyMessage.message_type)
+
+        # Unknown keys are ignored
+        stats.count_message_in(255)
+
+        exported = stats.export()
+        self.assertEqual(exported['incoming_packets'], 2)
+        self.assertEqual(exported['other_error'], 1)
+        self.assertEqual(exported['outgoing_packets'], 0)
+        self.assertEqual(exported['messages_in']['solicit'], 1)
+        self.assertEqual(exported['messages_out']['reply'], 1)
+
+        self.assertIn("- Incoming packets: 2", str(stats))
+        self.assertIn("- Solicit: 1", str(stats))
+
+
+class ServerStatisticsTestCase(unittest.TestCase):
+    def tearDown(self):
+        statistics_module.current_slot = 0
+        statistics_module.slot_count = 1
+
+    def test_set_worker_count(self):
+        server_stats = ServerStatistics()
+        server_stats.global_stats.count_incoming_packet()
+
+        server_stats.set_worker_count(3)
+        self.assertEqual(server_stats.global_stats.counters.slots, 4)
+        self.assertEqual(server_stats.slot_owners[0], os.getpid())
+        self.assertEqual(server_stats.export()['global']['incoming_packets'], 1)
+
+    def test_claim_slot(self):
+        server_stats = ServerStatistics()
+        server_stats.set_worker_count(2)
+
+        # Pretend to be a worker
+        server_stats.claim_slot()
+        self.assertEqual(statistics_module.current_slot, 1)
+
+        # Claiming again returns the same slot
+        server_stats.claim_slot()
+        self.assertEqual(statistics_module.current_slot, 1)
+
+        server_stats.global_stats.count_incoming_packet()
+        self.assertEqual(server_stats.global_stats.counters.counters[server_stats.global_stats.counters.stride], 1)
+
+    def test_claim_dead_slot(self):
+        server_stats = ServerStatistics()
+        server_stats.set_worker_count(1)
+
+        # A PID that can't exist
+        server_stats.slot_owners[1] = 2 ** 31 - 1
+        server_stats.claim_slot()
+        self.assertEqual(statistics_module.current_slot, 1)
+        self.assertEqual(server_stats.slot_owners[1], os.getpid())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+"""
+Test the verification of replies in the worker
+"""
+import unittest
+from unittest.mock import Mock
+
+from dhcpkit.ipv6.server.worker import VerifiedResponses
+from dhcpkit.tests.ipv6.messages.test_advertise_message import advertise_message
+from dhcpkit.tests.ipv6.messages.test_relay_reply_message import relayed_advertise_message
+
+
+class VerifiedResponsesTestCase(unittest.TestCase):
+    def test_valid(self):
+        statistics = Mock()
+        outgoing_messages = VerifiedResponses([relayed_advertise_message] * 3, statistics)
+
+        self.assertEqual(list(outgoing_messages), [relayed_advertise_message] * 3)
+        self.assertIsNone(outgoing_messages.error)
+        self.assertEqual(statistics.count_outgoing_packet.call_count, 3)
+
+    def test_invalid(self):
+        statistics = Mock()
+        outgoing_messages = VerifiedResponses([relayed_advertise_message, advertise_message,
+                                               relayed_advertise_message], statistics)
+
+        # The replies before the invalid one are still sent, the error is kept for the caller
+        self.assertEqual(list(outgoing_messages), [relayed_advertise_message])
+        self.assertRegex(str(outgoing_messages.error), 'RelayReplyMessage')
+        self.assertEqual(statistics.count_outgoing_packet.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
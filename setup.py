@@ -60,7 +60,9 @@ setup(
             'ipv6-dhcpd = dhcpkit.ipv6.server.main:run',
             'ipv6-dhcpctl = dhcpkit.ipv6.server.dhcpctl:run',
             'ipv6-dhcp-test-leasequery = dhcpkit.ipv6.client.test_leasequery:run',
+            'ipv6-dhcp-loadgen = dhcpkit.ipv6.client.loadgen:run',
             'ipv6-dhcp-build-sqlite = dhcpkit.ipv6.server.extensions.static_assignments.sqlite:build_sqlite',
+            'ipv6-dhcp-build-index = dhcpkit.ipv6.server.extensions.static_assignments.index:build_index',
         ],
         'pygments.lexers': [
             'dhcpkitconf = dhcpkit.ipv6.server.pygments_plugin:DHCPKitConfLexer'
@@ -153,6 +155,7 @@ setup(
             'listen-unicast     = dhcpkit.ipv6.server.listeners.unicast',
             'listen-interface   = dhcpkit.ipv6.server.listeners.multicast_interface',
             'listen-tcp         = dhcpkit.ipv6.server.listeners.unicast_tcp',
+            'listen-interfaces  = dhcpkit.ipv6.server.listeners.multicast_wildcard',
 
             # DUID elements for the configuration file
             'duid-ll            = dhcpkit.ipv6.server.duids.duid_ll',